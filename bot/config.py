@@ -14,6 +14,16 @@ CLIENT_BOT_USERNAME = os.getenv('CLIENT_BOT_USERNAME', '')  # Username клие
 # Database
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///database.db')
 
+# Nominatim (OpenStreetMap) - геокодирование; политика сервиса - не чаще 1 запроса в секунду
+NOMINATIM_URL = os.getenv('NOMINATIM_URL', 'https://nominatim.openstreetmap.org').rstrip('/')
+NOMINATIM_MIN_INTERVAL = float(os.getenv('NOMINATIM_MIN_INTERVAL', '1.0'))
+
+# Офлайн-справочник городов (CSV: name_ru,name_local,name_en,country_code,latitude,longitude)
+CITY_DATASET_PATH = os.getenv(
+    'CITY_DATASET_PATH',
+    os.path.join(os.path.dirname(__file__), 'data', 'cities.csv')
+)
+
 # Super admins (comma-separated IDs) - могут быть мастерами + видят статистику
 SUPER_ADMINS = [int(id.strip()) for id in os.getenv('SUPER_ADMINS', '').split(',') if id.strip()]
 
@@ -22,8 +32,63 @@ YOOKASSA_SHOP_ID = os.getenv('YOOKASSA_SHOP_ID', '1200992')  # Тестовый
 YOOKASSA_SECRET_KEY = os.getenv('YOOKASSA_SECRET_KEY', '')  # Секретный ключ из личного кабинета
 YOOKASSA_API_URL = 'https://api.yookassa.ru/v3/payments'
 YOOKASSA_TEST_MODE = os.getenv('YOOKASSA_TEST_MODE', 'true').lower() == 'true'
+# Перед применением уведомления webhook запрашивать статус платежа у ЮKassa (защита от поддельных уведомлений)
+YOOKASSA_WEBHOOK_VERIFY = os.getenv('YOOKASSA_WEBHOOK_VERIFY', 'true').lower() == 'true'
+# Интервал фоновой сверки зависших платежей (секунды)
+PAYMENT_RECONCILE_INTERVAL = int(os.getenv('PAYMENT_RECONCILE_INTERVAL', '300'))
 
 # Premium subscription prices (в рублях)
 PREMIUM_PRICE = float(os.getenv('PREMIUM_PRICE', '299.00'))  # Цена премиума
 PREMIUM_DURATION_DAYS = int(os.getenv('PREMIUM_DURATION_DAYS', '30'))  # Длительность подписки в днях
+SUBSCRIPTION_SWEEP_INTERVAL = int(os.getenv('SUBSCRIPTION_SWEEP_INTERVAL', '3600'))  # Проверка истекших подписок (секунды)
+
+
+# Напоминания клиентам о записях: за сколько часов до начала (через запятую)
+BOOKING_REMINDER_OFFSETS_HOURS = [
+    float(hours) for hours in os.getenv('BOOKING_REMINDER_OFFSETS_HOURS', '24,2').split(',') if hours.strip()
+]
+
+# Рассылки администратора: сообщений в секунду (лимит Telegram - около 30)
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', '20'))
+
+# Сколько апдейтов разных пользователей бот обрабатывает одновременно
+# (апдейты одного пользователя всегда обрабатываются по очереди)
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', '16'))
+
+# Оба бота и REST API в одном процессе (python run_all.py): как боты получают апдейты - polling или webhook
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+# Адрес ASGI-сервера (REST API и вебхуки ботов)
+SERVER_HOST = os.getenv('SERVER_HOST', '0.0.0.0')
+SERVER_PORT = int(os.getenv('SERVER_PORT', '8000'))
+# Режим webhook: публичный HTTPS-адрес сервера; если не задан, вебхуки у Telegram не регистрируются
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '').rstrip('/')
+# Секрет для заголовка X-Telegram-Bot-Api-Secret-Token (у каждого бота свой, производный от этого)
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+
+# Фоновые задачи (очередь уведомлений, напоминания, сводки, сверка платежей, рассылки) в этом процессе;
+# при нескольких процессах ботов они должны выполняться ровно в одном
+RUN_BACKGROUND_JOBS = os.getenv('RUN_BACKGROUND_JOBS', 'true').lower() == 'true'
+# Шардирование по пользователям (python run_sharded.py): число процессов-воркеров
+# и порт первого из них (воркеры слушают 127.0.0.1, снаружи доступен только диспетчер)
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '2'))
+SHARD_BASE_PORT = int(os.getenv('SHARD_BASE_PORT', '8100'))
+
+# Состояние ботов (user_data, разговоры) сохраняется в БД пачкой раз в столько секунд
+PERSISTENCE_UPDATE_INTERVAL = float(os.getenv('PERSISTENCE_UPDATE_INTERVAL', '5'))
+
+# Состояния пользователей в user_data (поиск, запись) удаляются после столька секунд простоя;
+# очистка и отчет об объеме user_data - раз в USER_STATE_SWEEP_INTERVAL секунд
+USER_STATE_TTL = float(os.getenv('USER_STATE_TTL', '3600'))
+USER_STATE_SWEEP_INTERVAL = float(os.getenv('USER_STATE_SWEEP_INTERVAL', '600'))
+# Незавершенный диалог (ConversationHandler) сбрасывается после столька секунд без ответа
+CONVERSATION_TIMEOUT = float(os.getenv('CONVERSATION_TIMEOUT', '1800'))
 
+# Ограничение частоты действий пользователей (декораторы debounce/rate_limit, REST API):
+# memory - в процессе, sqlite - общая таблица в файле RATE_LIMIT_DB_PATH для всех процессов ботов и API
+RATE_LIMIT_STORAGE = os.getenv('RATE_LIMIT_STORAGE', 'memory').lower()
+RATE_LIMIT_DB_PATH = os.getenv('RATE_LIMIT_DB_PATH', 'rate_limits.db')
+# Сколько пользователей помнит ограничитель (при превышении забываются самые давно активные)
+RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', '10000'))
+# REST API: запросов в минуту на пользователя и допустимый всплеск
+API_RATE_LIMIT_PER_MINUTE = float(os.getenv('API_RATE_LIMIT_PER_MINUTE', '120'))
+API_RATE_LIMIT_BURST = int(os.getenv('API_RATE_LIMIT_BURST', '20'))
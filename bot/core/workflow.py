@@ -1,13 +1,20 @@
 """Модуль для декларативного управления workflow и шагами в боте"""
-from typing import Dict, List, Callable, Optional, Any
+from typing import Dict, List, Callable, Optional, Any, Tuple
 from enum import Enum
 from dataclasses import dataclass, field
+import inspect
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 import logging
 
+from bot.utils.slots import slotted
+from bot.utils.user_state import WorkflowState, clear_state, get_state, set_state
+
 logger = logging.getLogger(__name__)
 
+# Префикс callback_data кнопок шага: workflow_callback_<значение>
+CALLBACK_PREFIX = 'workflow_callback_'
+
 
 class StepType(Enum):
     """Типы шагов"""
@@ -30,9 +37,10 @@ class Step:
     next_step: Optional[str] = None  # ID следующего шага
     condition: Optional[Callable] = None  # Условие для перехода (для CONDITIONAL)
     keyboard: Optional[List[List[Dict[str, str]]]] = None  # Кнопки (для CALLBACK)
-    data_key: Optional[str] = None  # Ключ в context.user_data для сохранения данных
+    data_key: Optional[str] = None  # Ключ в данных workflow для сохранения ввода
     default_value: Any = None  # Значение по умолчанию
     skip_if: Optional[Callable] = None  # Условие для пропуска шага
+    keyboard_builder: Optional[Callable] = None  # Кнопки, зависящие от данных (строятся при показе шага)
 
 
 @dataclass
@@ -43,156 +51,239 @@ class Workflow:
     steps: Dict[str, Step] = field(default_factory=dict)  # Словарь шагов по ID
     fallbacks: List[str] = field(default_factory=list)  # ID шагов для отмены
     context_keys: List[str] = field(default_factory=list)  # Ключи для очистки в context.user_data
+    on_complete: Optional[Callable] = None  # Действие по завершении: (update, context, data)
+
+
+@slotted
+@dataclass(frozen=True)
+class CompiledStep:
+    """Шаг, подготовленный при регистрации: переход - номер шага, статическая клавиатура собрана заранее"""
+    index: int
+    step: Step
+    next_index: Optional[int]  # None - завершение workflow
+    markup: Optional[InlineKeyboardMarkup]
+    handler_is_async: bool
+    builder_is_async: bool
+
+
+@slotted
+@dataclass(frozen=True)
+class CompiledWorkflow:
+    """Таблица шагов workflow, индексируемая номером шага"""
+    name: str
+    steps: Tuple[CompiledStep, ...]
+    index: Dict[str, int]  # ID шага -> номер
+    entry: int
+    context_keys: Tuple[str, ...]
+    on_complete: Optional[Callable]
+    on_complete_is_async: bool
+
+
+def _build_markup(rows: Optional[List[List[Dict[str, str]]]]) -> Optional[InlineKeyboardMarkup]:
+    """Клавиатура из описания кнопок ({'text', 'callback_data'}); пустые кнопки пропускаются"""
+    keyboard = []
+    for row in rows or []:
+        button_row = [
+            InlineKeyboardButton(btn['text'], callback_data=btn['callback_data'])
+            for btn in row
+            if btn.get('text') and btn.get('callback_data')
+        ]
+        if button_row:
+            keyboard.append(button_row)
+    return InlineKeyboardMarkup(keyboard) if keyboard else None
+
+
+def compile_workflow(workflow: Workflow) -> CompiledWorkflow:
+    """Проверить ссылки между шагами и собрать таблицу шагов"""
+    if workflow.entry_point not in workflow.steps:
+        raise ValueError(f"Workflow '{workflow.name}': entry point '{workflow.entry_point}' not found")
+
+    order = [workflow.entry_point] + [step_id for step_id in workflow.steps if step_id != workflow.entry_point]
+    index = {step_id: number for number, step_id in enumerate(order)}
+
+    steps = []
+    for number, step_id in enumerate(order):
+        step = workflow.steps[step_id]
+        if step.id != step_id:
+            raise ValueError(f"Workflow '{workflow.name}': step '{step.id}' registered as '{step_id}'")
+        if step.next_step is not None and step.next_step not in index:
+            raise ValueError(f"Workflow '{workflow.name}': step '{step_id}' refers to unknown step '{step.next_step}'")
+        if step.type == StepType.CONDITIONAL and not step.condition:
+            raise ValueError(f"Workflow '{workflow.name}': conditional step '{step_id}' has no condition")
+        steps.append(CompiledStep(
+            index=number,
+            step=step,
+            next_index=index.get(step.next_step) if step.next_step else None,
+            markup=None if step.keyboard_builder else _build_markup(step.keyboard),
+            handler_is_async=inspect.iscoroutinefunction(step.handler),
+            builder_is_async=inspect.iscoroutinefunction(step.keyboard_builder),
+        ))
+
+    return CompiledWorkflow(
+        name=workflow.name,
+        steps=tuple(steps),
+        index=index,
+        entry=0,
+        context_keys=tuple(workflow.context_keys),
+        on_complete=workflow.on_complete,
+        on_complete_is_async=inspect.iscoroutinefunction(workflow.on_complete),
+    )
+
+
+def workflow_data(context: ContextTypes.DEFAULT_TYPE) -> Dict[str, Any]:
+    """Данные, введенные в текущем workflow (для условий и обработчиков шагов)"""
+    state = get_state(context.user_data, WorkflowState)
+    return state.data if state else {}
 
 
 class WorkflowManager:
-    """Менеджер для управления workflow"""
-    
+    """
+    Менеджер для управления workflow
+
+    Workflow компилируется при регистрации в таблицу шагов: переходы - номера шагов,
+    статические клавиатуры собраны один раз. Прогресс пользователя - WorkflowState
+    в user_data (имя workflow, ID шага, данные), вытесняется при простое; номер шага
+    находится по ID через CompiledWorkflow.index.
+    """
+
     def __init__(self):
-        self.workflows: Dict[str, Workflow] = {}
-        self.current_workflows: Dict[int, str] = {}  # user_id -> workflow_name
-    
-    def register_workflow(self, workflow: Workflow):
+        self.workflows: Dict[str, CompiledWorkflow] = {}
+
+    def register_workflow(self, workflow: Workflow) -> CompiledWorkflow:
         """Зарегистрировать workflow"""
-        self.workflows[workflow.name] = workflow
-        logger.info(f"Workflow '{workflow.name}' registered with {len(workflow.steps)} steps")
-    
+        compiled = compile_workflow(workflow)
+        self.workflows[workflow.name] = compiled
+        logger.info(f"Workflow '{workflow.name}' registered with {len(compiled.steps)} steps")
+        return compiled
+
+    def _current(self, context: ContextTypes.DEFAULT_TYPE) -> Optional[Tuple[CompiledWorkflow, CompiledStep, WorkflowState]]:
+        """Активный workflow, его текущий шаг и состояние пользователя"""
+        state = get_state(context.user_data, WorkflowState)
+        if not state:
+            return None
+        workflow = self.workflows.get(state.workflow)
+        index = workflow.index.get(state.step) if workflow else None
+        if index is None:
+            logger.error(f"Workflow '{state.workflow}' or its step '{state.step}' not found")
+            clear_state(context.user_data, WorkflowState)
+            return None
+        return workflow, workflow.steps[index], state
+
     async def start_workflow(self, update: Update, context: ContextTypes.DEFAULT_TYPE, workflow_name: str):
         """Начать workflow"""
         workflow = self.workflows.get(workflow_name)
         if not workflow:
             logger.error(f"Workflow '{workflow_name}' not found")
             return None
-        
-        user_id = update.effective_user.id
-        self.current_workflows[user_id] = workflow_name
-        
-        # Инициализируем контекст
-        context.user_data['workflow_name'] = workflow_name
-        context.user_data['workflow_step'] = workflow.entry_point
-        context.user_data['workflow_data'] = {}
-        
-        # Переходим к первому шагу
-        return await self.process_step(update, context, workflow.entry_point)
-    
+
+        entry_id = workflow.steps[workflow.entry].step.id
+        state = set_state(context.user_data, WorkflowState(workflow=workflow_name, step=entry_id))
+        return await self._enter(update, context, workflow, state, workflow.entry)
+
     async def process_step(self, update: Update, context: ContextTypes.DEFAULT_TYPE, step_id: str):
-        """Обработать шаг"""
-        workflow_name = context.user_data.get('workflow_name')
-        if not workflow_name:
+        """Перейти к шагу по его ID"""
+        current = self._current(context)
+        if not current:
             logger.error("No active workflow")
             return None
-        
-        workflow = self.workflows.get(workflow_name)
-        if not workflow:
-            logger.error(f"Workflow '{workflow_name}' not found")
-            return None
-        
-        step = workflow.steps.get(step_id)
-        if not step:
-            logger.error(f"Step '{step_id}' not found in workflow '{workflow_name}'")
+
+        workflow, _, state = current
+        index = workflow.index.get(step_id)
+        if index is None:
+            logger.error(f"Step '{step_id}' not found in workflow '{workflow.name}'")
             return None
-        
-        # Проверяем условие пропуска
-        if step.skip_if:
-            try:
-                if step.skip_if(update, context):
-                    logger.info(f"Skipping step '{step_id}' due to skip_if condition")
-                    return await self._goto_next_step(update, context, step)
-            except Exception as e:
-                logger.error(f"Error in skip_if for step '{step_id}': {e}")
-        
-        # Выполняем обработчик шага, если он есть
-        if step.handler:
-            try:
-                # Проверяем, является ли функция async
-                import inspect
-                if inspect.iscoroutinefunction(step.handler):
-                    result = await step.handler(update, context)
-                else:
-                    result = step.handler(update, context)
-                if result:
-                    return result
-            except Exception as e:
-                logger.error(f"Error in handler for step '{step_id}': {e}")
-                return None
-        
-        # Показываем сообщение и клавиатуру
-        keyboard = self._build_keyboard(step, context)
-        
-        query = update.callback_query if hasattr(update, 'callback_query') and update.callback_query else None
-        
+        return await self._enter(update, context, workflow, state, index)
+
+    async def _enter(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
+                     workflow: CompiledWorkflow, state: WorkflowState, index: Optional[int]):
+        """Показать шаг; пропускаемые и условные шаги проходятся сразу"""
+        while index is not None:
+            compiled = workflow.steps[index]
+            step = compiled.step
+            state.step = step.id
+
+            # Проверяем условие пропуска
+            if step.skip_if:
+                try:
+                    skip = step.skip_if(update, context)
+                except Exception as e:
+                    logger.error(f"Error in skip_if for step '{step.id}': {e}")
+                    skip = False
+                if skip:
+                    logger.info(f"Skipping step '{step.id}' due to skip_if condition")
+                    index = self._next_index(update, context, workflow, compiled)
+                    continue
+
+            if step.type == StepType.CONDITIONAL:
+                index = self._next_index(update, context, workflow, compiled)
+                continue
+
+            # Выполняем обработчик шага, если он есть
+            if step.handler:
+                try:
+                    if compiled.handler_is_async:
+                        result = await step.handler(update, context)
+                    else:
+                        result = step.handler(update, context)
+                    if result:
+                        return result
+                except Exception as e:
+                    logger.error(f"Error in handler for step '{step.id}': {e}")
+                    return None
+
+            await self._show(update, context, compiled)
+            # Возвращаем состояние для ConversationHandler
+            return step.id
+
+        return await self._finish_workflow(update, context, workflow, state)
+
+    async def _show(self, update: Update, context: ContextTypes.DEFAULT_TYPE, compiled: CompiledStep):
+        """Показать сообщение шага с клавиатурой"""
+        step = compiled.step
+        markup = compiled.markup
+        if step.keyboard_builder:
+            if compiled.builder_is_async:
+                rows = await step.keyboard_builder(update, context)
+            else:
+                rows = step.keyboard_builder(update, context)
+            markup = _build_markup(rows)
+
+        query = update.callback_query
         if query:
-            await query.message.edit_text(
-                step.message,
-                parse_mode='HTML',
-                reply_markup=InlineKeyboardMarkup(keyboard) if keyboard else None
-            )
+            await query.message.edit_text(step.message, parse_mode='HTML', reply_markup=markup)
         else:
-            await update.message.reply_text(
-                step.message,
-                parse_mode='HTML',
-                reply_markup=InlineKeyboardMarkup(keyboard) if keyboard else None
-            )
-        
-        # Возвращаем состояние для ConversationHandler
-        return step_id
-    
-    def _build_keyboard(self, step: Step, context: ContextTypes.DEFAULT_TYPE) -> List[List[InlineKeyboardButton]]:
-        """Построить клавиатуру для шага"""
-        keyboard = []
-        
-        if step.keyboard:
-            for row in step.keyboard:
-                button_row = []
-                for btn in row:
-                    callback_data = btn.get('callback_data', '')
-                    text = btn.get('text', '')
-                    if callback_data and text:
-                        button_row.append(InlineKeyboardButton(text, callback_data=callback_data))
-                if button_row:
-                    keyboard.append(button_row)
-        
-        return keyboard
-    
-    async def _goto_next_step(self, update: Update, context: ContextTypes.DEFAULT_TYPE, current_step: Step):
-        """Перейти к следующему шагу"""
-        if current_step.type == StepType.CONDITIONAL and current_step.condition:
+            await update.message.reply_text(step.message, parse_mode='HTML', reply_markup=markup)
+
+    def _next_index(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
+                    workflow: CompiledWorkflow, compiled: CompiledStep) -> Optional[int]:
+        """Номер следующего шага (None - workflow завершен)"""
+        step = compiled.step
+        if step.type == StepType.CONDITIONAL and step.condition:
             # Определяем следующий шаг по условию
             try:
-                next_step_id = current_step.condition(update, context)
+                next_step_id = step.condition(update, context)
                 if next_step_id:
-                    context.user_data['workflow_step'] = next_step_id
-                    return await self.process_step(update, context, next_step_id)
+                    index = workflow.index.get(next_step_id)
+                    if index is not None:
+                        return index
+                    logger.error(f"Condition of step '{step.id}' returned unknown step '{next_step_id}'")
             except Exception as e:
-                logger.error(f"Error in condition for step '{current_step.id}': {e}")
-        
-        if current_step.next_step:
-            context.user_data['workflow_step'] = current_step.next_step
-            return await self.process_step(update, context, current_step.next_step)
-        
-        # Workflow завершен
-        return await self._finish_workflow(update, context)
-    
+                logger.error(f"Error in condition for step '{step.id}': {e}")
+        return compiled.next_index
+
     async def handle_input(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработать ввод пользователя"""
-        workflow_name = context.user_data.get('workflow_name')
-        step_id = context.user_data.get('workflow_step')
-        
-        if not workflow_name or not step_id:
+        current = self._current(context)
+        if not current:
             return None
-        
-        workflow = self.workflows.get(workflow_name)
-        if not workflow:
-            return None
-        
-        step = workflow.steps.get(step_id)
-        
-        if not step or step.type != StepType.INPUT:
+
+        workflow, compiled, state = current
+        step = compiled.step
+        if step.type != StepType.INPUT:
             return None
-        
-        # Сохраняем данные
+
         user_input = update.message.text.strip()
-        
+
         # Валидация
         if step.validator:
             try:
@@ -202,72 +293,55 @@ class WorkflowManager:
                     await update.message.reply_text(
                         validation_result if isinstance(validation_result, str) else "❌ Неверный ввод. Попробуйте снова:"
                     )
-                    return step_id
+                    return step.id
             except Exception as e:
-                logger.error(f"Error in validator for step '{step_id}': {e}")
+                logger.error(f"Error in validator for step '{step.id}': {e}")
                 await update.message.reply_text("❌ Ошибка валидации. Попробуйте снова:")
-                return step_id
-        
-        # Сохраняем в context.user_data
+                return step.id
+
         if step.data_key:
-            context.user_data['workflow_data'][step.data_key] = user_input
-        
+            state.data[step.data_key] = user_input
+
         # Переходим к следующему шагу
-        return await self._goto_next_step(update, context, step)
-    
+        return await self._enter(update, context, workflow, state, self._next_index(update, context, workflow, compiled))
+
     async def handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE, callback_data: str):
-        """Обработать callback"""
-        workflow_name = context.user_data.get('workflow_name')
-        step_id = context.user_data.get('workflow_step')
-        
-        if not workflow_name or not step_id:
-            return None
-        
-        workflow = self.workflows.get(workflow_name)
-        if not workflow:
+        """Обработать callback (в данные сохраняется значение без префикса workflow_callback_)"""
+        current = self._current(context)
+        if not current:
             return None
-        
-        step = workflow.steps.get(step_id)
-        
-        if not step or step.type != StepType.CALLBACK:
+
+        workflow, compiled, state = current
+        step = compiled.step
+        if step.type != StepType.CALLBACK:
             return None
-        
-        # Сохраняем выбор
+
         if step.data_key:
-            context.user_data['workflow_data'][step.data_key] = callback_data
-        
+            value = callback_data[len(CALLBACK_PREFIX):] if callback_data.startswith(CALLBACK_PREFIX) else callback_data
+            state.data[step.data_key] = value
+
         # Переходим к следующему шагу
-        return await self._goto_next_step(update, context, step)
-    
-    async def _finish_workflow(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        return await self._enter(update, context, workflow, state, self._next_index(update, context, workflow, compiled))
+
+    async def _finish_workflow(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
+                               workflow: CompiledWorkflow, state: WorkflowState):
         """Завершить workflow"""
-        workflow_name = context.user_data.get('workflow_name')
-        workflow = self.workflows.get(workflow_name)
-        
-        if workflow and hasattr(workflow, 'on_complete'):
+        if workflow.on_complete:
             try:
-                import inspect
-                if inspect.iscoroutinefunction(workflow.on_complete):
-                    await workflow.on_complete(update, context, context.user_data.get('workflow_data', {}))
+                if workflow.on_complete_is_async:
+                    await workflow.on_complete(update, context, state.data)
                 else:
-                    workflow.on_complete(update, context, context.user_data.get('workflow_data', {}))
+                    workflow.on_complete(update, context, state.data)
             except Exception as e:
-                logger.error(f"Error in on_complete for workflow '{workflow_name}': {e}")
-        
+                logger.error(f"Error in on_complete for workflow '{workflow.name}': {e}")
+
         # Очищаем контекст
-        user_id = update.effective_user.id
-        self.current_workflows.pop(user_id, None)
-        
-        for key in workflow.context_keys if workflow else []:
+        for key in workflow.context_keys:
             context.user_data.pop(key, None)
-        
-        context.user_data.pop('workflow_name', None)
-        context.user_data.pop('workflow_step', None)
-        context.user_data.pop('workflow_data', None)
-        
+        clear_state(context.user_data, WorkflowState)
+
         return None  # ConversationHandler.END
 
 
 # Глобальный экземпляр менеджера
 workflow_manager = WorkflowManager()
-
@@ -1,9 +1,11 @@
 """Управление базой данных для Lumi Beauty"""
-from sqlalchemy import create_engine
+import asyncio
+from sqlalchemy import create_engine, update
 from sqlalchemy.orm import sessionmaker, Session
-from contextlib import contextmanager
-from datetime import datetime
-from typing import List, Optional
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Dict, List, Optional, Tuple
 import logging
 
 from bot.config import DATABASE_URL, SUPER_ADMINS
@@ -19,7 +21,14 @@ from bot.database.models import (
     UserMaster,
     Booking,
     Payment,
-    Portfolio
+    Portfolio,
+    InviteQRCode,
+    GeocodeCache,
+    TemplateDescription,
+    NotificationOutbox,
+    ScheduledJob,
+    Broadcast,
+    PersistenceEntry
 )
 
 logger = logging.getLogger(__name__)
@@ -199,6 +208,116 @@ def migrate_country_currency_table():
     logger.info("Таблица country_currencies уже существует.")
 
 
+def migrate_payment_reconciliation():
+    """Миграция: добавление полей check_attempts и next_check_at в payments (для фоновой сверки)"""
+    from sqlalchemy import text, inspect
+    
+    inspector = inspect(engine)
+    
+    # Проверяем, существует ли таблица payments
+    if 'payments' not in inspector.get_table_names():
+        logger.info("Таблица payments не существует, будет создана при инициализации.")
+        return
+    
+    columns = [col['name'] for col in inspector.get_columns('payments')]
+    
+    if 'next_check_at' not in columns:
+        logger.info("Выполняется миграция: добавление полей сверки платежей в payments...")
+        with engine.connect() as conn:
+            try:
+                if 'check_attempts' not in columns:
+                    conn.execute(text("ALTER TABLE payments ADD COLUMN check_attempts INTEGER NOT NULL DEFAULT 0"))
+                conn.execute(text("ALTER TABLE payments ADD COLUMN next_check_at DATETIME"))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_payments_next_check_at ON payments (next_check_at)"))
+                conn.commit()
+                logger.info("Миграция: поля check_attempts и next_check_at добавлены в payments!")
+            except Exception as e:
+                logger.warning(f"Ошибка при добавлении полей сверки платежей: {e}. Возможно, поля уже существуют.")
+    else:
+        logger.info("Поля сверки платежей уже существуют в payments.")
+
+
+def migrate_subscription_expiry_index():
+    """Миграция: индекс по subscription_expires_at в master_accounts (для снятия истекших подписок)"""
+    from sqlalchemy import text, inspect
+    
+    inspector = inspect(engine)
+    
+    # Проверяем, существует ли таблица master_accounts
+    if 'master_accounts' not in inspector.get_table_names():
+        logger.info("Таблица master_accounts не существует, будет создана при инициализации.")
+        return
+    
+    indexes = [index['name'] for index in inspector.get_indexes('master_accounts')]
+    
+    if 'ix_master_accounts_subscription_expires_at' not in indexes:
+        logger.info("Выполняется миграция: создание индекса по subscription_expires_at...")
+        with engine.connect() as conn:
+            try:
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_master_accounts_subscription_expires_at "
+                    "ON master_accounts (subscription_expires_at)"
+                ))
+                conn.commit()
+                logger.info("Миграция: индекс по subscription_expires_at создан!")
+            except Exception as e:
+                logger.warning(f"Ошибка при создании индекса по subscription_expires_at: {e}")
+    else:
+        logger.info("Индекс по subscription_expires_at уже существует.")
+
+
+def migrate_notification_outbox_bot():
+    """Миграция: добавление поля bot в notification_outbox (уведомления клиентского бота)"""
+    from sqlalchemy import text, inspect
+    
+    inspector = inspect(engine)
+    
+    # Проверяем, существует ли таблица notification_outbox
+    if 'notification_outbox' not in inspector.get_table_names():
+        logger.info("Таблица notification_outbox не существует, будет создана при инициализации.")
+        return
+    
+    columns = [col['name'] for col in inspector.get_columns('notification_outbox')]
+    
+    if 'bot' not in columns:
+        logger.info("Выполняется миграция: добавление поля bot в notification_outbox...")
+        with engine.connect() as conn:
+            try:
+                conn.execute(text("ALTER TABLE notification_outbox ADD COLUMN bot VARCHAR(10) NOT NULL DEFAULT 'master'"))
+                conn.commit()
+                logger.info("Миграция: поле bot добавлено в notification_outbox!")
+            except Exception as e:
+                logger.warning(f"Ошибка при добавлении поля bot: {e}. Возможно, поле уже существует.")
+    else:
+        logger.info("Поле bot уже существует в notification_outbox.")
+
+
+def migrate_master_notification_mode():
+    """Миграция: добавление поля notification_mode в master_accounts (сводки уведомлений)"""
+    from sqlalchemy import text, inspect
+    
+    inspector = inspect(engine)
+    
+    # Проверяем, существует ли таблица master_accounts
+    if 'master_accounts' not in inspector.get_table_names():
+        logger.info("Таблица master_accounts не существует, будет создана при инициализации.")
+        return
+    
+    columns = [col['name'] for col in inspector.get_columns('master_accounts')]
+    
+    if 'notification_mode' not in columns:
+        logger.info("Выполняется миграция: добавление поля notification_mode в master_accounts...")
+        with engine.connect() as conn:
+            try:
+                conn.execute(text("ALTER TABLE master_accounts ADD COLUMN notification_mode VARCHAR(10) DEFAULT 'instant'"))
+                conn.commit()
+                logger.info("Миграция: поле notification_mode добавлено в master_accounts!")
+            except Exception as e:
+                logger.warning(f"Ошибка при добавлении поля notification_mode: {e}. Возможно, поле уже существует.")
+    else:
+        logger.info("Поле notification_mode уже существует в master_accounts.")
+
+
 def init_db():
     """Инициализация базы данных"""
     # Сначала выполняем миграции, если нужно
@@ -208,6 +327,10 @@ def init_db():
         migrate_service_ai_generated()
         migrate_master_currency()
         migrate_country_currency_table()
+        migrate_payment_reconciliation()
+        migrate_subscription_expiry_index()
+        migrate_notification_outbox_bot()
+        migrate_master_notification_mode()
     except Exception as e:
         logger.warning(f"Ошибка при миграции: {e}. Продолжаем инициализацию...")
     
@@ -216,9 +339,135 @@ def init_db():
     print("[OK] База данных инициализирована!")
 
 
+class UpdateSessionScope:
+    """
+    Одна сессия БД на обработку апдейта
+
+    Сессия создается при первом get_session() и общая для всех блоков апдейта.
+    Коммит - один раз в конце апдейта, а также перед каждым запросом к Bot API
+    и другим сетевым ожиданием (release): транзакция не остается открытой,
+    пока обработчик ждет сеть, соединение на это время возвращается в пул.
+    """
+
+    __slots__ = ('session', 'commits', 'closed', 'task')
+
+    def __init__(self):
+        self.session: Optional[Session] = None
+        self.commits = 0
+        self.closed = False
+        # Задачи, запущенные из обработчика, наследуют контекст, но работают со своими сессиями
+        self.task = asyncio.current_task()
+
+    @property
+    def active(self) -> bool:
+        if self.closed:
+            return False
+        try:
+            return asyncio.current_task() is self.task
+        except RuntimeError:
+            # Поток asyncio.to_thread: контекст скопирован, но цикла событий нет
+            return False
+
+    def acquire(self) -> Session:
+        if self.session is None:
+            self.session = SessionLocal()
+        return self.session
+
+    def has_transaction(self) -> bool:
+        session = self.session
+        return session is not None and (
+            session.in_transaction() or bool(session.new or session.dirty or session.deleted)
+        )
+
+    def release(self):
+        """Закоммитить открытую транзакцию (объекты сессии перечитаются при следующем обращении)"""
+        if self.has_transaction():
+            try:
+                self.session.commit()
+                self.commits += 1
+            except Exception:
+                self.session.rollback()
+                raise
+
+    def rollback(self):
+        if self.session is not None:
+            self.session.rollback()
+
+    def finish(self, commit: bool = True):
+        """Завершить апдейт: коммит (или откат) и закрытие сессии"""
+        self.closed = True
+        if self.session is None:
+            return
+        try:
+            if commit:
+                self.release()
+            else:
+                self.session.rollback()
+        except Exception as e:
+            logger.error(f"Error committing update session: {e}", exc_info=True)
+        finally:
+            self.session.close()
+            self.session = None
+
+
+_update_scope: ContextVar[Optional[UpdateSessionScope]] = ContextVar('update_session_scope', default=None)
+
+
+@asynccontextmanager
+async def update_session_scope():
+    """Общая сессия для всех get_session() внутри блока (обработка одного апдейта)"""
+    scope = UpdateSessionScope()
+    token = _update_scope.set(scope)
+    try:
+        yield scope
+    except BaseException:
+        scope.finish(commit=False)
+        raise
+    else:
+        scope.finish(commit=True)
+    finally:
+        _update_scope.reset(token)
+
+
+def release_update_session():
+    """Закоммитить транзакцию апдейта перед сетевым запросом (вне апдейта ничего не делает)"""
+    scope = _update_scope.get()
+    if scope is not None and scope.active:
+        scope.release()
+
+
+async def outside_transaction(awaitable: Awaitable[Any]) -> Any:
+    """
+    Дождаться сетевого запроса (API, скачивание файла), не держа открытой транзакцию апдейта
+
+    Запросы к Bot API оборачивать не нужно - транзакция завершается в TelegramRateLimiter.
+    """
+    release_update_session()
+    return await awaitable
+
+
 @contextmanager
 def get_session():
-    """Контекстный менеджер для сессии БД"""
+    """
+    Контекстный менеджер для сессии БД
+
+    Внутри update_session_scope() возвращает общую сессию апдейта: коммит делается
+    не в конце блока, а в конце апдейта (или перед сетевым запросом). Транзакция
+    остается открытой и после выхода из блока, поэтому сетевые ожидания после блока
+    тоже оборачиваются в outside_transaction(). Ошибка в блоке откатывает
+    незакоммиченные изменения апдейта; необязательную запись (кэш) выполняют
+    в session.begin_nested() и перехватывают ошибку внутри блока.
+    """
+    scope = _update_scope.get()
+    if scope is not None and scope.active:
+        session = scope.acquire()
+        try:
+            yield session
+        except Exception:
+            scope.rollback()
+            raise
+        return
+
     session = SessionLocal()
     try:
         yield session
@@ -260,6 +509,9 @@ def get_or_create_city(session: Session, name_ru: str, name_local: str, name_en:
         session.add(city)
         session.commit()
         logger.info(f"Created new city: {name_ru} ({name_local}, {name_en})")
+        # Список городов (read_models.list_cities) закэширован - сбрасываем
+        from bot.utils.cache import CacheKeys, CacheManager
+        CacheManager.delete(CacheKeys.CITIES)
     else:
         # Обновляем координаты, если они не были установлены
         if city.latitude is None and latitude is not None:
@@ -293,6 +545,53 @@ def search_cities(session: Session, query: str) -> List[City]:
     ).order_by(City.name_ru.asc()).all()
 
 
+# ===== GeocodeCache =====
+
+def get_geocode_cache(session: Session, lat_cell: int, lon_cell: int) -> Optional[GeocodeCache]:
+    """Получить закэшированный город для ячейки сетки координат"""
+    return session.query(GeocodeCache).filter_by(lat_cell=lat_cell, lon_cell=lon_cell).first()
+
+
+def save_geocode_cache(session: Session, lat_cell: int, lon_cell: int, city_data: dict) -> GeocodeCache:
+    """Сохранить город для ячейки сетки координат"""
+    entry = get_geocode_cache(session, lat_cell, lon_cell)
+    if not entry:
+        entry = GeocodeCache(lat_cell=lat_cell, lon_cell=lon_cell)
+        session.add(entry)
+    entry.name_ru = city_data['name_ru']
+    entry.name_local = city_data['name_local']
+    entry.name_en = city_data['name_en']
+    entry.country_code = city_data.get('country_code') or None
+    entry.latitude = city_data['latitude']
+    entry.longitude = city_data['longitude']
+    session.commit()
+    return entry
+
+
+# ===== TemplateDescription =====
+
+def get_template_descriptions(session: Session, service_name: str) -> List[TemplateDescription]:
+    """Получить сохраненные варианты описаний шаблона (по нормализованному названию)"""
+    return session.query(TemplateDescription).filter_by(
+        service_name=service_name
+    ).order_by(TemplateDescription.variation).all()
+
+
+def save_template_description(session: Session, service_name: str, variation: int,
+                              description: str) -> TemplateDescription:
+    """Сохранить вариант описания шаблона"""
+    entry = session.query(TemplateDescription).filter_by(
+        service_name=service_name, variation=variation
+    ).first()
+    if not entry:
+        entry = TemplateDescription(service_name=service_name, variation=variation)
+        session.add(entry)
+    entry.description = description
+    entry.created_at = datetime.utcnow()
+    session.commit()
+    return entry
+
+
 # ===== CountryCurrency =====
 
 def get_or_create_country_currency(
@@ -606,6 +905,8 @@ def create_booking(
         comment=comment
     )
     session.add(bk)
+    session.flush()
+    schedule_booking_reminders(session, bk)
     session.commit()
     return bk
 
@@ -757,6 +1058,10 @@ def delete_master(session: Session, master_id: int) -> bool:
         
         # 1. Удаляем бронирования (Booking) - они могут ссылаться на услуги
         bookings = get_bookings_for_master(session, master_id)
+        if bookings:
+            session.query(ScheduledJob).filter(
+                ScheduledJob.booking_id.in_([booking.id for booking in bookings])
+            ).delete(synchronize_session=False)
         for booking in bookings:
             session.delete(booking)
         
@@ -781,7 +1086,13 @@ def delete_master(session: Session, master_id: int) -> bool:
         for user_master in user_masters:
             session.delete(user_master)
         
-        # 6. Удаляем самого мастера - в последнюю очередь
+        # 6. Удаляем закэшированные QR-коды приглашения
+        session.query(InviteQRCode).filter_by(master_account_id=master_id).delete(synchronize_session=False)
+        
+        # 7. Удаляем неотправленные и отправленные уведомления мастера
+        session.query(NotificationOutbox).filter_by(master_account_id=master_id).delete(synchronize_session=False)
+        
+        # 8. Удаляем самого мастера - в последнюю очередь
         session.delete(master)
         
         # Коммитим все изменения
@@ -796,6 +1107,16 @@ def delete_master(session: Session, master_id: int) -> bool:
         return False
 
 
+def set_master_notification_mode(session: Session, master_id: int, mode: str) -> bool:
+    """Изменить режим уведомлений мастера о записях (instant, hourly, daily)"""
+    master = get_master_by_id(session, master_id)
+    if not master:
+        return False
+    master.notification_mode = mode
+    session.commit()
+    return True
+
+
 def update_master_subscription(session: Session, master_id: int, subscription_level: str, expires_at: datetime = None) -> bool:
     """Обновить подписку мастера"""
     master = get_master_by_id(session, master_id)
@@ -811,6 +1132,42 @@ def update_master_subscription(session: Session, master_id: int, subscription_le
     return True
 
 
+def downgrade_expired_subscriptions(session: Session, now: datetime = None) -> List[tuple]:
+    """
+    Перевести мастеров с истекшей платной подпиской на бесплатный тариф
+    
+    Выборка идет по индексу subscription_expires_at. Список для уведомлений
+    берется из строк, которые действительно изменил условный UPDATE ... RETURNING:
+    мастер, продливший подписку между выборкой и переводом (webhook платежа),
+    не переводится и не получает уведомление. Один UPDATE на каждый платный тариф,
+    чтобы знать, с какого тарифа переведен мастер.
+    
+    Returns:
+        Список (id, telegram_id, subscription_level) переведенных мастеров
+    """
+    now = now or datetime.utcnow()
+    expired_filter = (
+        MasterAccount.subscription_expires_at < now,
+        MasterAccount.subscription_level != 'free',
+    )
+    
+    levels = [
+        level for (level,) in session.query(MasterAccount.subscription_level).filter(*expired_filter).distinct()
+    ]
+    downgraded = []
+    for level in levels:
+        rows = session.execute(
+            update(MasterAccount)
+            .where(*expired_filter, MasterAccount.subscription_level == level)
+            .values(subscription_level='free')
+            .returning(MasterAccount.id, MasterAccount.telegram_id),
+            execution_options={'synchronize_session': False}
+        )
+        downgraded.extend((master_id, telegram_id, level) for master_id, telegram_id in rows)
+    if levels:
+        session.commit()
+    return downgraded
+
 # ===== Payment =====
 
 def create_payment_record(
@@ -942,6 +1299,44 @@ def get_portfolio_limit(session: Session, service_id: int) -> tuple[int, int]:
     return current_count, max_photos
 
 
+# ===== InviteQRCode =====
+
+def get_invite_qr(session: Session, master_id: int, deep_link: str) -> Optional[InviteQRCode]:
+    """Получить закэшированный QR-код приглашения мастера для конкретного диплинка"""
+    return session.query(InviteQRCode).filter_by(
+        master_account_id=master_id,
+        deep_link=deep_link
+    ).first()
+
+
+def save_invite_qr(session: Session, master_id: int, deep_link: str, png: bytes) -> InviteQRCode:
+    """Сохранить отрисованный QR-код (старые коды мастера с другим диплинком удаляются)"""
+    session.query(InviteQRCode).filter(
+        InviteQRCode.master_account_id == master_id,
+        InviteQRCode.deep_link != deep_link
+    ).delete(synchronize_session=False)
+    
+    qr_code = get_invite_qr(session, master_id, deep_link)
+    if qr_code:
+        qr_code.png = png
+        qr_code.file_id = None
+    else:
+        qr_code = InviteQRCode(master_account_id=master_id, deep_link=deep_link, png=png)
+        session.add(qr_code)
+    session.commit()
+    return qr_code
+
+
+def set_invite_qr_file_id(session: Session, master_id: int, deep_link: str, file_id: Optional[str]) -> bool:
+    """Запомнить (или сбросить) file_id отправленного QR-кода"""
+    qr_code = get_invite_qr(session, master_id, deep_link)
+    if not qr_code:
+        return False
+    qr_code.file_id = file_id
+    session.commit()
+    return True
+
+
 def get_master_stats(session: Session) -> dict:
     """Получить статистику по мастерам"""
     total_masters = session.query(MasterAccount).count()
@@ -996,3 +1391,228 @@ def get_masters_paginated(session: Session, page: int = 1, per_page: int = 10, i
     masters = query.order_by(MasterAccount.created_at.desc()).offset(offset).limit(per_page).all()
     
     return masters, total
+
+
+# ===== NotificationOutbox =====
+
+def enqueue_notification(session: Session, chat_id: int, text: str, kind: str = 'message',
+                         master_id: int = None, parse_mode: Optional[str] = 'HTML',
+                         bot: str = 'master', hold_until: datetime = None) -> NotificationOutbox:
+    """
+    Поставить уведомление в очередь отправки
+    
+    Не делает commit: запись сохраняется вместе с транзакцией вызывающего кода
+    (например, в одной транзакции с созданием бронирования).
+    С hold_until запись не отправляется сама, а попадает в сводку мастеру
+    после этого времени (см. bot.utils.digest).
+    """
+    entry = NotificationOutbox(
+        chat_id=chat_id,
+        bot=bot,
+        master_account_id=master_id,
+        kind=kind,
+        text=text,
+        parse_mode=parse_mode,
+        status='held' if hold_until else 'pending',
+        attempts=0,
+        next_attempt_at=hold_until or datetime.utcnow()
+    )
+    session.add(entry)
+    return entry
+
+
+def get_due_notifications(session: Session, now: datetime = None, limit: int = 50,
+                          bot: str = 'master') -> List[NotificationOutbox]:
+    """Получить уведомления бота, которые пора отправить (в порядке постановки в очередь)"""
+    now = now or datetime.utcnow()
+    return session.query(NotificationOutbox).filter(
+        NotificationOutbox.status == 'pending',
+        NotificationOutbox.bot == bot,
+        NotificationOutbox.next_attempt_at <= now
+    ).order_by(NotificationOutbox.id).limit(limit).all()
+
+
+
+def update_notification(session: Session, notification_id: int, **values) -> bool:
+    """Записать результат отправки уведомления (status, attempts, next_attempt_at, ...) одним UPDATE"""
+    updated = session.query(NotificationOutbox).filter(
+        NotificationOutbox.id == notification_id
+    ).update(values, synchronize_session=False)
+    return updated == 1
+
+
+# ===== ScheduledJob =====
+
+def schedule_booking_reminders(session: Session, booking: Booking, now: datetime = None) -> List[ScheduledJob]:
+    """
+    Запланировать напоминания клиенту о записи (BOOKING_REMINDER_OFFSETS_HOURS до начала)
+    
+    Не делает commit: задачи сохраняются вместе с бронированием.
+    Время - локальное время сервера, как и start_dt бронирования.
+    """
+    from bot.config import BOOKING_REMINDER_OFFSETS_HOURS
+    
+    now = now or datetime.now()
+    start_dt = booking.start_dt
+    if start_dt.tzinfo is not None:
+        # Время с часовым поясом (REST API) - в локальное время сервера
+        start_dt = start_dt.astimezone().replace(tzinfo=None)
+    jobs = []
+    for hours in BOOKING_REMINDER_OFFSETS_HOURS:
+        fire_at = start_dt - timedelta(hours=hours)
+        if fire_at <= now:
+            continue
+        job = ScheduledJob(kind='booking_reminder', fire_at=fire_at, booking_id=booking.id, status='pending')
+        session.add(job)
+        jobs.append(job)
+    return jobs
+
+
+def get_upcoming_scheduled_jobs(session: Session, until: datetime, limit: int) -> List[Tuple[datetime, int]]:
+    """Получить (fire_at, id) ожидающих задач со временем до until - по индексу (status, fire_at)"""
+    rows = session.query(ScheduledJob.fire_at, ScheduledJob.id).filter(
+        ScheduledJob.status == 'pending',
+        ScheduledJob.fire_at <= until
+    ).order_by(ScheduledJob.fire_at, ScheduledJob.id).limit(limit).all()
+    return [(fire_at, job_id) for fire_at, job_id in rows]
+
+
+def claim_scheduled_job(session: Session, job_id: int, status: str = 'done') -> bool:
+    """
+    Пометить ожидающую задачу выполненной
+    
+    Условный UPDATE: задачу забирает только один обработчик,
+    повторный вызов (например, после перезапуска) возвращает False.
+    """
+    updated = session.query(ScheduledJob).filter(
+        ScheduledJob.id == job_id,
+        ScheduledJob.status == 'pending'
+    ).update({'status': status, 'fired_at': datetime.utcnow()}, synchronize_session=False)
+    return updated == 1
+
+
+# ===== Broadcast =====
+
+def _broadcast_recipients_query(session: Session, audience: str):
+    """Запрос (id, telegram_id) получателей рассылки; заблокированным мастерам не пишем"""
+    if audience == 'masters':
+        return session.query(MasterAccount.id, MasterAccount.telegram_id).filter(MasterAccount.is_blocked == False)
+    return session.query(User.id, User.telegram_id)
+
+
+def create_broadcast(session: Session, audience: str, text: str, created_by: int = None) -> Broadcast:
+    """Создать рассылку (получатели считаются на момент запуска)"""
+    broadcast = Broadcast(
+        audience=audience,
+        text=text,
+        status='running',
+        total=_broadcast_recipients_query(session, audience).count(),
+        created_by=created_by
+    )
+    session.add(broadcast)
+    session.commit()
+    return broadcast
+
+
+def get_broadcast(session: Session, broadcast_id: int) -> Optional[Broadcast]:
+    """Получить рассылку по ID"""
+    return session.query(Broadcast).filter_by(id=broadcast_id).first()
+
+
+def get_recent_broadcasts(session: Session, limit: int = 5) -> List[Broadcast]:
+    """Получить последние рассылки"""
+    return session.query(Broadcast).order_by(Broadcast.id.desc()).limit(limit).all()
+
+
+def get_running_broadcasts(session: Session) -> List[Broadcast]:
+    """Получить незавершенные рассылки (для продолжения после перезапуска)"""
+    return session.query(Broadcast).filter_by(status='running').order_by(Broadcast.id).all()
+
+
+def get_broadcast_recipients_page(session: Session, audience: str, after_id: int,
+                                  limit: int = 500) -> List[Tuple[int, int]]:
+    """
+    Получить следующую страницу получателей рассылки после after_id
+    
+    Постраничный проход по первичному ключу: строки читаются потоком (yield_per),
+    без загрузки всех получателей в память, а контрольная точка - просто id.
+    """
+    model = MasterAccount if audience == 'masters' else User
+    query = _broadcast_recipients_query(session, audience).filter(
+        model.id > after_id
+    ).order_by(model.id).limit(limit)
+    return [(row_id, telegram_id) for row_id, telegram_id in query.yield_per(limit)]
+
+
+def update_broadcast_progress(session: Session, broadcast_id: int, last_recipient_id: int,
+                              sent: int, failed: int, finished: bool = False) -> Optional[str]:
+    """
+    Сохранить контрольную точку рассылки
+    
+    Returns:
+        Текущий статус рассылки (cancelled, если администратор ее остановил)
+    """
+    broadcast = get_broadcast(session, broadcast_id)
+    if not broadcast:
+        return None
+    broadcast.last_recipient_id = last_recipient_id
+    broadcast.sent = sent
+    broadcast.failed = failed
+    if finished and broadcast.status == 'running':
+        broadcast.status = 'done'
+        broadcast.finished_at = datetime.utcnow()
+    session.commit()
+    return broadcast.status
+
+
+def cancel_broadcast(session: Session, broadcast_id: int) -> bool:
+    """Остановить рассылку"""
+    updated = session.query(Broadcast).filter(
+        Broadcast.id == broadcast_id,
+        Broadcast.status == 'running'
+    ).update({'status': 'cancelled', 'finished_at': datetime.utcnow()}, synchronize_session=False)
+    session.commit()
+    return updated == 1
+
+
+def get_persistence_entries(session: Session, bot: str, kind: str) -> List[Tuple[str, str, bytes]]:
+    """Сохраненное состояние бота одного вида: список (name, key, data)"""
+    return session.query(PersistenceEntry.name, PersistenceEntry.key, PersistenceEntry.data).filter(
+        PersistenceEntry.bot == bot,
+        PersistenceEntry.kind == kind
+    ).all()
+
+
+def save_persistence_entries(session: Session, bot: str,
+                             entries: Dict[Tuple[str, str, str], Optional[bytes]], chunk_size: int = 500) -> int:
+    """
+    Записать пачку состояний бота одной транзакцией
+
+    Args:
+        entries: (kind, name, key) -> данные или None (удалить запись)
+
+    Returns:
+        Количество записанных (не удаленных) записей
+    """
+    groups: Dict[Tuple[str, str], List[str]] = {}
+    for kind, name, key in entries:
+        groups.setdefault((kind, name), []).append(key)
+    # Старые записи удаляются и вставляются заново - одинаково работает в SQLite и PostgreSQL
+    for (kind, name), keys in groups.items():
+        for start in range(0, len(keys), chunk_size):
+            session.query(PersistenceEntry).filter(
+                PersistenceEntry.bot == bot,
+                PersistenceEntry.kind == kind,
+                PersistenceEntry.name == name,
+                PersistenceEntry.key.in_(keys[start:start + chunk_size])
+            ).delete(synchronize_session=False)
+
+    now = datetime.utcnow()
+    rows = [
+        {'bot': bot, 'kind': kind, 'name': name, 'key': key, 'data': data, 'updated_at': now}
+        for (kind, name, key), data in entries.items() if data is not None
+    ]
+    if rows:
+        session.bulk_insert_mappings(PersistenceEntry, rows)
+    session.commit()
+    return len(rows)
@@ -2,7 +2,7 @@
 from datetime import datetime
 from sqlalchemy import (
     Column, Integer, String, Float, Boolean, 
-    DateTime, ForeignKey, Text
+    DateTime, ForeignKey, Text, LargeBinary, UniqueConstraint, Index
 )
 from sqlalchemy.orm import relationship, declarative_base
 import enum
@@ -46,12 +46,13 @@ class MasterAccount(Base):
     avatar_url = Column(String(255))  # ссылается на Telegram (или future upload)
     city_id = Column(Integer, ForeignKey('cities.id'), nullable=True)  # Город мастера
     currency = Column(String(3), default='RUB')  # Валюта мастера (RUB, BYN, KZT и т.д.)
+    notification_mode = Column(String(10), default='instant')  # Уведомления о записях: instant, hourly, daily
     created_at = Column(DateTime, default=datetime.utcnow)
     # multi-master — резервируем поле для будущих мастеров
     extra_masters_json = Column(Text, default=None)  # json c информацией о нескольких мастерах внутри аккаунта
     # Подписка и блокировка
     subscription_level = Column(String(20), default='free')  # free, basic, premium
-    subscription_expires_at = Column(DateTime, nullable=True)
+    subscription_expires_at = Column(DateTime, nullable=True, index=True)  # Индекс для фонового снятия истекших подписок
     is_blocked = Column(Boolean, default=False)
     blocked_at = Column(DateTime, nullable=True)
     block_reason = Column(Text, nullable=True)  # Причина блокировки (для админа)
@@ -149,6 +150,8 @@ class Payment(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     paid_at = Column(DateTime, nullable=True)
     expires_at = Column(DateTime, nullable=True)  # Срок действия подписки после оплаты
+    check_attempts = Column(Integer, default=0, nullable=False)  # Сколько раз статус запрашивался у ЮKassa
+    next_check_at = Column(DateTime, nullable=True, index=True)  # Когда можно снова запросить статус
 
     master_account = relationship('MasterAccount')
 
@@ -164,3 +167,102 @@ class Portfolio(Base):
 
     service = relationship('Service', back_populates='portfolio_photos')
 
+
+class InviteQRCode(Base):
+    """Кэш QR-кодов приглашения: PNG и file_id в Telegram для пары мастер + диплинк"""
+    __tablename__ = 'invite_qr_codes'
+    __table_args__ = (UniqueConstraint('master_account_id', 'deep_link', name='uq_invite_qr_master_link'),)
+    id = Column(Integer, primary_key=True)
+    master_account_id = Column(Integer, ForeignKey('master_accounts.id'), nullable=False, index=True)
+    deep_link = Column(String(255), nullable=False)  # Закодированная ссылка (ключ кэша вместе с мастером)
+    png = Column(LargeBinary, nullable=False)  # Отрисованное изображение
+    file_id = Column(String(255), nullable=True)  # file_id фото после первой отправки в мастер-боте
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class TemplateDescription(Base):
+    """Заранее сгенерированные варианты описаний для шаблонов услуг"""
+    __tablename__ = 'template_descriptions'
+    __table_args__ = (UniqueConstraint('service_name', 'variation', name='uq_template_description_variation'),)
+    id = Column(Integer, primary_key=True)
+    service_name = Column(String(100), nullable=False, index=True)  # Нормализованное название шаблона
+    variation = Column(Integer, nullable=False)  # Номер варианта (инструкции для вариативности)
+    description = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class GeocodeCache(Base):
+    """Кэш обратного геокодирования на сетке координат (ячейка ~1 км)"""
+    __tablename__ = 'geocode_cache'
+    __table_args__ = (UniqueConstraint('lat_cell', 'lon_cell', name='uq_geocode_cache_cell'),)
+    id = Column(Integer, primary_key=True)
+    lat_cell = Column(Integer, nullable=False)  # round(latitude / шаг сетки)
+    lon_cell = Column(Integer, nullable=False)  # round(longitude / шаг сетки)
+    name_ru = Column(String(100), nullable=False)
+    name_local = Column(String(100), nullable=False)
+    name_en = Column(String(100), nullable=False)
+    country_code = Column(String(2), nullable=True)
+    latitude = Column(Float, nullable=False)  # Координаты центра города
+    longitude = Column(Float, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class NotificationOutbox(Base):
+    """Очередь исходящих уведомлений (доставляет фоновый воркер мастер-бота)"""
+    __tablename__ = 'notification_outbox'
+    __table_args__ = (Index('ix_notification_outbox_due', 'status', 'next_attempt_at'),)
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(Integer, nullable=False)  # Telegram id получателя
+    bot = Column(String(10), nullable=False, default='master')  # Через какого бота отправлять: master, client
+    master_account_id = Column(Integer, ForeignKey('master_accounts.id'), nullable=True, index=True)
+    kind = Column(String(30), nullable=False, default='message')  # new_booking, ...
+    text = Column(Text, nullable=False)
+    parse_mode = Column(String(10), nullable=True, default='HTML')
+    status = Column(String(10), nullable=False, default='pending')  # pending, held (ждет сводки), digested, sent, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(String(255), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+
+class ScheduledJob(Base):
+    """Постоянная очередь отложенных задач (напоминания о записях)"""
+    __tablename__ = 'scheduled_jobs'
+    __table_args__ = (Index('ix_scheduled_jobs_due', 'status', 'fire_at'),)
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(30), nullable=False, default='booking_reminder')
+    fire_at = Column(DateTime, nullable=False)  # Локальное время сервера, как и Booking.start_dt
+    booking_id = Column(Integer, ForeignKey('bookings.id'), nullable=True, index=True)
+    status = Column(String(10), nullable=False, default='pending')  # pending, done, skipped
+    created_at = Column(DateTime, default=datetime.utcnow)
+    fired_at = Column(DateTime, nullable=True)
+
+
+class Broadcast(Base):
+    """Рассылка администратора всем мастерам или всем клиентам"""
+    __tablename__ = 'broadcasts'
+    id = Column(Integer, primary_key=True)
+    audience = Column(String(10), nullable=False)  # masters, clients
+    text = Column(Text, nullable=False)
+    status = Column(String(10), nullable=False, default='running', index=True)  # running, done, cancelled
+    total = Column(Integer, nullable=False, default=0)  # Получателей на момент запуска
+    sent = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    last_recipient_id = Column(Integer, nullable=False, default=0)  # Контрольная точка: id последнего обработанного получателя
+    created_by = Column(Integer, nullable=True)  # Telegram id администратора
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class PersistenceEntry(Base):
+    """Состояние бота между перезапусками: user_data, chat_data, bot_data и состояния ConversationHandler"""
+    __tablename__ = 'bot_persistence'
+    __table_args__ = (UniqueConstraint('bot', 'kind', 'name', 'key', name='uq_bot_persistence_entry'),)
+    id = Column(Integer, primary_key=True)
+    bot = Column(String(10), nullable=False)  # master, client
+    kind = Column(String(15), nullable=False)  # user, chat, bot, conversation
+    name = Column(String(64), nullable=False, default='')  # Имя ConversationHandler (для kind=conversation)
+    key = Column(String(255), nullable=False)  # id пользователя/чата или ключ разговора
+    data = Column(LargeBinary, nullable=False)  # pickle (сжатый zlib, если большой)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,233 @@
+"""
+Модели чтения для экранов-списков: неизменяемые DTO вместо ORM-сущностей
+
+Списки (мастера клиента, результаты поиска, города, списки мобильного API)
+читают только нужные колонки запросами Core. Результат - frozen-датаклассы
+со __slots__: без identity map и ленивых связей, их можно хранить в кэше
+и использовать после закрытия сессии.
+"""
+import logging
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from bot.database.models import City, MasterAccount, Service, ServiceCategory, User, UserMaster
+from bot.utils.slots import slotted
+
+logger = logging.getLogger(__name__)
+
+# Города меняются редко (добавляются при регистрации мастеров), список держим в кэше
+CITIES_CACHE_TTL = 600
+
+
+@slotted
+@dataclass(frozen=True)
+class CityItem:
+    id: int
+    name_ru: str
+    name_local: str
+    name_en: str
+
+
+@slotted
+@dataclass(frozen=True)
+class ServiceItem:
+    id: int
+    master_id: int
+    title: str
+    description: Optional[str]
+    price: float
+    duration: int
+    category_title: Optional[str]
+
+
+@slotted
+@dataclass(frozen=True)
+class MasterItem:
+    """Мастер в списке: профиль, город и число активных услуг"""
+    id: int
+    telegram_id: int
+    name: str
+    description: Optional[str]
+    avatar_url: Optional[str]
+    currency: str
+    city_name: Optional[str]
+    services_count: int
+
+
+@slotted
+@dataclass(frozen=True)
+class MasterPageItem:
+    """Строка страницы результатов поиска; цена и длительность - для списка по услуге"""
+    id: int
+    name: str
+    currency: str
+    service_id: Optional[int] = None
+    price: Optional[float] = None
+    duration: Optional[int] = None
+    already_added: bool = False
+
+
+def _active_services_count():
+    return (
+        select(Service.master_account_id, func.count(Service.id).label('services_count'))
+        .where(Service.active.is_(True))
+        .group_by(Service.master_account_id)
+        .subquery()
+    )
+
+
+def _master_items(session: Session, condition, *joins) -> List[MasterItem]:
+    """Мастера (не заблокированные) по условию, одним запросом вместе с городом и числом услуг"""
+    counts = _active_services_count()
+    query = select(
+        MasterAccount.id, MasterAccount.telegram_id, MasterAccount.name, MasterAccount.description,
+        MasterAccount.avatar_url, MasterAccount.currency, City.name_ru,
+        func.coalesce(counts.c.services_count, 0),
+    ).select_from(MasterAccount)
+    for target, on in joins:
+        query = query.join(target, on)
+    query = (
+        query.outerjoin(City, City.id == MasterAccount.city_id)
+        .outerjoin(counts, counts.c.master_account_id == MasterAccount.id)
+        .where(MasterAccount.is_blocked.is_(False), condition)
+    )
+    return [
+        MasterItem(id, telegram_id, name, description, avatar_url, currency or 'RUB', city_name, services_count)
+        for id, telegram_id, name, description, avatar_url, currency, city_name, services_count
+        in session.execute(query)
+    ]
+
+
+def list_client_masters(session: Session, user_telegram_id: int) -> List[MasterItem]:
+    """Мастера клиента в порядке добавления"""
+    user_masters = (
+        (UserMaster, UserMaster.master_account_id == MasterAccount.id),
+        (User, User.id == UserMaster.user_id),
+    )
+    items = _master_items(session, User.telegram_id == user_telegram_id, *user_masters)
+    order = {
+        master_id: position
+        for position, master_id in enumerate(session.scalars(
+            select(UserMaster.master_account_id)
+            .join(User, User.id == UserMaster.user_id)
+            .where(User.telegram_id == user_telegram_id)
+            .order_by(UserMaster.id)
+        ))
+    }
+    return sorted(items, key=lambda item: order.get(item.id, 0))
+
+
+def list_city_masters(session: Session, city_id: int, exclude_user_telegram_id: Optional[int] = None) -> List[MasterItem]:
+    """Мастера города по имени; exclude_user_telegram_id - без уже добавленных этим клиентом"""
+    items = _master_items(session, MasterAccount.city_id == city_id)
+    if exclude_user_telegram_id:
+        added = added_master_ids(session, exclude_user_telegram_id, [item.id for item in items])
+        items = [item for item in items if item.id not in added]
+    return sorted(items, key=lambda item: item.name)
+
+
+def list_active_services(session: Session, master_ids: Sequence[int]) -> Dict[int, Tuple[ServiceItem, ...]]:
+    """Активные услуги мастеров одним запросом: master_id -> услуги по порядку создания"""
+    if not master_ids:
+        return {}
+    rows = session.execute(
+        select(
+            Service.id, Service.master_account_id, Service.title, Service.description,
+            Service.price, Service.duration_mins, ServiceCategory.title,
+        )
+        .outerjoin(ServiceCategory, ServiceCategory.id == Service.category_id)
+        .where(Service.master_account_id.in_(master_ids), Service.active.is_(True))
+        .order_by(Service.id)
+    )
+    services: Dict[int, List[ServiceItem]] = {}
+    for row in rows:
+        services.setdefault(row[1], []).append(ServiceItem(*row))
+    return {master_id: tuple(items) for master_id, items in services.items()}
+
+
+def added_master_ids(session: Session, user_telegram_id: int, master_ids: Optional[Iterable[int]] = None) -> set:
+    """id мастеров (из master_ids, если заданы), уже добавленных клиентом"""
+    query = (
+        select(UserMaster.master_account_id)
+        .join(User, User.id == UserMaster.user_id)
+        .where(User.telegram_id == user_telegram_id)
+    )
+    if master_ids is not None:
+        query = query.where(UserMaster.master_account_id.in_(list(master_ids)))
+    return set(session.scalars(query))
+
+
+def filter_master_ids_for_client(session: Session, master_ids: Sequence[int], user_telegram_id: Optional[int]) -> List[int]:
+    """id мастеров по имени без заблокированных и уже добавленных клиентом"""
+    if not master_ids:
+        return []
+    ids = list(session.scalars(
+        select(MasterAccount.id)
+        .where(MasterAccount.id.in_(master_ids), MasterAccount.is_blocked.is_(False))
+        .order_by(MasterAccount.name.asc())
+    ))
+    if not ids or not user_telegram_id:
+        return ids
+    added = added_master_ids(session, user_telegram_id, ids)
+    return [master_id for master_id in ids if master_id not in added] if added else ids
+
+
+def load_masters_page(session: Session, master_ids: Sequence[int], service_ids: Sequence[int] = (),
+                      user_telegram_id: Optional[int] = None) -> List[MasterPageItem]:
+    """
+    Строки страницы поиска в порядке master_ids
+
+    service_ids - услуга каждого мастера (для списка по услуге), user_telegram_id -
+    пометить мастеров, уже добавленных клиентом. Заблокированные мастера пропускаются.
+    """
+    if not master_ids:
+        return []
+    masters = {
+        id: (name, currency or 'RUB')
+        for id, name, currency in session.execute(
+            select(MasterAccount.id, MasterAccount.name, MasterAccount.currency)
+            .where(MasterAccount.id.in_(master_ids), MasterAccount.is_blocked.is_(False))
+        )
+    }
+    services = {}
+    if service_ids:
+        services = {
+            master_id: (id, price, duration)
+            for id, master_id, price, duration in session.execute(
+                select(Service.id, Service.master_account_id, Service.price, Service.duration_mins)
+                .where(Service.id.in_(service_ids))
+            )
+        }
+    added = added_master_ids(session, user_telegram_id, master_ids) if user_telegram_id else set()
+
+    page = []
+    for master_id in master_ids:
+        master = masters.get(master_id)
+        if master is None:
+            continue
+        service_id, price, duration = services.get(master_id, (None, None, None))
+        page.append(MasterPageItem(
+            id=master_id, name=master[0], currency=master[1],
+            service_id=service_id, price=price, duration=duration,
+            already_added=master_id in added,
+        ))
+    return page
+
+
+def list_cities(session: Session) -> Tuple[CityItem, ...]:
+    """Все города по названию (из кэша, если список уже читался)"""
+    from bot.utils.cache import CacheKeys, CacheManager
+
+    cities = CacheManager.get(CacheKeys.CITIES)
+    if cities is None:
+        cities = tuple(
+            CityItem(*row)
+            for row in session.execute(
+                select(City.id, City.name_ru, City.name_local, City.name_en).order_by(City.name_ru.asc())
+            )
+        )
+        CacheManager.set(CacheKeys.CITIES, cities, CITIES_CACHE_TTL)
+    return cities
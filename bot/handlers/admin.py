@@ -1,6 +1,7 @@
 """Обработчики для админ-панели"""
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes, ConversationHandler, CallbackQueryHandler, MessageHandler, filters
 from bot.database.db import (
     get_session,
@@ -16,8 +17,12 @@ from bot.database.db import (
     get_services_by_master,
     get_work_periods,
     get_bookings_for_master,
-    get_master_clients_count
+    get_master_clients_count,
+    create_broadcast,
+    get_recent_broadcasts,
+    cancel_broadcast
 )
+from bot.config import CONVERSATION_TIMEOUT
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
@@ -26,6 +31,7 @@ logger = logging.getLogger(__name__)
 WAITING_DELETE_CONFIRM = 1
 WAITING_BLOCK_REASON = 2
 WAITING_SEARCH_QUERY = 3
+WAITING_BROADCAST_TEXT = 4
 
 
 def require_superadmin(func):
@@ -86,6 +92,7 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         [InlineKeyboardButton("📋 Список мастеров", callback_data="admin_masters_list_1")],
         [InlineKeyboardButton("🚫 Заблокированные", callback_data="admin_blocked_masters")],
         [InlineKeyboardButton("🔍 Поиск мастера", callback_data="admin_search_master")],
+        [InlineKeyboardButton("📣 Рассылки", callback_data="admin_broadcasts")],
     ]
     
     if query:
@@ -731,6 +738,144 @@ async def admin_stop_impersonation(update: Update, context: ContextTypes.DEFAULT
         )
 
 
+# ===== Рассылки =====
+
+BROADCAST_STATUS_NAMES = {
+    'running': '⏳ идет',
+    'done': '✅ завершена',
+    'cancelled': '⛔ остановлена',
+}
+
+
+def _format_broadcast_progress(broadcast) -> str:
+    """Строка прогресса рассылки"""
+    from bot.utils.broadcast import AUDIENCE_NAMES
+    processed = broadcast.sent + broadcast.failed
+    percent = int(processed * 100 / broadcast.total) if broadcast.total else 100
+    return (
+        f"#{broadcast.id} {AUDIENCE_NAMES.get(broadcast.audience, broadcast.audience)} — "
+        f"{BROADCAST_STATUS_NAMES.get(broadcast.status, broadcast.status)}\n"
+        f"   📤 {processed}/{broadcast.total} ({percent}%) | ✅ {broadcast.sent} | ❌ {broadcast.failed}"
+    )
+
+
+@require_superadmin
+async def admin_broadcasts(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Список последних рассылок с прогрессом"""
+    query = update.callback_query
+    await query.answer()
+    
+    with get_session() as session:
+        broadcasts = get_recent_broadcasts(session)
+        lines = [_format_broadcast_progress(broadcast) for broadcast in broadcasts]
+        running_ids = [broadcast.id for broadcast in broadcasts if broadcast.status == 'running']
+    
+    text = "📣 <b>Рассылки</b>\n\n"
+    text += "\n\n".join(lines) if lines else "Рассылок пока не было."
+    
+    keyboard = [
+        [InlineKeyboardButton("✉️ Всем мастерам", callback_data="admin_broadcast_new_masters")],
+        [InlineKeyboardButton("✉️ Всем клиентам", callback_data="admin_broadcast_new_clients")],
+    ]
+    for broadcast_id in running_ids:
+        keyboard.append([InlineKeyboardButton(f"⛔ Остановить #{broadcast_id}", callback_data=f"admin_broadcast_cancel_{broadcast_id}")])
+    keyboard.append([InlineKeyboardButton("🔄 Обновить", callback_data="admin_broadcasts")])
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="admin_panel")])
+    
+    try:
+        await query.message.edit_text(text, parse_mode='HTML', reply_markup=InlineKeyboardMarkup(keyboard))
+    except BadRequest as e:
+        # Прогресс не изменился с прошлого обновления
+        if "not modified" not in str(e).lower():
+            raise
+
+
+@require_superadmin
+async def admin_broadcast_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Начало создания рассылки: запрос текста"""
+    from bot.utils.broadcast import AUDIENCE_NAMES
+    query = update.callback_query
+    await query.answer()
+    
+    audience = query.data.replace('admin_broadcast_new_', '')
+    context.user_data['admin_broadcast_audience'] = audience
+    
+    await query.message.edit_text(
+        f"✉️ <b>Рассылка {AUDIENCE_NAMES[audience]}</b>\n\n"
+        "Отправьте текст сообщения:",
+        parse_mode='HTML',
+        reply_markup=InlineKeyboardMarkup([[
+            InlineKeyboardButton("❌ Отмена", callback_data="admin_broadcasts")
+        ]])
+    )
+    
+    return WAITING_BROADCAST_TEXT
+
+
+@require_superadmin
+async def admin_broadcast_text_received(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Получен текст рассылки - показываем предпросмотр"""
+    from bot.utils.broadcast import AUDIENCE_NAMES
+    audience = context.user_data.get('admin_broadcast_audience')
+    if not audience:
+        await update.message.reply_text("❌ Ошибка: не выбрана аудитория рассылки")
+        return ConversationHandler.END
+    
+    context.user_data['admin_broadcast_text'] = update.message.text
+    
+    await update.message.reply_text(
+        f"👀 <b>Предпросмотр рассылки {AUDIENCE_NAMES[audience]}:</b>",
+        parse_mode='HTML'
+    )
+    await update.message.reply_text(
+        update.message.text,
+        reply_markup=InlineKeyboardMarkup([
+            [InlineKeyboardButton("✅ Отправить", callback_data="admin_broadcast_send")],
+            [InlineKeyboardButton("❌ Отмена", callback_data="admin_broadcasts")]
+        ])
+    )
+    
+    return ConversationHandler.END
+
+
+@require_superadmin
+async def admin_broadcast_send(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Запуск рассылки"""
+    from bot.utils.broadcast import start_broadcast
+    query = update.callback_query
+    
+    audience = context.user_data.pop('admin_broadcast_audience', None)
+    text = context.user_data.pop('admin_broadcast_text', None)
+    if not audience or not text:
+        await query.answer("❌ Рассылка уже запущена или устарела", show_alert=True)
+        return
+    
+    with get_session() as session:
+        broadcast = create_broadcast(session, audience, text, created_by=update.effective_user.id)
+        broadcast_id = broadcast.id
+    
+    if not start_broadcast(context.application, broadcast_id, audience):
+        with get_session() as session:
+            cancel_broadcast(session, broadcast_id)
+        await query.answer("❌ Бот для этой аудитории не настроен", show_alert=True)
+        return
+    
+    logger.info(f"[ADMIN] Broadcast {broadcast_id} to {audience} started by {update.effective_user.id}")
+    await admin_broadcasts(update, context)
+
+
+@require_superadmin
+async def admin_broadcast_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Остановить рассылку"""
+    broadcast_id = int(update.callback_query.data.split('_')[-1])
+    
+    with get_session() as session:
+        cancel_broadcast(session, broadcast_id)
+    
+    logger.info(f"[ADMIN] Broadcast {broadcast_id} cancelled by {update.effective_user.id}")
+    await admin_broadcasts(update, context)
+
+
 # ConversationHandler для админки
 def create_admin_conversation_handler():
     """Создать ConversationHandler для админки"""
@@ -738,14 +883,38 @@ def create_admin_conversation_handler():
         entry_points=[
             CallbackQueryHandler(admin_block_master, pattern=r'^admin_block_\d+$'),
             CallbackQueryHandler(admin_search_master_start, pattern='^admin_search_master$'),
+            CallbackQueryHandler(admin_broadcast_start, pattern='^admin_broadcast_new_(masters|clients)$'),
         ],
         states={
             WAITING_BLOCK_REASON: [MessageHandler(filters.TEXT & ~filters.COMMAND, admin_block_reason_received)],
             WAITING_SEARCH_QUERY: [MessageHandler(filters.TEXT & ~filters.COMMAND, admin_search_master_result)],
+            WAITING_BROADCAST_TEXT: [MessageHandler(filters.TEXT & ~filters.COMMAND, admin_broadcast_text_received)],
         },
         fallbacks=[
             CallbackQueryHandler(admin_panel, pattern='^admin_panel$'),
+            CallbackQueryHandler(admin_broadcasts, pattern='^admin_broadcasts$'),
             MessageHandler(filters.COMMAND, admin_panel),
         ],
-        name="admin_conversation"
+        conversation_timeout=CONVERSATION_TIMEOUT,
+        name="admin_conversation",
+        persistent=True
     )
+
+
+# Кнопки вне диалогов: шаблон callback_data -> обработчик (bot/utils/callback_router.py)
+CALLBACK_ROUTES = [
+    ('stop_impersonation', admin_stop_impersonation),
+    ('admin_panel', admin_panel),
+    ('admin_masters_list_<int>', admin_masters_list),
+    ('admin_master_detail_<int>', admin_master_detail),
+    ('admin_unblock_<int>', admin_unblock_master),
+    ('admin_delete_confirm_<int>', admin_delete_confirm),
+    ('admin_delete_execute_<int>', admin_delete_execute),
+    ('admin_change_sub_<int>', admin_change_subscription),
+    ('admin_set_sub_<int>_<free|basic|premium>', admin_set_subscription),
+    ('admin_blocked_masters', admin_blocked_masters),
+    ('admin_impersonate_<int>', admin_impersonate_master),
+    ('admin_broadcasts', admin_broadcasts),
+    ('admin_broadcast_send', admin_broadcast_send),
+    ('admin_broadcast_cancel_<int>', admin_broadcast_cancel),
+]
@@ -1,5 +1,5 @@
 """Обработчики для клиентского бота"""
-from typing import Dict, List
+from typing import Dict, List, Optional
 import qrcode
 import io
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
@@ -9,6 +9,7 @@ from telegram.ext import ContextTypes, ConversationHandler
 MASTERS_PER_PAGE = 7
 from bot.database.db import (
     get_session,
+    outside_transaction,
     get_or_create_user,
     get_master_by_telegram,
     add_user_master_link,
@@ -20,14 +21,19 @@ from bot.database.db import (
     check_booking_conflict,
     get_portfolio_photos,
     get_all_cities,
-    get_masters_by_city
+    get_masters_by_city,
+    enqueue_notification
 )
 from bot.utils.schedule_utils import get_available_time_slots, has_available_slots_on_date, format_time
 from datetime import datetime, timedelta, date
-from bot.database.models import Service, ServiceCategory, MasterAccount, UserMaster
+from bot.database.models import Service, ServiceCategory, MasterAccount
+from bot.database.read_models import (
+    MasterPageItem, filter_master_ids_for_client, list_active_services, list_client_masters, load_masters_page
+)
 from bot.config import BOT_TOKEN
 from bot.utils.currency import format_price
-from telegram import Bot
+from bot.utils.shared_bot import get_master_bot
+from bot.utils.user_state import BookingState, SearchState, clear_state, get_state, set_state
 import logging
 
 logger = logging.getLogger(__name__)
@@ -36,9 +42,14 @@ logger = logging.getLogger(__name__)
 WAITING_BOOKING_DATE, WAITING_BOOKING_TIME, WAITING_BOOKING_COMMENT = range(3)
 
 
-def _get_client_search_state(context: ContextTypes.DEFAULT_TYPE) -> Dict:
+def _get_client_search_state(context: ContextTypes.DEFAULT_TYPE) -> SearchState:
     """Получить (или инициализировать) состояние поиска мастеров для клиента"""
-    return context.user_data.setdefault('client_search_state', {})
+    return get_state(context.user_data, SearchState) or set_state(context.user_data, SearchState())
+
+
+def _get_booking_state(context: ContextTypes.DEFAULT_TYPE) -> Optional[BookingState]:
+    """Состояние текущей записи клиента (None, если запись не начата или вытеснена по простою)"""
+    return get_state(context.user_data, BookingState)
 
 
 def _build_category_items(session, city_id: int) -> List[Dict]:
@@ -129,23 +140,27 @@ def _compose_categories_markup(city_name: str, city_id: int, category_items: Lis
 def _compose_services_response(context: ContextTypes.DEFAULT_TYPE, category_idx: int):
     """
     Собрать текст и клавиатуру для списка услуг выбранной категории.
-    Обновляет состояние поиска (selected_category_idx, services).
+    Обновляет состояние поиска (category_idx, has_services).
     """
     state = _get_client_search_state(context)
-    categories = state.get('categories') or []
-    city_id = state.get('city_id')
-    city_name = state.get('city_name', 'неизвестный город')
+    city_id = state.city_id
+    city_name = state.city_name or 'неизвестный город'
     
-    if city_id is None or category_idx >= len(categories):
-        raise ValueError("Invalid category index or city not selected")
-    
-    category_item = categories[category_idx]
-    state['selected_category_idx'] = category_idx
-    state['selected_service_idx'] = None
+    if city_id is None:
+        raise ValueError("City not selected")
     
     with get_session() as session:
+        categories = _build_category_items(session, city_id)
+        if category_idx >= len(categories):
+            raise ValueError("Invalid category index")
+        category_item = categories[category_idx]
         service_items = _build_service_items(session, city_id, category_item)
-        state['services'] = service_items
+    
+    state.category_idx = category_idx
+    state.category_title = category_item['title']
+    state.has_services = bool(service_items)
+    state.service_idx = None
+    state.service_title = None
     
     text = f"🔍 <b>{city_name}</b>\n"
     text += f"Категория: <b>{category_item['title']}</b>\n\n"
@@ -242,54 +257,14 @@ def _build_service_items(session, city_id: int, category_item: Dict) -> List[Dic
     return service_items
 
 
-def _filter_masters_for_client(session, master_ids: List[int], user_telegram_id: int) -> List[MasterAccount]:
-    """Отфильтровать мастеров, исключив заблокированных и уже добавленных клиентом"""
-    if not master_ids:
-        return []
-    
-    masters = (
-        session.query(MasterAccount)
-        .filter(
-            MasterAccount.id.in_(master_ids),
-            MasterAccount.is_blocked.is_(False),
-        )
-        .order_by(MasterAccount.name.asc())
-        .all()
-    )
-    
-    if not masters or not user_telegram_id:
-        return masters
-    
-    user = get_or_create_user(session, user_telegram_id)
-    if not user:
-        return masters
-    
-    added_master_ids = {
-        link.master_account_id
-        for link in session.query(UserMaster).filter_by(user_id=user.id).all()
-    }
-    
-    if not added_master_ids:
-        return masters
-    
-    filtered = [master for master in masters if master.id not in added_master_ids]
-    logger.info(
-        f"Filtered masters for user {user_telegram_id}: "
-        f"{len(filtered)} of {len(masters)} remain after excluding already added"
-    )
-    return filtered
-
-
-def _format_masters_list_page(masters_data: List[Dict], page: int = 0, per_page: int = MASTERS_PER_PAGE, display_type: str = 'service') -> tuple[str, List[List[InlineKeyboardButton]], int]:
+def _format_masters_list_page(page_masters: List[MasterPageItem], page: int, total_count: int, per_page: int = MASTERS_PER_PAGE, display_type: str = 'service') -> tuple[str, List[List[InlineKeyboardButton]], int]:
     """
-    Форматирует список мастеров с пагинацией.
+    Форматирует страницу списка мастеров с пагинацией.
+    page_masters: мастера текущей страницы, total_count: сколько мастеров во всем списке
     display_type: 'service', 'category', 'city' - для правильной генерации callback_data пагинации
     Возвращает: (текст, клавиатура, общее количество страниц)
     """
-    total_pages = (len(masters_data) + per_page - 1) // per_page if masters_data else 0
-    start_idx = page * per_page
-    end_idx = start_idx + per_page
-    page_masters = masters_data[start_idx:end_idx]
+    total_pages = (total_count + per_page - 1) // per_page if total_count else 0
     
     text = ""
     keyboard = []
@@ -300,21 +275,19 @@ def _format_masters_list_page(masters_data: List[Dict], page: int = 0, per_page:
         if total_pages > 1:
             text += f"Мастера (страница {page + 1} из {total_pages}):\n\n"
         else:
-            text += f"Мастера ({len(masters_data)}):\n\n"
-        for master_data in page_masters:
+            text += f"Мастера ({total_count}):\n\n"
+        for master in page_masters:
             details = ""
-            if master_data.get('service_info'):
-                price_text = format_price(master_data['service_info']['price'], master_data.get('currency', 'RUB'))
-                details = f" — {price_text}, {master_data['service_info']['duration']} мин"
-            elif master_data.get('price'):
-                price_text = format_price(master_data['price'], master_data.get('currency', 'RUB'))
-                details = f" — {price_text}"
+            if master.price is not None and master.duration is not None:
+                details = f" — {format_price(master.price, master.currency)}, {master.duration} мин"
+            elif master.price:
+                details = f" — {format_price(master.price, master.currency)}"
             
-            label = f"👤 {master_data['name']}"
-            if master_data.get('already_added'):
+            label = f"👤 {master.name}"
+            if master.already_added:
                 label += " • уже в списке"
-            text += f"• {master_data['name']}{details}\n"
-            keyboard.append([InlineKeyboardButton(label, callback_data=f"search_view_master_{master_data['id']}")])
+            text += f"• {master.name}{details}\n"
+            keyboard.append([InlineKeyboardButton(label, callback_data=f"search_view_master_{master.id}")])
         text += "\n"
     
     # Пагинация
@@ -330,6 +303,20 @@ def _format_masters_list_page(masters_data: List[Dict], page: int = 0, per_page:
     return text, keyboard, total_pages
 
 
+def _load_masters_page(session, state: SearchState, page: int, user_telegram_id: int) -> List[MasterPageItem]:
+    """
+    Строки одной страницы текущего списка поиска.
+    В состоянии хранятся только id мастеров (и услуг), имена и цены читаются из БД.
+    """
+    start_idx = page * MASTERS_PER_PAGE
+    page_ids = state.master_ids[start_idx:start_idx + MASTERS_PER_PAGE]
+    service_ids = state.service_ids[start_idx:start_idx + MASTERS_PER_PAGE] if state.display_type == 'service' else ()
+    # Пометка "уже в списке" нужна только для всех мастеров города - в остальных списках добавленные исключены
+    return load_masters_page(
+        session, page_ids, service_ids, user_telegram_id if state.display_type == 'city' else None
+    )
+
+
 async def start_client(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Стартовая команда для клиентского бота"""
     user = update.effective_user
@@ -352,11 +339,9 @@ async def start_client(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     logger.info(f"Payment return for master_id: {master_id}")
                     
                     # Импортируем функции для работы с платежами
-                    from bot.database.db import get_master_by_id, get_payment_by_id
-                    from bot.utils.yookassa_api import get_payment_status
-                    from bot.database.db import update_payment_status, update_master_subscription
+                    from bot.database.db import get_master_by_id
+                    from bot.utils.payments import refresh_payment_status
                     from bot.config import PREMIUM_DURATION_DAYS
-                    from datetime import datetime, timedelta
                     
                     master = get_master_by_id(session, master_id)
                     if not master:
@@ -366,38 +351,24 @@ async def start_client(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         )
                         return
                     
-                    # Ищем последний pending платеж для этого мастера
+                    # Ищем последний платеж этого мастера (webhook мог уже обновить его статус)
                     from bot.database.models import Payment
                     payment = session.query(Payment).filter_by(
-                        master_account_id=master_id,
-                        status='pending'
+                        master_account_id=master_id
                     ).order_by(Payment.created_at.desc()).first()
                     
                     if payment:
-                        # Проверяем статус платежа
-                        payment_data = get_payment_status(payment.payment_id)
-                        if payment_data:
-                            status = payment_data.get('status')
-                            paid = payment_data.get('paid', False)
-                            
-                            if status != payment.status:
-                                paid_at = None
-                                if status == 'succeeded' and paid:
-                                    paid_at = datetime.utcnow()
-                                
-                                update_payment_status(session, payment.payment_id, status, paid_at)
-                                
-                                if status == 'succeeded' and paid:
-                                    expires_at = datetime.utcnow() + timedelta(days=PREMIUM_DURATION_DAYS)
-                                    update_master_subscription(session, master_id, 'premium', expires_at)
-                                    
-                                    await update.message.reply_text(
-                                        "✅ <b>Оплата успешно завершена!</b>\n\n"
-                                        f"⭐ Премиум подписка активирована на {PREMIUM_DURATION_DAYS} дней.\n\n"
-                                        "Спасибо за покупку!",
-                                        parse_mode='HTML'
-                                    )
-                                    return
+                        # Статус обновляется webhook'ом и фоновой сверкой,
+                        # ЮKassa опрашивается только если подошло время проверки
+                        status = await outside_transaction(refresh_payment_status(payment.payment_id))
+                        if status == 'succeeded':
+                            await update.message.reply_text(
+                                "✅ <b>Оплата успешно завершена!</b>\n\n"
+                                f"⭐ Премиум подписка активирована на {PREMIUM_DURATION_DAYS} дней.\n\n"
+                                "Спасибо за покупку!",
+                                parse_mode='HTML'
+                            )
+                            return
                     
                     await update.message.reply_text(
                         "💳 <b>Оплата обрабатывается</b>\n\n"
@@ -466,13 +437,12 @@ async def start_client(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         if master.avatar_url:
                             try:
                                 from bot.config import BOT_TOKEN
-                                from telegram import Bot as TelegramBot
                                 import io
                                 import asyncio
                                 import requests
                                 
                                 # Скачиваем фото профиля через мастер-бот, так как file_id не работает между разными ботами
-                                master_bot = TelegramBot(token=BOT_TOKEN)
+                                master_bot = get_master_bot()
                                 file = await master_bot.get_file(master.avatar_url)
                                 file_path = file.file_path
                                 
@@ -491,7 +461,7 @@ async def start_client(update: Update, context: ContextTypes.DEFAULT_TYPE):
                                     response.raise_for_status()
                                     return response.content
                                 
-                                file_content = await asyncio.to_thread(download_file, file_url)
+                                file_content = await outside_transaction(asyncio.to_thread(download_file, file_url))
                                 photo_data = io.BytesIO(file_content)
                                 photo_data.seek(0)
                                 
@@ -571,14 +541,11 @@ async def client_masters(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.answer()
     user = update.effective_user
     
-    # Извлекаем данные мастеров внутри сессии
-    masters_data = []
-    
     with get_session() as session:
-        client_user = get_or_create_user(session, user.id)
-        links = get_client_masters(session, client_user)
+        masters = list_client_masters(session, user.id)
+        services_by_master = list_active_services(session, [master.id for master in masters])
         
-        if not links:
+        if not masters:
             text = "👥 <b>Мои мастера</b>\n\nУ вас пока нет добавленных мастеров.\n\nПопросите мастера отправить вам QR-код или ссылку для записи!"
             keyboard = [
                 [InlineKeyboardButton("« Назад", callback_data="client_menu")]
@@ -606,31 +573,6 @@ async def client_masters(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     reply_markup=InlineKeyboardMarkup(keyboard)
                 )
             return
-        
-        # Извлекаем данные мастеров внутри сессии
-        for link in links:
-            master = link.master_account
-            services = get_services_by_master(session, master.id, active_only=True)
-            
-            # Формируем список услуг для мастера
-            services_list = []
-            for svc in services:
-                services_list.append({
-                    'title': svc.title,
-                    'price': svc.price,
-                    'duration': svc.duration_mins
-                })
-            
-            masters_data.append({
-                'id': master.id,
-                'name': master.name,
-                'description': master.description or '',
-                'avatar_url': master.avatar_url,
-                'services': services_list,
-                'services_count': len(services_list),
-                'telegram_id': master.telegram_id,
-                'currency': master.currency or 'RUB'
-            })
     
     # Формируем список мастеров с подробной информацией
     text = "👥 <b>Мои мастера</b>\n\n"
@@ -638,13 +580,13 @@ async def client_masters(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Добавляем информацию о каждом мастере
     MAX_MESSAGE_LENGTH = 4000  # Оставляем запас для HTML-тегов
-    for i, master_info in enumerate(masters_data, 1):
-        master_text = f"<b>{i}. 👤 {master_info['name']}</b>\n"
+    for i, master in enumerate(masters, 1):
+        master_text = f"<b>{i}. 👤 {master.name}</b>\n"
         
         # Описание
-        if master_info['description']:
+        if master.description:
             # Ограничиваем длину описания для компактности
-            desc = master_info['description']
+            desc = master.description
             if len(desc) > 100:
                 desc = desc[:97] + "..."
             master_text += f"📝 {desc}\n"
@@ -652,16 +594,16 @@ async def client_masters(update: Update, context: ContextTypes.DEFAULT_TYPE):
             master_text += f"📝 <i>Описание не указано</i>\n"
         
         # Услуги
-        if master_info['services']:
+        services = services_by_master.get(master.id, ())
+        if services:
             from bot.utils.currency import format_price
-            master_currency = master_info.get('currency', 'RUB')
-            master_text += f"💼 <b>Услуги ({master_info['services_count']}):</b>\n"
+            master_text += f"💼 <b>Услуги ({len(services)}):</b>\n"
             # Показываем первые 5 услуг для компактности
-            for svc in master_info['services'][:5]:
-                price_formatted = format_price(svc['price'], master_currency)
-                master_text += f"  • {svc['title']} — {price_formatted} ({svc['duration']} мин)\n"
-            if master_info['services_count'] > 5:
-                master_text += f"  <i>... и еще {master_info['services_count'] - 5}</i>\n"
+            for svc in services[:5]:
+                price_formatted = format_price(svc.price, master.currency)
+                master_text += f"  • {svc.title} — {price_formatted} ({svc.duration} мин)\n"
+            if len(services) > 5:
+                master_text += f"  <i>... и еще {len(services) - 5}</i>\n"
         else:
             master_text += f"💼 <i>Услуги не добавлены</i>\n"
         
@@ -669,18 +611,18 @@ async def client_masters(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         # Проверяем, не превысит ли добавление этого мастера лимит
         if len(text) + len(master_text) > MAX_MESSAGE_LENGTH:
-            text += f"\n<i>... и еще {len(masters_data) - i + 1} мастер(ов)</i>"
+            text += f"\n<i>... и еще {len(masters) - i + 1} мастер(ов)</i>"
             break
         
         text += master_text
     
     keyboard = []
-    for master_info in masters_data:
+    for master in masters:
         # Добавляем кнопку для каждого мастера
         keyboard.append([
             InlineKeyboardButton(
-                f"👤 {master_info['name']}",
-                callback_data=f"view_master_{master_info['id']}"
+                f"👤 {master.name}",
+                callback_data=f"view_master_{master.id}"
             )
         ])
     
@@ -816,13 +758,12 @@ async def view_master(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if master_avatar:
         try:
             from bot.config import BOT_TOKEN
-            from telegram import Bot as TelegramBot
             import io
             import asyncio
             import requests
             
             # Скачиваем фото профиля через мастер-бот, так как file_id не работает между разными ботами
-            master_bot = TelegramBot(token=BOT_TOKEN)
+            master_bot = get_master_bot()
             file = await master_bot.get_file(master_avatar)
             file_path = file.file_path
             
@@ -841,7 +782,7 @@ async def view_master(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 response.raise_for_status()
                 return response.content
             
-            file_content = await asyncio.to_thread(download_file, file_url)
+            file_content = await outside_transaction(asyncio.to_thread(download_file, file_url))
             photo_to_send = io.BytesIO(file_content)
             photo_to_send.seek(0)
         except Exception as e:
@@ -1039,9 +980,7 @@ async def select_service(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     # Очищаем старые данные бронирования, если они есть (для повторных записей)
-    booking_keys = [k for k in list(context.user_data.keys()) if k.startswith('booking_')]
-    for key in booking_keys:
-        del context.user_data[key]
+    clear_state(context.user_data, BookingState)
     
     # Принудительно завершаем предыдущий разговор, если он активен
     # Это позволяет перезапустить ConversationHandler для новой записи
@@ -1085,11 +1024,13 @@ async def select_service(update: Update, context: ContextTypes.DEFAULT_TYPE):
         master = service.master_account
         
         # Сохраняем данные в контексте
-        context.user_data['booking_service_id'] = service_id
-        context.user_data['booking_master_id'] = master.id
-        context.user_data['booking_duration'] = service.duration_mins
-        context.user_data['booking_price'] = service.price
-        context.user_data['booking_cooling'] = service.cooling_period_mins or 0
+        booking = set_state(context.user_data, BookingState(
+            service_id=service_id,
+            master_id=master.id,
+            duration=service.duration_mins,
+            price=service.price,
+            cooling=service.cooling_period_mins or 0,
+        ))
         
         # Получаем портфолио услуги
         portfolio_photos = get_portfolio_photos(session, service_id)
@@ -1149,10 +1090,10 @@ async def select_service(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return ConversationHandler.END
         
         # Сохраняем все доступные даты в контексте для пагинации
-        context.user_data['booking_available_dates'] = [d.isoformat() for d in available_dates]
-        context.user_data['booking_date_page'] = 0  # Начинаем с первой страницы
+        booking.available_dates = tuple(available_dates)
+        booking.date_page = 0  # Начинаем с первой страницы
         # Сохраняем портфолио в контексте для использования при пагинации
-        context.user_data['booking_portfolio_photos'] = [p.id for p in portfolio_photos] if portfolio_photos else []
+        booking.portfolio_photo_ids = tuple(p.id for p in portfolio_photos) if portfolio_photos else ()
         
         # Показываем первую страницу (7 дней) с портфолио
         # Передаем только service_id, так как объекты service и master отсоединены от сессии
@@ -1173,7 +1114,7 @@ async def _send_service_selection_with_portfolio(query, context, text, keyboard,
     if portfolio_photos and len(portfolio_photos) > 0:
         try:
             from bot.config import BOT_TOKEN
-            from telegram import Bot as TelegramBot, InputMediaPhoto
+            from telegram import InputMediaPhoto
             import io
             import asyncio
             import requests
@@ -1185,7 +1126,7 @@ async def _send_service_selection_with_portfolio(query, context, text, keyboard,
                     photo_file_id = photo.file_id
                     
                     # Скачиваем фото через мастер-бот
-                    master_bot = TelegramBot(token=BOT_TOKEN)
+                    master_bot = get_master_bot()
                     file = await master_bot.get_file(photo_file_id)
                     file_path = file.file_path
                     
@@ -1204,7 +1145,7 @@ async def _send_service_selection_with_portfolio(query, context, text, keyboard,
                         response.raise_for_status()
                         return response.content
                     
-                    file_content = await asyncio.to_thread(download_file, file_url)
+                    file_content = await outside_transaction(asyncio.to_thread(download_file, file_url))
                     photo_data = io.BytesIO(file_content)
                     photo_data.seek(0)
                     
@@ -1255,8 +1196,8 @@ async def _send_service_selection_with_portfolio(query, context, text, keyboard,
 
 async def _show_date_page(query, context, service_id: int, page: int, portfolio_photos=None):
     """Показать страницу с датами (7 дней в столбик)"""
-    available_dates_str = context.user_data.get('booking_available_dates', [])
-    available_dates = [datetime.strptime(d, '%Y-%m-%d').date() for d in available_dates_str]
+    booking = _get_booking_state(context)
+    available_dates = booking.available_dates if booking else ()
     
     if not available_dates:
         await query.message.edit_text("❌ Нет доступных дат")
@@ -1271,7 +1212,7 @@ async def _show_date_page(query, context, service_id: int, page: int, portfolio_
     if page >= total_pages:
         page = total_pages - 1
     
-    context.user_data['booking_date_page'] = page
+    booking.date_page = page
     
     # Берем 7 дней для текущей страницы
     start_idx = page * 7
@@ -1364,7 +1305,7 @@ async def _show_date_page(query, context, service_id: int, page: int, portfolio_
         
         try:
             from bot.config import BOT_TOKEN
-            from telegram import Bot as TelegramBot, InputMediaPhoto
+            from telegram import InputMediaPhoto
             import io
             import asyncio
             import requests
@@ -1376,7 +1317,7 @@ async def _show_date_page(query, context, service_id: int, page: int, portfolio_
                     photo_file_id = photo.file_id
                     
                     # Скачиваем фото через мастер-бот
-                    master_bot = TelegramBot(token=BOT_TOKEN)
+                    master_bot = get_master_bot()
                     file = await master_bot.get_file(photo_file_id)
                     file_path = file.file_path
                     
@@ -1395,7 +1336,7 @@ async def _show_date_page(query, context, service_id: int, page: int, portfolio_
                         response.raise_for_status()
                         return response.content
                     
-                    file_content = await asyncio.to_thread(download_file, file_url)
+                    file_content = await outside_transaction(asyncio.to_thread(download_file, file_url))
                     photo_data = io.BytesIO(file_content)
                     photo_data.seek(0)
                     
@@ -1467,18 +1408,18 @@ async def select_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if query.data.startswith('date_page_'):
         # Это пагинация
         page = int(query.data.split('_')[2])
-        service_id = context.user_data.get('booking_service_id')
-        master_id = context.user_data.get('booking_master_id')
+        booking = _get_booking_state(context)
         
-        if not service_id or not master_id:
+        if booking is None:
             await query.message.edit_text("❌ Ошибка: данные бронирования не найдены")
             return ConversationHandler.END
+        service_id = booking.service_id
         
         with get_session() as session:
             # Загружаем портфолио из контекста (только для первой страницы)
             portfolio_photos = None
             if page == 0:
-                portfolio_photo_ids = context.user_data.get('booking_portfolio_photos', [])
+                portfolio_photo_ids = booking.portfolio_photo_ids
                 if portfolio_photo_ids:
                     from bot.database.models import Portfolio
                     portfolio_photos = session.query(Portfolio).filter(
@@ -1494,15 +1435,16 @@ async def select_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
     selected_date = datetime.strptime(date_str, '%Y-%m-%d').date()
     user = update.effective_user
     
-    service_id = context.user_data.get('booking_service_id')
-    master_id = context.user_data.get('booking_master_id')
-    duration = context.user_data.get('booking_duration')
-    cooling = context.user_data.get('booking_cooling')
-    
-    if not all([service_id, master_id, duration]):
+    booking = _get_booking_state(context)
+    if booking is None:
         await query.message.edit_text("❌ Ошибка: данные бронирования не найдены")
         return ConversationHandler.END
     
+    service_id = booking.service_id
+    master_id = booking.master_id
+    duration = booking.duration
+    cooling = booking.cooling
+    
     with get_session() as session:
         # Получаем данные услуги внутри сессии
         service_obj = session.query(Service).filter_by(id=service_id).first()
@@ -1541,8 +1483,8 @@ async def select_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     available_dates.append(check_date)
             
             # Сохраняем даты в контексте
-            context.user_data['booking_available_dates'] = [d.isoformat() for d in available_dates]
-            current_page = context.user_data.get('booking_date_page', 0)
+            booking.available_dates = tuple(available_dates)
+            current_page = booking.date_page
             
             # Показываем текущую страницу
             # Передаем только service_id, так как объекты service и master отсоединены от сессии
@@ -1550,7 +1492,7 @@ async def select_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return WAITING_BOOKING_DATE
         
         # Сохраняем выбранную дату
-        context.user_data['booking_date'] = selected_date.isoformat()
+        booking.selected_date = selected_date
         
         # Формируем текст и кнопки со временем
         weekdays = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
@@ -1596,18 +1538,18 @@ async def select_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Получаем время из callback_data: select_time_14:00
     time_str = query.data.split('_')[2]  # 14:00
     
-    service_id = context.user_data.get('booking_service_id')
-    master_id = context.user_data.get('booking_master_id')
-    duration = context.user_data.get('booking_duration')
-    price = context.user_data.get('booking_price')
-    date_str = context.user_data.get('booking_date')
-    
-    if not all([service_id, master_id, duration, price, date_str]):
+    booking = _get_booking_state(context)
+    if booking is None or booking.selected_date is None:
         await query.message.edit_text("❌ Ошибка: данные бронирования не найдены")
         return ConversationHandler.END
     
-    # Парсим дату и время
-    selected_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+    service_id = booking.service_id
+    master_id = booking.master_id
+    duration = booking.duration
+    price = booking.price
+    
+    # Парсим время
+    selected_date = booking.selected_date
     from datetime import time as dt_time
     time_parts = time_str.split(':')
     start_time = datetime.combine(selected_date, dt_time(
@@ -1618,8 +1560,8 @@ async def select_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
     end_time = start_time + timedelta(minutes=duration)
     
     # Сохраняем время
-    context.user_data['booking_start_dt'] = start_time.isoformat()
-    context.user_data['booking_end_dt'] = end_time.isoformat()
+    booking.start_dt = start_time
+    booking.end_dt = end_time
     
     with get_session() as session:
         # Получаем данные услуги и мастера внутри сессии
@@ -1654,7 +1596,7 @@ async def select_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 master_id,
                 selected_date,
                 duration,
-                context.user_data.get('booking_cooling', 0),
+                booking.cooling,
                 min_time_from_now=60
             )
             
@@ -1736,7 +1678,9 @@ async def receive_comment(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return WAITING_BOOKING_COMMENT
     
-    context.user_data['booking_comment'] = comment
+    booking = _get_booking_state(context)
+    if booking is not None:
+        booking.comment = comment
     
     # Показываем подтверждение с комментарием
     await show_booking_confirmation(update, context, comment)
@@ -1749,7 +1693,9 @@ async def skip_comment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    context.user_data['booking_comment'] = ''
+    booking = _get_booking_state(context)
+    if booking is not None:
+        booking.comment = ''
     await show_booking_confirmation(update, context, '')
     
     return WAITING_BOOKING_COMMENT
@@ -1757,19 +1703,15 @@ async def skip_comment(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def show_booking_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE, comment: str = ''):
     """Показать финальное подтверждение"""
-    service_id = context.user_data.get('booking_service_id')
-    master_id = context.user_data.get('booking_master_id')
-    price = context.user_data.get('booking_price')
-    date_str = context.user_data.get('booking_date')
-    start_dt_str = context.user_data.get('booking_start_dt')
-    end_dt_str = context.user_data.get('booking_end_dt')
-    
-    if not all([service_id, master_id, price, date_str, start_dt_str, end_dt_str]):
+    booking = _get_booking_state(context)
+    if booking is None or not all([booking.selected_date, booking.start_dt, booking.end_dt]):
         return
     
-    selected_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-    start_dt = datetime.fromisoformat(start_dt_str)
-    end_dt = datetime.fromisoformat(end_dt_str)
+    service_id = booking.service_id
+    price = booking.price
+    selected_date = booking.selected_date
+    start_dt = booking.start_dt
+    end_dt = booking.end_dt
     
     weekdays = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
     
@@ -1815,47 +1757,25 @@ async def show_booking_confirmation(update: Update, context: ContextTypes.DEFAUL
             )
 
 
-async def notify_master_about_booking(master_telegram_id: int, client_name: str, service_title: str, 
-                                       start_dt: datetime, price: float, comment: str = ''):
-    """Отправить уведомление мастеру о новой записи"""
-    try:
-        if not BOT_TOKEN:
-            logger.warning("BOT_TOKEN не установлен, невозможно отправить уведомление мастеру")
-            return
-        
-        bot = Bot(token=BOT_TOKEN)
-        
-        from bot.utils.currency import format_price
-        
-        # Получаем валюту мастера
-        with get_session() as session:
-            from bot.database.models import MasterAccount
-            master_obj = session.query(MasterAccount).filter_by(telegram_id=master_telegram_id).first()
-            master_currency = master_obj.currency if master_obj else 'RUB'
-        
-        price_formatted = format_price(price, master_currency)
-        
-        weekdays = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
-        
-        text = f"""🔔 <b>Новая запись!</b>
+def format_master_booking_notification(client_name: str, service_title: str, start_dt: datetime,
+                                       price: float, currency: str, comment: str = '') -> str:
+    """Текст уведомления мастеру о новой записи"""
+    price_formatted = format_price(price, currency)
+    
+    weekdays = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
+    
+    text = f"""🔔 <b>Новая запись!</b>
 
 👤 Клиент: <b>{client_name}</b>
 💼 Услуга: {service_title}
 📅 Дата и время: {start_dt.strftime('%d.%m.%Y %H:%M')} ({weekdays[start_dt.weekday()]})
 💰 Цена: {price_formatted}"""
-        
-        if comment:
-            text += f"\n📝 Комментарий: {comment}"
-        
-        text += "\n\nПроверьте раздел \"📋 Записи\" для просмотра всех записей."
-        
-        await bot.send_message(
-            chat_id=master_telegram_id,
-            text=text,
-            parse_mode='HTML'
-        )
-    except Exception as e:
-        logger.error(f"Ошибка при отправке уведомления мастеру {master_telegram_id}: {e}", exc_info=True)
+    
+    if comment:
+        text += f"\n📝 Комментарий: {comment}"
+    
+    text += "\n\nПроверьте раздел \"📋 Записи\" для просмотра всех записей."
+    return text
 
 
 async def confirm_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1865,12 +1785,17 @@ async def confirm_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     user = update.effective_user
     
-    service_id = context.user_data.get('booking_service_id')
-    master_id = context.user_data.get('booking_master_id')
-    price = context.user_data.get('booking_price')
-    start_dt_str = context.user_data.get('booking_start_dt')
-    end_dt_str = context.user_data.get('booking_end_dt')
-    comment = context.user_data.get('booking_comment', '')
+    booking = _get_booking_state(context)
+    if booking is None or booking.start_dt is None or booking.end_dt is None:
+        await query.message.edit_text("❌ Ошибка: данные бронирования не найдены")
+        return ConversationHandler.END
+    
+    service_id = booking.service_id
+    master_id = booking.master_id
+    price = booking.price
+    start_dt = booking.start_dt
+    end_dt = booking.end_dt
+    comment = booking.comment
     
     # Проверяем, что цена больше 0
     if price is None or price <= 0:
@@ -1882,14 +1807,6 @@ async def confirm_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return ConversationHandler.END
     
-    if not all([service_id, master_id, price, start_dt_str, end_dt_str]):
-        await query.message.edit_text("❌ Ошибка: данные бронирования не найдены")
-        return ConversationHandler.END
-    
-    start_dt = datetime.fromisoformat(start_dt_str)
-    end_dt = datetime.fromisoformat(end_dt_str)
-    
-    master_telegram_id = None
     client_name = user.full_name or user.first_name or "Клиент"
     
     with get_session() as session:
@@ -1905,14 +1822,33 @@ async def confirm_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return ConversationHandler.END
         
-        # Получаем telegram_id мастера для уведомления
-        from bot.database.models import MasterAccount
         master = session.query(MasterAccount).filter_by(id=master_id).first()
-        if master:
-            master_telegram_id = master.telegram_id
         
         service = session.query(Service).filter_by(id=service_id).first()
         
+        # Уведомление мастеру ставим в очередь в той же транзакции, что и запись:
+        # его доставит воркер мастер-бота, ответ клиенту не ждет отправки.
+        # В режиме сводки уведомление ждет отправки сводки за час или за день
+        if master:
+            from bot.utils.digest import get_digest_release_time, format_booking_digest_line
+            hold_until = get_digest_release_time(master.notification_mode)
+            if hold_until:
+                notification_text = format_booking_digest_line(
+                    client_name, service.title, start_dt, price, master.currency or 'RUB'
+                )
+            else:
+                notification_text = format_master_booking_notification(
+                    client_name, service.title, start_dt, price, master.currency or 'RUB', comment
+                )
+            enqueue_notification(
+                session,
+                master.telegram_id,
+                notification_text,
+                kind='new_booking',
+                master_id=master.id,
+                hold_until=hold_until
+            )
+        
         # Создаем бронирование
         booking = create_booking(
             session,
@@ -1958,17 +1894,6 @@ async def confirm_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
     
-    # Отправляем уведомление мастеру асинхронно (после закрытия сессии)
-    if master_telegram_id:
-        await notify_master_about_booking(
-            master_telegram_id,
-            client_name,
-            service_title,
-            start_dt,
-            price,
-            comment
-        )
-    
     return ConversationHandler.END
 
 
@@ -2000,6 +1925,12 @@ async def cancel_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return ConversationHandler.END
 
 
+async def booking_timeout(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Запись не завершена за CONVERSATION_TIMEOUT - забываем выбранные услугу и время"""
+    clear_state(context.user_data, BookingState)
+    logger.info(f"Booking conversation of user {update.effective_user.id if update.effective_user else None} timed out")
+
+
 async def client_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать записи клиента"""
     query = update.callback_query
@@ -2049,10 +1980,9 @@ async def client_settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     
     with get_session() as session:
-        client_user = get_or_create_user(session, user.id)
-        links = get_client_masters(session, client_user)
+        masters = list_client_masters(session, user.id)
         
-        if not links:
+        if not masters:
             text = "⚙️ <b>Настройки</b>\n\n"
             text += "У вас пока нет добавленных мастеров."
             
@@ -2065,8 +1995,7 @@ async def client_settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
             text += "Выберите мастера для удаления из вашего списка:\n\n"
             
             keyboard = []
-            for link in links:
-                master = link.master_account
+            for master in masters:
                 keyboard.append([
                     InlineKeyboardButton(
                         f"🗑 {master.name}",
@@ -2210,7 +2139,7 @@ async def client_invite_master(update: Update, context: ContextTypes.DEFAULT_TYP
     master_bot_username = None
     try:
         if BOT_TOKEN:
-            master_bot = Bot(token=BOT_TOKEN)
+            master_bot = get_master_bot()
             bot_info = await master_bot.get_me()
             master_bot_username = bot_info.username
     except Exception as e:
@@ -2281,7 +2210,7 @@ async def client_copy_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
     master_bot_username = None
     try:
         if BOT_TOKEN:
-            master_bot = Bot(token=BOT_TOKEN)
+            master_bot = get_master_bot()
             bot_info = await master_bot.get_me()
             master_bot_username = bot_info.username
     except Exception as e:
@@ -2341,8 +2270,7 @@ async def client_search_masters(update: Update, context: ContextTypes.DEFAULT_TY
         await query.answer()
     
     # Сбрасываем состояние поиска при новом запросе
-    state = _get_client_search_state(context)
-    state.clear()
+    set_state(context.user_data, SearchState())
     
     user = update.effective_user
     
@@ -2424,9 +2352,7 @@ async def client_search_city_masters(update: Update, context: ContextTypes.DEFAU
     await query.answer()
     
     city_id = int(query.data.split('_')[2])
-    state = _get_client_search_state(context)
-    state.clear()
-    state['city_id'] = city_id
+    state = set_state(context.user_data, SearchState(city_id=city_id))
     
     with get_session() as session:
         from bot.database.models import City, MasterAccount
@@ -2441,12 +2367,9 @@ async def client_search_city_masters(update: Update, context: ContextTypes.DEFAU
             )
             return
         
-        state['city_name'] = city.name_ru
+        state.city_name = city.name_ru
         
         category_items = _build_category_items(session, city_id)
-        state['categories'] = category_items
-        state['selected_category_idx'] = None
-        state['selected_service_idx'] = None
         
         total_masters = session.query(MasterAccount).filter_by(city_id=city_id, is_blocked=False).count()
         logger.info(
@@ -2489,7 +2412,7 @@ async def client_search_categories_back(update: Update, context: ContextTypes.DE
     await query.answer()
     
     state = _get_client_search_state(context)
-    city_id = state.get('city_id')
+    city_id = state.city_id
     if city_id is None:
         await query.message.edit_text(
             "ℹ️ Пожалуйста, выберите город заново.",
@@ -2498,28 +2421,19 @@ async def client_search_categories_back(update: Update, context: ContextTypes.DE
         return
     
     # Очищаем временные данные пагинации
-    state.pop('current_masters_list', None)
-    state.pop('current_display_type', None)
-    state.pop('current_category_idx', None)
-    state.pop('current_service_idx', None)
-    state.pop('selected_service_idx', None)
-    state.pop('current_total_master_ids', None)
-    state.pop('current_total_city_masters', None)
-    state.pop('current_total_category_masters', None)
-    state.pop('current_page', None)
-    
-    categories = state.get('categories')
-    city_name = state.get('city_name')
+    state.reset_list()
+    state.service_idx = None
+    state.service_title = None
+    
+    city_name = state.city_name
     
     with get_session() as session:
         from bot.database.models import City, MasterAccount
-        if categories is None:
-            categories = _build_category_items(session, city_id)
-            state['categories'] = categories
+        categories = _build_category_items(session, city_id)
         if city_name is None:
             city = session.query(City).filter_by(id=city_id).first()
             city_name = city.name_ru if city else "неизвестный город"
-            state['city_name'] = city_name
+            state.city_name = city_name
         total_masters = session.query(MasterAccount).filter_by(city_id=city_id, is_blocked=False).count()
     
     if not categories:
@@ -2580,8 +2494,7 @@ async def client_search_services_back(update: Update, context: ContextTypes.DEFA
     await query.answer()
     
     state = _get_client_search_state(context)
-    # Используем current_category_idx если есть, иначе selected_category_idx
-    selected_category_idx = state.get('current_category_idx') or state.get('selected_category_idx')
+    selected_category_idx = state.category_idx
     if selected_category_idx is None:
         await client_search_categories_back(update, context)
         return
@@ -2589,14 +2502,7 @@ async def client_search_services_back(update: Update, context: ContextTypes.DEFA
     try:
         text, markup = _compose_services_response(context, selected_category_idx)
         # Очищаем временные данные пагинации
-        state.pop('current_masters_list', None)
-        state.pop('current_display_type', None)
-        state.pop('current_category_idx', None)
-        state.pop('current_service_idx', None)
-        state.pop('current_total_master_ids', None)
-        state.pop('current_total_category_masters', None)
-        state.pop('current_total_city_masters', None)
-        state.pop('current_page', None)
+        state.reset_list()
     except ValueError:
         await query.message.edit_text(
             "ℹ️ Данные устарели. Пожалуйста, начните поиск заново.",
@@ -2617,78 +2523,58 @@ async def client_search_category_all(update: Update, context: ContextTypes.DEFAU
     await query.answer()
     
     state = _get_client_search_state(context)
+    user = update.effective_user
     
-    # Проверяем, это выбор категории или пагинация
-    if query.data.startswith('masters_page_category_'):
-        # Пагинация для категории
-        page = int(query.data.split('_')[3])
-        masters_data = state.get('current_masters_list', [])
-        display_type = 'category'
-    else:
-        # Выбор "Все мастера категории"
-        selected_category_idx = state.get('selected_category_idx')
-        if selected_category_idx is None:
-            await client_search_categories_back(update, context)
-            return
-        
-        categories = state.get('categories') or []
-        if selected_category_idx >= len(categories):
-            await client_search_categories_back(update, context)
-            return
-        
-        category_item = categories[selected_category_idx]
-        city_id = state.get('city_id')
-        user = update.effective_user
-        page = 0
-        
-        with get_session() as session:
-            masters = _filter_masters_for_client(session, category_item['master_ids'], user.id)
-            total_in_category = len(category_item['master_ids'])
+    with get_session() as session:
+        # Проверяем, это выбор категории или пагинация
+        if query.data.startswith('masters_page_category_'):
+            # Пагинация для категории
+            page = int(query.data.split('_')[3])
+        else:
+            # Выбор "Все мастера категории"
+            selected_category_idx = state.category_idx
+            categories = _build_category_items(session, state.city_id) if state.city_id is not None else []
+            if selected_category_idx is None or selected_category_idx >= len(categories):
+                await client_search_categories_back(update, context)
+                return
             
-            # Извлекаем данные мастеров внутри сессии
-            masters_data = []
-            for master in masters:
-                masters_data.append({
-                    "id": master.id,
-                    "name": master.name,
-                    "currency": master.currency or 'RUB'
-                })
-        
-        # Сохраняем список мастеров для пагинации
-        state['current_masters_list'] = masters_data
-        state['current_display_type'] = 'category'
-        state['current_category_idx'] = selected_category_idx
-        state['current_total_category_masters'] = total_in_category
-        display_type = 'category'
+            category_item = categories[selected_category_idx]
+            page = 0
+            master_ids = filter_master_ids_for_client(session, category_item['master_ids'], user.id)
+            
+            # Сохраняем для пагинации только id мастеров
+            state.reset_list()
+            state.display_type = 'category'
+            state.master_ids = tuple(master_ids)
+            state.total = len(category_item['master_ids'])
+        
+        state.page = page
+        masters_data = _load_masters_page(session, state, page, user.id)
     
     # Формируем текст и клавиатуру
-    city_name = state.get('city_name', 'неизвестный город')
-    categories = state.get('categories') or []
-    selected_category_idx = state.get('current_category_idx') or state.get('selected_category_idx')
-    total_in_category = state.get('current_total_category_masters', 0)
-    
-    if selected_category_idx is not None and selected_category_idx < len(categories):
-        category_item = categories[selected_category_idx]
+    city_name = state.city_name or 'неизвестный город'
+    if state.category_title:
         text = f"🔍 <b>{city_name}</b>\n"
-        text += f"Категория: <b>{category_item['title']}</b>\n\n"
+        text += f"Категория: <b>{state.category_title}</b>\n\n"
     else:
         text = f"🔍 <b>{city_name}</b>\n\n"
     
-    state['current_page'] = page
     keyboard = []
     
     if not masters_data:
-        if total_in_category == 0:
+        if state.total == 0:
             text += "❌ Пока нет мастеров в этой категории.\n\n"
         else:
             text += "✅ Все мастера из этой категории уже есть в вашем списке.\n\n"
     else:
-        page_text, page_keyboard, total_pages = _format_masters_list_page(masters_data, page, MASTERS_PER_PAGE, display_type)
+        page_text, page_keyboard, total_pages = _format_masters_list_page(
+            masters_data, page, len(state.master_ids), MASTERS_PER_PAGE, 'category'
+        )
         text += page_text
         keyboard = page_keyboard
     
     # Кнопка назад - только "Назад к услугам" (если есть услуги) или "Назад к категориям"
-    if state.get('services'):
+    if state.has_services:
         keyboard.append([InlineKeyboardButton("« Назад к услугам", callback_data="search_services_back")])
     else:
         keyboard.append([InlineKeyboardButton("« Назад к категориям", callback_data="search_categories_back")])
@@ -2706,95 +2592,70 @@ async def client_search_service_masters(update: Update, context: ContextTypes.DE
     await query.answer()
     
     state = _get_client_search_state(context)
+    user = update.effective_user
     
-    # Проверяем, это выбор услуги или пагинация
-    if query.data.startswith('masters_page_service_'):
-        # Пагинация для услуги
-        page = int(query.data.split('_')[3])
-        masters_data = state.get('current_masters_list', [])
-        display_type = 'service'
-    else:
-        # Выбор услуги
-        parts = query.data.split('_')
-        service_idx = int(parts[-1])
-        page = 0
-        
-        services = state.get('services') or []
-        categories = state.get('categories') or []
-        selected_category_idx = state.get('selected_category_idx')
-        city_id = state.get('city_id')
-        user = update.effective_user
-        
-        if (
-            city_id is None
-            or selected_category_idx is None
-            or selected_category_idx >= len(categories)
-            or service_idx >= len(services)
-        ):
-            await query.message.edit_text(
-                "ℹ️ Данные устарели. Пожалуйста, начните поиск заново.",
-                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("« К городам", callback_data="client_search_masters")]])
-            )
-            return
-        
-        category_item = categories[selected_category_idx]
-        service_item = services[service_idx]
-        state['selected_service_idx'] = service_idx
-        
-        with get_session() as session:
-            masters = _filter_masters_for_client(session, service_item['master_ids'], user.id)
-            total_master_ids = len(service_item['master_ids'])
+    with get_session() as session:
+        # Проверяем, это выбор услуги или пагинация
+        if query.data.startswith('masters_page_service_'):
+            # Пагинация для услуги
+            page = int(query.data.split('_')[3])
+        else:
+            # Выбор услуги
+            parts = query.data.split('_')
+            service_idx = int(parts[-1])
+            page = 0
             
-            # Загружаем все необходимые данные мастеров внутри сессии
-            masters_data = []
-            for master in masters:
-                service_info = service_item['master_services'].get(master.id)
-                master_data = {
-                    "id": master.id,
-                    "name": master.name,
-                    "currency": master.currency or 'RUB',
-                    "service_info": service_info
-                }
-                masters_data.append(master_data)
-        
-        # Сохраняем список мастеров для пагинации
-        state['current_masters_list'] = masters_data
-        state['current_display_type'] = 'service'
-        state['current_service_idx'] = service_idx
-        state['current_category_idx'] = selected_category_idx
-        state['current_total_master_ids'] = total_master_ids
-        display_type = 'service'
+            selected_category_idx = state.category_idx
+            categories = _build_category_items(session, state.city_id) if state.city_id is not None else []
+            services = []
+            if selected_category_idx is not None and selected_category_idx < len(categories):
+                services = _build_service_items(session, state.city_id, categories[selected_category_idx])
+            
+            if service_idx >= len(services):
+                await query.message.edit_text(
+                    "ℹ️ Данные устарели. Пожалуйста, начните поиск заново.",
+                    reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("« К городам", callback_data="client_search_masters")]])
+                )
+                return
+            
+            service_item = services[service_idx]
+            master_ids = filter_master_ids_for_client(session, service_item['master_ids'], user.id)
+            
+            # Сохраняем для пагинации только id мастеров и их услуг
+            state.reset_list()
+            state.service_idx = service_idx
+            state.service_title = service_item['title']
+            state.display_type = 'service'
+            state.master_ids = tuple(master_ids)
+            state.service_ids = tuple(service_item['master_services'][master_id]['service_id'] for master_id in master_ids)
+            state.total = len(service_item['master_ids'])
+        
+        state.page = page
+        masters_data = _load_masters_page(session, state, page, user.id)
     
     # Формируем текст и клавиатуру
-    city_name = state.get('city_name', 'неизвестный город')
-    categories = state.get('categories') or []
-    services = state.get('services') or []
-    selected_category_idx = state.get('current_category_idx') or state.get('selected_category_idx')
-    service_idx = state.get('current_service_idx') or state.get('selected_service_idx')
-    total_master_ids = state.get('current_total_master_ids', 0)
-    
-    if selected_category_idx is not None and selected_category_idx < len(categories):
-        category_item = categories[selected_category_idx]
+    city_name = state.city_name or 'неизвестный город'
+    if state.category_title:
         text = f"🔍 <b>{city_name}</b>\n"
-        text += f"Категория: <b>{category_item['title']}</b>\n"
-        if service_idx is not None and service_idx < len(services):
-            service_item = services[service_idx]
-            text += f"Услуга: <b>{service_item['title']}</b>\n\n"
+        text += f"Категория: <b>{state.category_title}</b>\n"
+        if state.service_title:
+            text += f"Услуга: <b>{state.service_title}</b>\n\n"
         else:
             text += "\n"
     else:
         text = f"🔍 <b>{city_name}</b>\n\n"
     
-    state['current_page'] = page
     keyboard = []
     
     if not masters_data:
-        if total_master_ids == 0:
+        if state.total == 0:
             text += "❌ Пока нет мастеров, предлагающих эту услугу.\n\n"
         else:
             text += "✅ Все мастера с этой услугой уже есть в вашем списке.\n\n"
     else:
-        page_text, page_keyboard, total_pages = _format_masters_list_page(masters_data, page, MASTERS_PER_PAGE, display_type)
+        page_text, page_keyboard, total_pages = _format_masters_list_page(
+            masters_data, page, len(state.master_ids), MASTERS_PER_PAGE, 'service'
+        )
         text += page_text
         keyboard = page_keyboard
     
@@ -2813,28 +2674,21 @@ async def client_search_city_all_masters(update: Update, context: ContextTypes.D
     query = update.callback_query
     await query.answer()
     
-    # Проверяем, это выбор "Все мастера города" или пагинация
-    if query.data.startswith('masters_page_city_'):
-        # Пагинация для города
-        page = int(query.data.split('_')[3])
-        state = _get_client_search_state(context)
-        masters_data = state.get('current_masters_list', [])
-        city_id = state.get('city_id')
-        display_type = state.get('current_display_type', 'city')
-        if not masters_data:
+    state = _get_client_search_state(context)
+    user = update.effective_user
+    
+    with get_session() as session:
+        # Проверяем, это выбор "Все мастера города" или пагинация
+        if query.data.startswith('masters_page_city_'):
+            # Пагинация для города
+            page = int(query.data.split('_')[3])
+            if not state.master_ids:
+                page = 0
+        else:
+            # Выбор "Все мастера города"
+            city_id = int(query.data.split('_')[3])
             page = 0
-            display_type = 'city'
-    else:
-        # Выбор "Все мастера города"
-        city_id = int(query.data.split('_')[3])
-        user = update.effective_user
-        state = _get_client_search_state(context)
-        state['city_id'] = city_id
-        state['selected_category_idx'] = None
-        state['selected_service_idx'] = None
-        page = 0
-        
-        with get_session() as session:
+            
             from bot.database.models import City
             city = session.query(City).filter_by(id=city_id).first()
             if not city:
@@ -2844,62 +2698,50 @@ async def client_search_city_all_masters(update: Update, context: ContextTypes.D
                 )
                 return
             
-            masters = (
-                session.query(MasterAccount)
+            master_ids = [
+                master_id
+                for master_id, in session.query(MasterAccount.id)
                 .filter_by(city_id=city_id, is_blocked=False)
                 .order_by(MasterAccount.name.asc())
                 .all()
-            )
-            total_in_city = len(masters)
-            
-            client_user = get_or_create_user(session, user.id)
-            existing_ids = set()
-            if client_user:
-                existing_ids = {
-                    link.master_account_id
-                    for link in session.query(UserMaster).filter_by(user_id=client_user.id).all()
-                }
-            
-            masters_data = [
-                {
-                    "id": master.id,
-                    "name": master.name,
-                    "already_added": master.id in existing_ids,
-                    "currency": master.currency or 'RUB'
-                }
-                for master in masters
             ]
-            city_name = city.name_ru
-            state['city_name'] = city_name
-        
-        # Сохраняем список мастеров для пагинации
-        state['current_masters_list'] = masters_data
-        state['current_display_type'] = 'city'
-        state['current_total_city_masters'] = total_in_city
-        display_type = 'city'
-    total_in_city = state.get('current_total_city_masters', len(masters_data))
+            
+            # Сохраняем для пагинации только id мастеров
+            state.city_id = city_id
+            state.city_name = city.name_ru
+            state.category_idx = None
+            state.category_title = None
+            state.has_services = False
+            state.service_idx = None
+            state.service_title = None
+            state.reset_list()
+            state.display_type = 'city'
+            state.master_ids = tuple(master_ids)
+            state.total = len(master_ids)
+        
+        state.page = page
+        masters_data = _load_masters_page(session, state, page, user.id)
     
     # Формируем текст и клавиатуру
-    state = _get_client_search_state(context)
-    city_name = state.get('city_name', 'неизвестный город')
+    city_name = state.city_name or 'неизвестный город'
     text = f"🔍 <b>{city_name}</b>\n\n"
     
     keyboard = []
     
-    state['current_page'] = page
-
     if not masters_data:
-        if total_in_city == 0:
+        if state.total == 0:
             text += "❌ В этом городе пока нет мастеров.\n\n"
         else:
             text += "✅ Все мастера этого города уже есть в вашем списке.\n\n"
     else:
-        page_text, page_keyboard, total_pages = _format_masters_list_page(masters_data, page, MASTERS_PER_PAGE, display_type)
+        page_text, page_keyboard, total_pages = _format_masters_list_page(
+            masters_data, page, len(state.master_ids), MASTERS_PER_PAGE, state.display_type or 'city'
+        )
         text += page_text
         keyboard = page_keyboard
     
     # Кнопка назад - только "Назад к категориям"
-    keyboard.append([InlineKeyboardButton("« Назад к категориям", callback_data=f"search_city_{city_id}")])
+    keyboard.append([InlineKeyboardButton("« Назад к категориям", callback_data=f"search_city_{state.city_id}")])
     
     await query.message.edit_text(
         text,
@@ -3013,8 +2855,8 @@ async def _update_master_view_message(query, master_id: int, user_id: int, conte
         
         # Определяем, откуда вернуться
         back_buttons = []
-        display_type = state.get('current_display_type')
-        current_page = state.get('current_page', 0)
+        display_type = state.display_type
+        current_page = state.page
         if display_type == 'service':
             back_buttons.append(
                 InlineKeyboardButton(
@@ -3037,14 +2879,14 @@ async def _update_master_view_message(query, master_id: int, user_id: int, conte
                 )
             )
         else:
-            if state.get('selected_service_idx') is not None and state.get('services'):
+            if state.service_idx is not None and state.has_services:
                 back_buttons.append(
                     InlineKeyboardButton(
                         "« Назад к услугам",
                         callback_data="search_services_back"
                     )
                 )
-            elif state.get('selected_category_idx') is not None:
+            elif state.category_idx is not None:
                 back_buttons.append(
                     InlineKeyboardButton(
                         "« Назад к категориям",
@@ -3069,13 +2911,12 @@ async def _update_master_view_message(query, master_id: int, user_id: int, conte
         if master_avatar:
             try:
                 from bot.config import BOT_TOKEN
-                from telegram import Bot as TelegramBot
                 import io
                 import asyncio
                 import requests
                 
                 # Скачиваем фото профиля через мастер-бот, так как file_id не работает между разными ботами
-                master_bot = TelegramBot(token=BOT_TOKEN)
+                master_bot = get_master_bot()
                 file = await master_bot.get_file(master_avatar)
                 file_path = file.file_path
                 
@@ -3094,7 +2935,7 @@ async def _update_master_view_message(query, master_id: int, user_id: int, conte
                     response.raise_for_status()
                     return response.content
                 
-                file_content = await asyncio.to_thread(download_file, file_url)
+                file_content = await outside_transaction(asyncio.to_thread(download_file, file_url))
                 photo_to_send = io.BytesIO(file_content)
                 photo_to_send.seek(0)
             except Exception as e:
@@ -3365,13 +3206,12 @@ async def client_service_portfolio(update: Update, context: ContextTypes.DEFAULT
             # Если file_id не работает (разные боты), получаем файл через мастер-бот
             try:
                 from bot.config import BOT_TOKEN
-                from telegram import Bot as TelegramBot
                 import io
                 import asyncio
                 import requests
                 
                 logger.info(f"Attempting to download photo via master bot. file_id: {first_photo.file_id}")
-                master_bot = TelegramBot(token=BOT_TOKEN)
+                master_bot = get_master_bot()
                 file = await master_bot.get_file(first_photo.file_id)
                 logger.info(f"Got file info. file_path: {file.file_path}, file_size: {file.file_size}")
                 
@@ -3416,7 +3256,7 @@ async def client_service_portfolio(update: Update, context: ContextTypes.DEFAULT
                         response.raise_for_status()
                         return response.content
                     
-                    file_content = await asyncio.to_thread(download_file, file_url)
+                    file_content = await outside_transaction(asyncio.to_thread(download_file, file_url))
                     logger.info(f"Downloaded file. Size: {len(file_content)} bytes")
                     photo_data = io.BytesIO(file_content)
                     photo_data.seek(0)
@@ -3490,13 +3330,12 @@ async def client_portfolio_next(update: Update, context: ContextTypes.DEFAULT_TY
             # Если file_id не работает (разные боты), получаем файл через мастер-бот
             try:
                 from bot.config import BOT_TOKEN
-                from telegram import Bot as TelegramBot
                 import io
                 import asyncio
                 import requests
                 
                 logger.info(f"Attempting to download photo via master bot. file_id: {photo.file_id}")
-                master_bot = TelegramBot(token=BOT_TOKEN)
+                master_bot = get_master_bot()
                 file = await master_bot.get_file(photo.file_id)
                 logger.info(f"Got file info. file_path: {file.file_path}, file_size: {file.file_size}")
                 
@@ -3513,7 +3352,7 @@ async def client_portfolio_next(update: Update, context: ContextTypes.DEFAULT_TY
                     response.raise_for_status()
                     return response.content
                 
-                file_content = await asyncio.to_thread(download_file, file_url)
+                file_content = await outside_transaction(asyncio.to_thread(download_file, file_url))
                 logger.info(f"Downloaded file. Size: {len(file_content)} bytes")
                 photo_data = io.BytesIO(file_content)
                 photo_data.seek(0)
@@ -3588,13 +3427,12 @@ async def client_portfolio_prev(update: Update, context: ContextTypes.DEFAULT_TY
             # Если file_id не работает (разные боты), получаем файл через мастер-бот
             try:
                 from bot.config import BOT_TOKEN
-                from telegram import Bot as TelegramBot
                 import io
                 import asyncio
                 import requests
                 
                 logger.info(f"Attempting to download photo via master bot. file_id: {photo.file_id}")
-                master_bot = TelegramBot(token=BOT_TOKEN)
+                master_bot = get_master_bot()
                 file = await master_bot.get_file(photo.file_id)
                 logger.info(f"Got file info. file_path: {file.file_path}, file_size: {file.file_size}")
                 
@@ -3611,7 +3449,7 @@ async def client_portfolio_prev(update: Update, context: ContextTypes.DEFAULT_TY
                     response.raise_for_status()
                     return response.content
                 
-                file_content = await asyncio.to_thread(download_file, file_url)
+                file_content = await outside_transaction(asyncio.to_thread(download_file, file_url))
                 logger.info(f"Downloaded file. Size: {len(file_content)} bytes")
                 photo_data = io.BytesIO(file_content)
                 photo_data.seek(0)
@@ -81,6 +81,7 @@ from .profile import (
     receive_description,
     upload_photo,
     receive_photo,
+    toggle_notification_mode,
 )
 
 # Услуги
@@ -243,6 +244,7 @@ __all__ = [
     'receive_description',
     'upload_photo',
     'receive_photo',
+    'toggle_notification_mode',
     # Services
     'master_services',
     'add_category_start',
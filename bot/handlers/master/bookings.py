@@ -68,3 +68,8 @@ async def master_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 reply_markup=InlineKeyboardMarkup(keyboard)
             )
 
+
+# Кнопки вне диалогов: шаблон callback_data -> обработчик (bot/utils/callback_router.py)
+CALLBACK_ROUTES = [
+    ('master_bookings', master_bookings),
+]
@@ -320,3 +320,9 @@ async def restart_after_delete(update: Update, context: ContextTypes.DEFAULT_TYP
     
     # Вызываем start_master как будто это была команда /start
     await start_master(update, context)
+
+
+# Кнопки вне диалогов: шаблон callback_data -> обработчик (bot/utils/callback_router.py)
+CALLBACK_ROUTES = [
+    ('restart_after_delete', restart_after_delete),
+]
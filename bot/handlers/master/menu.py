@@ -2,10 +2,13 @@
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
-from bot.database.db import get_session, get_master_by_telegram, create_master_account, get_or_create_city, add_user_master_link
+from bot.database.db import (
+    get_session, get_master_by_telegram, create_master_account, get_or_create_city, add_user_master_link,
+    outside_transaction
+)
 from bot.database.models import User, MasterAccount
 from bot.utils.impersonation import get_impersonation_banner
-from bot.utils.geocoding import get_city_from_location, search_city_by_name
+from bot.utils.geocoding import resolve_city_from_location, search_city_by_name_async
 from .common import WAITING_CITY_NAME, WAITING_CITY_SELECT, WAITING_REGISTRATION_NAME, WAITING_REGISTRATION_DESCRIPTION, WAITING_REGISTRATION_PHOTO
 from .onboarding import show_onboarding, get_onboarding_progress
 
@@ -711,7 +714,7 @@ async def receive_city_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Ищем город в интернете
     await update.message.reply_text("🔍 Ищу город в интернете...")
     
-    cities = search_city_by_name(city_query, limit=10)
+    cities = await search_city_by_name_async(city_query, limit=10)
     
     if not cities:
         text = f"❌ Не удалось найти город по запросу: <b>{city_query}</b>\n\n"
@@ -886,10 +889,10 @@ async def select_city_from_search(update: Update, context: ContextTypes.DEFAULT_
                 # Добавляем общий таймаут для запроса валюты (30 секунд)
                 # Если запрос зависает, используем fallback
                 try:
-                    currency = await asyncio.wait_for(
+                    currency = await outside_transaction(asyncio.wait_for(
                         get_currency_by_country_async(session, city.country_code),
                         timeout=30.0
-                    )
+                    ))
                     master.currency = currency
                     logger.info(f"Currency {currency} set for master {master_id} based on country {city.country_code}")
                 except asyncio.TimeoutError:
@@ -1104,8 +1107,8 @@ async def receive_location(update: Update, context: ContextTypes.DEFAULT_TYPE):
     latitude = location.latitude
     longitude = location.longitude
     
-    # Определяем город по геолокации
-    city_data = get_city_from_location(latitude, longitude)
+    # Определяем город по геолокации (локально, сеть - только при промахе)
+    city_data = await resolve_city_from_location(latitude, longitude)
     
     with get_session() as session:
         master_id = context.user_data.get('master_id')
@@ -1145,10 +1148,10 @@ async def receive_location(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     # Добавляем общий таймаут для запроса валюты (30 секунд)
                     # Если запрос зависает, используем fallback
                     try:
-                        currency = await asyncio.wait_for(
+                        currency = await outside_transaction(asyncio.wait_for(
                             get_currency_by_country_async(session, city.country_code),
                             timeout=30.0
-                        )
+                        ))
                         master.currency = currency
                         logger.info(f"Currency {currency} set for master {master_id} based on country {city.country_code}")
                     except asyncio.TimeoutError:
@@ -1349,3 +1352,10 @@ async def handle_client_invitation_after_registration(session, master_id: int, c
     except Exception as e:
         logger.error(f"Error handling client invitation: {e}", exc_info=True)
 
+
+# Кнопки вне диалогов: шаблон callback_data -> обработчик (bot/utils/callback_router.py)
+# Кнопки возврата в разделы - обрабатываются раньше диалогов, даже если диалог активен
+NAVIGATION_ROUTES = [
+    ('master_menu', master_menu_callback),
+    ('master_settings', master_settings),
+]
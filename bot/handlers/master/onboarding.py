@@ -471,3 +471,13 @@ async def onboarding_next_schedule(update: Update, context: ContextTypes.DEFAULT
     
     # Переходим к расписанию
     await onboarding_schedule(update, context)
+
+
+# Кнопки вне диалогов: шаблон callback_data -> обработчик (bot/utils/callback_router.py)
+CALLBACK_ROUTES = [
+    ('onboarding_profile', onboarding_profile),
+    ('onboarding_services', onboarding_services),
+    ('onboarding_schedule', onboarding_schedule),
+    ('onboarding_next_services', onboarding_next_services),
+    ('onboarding_next_schedule', onboarding_next_schedule),
+]
@@ -385,3 +385,18 @@ async def portfolio_delete_confirm(update: Update, context: ContextTypes.DEFAULT
         else:
             await query.message.edit_text("❌ Ошибка при удалении фото")
 
+
+# Кнопки вне диалогов: шаблон callback_data -> обработчик (bot/utils/callback_router.py)
+CALLBACK_ROUTES = [
+    ('portfolio_add', portfolio_add),
+    ('portfolio_view', portfolio_view),
+    ('portfolio_next', portfolio_next),
+    ('portfolio_prev', portfolio_prev),
+    ('portfolio_delete', portfolio_delete),
+    ('portfolio_delete_confirm_<int>', portfolio_delete_confirm),
+]
+
+# Кнопки возврата в разделы - обрабатываются раньше диалогов, даже если диалог активен
+NAVIGATION_ROUTES = [
+    ('master_portfolio', master_portfolio),
+]
@@ -1,17 +1,16 @@
 """Управление премиум подпиской"""
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from bot.database.db import (
     get_session,
+    outside_transaction,
     get_master_by_telegram,
-    update_master_subscription,
     create_payment_record,
-    update_payment_status,
 )
 from bot.utils.impersonation import get_master_telegram_id, get_impersonation_banner
-from bot.utils.yookassa_api import create_premium_payment, get_payment_status
+from bot.utils.yookassa_api import create_premium_payment
 from bot.config import CLIENT_BOT_USERNAME, PREMIUM_PRICE, PREMIUM_DURATION_DAYS
 
 logger = logging.getLogger(__name__)
@@ -115,7 +114,7 @@ async def premium_pay(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         # Создаем платеж
         return_url = f"https://t.me/{CLIENT_BOT_USERNAME}"  # URL для возврата после оплаты
-        payment_data = create_premium_payment(master.id, return_url)
+        payment_data = await outside_transaction(create_premium_payment(master.id, return_url))
         
         if not payment_data:
             await query.message.edit_text(
@@ -144,7 +143,8 @@ async def premium_pay(update: Update, context: ContextTypes.DEFAULT_TYPE):
             master.id,
             payment_id,
             PREMIUM_PRICE,
-            'premium'
+            'premium',
+            confirmation_url
         )
         
         if payment_record:
@@ -152,7 +152,7 @@ async def premium_pay(update: Update, context: ContextTypes.DEFAULT_TYPE):
             text += f"💰 Сумма: {PREMIUM_PRICE}₽\n"
             text += f"📅 Срок: {PREMIUM_DURATION_DAYS} дней\n\n"
             text += "Нажмите на кнопку ниже, чтобы перейти к оплате:\n\n"
-            text += "После оплаты вернитесь и нажмите «Проверить статус оплаты»"
+            text += "Подписка активируется автоматически сразу после оплаты."
             
             keyboard = [
                 [InlineKeyboardButton("💳 Оплатить", url=confirmation_url)],
@@ -179,99 +179,103 @@ async def premium_check_status(update: Update, context: ContextTypes.DEFAULT_TYP
     query = update.callback_query
     await query.answer()
     
+    master_telegram_id = get_master_telegram_id(update, context)
     with get_session() as session:
-        master = get_master_by_telegram(session, get_master_telegram_id(update, context))
+        master = get_master_by_telegram(session, master_telegram_id)
         
         if not master:
             await query.message.edit_text("❌ Аккаунт не найден")
             return
         
-        # Получаем последний платеж
+        # Получаем последний платеж (webhook и сверка могли уже перевести его в итоговый статус)
         from bot.database.models import Payment
         payment = session.query(Payment).filter_by(
-            master_account_id=master.id,
-            status='pending'
+            master_account_id=master.id
         ).order_by(Payment.created_at.desc()).first()
         
         if not payment:
             await query.message.edit_text(
-                "❌ Активных платежей не найдено",
+                "❌ Платежей не найдено",
                 reply_markup=InlineKeyboardMarkup([[
                     InlineKeyboardButton("« Назад", callback_data="master_premium")
                 ]])
             )
             return
         
-        # Проверяем статус платежа в ЮKassa
-        payment_status = get_payment_status(payment.payment_id)
-        
-        if not payment_status:
-            await query.message.edit_text(
-                "❌ Ошибка при проверке статуса платежа. Попробуйте позже.",
-                reply_markup=InlineKeyboardMarkup([[
-                    InlineKeyboardButton("🔄 Проверить снова", callback_data="premium_check_status"),
-                    InlineKeyboardButton("« Назад", callback_data="master_premium")
-                ]])
-            )
-            return
-        
-        status = payment_status.get('status', 'unknown')
+        payment_id = payment.payment_id
+    
+    # Статус обычно уже обновлен webhook'ом; ЮKassa опрашивается не чаще,
+    # чем позволяет расписание сверки платежа
+    from bot.utils.payments import refresh_payment_status
+    status = await outside_transaction(refresh_payment_status(payment_id))
+    
+    if not status:
+        await query.message.edit_text(
+            "❌ Ошибка при проверке статуса платежа. Попробуйте позже.",
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("🔄 Проверить снова", callback_data="premium_check_status"),
+                InlineKeyboardButton("« Назад", callback_data="master_premium")
+            ]])
+        )
+        return
+    
+    if status == 'succeeded':
+        with get_session() as session:
+            master = get_master_by_telegram(session, master_telegram_id)
+            expires_at = master.subscription_expires_at if master else None
+        expires_str = expires_at.strftime('%d.%m.%Y %H:%M') if expires_at else "Не указано"
         
-        if status == 'succeeded':
-            # Платеж успешен - активируем подписку
-            expires_at = datetime.utcnow() + timedelta(days=PREMIUM_DURATION_DAYS)
-            
-            # Обновляем статус платежа
-            update_payment_status(session, payment.id, 'completed')
-            
-            # Обновляем подписку мастера
-            update_master_subscription(
-                session,
-                master.id,
-                'premium',
-                expires_at
-            )
-            
-            await query.message.edit_text(
-                f"✅ <b>Платеж успешно обработан!</b>\n\n"
-                f"💎 Премиум подписка активирована на {PREMIUM_DURATION_DAYS} дней.\n"
-                f"📅 Истекает: {expires_at.strftime('%d.%m.%Y %H:%M')}\n\n"
-                f"Теперь вам доступны все премиум возможности!",
-                parse_mode='HTML',
-                reply_markup=InlineKeyboardMarkup([[
-                    InlineKeyboardButton("« Назад", callback_data="master_premium")
-                ]])
-            )
-        elif status == 'pending':
-            await query.message.edit_text(
-                "⏳ <b>Оплата в обработке</b>\n\n"
-                "Платеж еще не обработан. Подождите несколько минут и проверьте снова.",
-                parse_mode='HTML',
-                reply_markup=InlineKeyboardMarkup([[
-                    InlineKeyboardButton("🔄 Проверить снова", callback_data="premium_check_status"),
-                    InlineKeyboardButton("« Назад", callback_data="master_premium")
-                ]])
-            )
-        elif status == 'canceled':
-            update_payment_status(session, payment.id, 'cancelled')
-            await query.message.edit_text(
-                "❌ <b>Платеж отменен</b>\n\n"
-                "Платеж был отменен. Вы можете создать новый платеж.",
-                parse_mode='HTML',
-                reply_markup=InlineKeyboardMarkup([[
-                    InlineKeyboardButton("💳 Оплатить премиум", callback_data="premium_pay"),
-                    InlineKeyboardButton("« Назад", callback_data="master_premium")
-                ]])
-            )
-        else:
-            await query.message.edit_text(
-                f"❌ <b>Неизвестный статус платежа</b>\n\n"
-                f"Статус: {status}\n\n"
-                f"Попробуйте проверить снова позже.",
-                parse_mode='HTML',
-                reply_markup=InlineKeyboardMarkup([[
-                    InlineKeyboardButton("🔄 Проверить снова", callback_data="premium_check_status"),
-                    InlineKeyboardButton("« Назад", callback_data="master_premium")
-                ]])
-            )
+        await query.message.edit_text(
+            f"✅ <b>Платеж успешно обработан!</b>\n\n"
+            f"💎 Премиум подписка активирована на {PREMIUM_DURATION_DAYS} дней.\n"
+            f"📅 Истекает: {expires_str}\n\n"
+            f"Теперь вам доступны все премиум возможности!",
+            parse_mode='HTML',
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("« Назад", callback_data="master_premium")
+            ]])
+        )
+    elif status == 'pending':
+        await query.message.edit_text(
+            "⏳ <b>Оплата в обработке</b>\n\n"
+            "Платеж еще не обработан. Подписка активируется автоматически, "
+            "как только ЮKassa подтвердит оплату.",
+            parse_mode='HTML',
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("🔄 Проверить снова", callback_data="premium_check_status"),
+                InlineKeyboardButton("« Назад", callback_data="master_premium")
+            ]])
+        )
+    elif status == 'canceled':
+        await query.message.edit_text(
+            "❌ <b>Платеж отменен</b>\n\n"
+            "Платеж был отменен. Вы можете создать новый платеж.",
+            parse_mode='HTML',
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("💳 Оплатить премиум", callback_data="premium_pay"),
+                InlineKeyboardButton("« Назад", callback_data="master_premium")
+            ]])
+        )
+    else:
+        await query.message.edit_text(
+            f"❌ <b>Неизвестный статус платежа</b>\n\n"
+            f"Статус: {status}\n\n"
+            f"Попробуйте проверить снова позже.",
+            parse_mode='HTML',
+            reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("🔄 Проверить снова", callback_data="premium_check_status"),
+                InlineKeyboardButton("« Назад", callback_data="master_premium")
+            ]])
+        )
+
+
+# Кнопки вне диалогов: шаблон callback_data -> обработчик (bot/utils/callback_router.py)
+CALLBACK_ROUTES = [
+    ('premium_pay', premium_pay),
+    ('premium_check_<rest>', premium_check_status),
+]
 
+# Кнопки возврата в разделы - обрабатываются раньше диалогов, даже если диалог активен
+NAVIGATION_ROUTES = [
+    ('master_premium', master_premium),
+]
@@ -9,6 +9,13 @@ from .common import WAITING_NAME, WAITING_DESCRIPTION
 logger = logging.getLogger(__name__)
 
 
+def _notification_mode_button(master) -> InlineKeyboardButton:
+    """Кнопка переключения режима уведомлений о записях"""
+    from bot.utils.digest import NOTIFICATION_MODE_NAMES
+    mode_name = NOTIFICATION_MODE_NAMES.get(master.notification_mode or 'instant', NOTIFICATION_MODE_NAMES['instant'])
+    return InlineKeyboardButton(f"🔔 Уведомления о записях: {mode_name}", callback_data="toggle_notification_mode")
+
+
 async def _send_profile_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, session, master):
     """Вспомогательная функция для отправки меню профиля"""
     # Проверяем прогресс анбординга
@@ -30,7 +37,8 @@ async def _send_profile_menu(update: Update, context: ContextTypes.DEFAULT_TYPE,
     keyboard = [
         [InlineKeyboardButton("✏️ Изменить имя", callback_data="edit_name")],
         [InlineKeyboardButton("✏️ Изменить описание", callback_data="edit_description")],
-        [InlineKeyboardButton("🖼 Загрузить фото", callback_data="upload_photo")]
+        [InlineKeyboardButton("🖼 Загрузить фото", callback_data="upload_photo")],
+        [_notification_mode_button(master)]
     ]
     
     # Добавляем кнопку удаления аккаунта последней (отдельной строкой)
@@ -85,7 +93,8 @@ async def master_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
         keyboard = [
             [InlineKeyboardButton("✏️ Изменить имя", callback_data="edit_name")],
             [InlineKeyboardButton("✏️ Изменить описание", callback_data="edit_description")],
-            [InlineKeyboardButton("🖼 Загрузить фото", callback_data="upload_photo")]
+            [InlineKeyboardButton("🖼 Загрузить фото", callback_data="upload_photo")],
+            [_notification_mode_button(master)]
         ]
         
         # Добавляем кнопку удаления аккаунта последней (отдельной строкой)
@@ -248,3 +257,29 @@ async def receive_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         context.user_data.pop('uploading_photo_type', None)
 
+
+
+async def toggle_notification_mode(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Переключить режим уведомлений о записях: сразу, сводка раз в час, сводка раз в день"""
+    from bot.database.db import set_master_notification_mode
+    from bot.utils.digest import next_notification_mode
+    
+    with get_session() as session:
+        master = get_master_by_telegram(session, get_master_telegram_id(update, context))
+        if master:
+            set_master_notification_mode(session, master.id, next_notification_mode(master.notification_mode))
+    
+    # Профиль перерисовывается с новым режимом (и отвечает на callback)
+    await master_profile(update, context)
+
+
+# Кнопки вне диалогов: шаблон callback_data -> обработчик (bot/utils/callback_router.py)
+CALLBACK_ROUTES = [
+    ('upload_photo', upload_photo),
+    ('toggle_notification_mode', toggle_notification_mode),
+]
+
+# Кнопки возврата в разделы - обрабатываются раньше диалогов, даже если диалог активен
+NAVIGATION_ROUTES = [
+    ('master_profile', master_profile),
+]
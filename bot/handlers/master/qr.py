@@ -1,11 +1,17 @@
 """QR код и приглашение клиентов"""
 import logging
-import qrcode
 import io
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
-from bot.database.db import get_session, get_master_by_telegram
+from bot.database.db import get_session, get_master_by_telegram, outside_transaction
 from bot.utils.impersonation import get_master_telegram_id, get_impersonation_banner
+from bot.utils.qr_codes import (
+    build_invite_link,
+    get_cached_invite_qr,
+    render_invite_qr,
+    remember_invite_qr_file_id,
+)
 from bot.config import CLIENT_BOT_USERNAME
 
 logger = logging.getLogger(__name__)
@@ -28,52 +34,62 @@ async def master_qr(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await update.message.reply_text(text)
             return
         
-        # Генерируем deep link
-        if CLIENT_BOT_USERNAME:
-            deep_link = f"https://t.me/{CLIENT_BOT_USERNAME}?start=m_{master.id}"
-        else:
-            deep_link = f"Используйте команду /start m_{master.id} в клиентском боте"
-        
-        text = f"👤➡️ <b>Пригласить клиента</b>\n\n"
-        text += f"Отправьте эту ссылку клиенту:\n\n"
-        if CLIENT_BOT_USERNAME:
-            text += f"<a href=\"{deep_link}\">{deep_link}</a>\n\n"
-        else:
-            text += f"<code>{deep_link}</code>\n\n"
-        text += get_impersonation_banner(context)
+        master_id = master.id
         
-        keyboard = [
-            [InlineKeyboardButton("📋 Копировать ссылку", callback_data=f"copy_link_{master.id}")],
-            [InlineKeyboardButton("« Назад", callback_data="master_menu")]
-        ]
-        
-        # Генерируем QR код
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(deep_link)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Сохраняем в память
-        bio = io.BytesIO()
-        img.save(bio, format='PNG')
-        bio.seek(0)
+        # Генерируем deep link
+        deep_link = build_invite_link(master_id)
         
-        if query:
-            await query.message.delete()
-            await query.message.chat.send_photo(
-                photo=bio,
-                caption=text,
-                parse_mode='HTML',
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-        elif update.message:
-            await update.message.reply_photo(
-                photo=bio,
+        # QR зависит только от мастера и диплинка - берем готовый из кэша
+        png, file_id = get_cached_invite_qr(session, master_id, deep_link)
+    
+    text = f"👤➡️ <b>Пригласить клиента</b>\n\n"
+    text += f"Отправьте эту ссылку клиенту:\n\n"
+    if CLIENT_BOT_USERNAME:
+        text += f"<a href=\"{deep_link}\">{deep_link}</a>\n\n"
+    else:
+        text += f"<code>{deep_link}</code>\n\n"
+    text += get_impersonation_banner(context)
+    
+    keyboard = [
+        [InlineKeyboardButton("📋 Копировать ссылку", callback_data=f"copy_link_{master_id}")],
+        [InlineKeyboardButton("« Назад", callback_data="master_menu")]
+    ]
+    
+    if query:
+        await query.message.delete()
+        send_photo = query.message.chat.send_photo
+    elif update.message:
+        send_photo = update.message.reply_photo
+    else:
+        return
+    
+    # Сначала пробуем переотправить уже загруженное в Telegram фото по file_id
+    if file_id:
+        try:
+            await send_photo(
+                photo=file_id,
                 caption=text,
                 parse_mode='HTML',
                 reply_markup=InlineKeyboardMarkup(keyboard)
             )
+            return
+        except BadRequest as e:
+            logger.warning(f"Cached QR file_id for master {master_id} is no longer valid: {e}")
+            remember_invite_qr_file_id(master_id, deep_link, None)
+    
+    # Отрисовка QR - CPU-bound, выполняем вне event loop
+    if png is None:
+        png = await outside_transaction(render_invite_qr(master_id, deep_link))
+    
+    message = await send_photo(
+        photo=io.BytesIO(png),
+        caption=text,
+        parse_mode='HTML',
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+    
+    if message and message.photo:
+        remember_invite_qr_file_id(master_id, deep_link, message.photo[-1].file_id)
 
 
 async def copy_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -89,10 +105,7 @@ async def copy_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         
         # Генерируем deep link
-        if CLIENT_BOT_USERNAME:
-            deep_link = f"https://t.me/{CLIENT_BOT_USERNAME}?start=m_{master.id}"
-        else:
-            deep_link = f"Используйте команду /start m_{master.id} в клиентском боте"
+        deep_link = build_invite_link(master.id)
         
         text = f"🔗 <b>Ваша ссылка для приглашения</b>\n\n"
         text += f"Отправьте эту ссылку клиентам, чтобы они могли записаться к вам:\n\n"
@@ -113,3 +126,9 @@ async def copy_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=InlineKeyboardMarkup(keyboard)
         )
 
+
+# Кнопки вне диалогов: шаблон callback_data -> обработчик (bot/utils/callback_router.py)
+CALLBACK_ROUTES = [
+    ('master_qr', master_qr),
+    ('copy_link_<int>', copy_link),
+]
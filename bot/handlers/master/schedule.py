@@ -1478,3 +1478,20 @@ async def schedule_finish_setup(update: Update, context: ContextTypes.DEFAULT_TY
             fake_update = FakeUpdate(fake_callback)
             await start_master(fake_update, context)
 
+
+# Кнопки вне диалогов: шаблон callback_data -> обработчик (bot/utils/callback_router.py)
+CALLBACK_ROUTES = [
+    ('schedule_add_period_<int>', schedule_add_period_start),
+    ('edit_day_<int>', schedule_edit_day),
+    ('schedule_toggle_day_<int>', schedule_toggle_day),
+    ('schedule_finish_setup', schedule_finish_setup),
+    ('schedule_delete_period_<int>', schedule_delete_period),
+    ('schedule_delete_temp_<int>_<int>', schedule_delete_temp_period),
+    ('schedule_save_<int>', schedule_save_changes),
+    ('schedule_cancel_<int>', schedule_cancel_changes),
+]
+
+# Кнопки возврата в разделы - обрабатываются раньше диалогов, даже если диалог активен
+NAVIGATION_ROUTES = [
+    ('master_schedule', master_schedule),
+]
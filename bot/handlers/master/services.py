@@ -15,6 +15,7 @@ from bot.database.db import (
     get_service_by_id,
     update_service,
     delete_service,
+    outside_transaction,
 )
 from bot.utils.impersonation import get_master_telegram_id, get_impersonation_banner
 from bot.data.service_templates import get_predefined_categories_list, get_category_info, get_category_templates
@@ -522,6 +523,9 @@ async def service_template_selected(update: Update, context: ContextTypes.DEFAUL
     else:
         # Используем шаблон (пока просто сохраняем название)
         context.user_data['service_name'] = template_name
+        # Описание для шаблона берется из библиотеки готовых вариантов,
+        # начинаем с первого варианта
+        context.user_data.pop('service_description_generation_count', None)
         
         # Получаем валюту мастера для отображения
         with get_session() as session:
@@ -531,8 +535,8 @@ async def service_template_selected(update: Update, context: ContextTypes.DEFAUL
             else:
                 # Обновляем объект из базы данных, чтобы получить актуальную валюту
                 session.refresh(master)
-                from bot.utils.currency import CURRENCY_NAMES_RU_PREPOSITIONAL
-                currency_name = CURRENCY_NAMES_RU_PREPOSITIONAL.get(master.currency or 'RUB', 'рублях')
+                from bot.utils.currency import get_currency_name_prepositional
+                currency_name = get_currency_name_prepositional(master.currency or 'RUB')
         
         text = f"💰 Введите цену услуги (в {currency_name}, только число):"
         keyboard = [[InlineKeyboardButton("« Назад", callback_data="service_back_to_template")]]
@@ -566,8 +570,8 @@ async def receive_service_name(update: Update, context: ContextTypes.DEFAULT_TYP
         else:
             # Обновляем объект из базы данных, чтобы получить актуальную валюту
             session.refresh(master)
-            from bot.utils.currency import CURRENCY_NAMES_RU_PREPOSITIONAL
-            currency_name = CURRENCY_NAMES_RU_PREPOSITIONAL.get(master.currency or 'RUB', 'рублях')
+            from bot.utils.currency import get_currency_name_prepositional
+            currency_name = get_currency_name_prepositional(master.currency or 'RUB')
     
     reply_text = f"💰 Введите цену услуги (в {currency_name}, только число):"
     keyboard = [[InlineKeyboardButton("« Назад", callback_data="service_back_to_name")]]
@@ -610,8 +614,8 @@ async def receive_service_price(update: Update, context: ContextTypes.DEFAULT_TY
                 # Обновляем объект из базы данных, чтобы получить актуальную валюту
                 session.refresh(master)
                 currency_code = master.currency or 'RUB'
-                from bot.utils.currency import CURRENCY_NAMES_RU_PREPOSITIONAL
-                currency_name = CURRENCY_NAMES_RU_PREPOSITIONAL.get(currency_code, 'рублях')
+                from bot.utils.currency import get_currency_name_prepositional
+                currency_name = get_currency_name_prepositional(currency_code)
                 logger.info(f"Master currency: {currency_code}, currency_name: {currency_name}")
     except Exception as e:
         logger.error(f"Error getting master currency: {e}", exc_info=True)
@@ -949,7 +953,16 @@ async def service_add_description(update: Update, context: ContextTypes.DEFAULT_
 
 async def service_generate_description(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Генерировать описание услуги через ИИ"""
+    from bot.utils.openai_client import is_generation_in_progress
+    
     query = update.callback_query
+    master_telegram_id = get_master_telegram_id(update, context)
+    
+    # Повторное нажатие, пока описание еще генерируется - не запускаем новую генерацию
+    if is_generation_in_progress(master_telegram_id):
+        await query.answer("⏳ Описание уже генерируется, подождите...")
+        return
+    
     await query.answer()
     
     service_name = context.user_data.get('service_name', '')
@@ -978,7 +991,9 @@ async def service_generate_description(update: Update, context: ContextTypes.DEF
     from bot.utils.openai_client import generate_service_description
     
     try:
-        description = await generate_service_description(service_name, generation_count)
+        description = await outside_transaction(generate_service_description(
+            service_name, generation_count, master_id=master_telegram_id
+        ))
         
         if description:
             # Сохраняем сгенерированное описание во временное хранилище
@@ -1151,8 +1166,8 @@ async def service_back_to_price(update: Update, context: ContextTypes.DEFAULT_TY
         else:
             # Обновляем объект из базы данных, чтобы получить актуальную валюту
             session.refresh(master)
-            from bot.utils.currency import CURRENCY_NAMES_RU_PREPOSITIONAL
-            currency_name = CURRENCY_NAMES_RU_PREPOSITIONAL.get(master.currency or 'RUB', 'рублях')
+            from bot.utils.currency import get_currency_name_prepositional
+            currency_name = get_currency_name_prepositional(master.currency or 'RUB')
     
     text = f"💰 Введите цену услуги (в {currency_name}, только число):"
     keyboard = [[InlineKeyboardButton("« Назад", callback_data="service_back_to_name")]]
@@ -1333,9 +1348,9 @@ async def edit_service_price_start(update: Update, context: ContextTypes.DEFAULT
         context.user_data['edit_service_id'] = service_id
         context.user_data['edit_service_field'] = 'price'
         
-        from bot.utils.currency import format_price, CURRENCY_NAMES_RU_PREPOSITIONAL
+        from bot.utils.currency import format_price, get_currency_name_prepositional
         price_formatted = format_price(service.price, master.currency)
-        currency_name = CURRENCY_NAMES_RU_PREPOSITIONAL.get(master.currency, 'рублях')
+        currency_name = get_currency_name_prepositional(master.currency)
         
         text = f"💰 <b>Изменение цены услуги</b>\n\n"
         text += f"Текущая цена: <b>{price_formatted}</b>\n\n"
@@ -1369,8 +1384,8 @@ async def receive_edit_service_price(update: Update, context: ContextTypes.DEFAU
             else:
                 # Обновляем объект из базы данных, чтобы получить актуальную валюту
                 session.refresh(master)
-                from bot.utils.currency import CURRENCY_NAMES_RU_PREPOSITIONAL
-                currency_name = CURRENCY_NAMES_RU_PREPOSITIONAL.get(master.currency or 'RUB', 'рублях')
+                from bot.utils.currency import get_currency_name_prepositional
+                currency_name = get_currency_name_prepositional(master.currency or 'RUB')
         
         if price <= 0:
             await update.message.reply_text(f"❌ Цена должна быть больше 0. Попробуйте снова (в {currency_name}):")
@@ -1627,7 +1642,16 @@ async def edit_service_description_start(update: Update, context: ContextTypes.D
 
 async def edit_service_generate_description(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Генерировать описание для редактируемой услуги через ИИ"""
+    from bot.utils.openai_client import is_generation_in_progress
+    
     query = update.callback_query
+    master_telegram_id = get_master_telegram_id(update, context)
+    
+    # Повторное нажатие, пока описание еще генерируется - не запускаем новую генерацию
+    if is_generation_in_progress(master_telegram_id):
+        await query.answer("⏳ Описание уже генерируется, подождите...")
+        return
+    
     await query.answer()
     
     # Извлекаем service_id из callback_data: edit_service_generate_description_123
@@ -1670,7 +1694,9 @@ async def edit_service_generate_description(update: Update, context: ContextType
     from bot.utils.openai_client import generate_service_description
     
     try:
-        description = await generate_service_description(service_name, generation_count)
+        description = await outside_transaction(generate_service_description(
+            service_name, generation_count, master_id=master_telegram_id
+        ))
         
         if description:
             # Сохраняем сгенерированное описание во временное хранилище
@@ -1924,7 +1950,16 @@ async def edit_service_delete_description(update: Update, context: ContextTypes.
 
 async def new_service_generate_description(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Генерировать описание для новой услуги через ИИ"""
+    from bot.utils.openai_client import is_generation_in_progress
+    
     query = update.callback_query
+    master_telegram_id = get_master_telegram_id(update, context)
+    
+    # Повторное нажатие, пока описание еще генерируется - не запускаем новую генерацию
+    if is_generation_in_progress(master_telegram_id):
+        await query.answer("⏳ Описание уже генерируется, подождите...")
+        return
+    
     await query.answer()
     
     # Извлекаем service_id из callback_data: new_service_generate_description_123
@@ -1974,7 +2009,9 @@ async def new_service_generate_description(update: Update, context: ContextTypes
     from bot.utils.openai_client import generate_service_description
     
     try:
-        description = await generate_service_description(service_name, generation_count)
+        description = await outside_transaction(generate_service_description(
+            service_name, generation_count, master_id=master_telegram_id
+        ))
         
         if description:
             # Сохраняем описание сразу в базу и устанавливаем флаг, что оно было сгенерировано через ИИ
@@ -2169,3 +2206,20 @@ async def delete_service_execute(update: Update, context: ContextTypes.DEFAULT_T
         else:
             await query.message.edit_text("❌ Ошибка при удалении услуги")
 
+
+# Кнопки вне диалогов: шаблон callback_data -> обработчик (bot/utils/callback_router.py)
+CALLBACK_ROUTES = [
+    ('service_category_<int>', service_category_selected),
+    ('service_category_custom', service_category_selected),
+    ('service_category_predef_<rest>', service_category_selected),
+    ('edit_service_<int>', edit_service),
+    ('delete_service_confirm_<int>', delete_service_confirm),
+    ('delete_service_execute_<int>', delete_service_execute),
+    ('new_service_generate_description_<int>', new_service_generate_description),
+    ('service_created_next_<int>', service_created_next),
+]
+
+# Кнопки возврата в разделы - обрабатываются раньше диалогов, даже если диалог активен
+NAVIGATION_ROUTES = [
+    ('master_services', master_services),
+]
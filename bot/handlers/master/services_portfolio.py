@@ -466,3 +466,14 @@ async def service_portfolio_delete_confirm(update: Update, context: ContextTypes
         else:
             await query.message.edit_text("❌ Ошибка при удалении фото")
 
+
+# Кнопки вне диалогов: шаблон callback_data -> обработчик (bot/utils/callback_router.py)
+CALLBACK_ROUTES = [
+    ('service_portfolio_<int>', service_portfolio),
+    ('service_portfolio_add_<int>', service_portfolio_add),
+    ('service_portfolio_view_<int>', service_portfolio_view),
+    ('service_portfolio_next_<int>', service_portfolio_next),
+    ('service_portfolio_prev_<int>', service_portfolio_prev),
+    ('service_portfolio_delete_<int>', service_portfolio_delete),
+    ('service_portfolio_delete_confirm_<int>', service_portfolio_delete_confirm),
+]
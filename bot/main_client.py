@@ -8,11 +8,16 @@ from telegram.ext import (
     CallbackQueryHandler,
     MessageHandler,
     ConversationHandler,
+    TypeHandler,
     filters
 )
 
-from bot.config import CLIENT_BOT_TOKEN
+from bot.config import CLIENT_BOT_TOKEN, CONVERSATION_TIMEOUT, PERSISTENCE_UPDATE_INTERVAL, UPDATE_WORKERS
 from bot.database.db import init_db
+from bot.utils.network import force_ipv4
+from bot.utils.persistence import DatabasePersistence
+from bot.utils.rate_limiter import TelegramRateLimiter
+from bot.utils.update_processor import PerUserUpdateProcessor
 
 # Импорт обработчиков для клиентского бота
 from bot.handlers.client import (
@@ -29,6 +34,7 @@ from bot.handlers.client import (
     skip_comment,
     confirm_booking,
     cancel_booking,
+    booking_timeout,
     client_bookings,
     client_menu_callback,
     client_help,
@@ -85,6 +91,47 @@ async def error_handler(update: object, context: object) -> None:
 
 async def post_init(application: Application):
     """Функция, вызываемая после инициализации бота - настройка меню команд"""
+    # Загружаем валюты стран в память, чтобы не обращаться к БД при каждом форматировании цены
+    try:
+        from bot.utils.currency import load_currency_registry
+        await asyncio.to_thread(load_currency_registry)
+    except Exception as e:
+        logger.warning(f"[WARNING] Не удалось загрузить реестр валют: {e}")
+    
+    # Доставка уведомлений клиентского бота (напоминания о записях) из notification_outbox
+    # Фоновые задачи выполняет один процесс (при шардировании - шард 0), иначе уведомления задублируются
+    from bot.config import RUN_BACKGROUND_JOBS
+    from bot.utils.outbox import start_outbox_worker
+    from bot.utils.shared_bot import set_client_bot
+    set_client_bot(application.bot)
+    if RUN_BACKGROUND_JOBS:
+        start_outbox_worker(application.bot, bot_name='client')
+    
+    # Напоминания о записях: ближайшее окно задач scheduled_jobs срабатывает через JobQueue
+    if not RUN_BACKGROUND_JOBS:
+        logger.info("[INFO] Фоновые задачи выполняются другим процессом (RUN_BACKGROUND_JOBS=false)")
+    elif application.job_queue:
+        from bot.utils.reminders import ReminderScheduler
+        try:
+            ReminderScheduler(application.job_queue).start()
+        except Exception as e:
+            logger.error(f"[ERROR] Не удалось запустить напоминания о записях: {e}", exc_info=True)
+    else:
+        logger.warning("[WARNING] JobQueue недоступна (установите python-telegram-bot[job-queue]), "
+                       "напоминания о записях отключены")
+    
+    # Вытеснение простаивающих состояний поиска и записи: user_data у каждого процесса свой,
+    # поэтому очистка выполняется независимо от RUN_BACKGROUND_JOBS
+    if application.job_queue:
+        from bot.config import USER_STATE_SWEEP_INTERVAL
+        from bot.utils.user_state import sweep_user_states
+        application.job_queue.run_repeating(
+            sweep_user_states,
+            interval=USER_STATE_SWEEP_INTERVAL,
+            first=USER_STATE_SWEEP_INTERVAL,
+            name='user_state_sweep'
+        )
+    
     # Автоматически генерируем команды на основе кнопок главного меню
     # Используем большой таймаут для медленных подключений
     try:
@@ -100,75 +147,43 @@ async def post_init(application: Application):
         logger.warning(f"[WARNING] Не удалось установить команды: {e} (бот продолжит работу)")
 
 
-def main():
-    """Запуск бота для клиентов"""
-    
-    # Проверка токена
-    if not CLIENT_BOT_TOKEN:
-        logger.error("[ERROR] CLIENT_BOT_TOKEN не установлен! Проверьте файл .env")
-        return
-    
-    # Инициализация базы данных
-    logger.info("[INFO] Инициализация базы данных...")
-    init_db()
-    
-    # Создание приложения
-    logger.info("[INFO] Запуск клиентского бота...")
-    
-    # Патч для принудительного использования IPv4
-    # Это необходимо, так как на некоторых серверах IPv6 вызывает проблемы с TLS
-    import socket
-    import asyncio
-    
-    original_getaddrinfo = socket.getaddrinfo
-    
-    def getaddrinfo_ipv4_only(host, port, family=0, type=0, proto=0, flags=0):
-        """Переопределяем getaddrinfo для использования только IPv4"""
-        # Принудительно используем IPv4 вместо AF_UNSPEC (0) или AF_INET6
-        if family == socket.AF_UNSPEC or family == 0:
-            family = socket.AF_INET
-        elif family == socket.AF_INET6:
-            family = socket.AF_INET  # Заменяем IPv6 на IPv4
-        return original_getaddrinfo(host, port, family, type, proto, flags)
-    
-    # Применяем патч для socket.getaddrinfo
-    socket.getaddrinfo = getaddrinfo_ipv4_only
-    
-    # Патч для asyncio.getaddrinfo (если доступен)
-    if hasattr(asyncio, 'getaddrinfo'):
-        original_asyncio_getaddrinfo = asyncio.getaddrinfo
-        
-        async def asyncio_getaddrinfo_ipv4_only(host, port, family=0, type=0, proto=0, flags=0):
-            """Асинхронная версия getaddrinfo для использования только IPv4"""
-            # Принудительно используем IPv4 вместо AF_UNSPEC (0) или AF_INET6
-            if family == socket.AF_UNSPEC or family == 0:
-                family = socket.AF_INET
-            elif family == socket.AF_INET6:
-                family = socket.AF_INET  # Заменяем IPv6 на IPv4
-            return await original_asyncio_getaddrinfo(host, port, family, type, proto, flags)
-        
-        asyncio.getaddrinfo = asyncio_getaddrinfo_ipv4_only
-        logger.info("[INFO] Настроен принудительный IPv4 для подключений (socket и asyncio)")
-    else:
-        logger.info("[INFO] Настроен принудительный IPv4 для подключений (socket)")
+async def post_stop(application: Application):
+    """Функция, вызываемая после остановки приема апдейтов - остановка воркера outbox, пока бот открыт"""
+    from bot.utils.outbox import stop_outbox_worker
+    await stop_outbox_worker('client')
+
+
+async def post_shutdown(application: Application):
+    """Функция, вызываемая при остановке бота - закрытие общих HTTP-клиентов"""
+    from bot.utils.yookassa_api import close_http_client as close_yookassa_client
+    from bot.utils.shared_bot import close_client_bot, close_master_bot
+    await close_yookassa_client()
+    await close_master_bot()
+    await close_client_bot()
+
+
+def build_application(request=None, webhook: bool = False) -> Application:
+    """
+    Собрать приложение клиентского бота со всеми обработчиками
     
-    # Настраиваем HTTP-клиент с увеличенными таймаутами для медленных соединений
-    from telegram.request import HTTPXRequest
-    
-    # Используем HTTPXRequest с увеличенными таймаутами
-    # HTTP/1.1 вместо HTTP/2 для лучшей совместимости
-    request = HTTPXRequest(
-        connect_timeout=60.0,  # Увеличен для медленных соединений
-        read_timeout=90.0,     # Увеличен для long polling
-        write_timeout=60.0,
-        http_version="1.1"     # Используем HTTP/1.1 для стабильности
-    )
+    Args:
+        request: HTTP-клиент для запросов к Bot API (по умолчанию - стандартный)
+        webhook: Режим webhook - апдейты кладет в update_queue ASGI-сервер, Updater не создается
+    """
+    builder = Application.builder().token(CLIENT_BOT_TOKEN)
+    if request is not None:
+        builder = builder.request(request)
+    if webhook:
+        builder = builder.updater(None)
     
     application = (
-        Application.builder()
-        .token(CLIENT_BOT_TOKEN)
-        .request(request)
+        builder
+        .rate_limiter(TelegramRateLimiter())
+        .persistence(DatabasePersistence('client', PERSISTENCE_UPDATE_INTERVAL))
+        .concurrent_updates(PerUserUpdateProcessor(UPDATE_WORKERS))
         .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
         .build()
     )
     
@@ -197,6 +212,9 @@ def main():
                 CallbackQueryHandler(confirm_booking, pattern='^confirm_booking$'),
                 MessageHandler(filters.TEXT & ~filters.COMMAND, receive_comment)
             ],
+            ConversationHandler.TIMEOUT: [
+                TypeHandler(Update, booking_timeout),
+            ],
         },
         fallbacks=[
             CallbackQueryHandler(cancel_booking, pattern='^cancel_booking$'),
@@ -204,7 +222,9 @@ def main():
             CallbackQueryHandler(select_service, pattern=r'^select_service_\d+$'),
         ],
         per_message=False,
-        name="booking"
+        conversation_timeout=CONVERSATION_TIMEOUT,
+        name="booking",
+        persistent=True
     )
     application.add_handler(booking_conversation)
     
@@ -247,6 +267,41 @@ def main():
     # Обработчик ошибок
     application.add_error_handler(error_handler)
     
+    return application
+
+
+def main():
+    """Запуск бота для клиентов"""
+    
+    # Проверка токена
+    if not CLIENT_BOT_TOKEN:
+        logger.error("[ERROR] CLIENT_BOT_TOKEN не установлен! Проверьте файл .env")
+        return
+    
+    # Инициализация базы данных
+    logger.info("[INFO] Инициализация базы данных...")
+    init_db()
+    
+    # Создание приложения
+    logger.info("[INFO] Запуск клиентского бота...")
+    
+    # Принудительный IPv4: на некоторых серверах IPv6 вызывает проблемы с TLS
+    force_ipv4()
+    
+    # Настраиваем HTTP-клиент с увеличенными таймаутами для медленных соединений
+    from telegram.request import HTTPXRequest
+    
+    # Используем HTTPXRequest с увеличенными таймаутами
+    # HTTP/1.1 вместо HTTP/2 для лучшей совместимости
+    request = HTTPXRequest(
+        connect_timeout=60.0,  # Увеличен для медленных соединений
+        read_timeout=90.0,     # Увеличен для long polling
+        write_timeout=60.0,
+        http_version="1.1"     # Используем HTTP/1.1 для стабильности
+    )
+    
+    application = build_application(request)
+    
     # Запуск бота с настройками polling
     logger.info("[OK] Клиентский бот успешно запущен!")
     # Используем стандартный run_polling - он автоматически обрабатывает ошибки
@@ -12,43 +12,25 @@ from telegram.ext import (
     filters
 )
 
-from bot.config import BOT_TOKEN
+from bot.config import BOT_TOKEN, CONVERSATION_TIMEOUT, PERSISTENCE_UPDATE_INTERVAL, UPDATE_WORKERS
 from bot.database.db import init_db
+from bot.utils.callback_router import CallbackRouter
+from bot.utils.network import force_ipv4
+from bot.utils.persistence import DatabasePersistence
+from bot.utils.rate_limiter import TelegramRateLimiter
+from bot.utils.update_processor import PerUserUpdateProcessor
 
 # Импорт обработчиков для мастер-бота
 from bot.handlers.admin import (
     admin_panel,
-    admin_masters_list,
-    admin_master_detail,
-    admin_block_master,
-    admin_unblock_master,
-    admin_delete_confirm,
-    admin_delete_execute,
-    admin_change_subscription,
-    admin_set_subscription,
-    admin_blocked_masters,
-    admin_search_master_start,
-    admin_search_master_result,
-    admin_impersonate_master,
     admin_stop_impersonation,
-    admin_block_reason_received,
     create_admin_conversation_handler,
-    WAITING_BLOCK_REASON,
-    WAITING_SEARCH_QUERY,
 )
 from bot.handlers.master import (
     start_master,
     master_profile,
     master_services,
     master_schedule,
-    master_qr,
-    master_bookings,
-    master_menu_callback,
-    master_settings,
-    master_premium,
-    master_portfolio,
-    premium_pay,
-    premium_check_status,
     edit_name_start,
     edit_description_start,
     receive_name,
@@ -63,8 +45,6 @@ from bot.handlers.master import (
     service_duration_selected,
     receive_service_duration,
     receive_service_cooling,
-    receive_service_description,
-    service_skip_description,
     service_change_duration,
     service_advanced_settings,
     service_set_cooling,
@@ -73,10 +53,7 @@ from bot.handlers.master import (
     service_back_to_price,
     service_back_to_template,
     service_back_to_advanced,
-    create_service_from_data,
     edit_service,
-    delete_service_confirm,
-    delete_service_execute,
     edit_service_name_start,
     receive_edit_service_name,
     edit_service_price_start,
@@ -91,22 +68,13 @@ from bot.handlers.master import (
     edit_service_enter_description_manual,
     receive_edit_service_description,
     edit_service_delete_description,
-    new_service_generate_description,
-    service_created_next,
     schedule_edit_day,
     schedule_add_period_start,
     schedule_start_selected,
     schedule_start_received,
     schedule_end_selected,
     schedule_end_received,
-    schedule_delete_period,
-    schedule_delete_temp_period,
-    schedule_save_changes,
-    schedule_cancel_changes,
-    schedule_toggle_day,
     schedule_confirm_days,
-    schedule_finish_setup,
-    schedule_add_period_start_multi,
     WAITING_NAME,
     WAITING_DESCRIPTION,
     WAITING_CATEGORY_NAME,
@@ -115,7 +83,6 @@ from bot.handlers.master import (
     WAITING_SERVICE_NAME,
     WAITING_SERVICE_PRICE,
     WAITING_SERVICE_DURATION,
-    WAITING_SERVICE_DESCRIPTION,
     WAITING_SERVICE_ADVANCED,
     WAITING_SERVICE_COOLING,
     WAITING_EDIT_SERVICE_NAME,
@@ -142,11 +109,9 @@ from bot.handlers.master.menu import (
     enter_custom_name,
     back_to_name_choice,
     receive_registration_name,
-    start_registration_description,
     enter_description,
     skip_description,
     receive_registration_description,
-    start_registration_photo,
     upload_registration_photo,
     skip_photo,
     receive_registration_photo,
@@ -163,10 +128,39 @@ from bot.handlers.master.delete_account import (
     delete_account_confirm,
     delete_account_confirm_intent,
     delete_account_cancel,
-    restart_after_delete,
     WAITING_DELETE_CONFIRM,
     WAITING_DELETE_FINAL,
 )
+from bot.handlers import admin as admin_handlers
+from bot.handlers.master import (
+    bookings as bookings_handlers,
+    delete_account as delete_account_handlers,
+    menu as menu_handlers,
+    onboarding as onboarding_handlers,
+    portfolio as portfolio_handlers,
+    premium as premium_handlers,
+    profile as profile_handlers,
+    qr as qr_handlers,
+    schedule as schedule_handlers,
+    services as services_handlers,
+    services_portfolio as services_portfolio_handlers,
+)
+
+# Модули с таблицами маршрутов кнопок (CALLBACK_ROUTES, NAVIGATION_ROUTES)
+CALLBACK_ROUTE_MODULES = (
+    menu_handlers,
+    profile_handlers,
+    services_handlers,
+    services_portfolio_handlers,
+    schedule_handlers,
+    portfolio_handlers,
+    premium_handlers,
+    onboarding_handlers,
+    qr_handlers,
+    bookings_handlers,
+    delete_account_handlers,
+    admin_handlers,
+)
 
 # Настройка логирования
 logging.basicConfig(
@@ -214,6 +208,73 @@ async def post_init(application: Application):
     # Примечание: webhook автоматически очищается в run_polling, поэтому здесь не нужно
     # Автоматически генерируем команды на основе кнопок главного меню
     # Используем большой таймаут для медленных подключений
+    
+    # Прогреваем офлайн-справочник городов, чтобы первая геолокация не ждала его загрузки
+    try:
+        from bot.utils.gazetteer import get_gazetteer
+        await asyncio.to_thread(get_gazetteer)
+    except Exception as e:
+        logger.warning(f"[WARNING] Не удалось загрузить справочник городов: {e}")
+    
+    # Фоновые задачи выполняет один процесс (при шардировании - шард 0), иначе уведомления задублируются
+    from bot.config import RUN_BACKGROUND_JOBS
+    
+    # Фоновая сверка зависших платежей (основной источник статусов - webhook ЮKassa)
+    if not RUN_BACKGROUND_JOBS:
+        logger.info("[INFO] Фоновые задачи выполняются другим процессом (RUN_BACKGROUND_JOBS=false)")
+    elif application.job_queue:
+        from bot.config import PAYMENT_RECONCILE_INTERVAL
+        from bot.utils.payments import reconcile_payments_job
+        application.job_queue.run_repeating(
+            reconcile_payments_job,
+            interval=PAYMENT_RECONCILE_INTERVAL,
+            first=60,
+            name='reconcile_payments'
+        )
+        
+        # Перевод мастеров с истекшей подпиской на бесплатный тариф
+        from bot.config import SUBSCRIPTION_SWEEP_INTERVAL
+        from bot.utils.subscriptions import subscription_expiry_job
+        application.job_queue.run_repeating(
+            subscription_expiry_job,
+            interval=SUBSCRIPTION_SWEEP_INTERVAL,
+            first=30,
+            name='subscription_expiry'
+        )
+        
+        # Сводки уведомлений для мастеров, выбравших режим "раз в час" или "раз в день"
+        from bot.utils.digest import master_digest_job, DIGEST_CHECK_INTERVAL
+        application.job_queue.run_repeating(
+            master_digest_job,
+            interval=DIGEST_CHECK_INTERVAL,
+            first=DIGEST_CHECK_INTERVAL,
+            name='master_digests'
+        )
+    else:
+        logger.warning("[WARNING] JobQueue недоступна (установите python-telegram-bot[job-queue]), "
+                       "сверка платежей, снятие истекших подписок и сводки уведомлений отключены")
+    
+    # Загружаем валюты стран в память один раз при старте
+    try:
+        from bot.utils.currency import load_currency_registry
+        await asyncio.to_thread(load_currency_registry)
+    except Exception as e:
+        logger.warning(f"[WARNING] Не удалось загрузить реестр валют: {e}")
+    
+    # Общий бот для уведомлений и воркер очереди уведомлений (notification_outbox)
+    from bot.utils.shared_bot import set_master_bot
+    from bot.utils.outbox import start_outbox_worker
+    set_master_bot(application.bot)
+    if RUN_BACKGROUND_JOBS:
+        start_outbox_worker(application.bot)
+        
+        # Продолжаем рассылки, прерванные перезапуском, с последней контрольной точки
+        try:
+            from bot.utils.broadcast import resume_broadcasts
+            resume_broadcasts(application)
+        except Exception as e:
+            logger.error(f"[ERROR] Не удалось продолжить рассылки: {e}", exc_info=True)
+    
     try:
         # Проверяем подключение к боту
         me = await application.bot.get_me()
@@ -232,75 +293,56 @@ async def post_init(application: Application):
         logger.warning(f"[WARNING] Не удалось установить команды: {e} (бот продолжит работу)")
 
 
-def main():
-    """Запуск бота для мастеров"""
-    
-    # Проверка токена
-    if not BOT_TOKEN:
-        logger.error("[ERROR] BOT_TOKEN не установлен! Проверьте файл .env")
-        return
-    
-    # Инициализация базы данных
-    logger.info("[INFO] Инициализация базы данных...")
-    init_db()
-    
-    # Создание приложения
-    logger.info("[INFO] Запуск мастер-бота...")
-    
-    # Патч для принудительного использования IPv4
-    # Это необходимо, так как на некоторых серверах IPv6 вызывает проблемы с TLS
-    import socket
-    import asyncio
-    
-    original_getaddrinfo = socket.getaddrinfo
-    
-    def getaddrinfo_ipv4_only(host, port, family=0, type=0, proto=0, flags=0):
-        """Переопределяем getaddrinfo для использования только IPv4"""
-        # Принудительно используем IPv4 вместо AF_UNSPEC (0) или AF_INET6
-        if family == socket.AF_UNSPEC or family == 0:
-            family = socket.AF_INET
-        elif family == socket.AF_INET6:
-            family = socket.AF_INET  # Заменяем IPv6 на IPv4
-        return original_getaddrinfo(host, port, family, type, proto, flags)
-    
-    # Применяем патч для socket.getaddrinfo
-    socket.getaddrinfo = getaddrinfo_ipv4_only
-    
-    # Патч для asyncio.getaddrinfo (если доступен)
-    if hasattr(asyncio, 'getaddrinfo'):
-        original_asyncio_getaddrinfo = asyncio.getaddrinfo
-        
-        async def asyncio_getaddrinfo_ipv4_only(host, port, family=0, type=0, proto=0, flags=0):
-            """Асинхронная версия getaddrinfo для использования только IPv4"""
-            # Принудительно используем IPv4 вместо AF_UNSPEC (0) или AF_INET6
-            if family == socket.AF_UNSPEC or family == 0:
-                family = socket.AF_INET
-            elif family == socket.AF_INET6:
-                family = socket.AF_INET  # Заменяем IPv6 на IPv4
-            return await original_asyncio_getaddrinfo(host, port, family, type, proto, flags)
-        
-        asyncio.getaddrinfo = asyncio_getaddrinfo_ipv4_only
-        logger.info("[INFO] Настроен принудительный IPv4 для подключений (socket и asyncio)")
-    else:
-        logger.info("[INFO] Настроен принудительный IPv4 для подключений (socket)")
-    
-    # Настраиваем HTTP-клиент с увеличенными таймаутами для медленных соединений
-    from telegram.request import HTTPXRequest
-    
-    # Используем HTTPXRequest с увеличенными таймаутами
-    # HTTP/1.1 вместо HTTP/2 для лучшей совместимости
-    request = HTTPXRequest(
-        connect_timeout=60.0,  # Увеличен для медленных соединений
-        read_timeout=90.0,     # Увеличен для long polling
-        write_timeout=60.0,
-        http_version="1.1"     # Используем HTTP/1.1 для стабильности
-    )
+async def post_stop(application: Application):
+    """
+    Функция, вызываемая после остановки приема апдейтов - остановка фоновой отправки
+
+    Воркер outbox и рассылки останавливаются здесь, а не в post_shutdown: бот
+    приложения должен быть еще открыт, пока они отправляют последние сообщения.
+    """
+    from bot.utils.broadcast import stop_broadcasts
+    from bot.utils.outbox import stop_outbox_worker
+    await stop_broadcasts()
+    await stop_outbox_worker()
+
+
+async def post_shutdown(application: Application):
+    """Функция, вызываемая при остановке бота - закрытие общих HTTP-клиентов"""
+    from bot.utils.shared_bot import close_client_bot
+    await close_client_bot()
+    
+    from bot.utils.geocoding import close_http_client as close_geocoding_client
+    from bot.utils.openai_client import close_client as close_openai_client
+    from bot.utils.country_api import close_http_client as close_country_api_client
+    from bot.utils.yookassa_api import close_http_client as close_yookassa_client
+    await close_geocoding_client()
+    await close_openai_client()
+    await close_country_api_client()
+    await close_yookassa_client()
+
+
+def build_application(request=None, webhook: bool = False) -> Application:
+    """
+    Собрать приложение мастер-бота со всеми обработчиками
+    
+    Args:
+        request: HTTP-клиент для запросов к Bot API (по умолчанию - стандартный)
+        webhook: Режим webhook - апдейты кладет в update_queue ASGI-сервер, Updater не создается
+    """
+    builder = Application.builder().token(BOT_TOKEN)
+    if request is not None:
+        builder = builder.request(request)
+    if webhook:
+        builder = builder.updater(None)
     
     application = (
-        Application.builder()
-        .token(BOT_TOKEN)
-        .request(request)
+        builder
+        .rate_limiter(TelegramRateLimiter())
+        .persistence(DatabasePersistence('master', PERSISTENCE_UPDATE_INTERVAL))
+        .concurrent_updates(PerUserUpdateProcessor(UPDATE_WORKERS))
         .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
         .build()
     )
     
@@ -358,7 +400,9 @@ def main():
             CommandHandler("cancel", start_registration),
         ],
         per_message=False,
-        name="registration"
+        name="registration",
+        conversation_timeout=CONVERSATION_TIMEOUT,
+        persistent=True
     )
     application.add_handler(registration_conversation)
     
@@ -372,8 +416,6 @@ def main():
     # Админ-панель
     application.add_handler(CommandHandler("admin", admin_panel))
     application.add_handler(CommandHandler("stop_impersonation", admin_stop_impersonation))
-    # Обработчик кнопки выхода из имперсонации
-    application.add_handler(CallbackQueryHandler(admin_stop_impersonation, pattern='^stop_impersonation$'))
     
     # ===== ConversationHandler для редактирования имени =====
     edit_name_conversation = ConversationHandler(
@@ -383,7 +425,9 @@ def main():
         },
         fallbacks=[CallbackQueryHandler(master_profile, pattern='^master_profile$')],
         per_message=False,
-        name="edit_name"
+        name="edit_name",
+        conversation_timeout=CONVERSATION_TIMEOUT,
+        persistent=True
     )
     application.add_handler(edit_name_conversation)
     
@@ -395,7 +439,9 @@ def main():
         },
         fallbacks=[CallbackQueryHandler(master_profile, pattern='^master_profile$')],
         per_message=False,
-        name="edit_description"
+        name="edit_description",
+        conversation_timeout=CONVERSATION_TIMEOUT,
+        persistent=True
     )
     application.add_handler(edit_description_conversation)
     
@@ -417,26 +463,15 @@ def main():
             CallbackQueryHandler(master_profile, pattern='^master_profile$'),
         ],
         per_message=False,
-        name="delete_account"
+        name="delete_account",
+        conversation_timeout=CONVERSATION_TIMEOUT,
+        persistent=True
     )
     application.add_handler(delete_account_conversation)
     
-    # Обработчик для перестарта после удаления (эквивалент /start)
-    application.add_handler(CallbackQueryHandler(restart_after_delete, pattern='^restart_after_delete$'))
-    
     # ===== Обработчики кнопок "назад" (регистрируем ДО ConversationHandler'ов) =====
     # Это гарантирует, что кнопки "назад" будут обрабатываться даже если активен ConversationHandler
-    application.add_handler(CallbackQueryHandler(master_menu_callback, pattern='^master_menu$'))
-    application.add_handler(CallbackQueryHandler(master_settings, pattern='^master_settings$'))
-    application.add_handler(CallbackQueryHandler(master_profile, pattern='^master_profile$'))
-    application.add_handler(CallbackQueryHandler(master_services, pattern='^master_services$'))
-    application.add_handler(CallbackQueryHandler(master_schedule, pattern='^master_schedule$'))
-    application.add_handler(CallbackQueryHandler(master_portfolio, pattern='^master_portfolio$'))
-    application.add_handler(CallbackQueryHandler(master_premium, pattern='^master_premium$'))
-    
-    # Обработчики для новых функций после создания услуги
-    application.add_handler(CallbackQueryHandler(new_service_generate_description, pattern=r'^new_service_generate_description_\d+$'))
-    application.add_handler(CallbackQueryHandler(service_created_next, pattern=r'^service_created_next_\d+$'))
+    application.add_handler(CallbackRouter.from_modules(CALLBACK_ROUTE_MODULES, 'NAVIGATION_ROUTES'))
     
     # ===== ConversationHandler для добавления категории =====
     add_category_conversation = ConversationHandler(
@@ -446,7 +481,9 @@ def main():
         },
         fallbacks=[CallbackQueryHandler(master_services, pattern='^master_services$')],
         per_message=False,
-        name="add_category"
+        name="add_category",
+        conversation_timeout=CONVERSATION_TIMEOUT,
+        persistent=True
     )
     application.add_handler(add_category_conversation)
     
@@ -532,7 +569,9 @@ def main():
             MessageHandler(filters.LOCATION, cancel_city_input),
         ],
         per_message=False,
-        name="city_input"
+        name="city_input",
+        conversation_timeout=CONVERSATION_TIMEOUT,
+        persistent=True
     )
     # Регистрируем ПЕРЕД add_service_conversation
     application.add_handler(city_input_conversation)
@@ -599,7 +638,9 @@ def main():
             CallbackQueryHandler(add_service_start, pattern='^add_service$')
         ],
         per_message=False,
-        name="add_service"
+        name="add_service",
+        conversation_timeout=CONVERSATION_TIMEOUT,
+        persistent=True
     )
     application.add_handler(add_service_conversation)
     
@@ -639,7 +680,9 @@ def main():
             CallbackQueryHandler(edit_service, pattern=r'^edit_service_\d+$')
         ],
         per_message=False,
-        name="edit_service"
+        name="edit_service",
+        conversation_timeout=CONVERSATION_TIMEOUT,
+        persistent=True
     )
     application.add_handler(edit_service_conversation)
     
@@ -677,85 +720,14 @@ def main():
             CallbackQueryHandler(schedule_add_period_start, pattern=r'^schedule_add_period_\d+$'),
         ],
         per_message=False,
-        name="schedule"
+        name="schedule",
+        conversation_timeout=CONVERSATION_TIMEOUT,
+        persistent=True
     )
     application.add_handler(schedule_conversation)
     
     # ===== Callback обработчики =====
-    application.add_handler(CallbackQueryHandler(master_menu_callback, pattern='^master_menu$'))
-    application.add_handler(CallbackQueryHandler(master_settings, pattern='^master_settings$'))
-    application.add_handler(CallbackQueryHandler(master_profile, pattern='^master_profile$'))
-    # Обработчики анбординга
-    from bot.handlers.master.onboarding import (
-        onboarding_profile,
-        onboarding_services,
-        onboarding_schedule,
-        show_onboarding
-    )
-    application.add_handler(CallbackQueryHandler(onboarding_profile, pattern='^onboarding_profile$'))
-    application.add_handler(CallbackQueryHandler(onboarding_services, pattern='^onboarding_services$'))
-    application.add_handler(CallbackQueryHandler(onboarding_schedule, pattern='^onboarding_schedule$'))
-    # Обработчики кнопок "Далее"
-    from bot.handlers.master.onboarding import (
-        onboarding_next_services,
-        onboarding_next_schedule
-    )
-    application.add_handler(CallbackQueryHandler(onboarding_next_services, pattern='^onboarding_next_services$'))
-    application.add_handler(CallbackQueryHandler(onboarding_next_schedule, pattern='^onboarding_next_schedule$'))
-    application.add_handler(CallbackQueryHandler(master_services, pattern='^master_services$'))
-    application.add_handler(CallbackQueryHandler(master_premium, pattern='^master_premium$'))
-    application.add_handler(CallbackQueryHandler(premium_pay, pattern='^premium_pay$'))
-    application.add_handler(CallbackQueryHandler(premium_check_status, pattern=r'^premium_check_[\w-]+$'))
-    # Обработчик для выбора категории услуги (вне ConversationHandler, ПЕРЕД ним, чтобы перезапустить разговор)
-    # Это позволяет перезапустить ConversationHandler даже если он активен
-    application.add_handler(CallbackQueryHandler(service_category_selected, pattern=r'^service_category_(predef_\w+|custom|\d+)$'))
-    application.add_handler(CallbackQueryHandler(master_schedule, pattern='^master_schedule$'))
-    # Обработчик для добавления периода (вне ConversationHandler, чтобы работал после завершения)
-    application.add_handler(CallbackQueryHandler(schedule_add_period_start, pattern=r'^schedule_add_period_\d+$'))
-    application.add_handler(CallbackQueryHandler(master_qr, pattern='^master_qr$'))
-    application.add_handler(CallbackQueryHandler(master_bookings, pattern='^master_bookings$'))
-    # Обработчики для редактирования и удаления услуг
-    application.add_handler(CallbackQueryHandler(edit_service, pattern=r'^edit_service_\d+$'))
-    application.add_handler(CallbackQueryHandler(delete_service_confirm, pattern=r'^delete_service_confirm_\d+$'))
-    application.add_handler(CallbackQueryHandler(delete_service_execute, pattern=r'^delete_service_execute_\d+$'))
-    # Обработчики портфолио услуги
-    from bot.handlers.master.services_portfolio import (
-        service_portfolio,
-        service_portfolio_add,
-        service_portfolio_view,
-        service_portfolio_next,
-        service_portfolio_prev,
-        service_portfolio_delete,
-        service_portfolio_delete_confirm,
-    )
-    application.add_handler(CallbackQueryHandler(service_portfolio, pattern=r'^service_portfolio_\d+$'))
-    application.add_handler(CallbackQueryHandler(service_portfolio_add, pattern=r'^service_portfolio_add_\d+$'))
-    application.add_handler(CallbackQueryHandler(service_portfolio_view, pattern=r'^service_portfolio_view_\d+$'))
-    application.add_handler(CallbackQueryHandler(service_portfolio_next, pattern=r'^service_portfolio_next_\d+$'))
-    application.add_handler(CallbackQueryHandler(service_portfolio_prev, pattern=r'^service_portfolio_prev_\d+$'))
-    application.add_handler(CallbackQueryHandler(service_portfolio_delete, pattern=r'^service_portfolio_delete_\d+$'))
-    application.add_handler(CallbackQueryHandler(service_portfolio_delete_confirm, pattern=r'^service_portfolio_delete_confirm_\d+$'))
-    # Обработчики загрузки фото и портфолио
-    from bot.handlers.master import (
-        upload_photo,
-        receive_photo,
-        receive_location,
-        portfolio_add,
-        receive_portfolio_photo,
-        portfolio_view,
-        portfolio_next,
-        portfolio_prev,
-        portfolio_delete,
-        portfolio_delete_confirm
-    )
-    application.add_handler(CallbackQueryHandler(upload_photo, pattern='^upload_photo$'))
-    application.add_handler(CallbackQueryHandler(master_portfolio, pattern='^master_portfolio$'))
-    application.add_handler(CallbackQueryHandler(portfolio_add, pattern='^portfolio_add$'))
-    application.add_handler(CallbackQueryHandler(portfolio_view, pattern='^portfolio_view$'))
-    application.add_handler(CallbackQueryHandler(portfolio_next, pattern='^portfolio_next$'))
-    application.add_handler(CallbackQueryHandler(portfolio_prev, pattern='^portfolio_prev$'))
-    application.add_handler(CallbackQueryHandler(portfolio_delete, pattern='^portfolio_delete$'))
-    application.add_handler(CallbackQueryHandler(portfolio_delete_confirm, pattern=r'^portfolio_delete_confirm_\d+$'))
+    from bot.handlers.master import receive_photo, receive_location
     # Примечание: city_input_conversation уже зарегистрирован выше, перед add_service_conversation
     
     # Обработчик получения фото (общий для фото профиля и портфолио)
@@ -820,36 +792,54 @@ def main():
     # Регистрируем диагностический обработчик с низким приоритетом
     application.add_handler(CallbackQueryHandler(debug_select_city_handler, pattern=r'^select_city_\d+$'), group=-1)
     
-    # Обработчик копирования ссылки
-    from bot.handlers.master import copy_link
-    application.add_handler(CallbackQueryHandler(copy_link, pattern=r'^copy_link_\d+$'))
-    # Обработчики расписания
-    application.add_handler(CallbackQueryHandler(schedule_edit_day, pattern=r'^edit_day_\d+$'))
-    application.add_handler(CallbackQueryHandler(schedule_toggle_day, pattern=r'^schedule_toggle_day_\d+$'))
-    application.add_handler(CallbackQueryHandler(schedule_finish_setup, pattern='^schedule_finish_setup$'))
-    application.add_handler(CallbackQueryHandler(schedule_delete_period, pattern=r'^schedule_delete_period_\d+$'))
-    application.add_handler(CallbackQueryHandler(schedule_delete_temp_period, pattern=r'^schedule_delete_temp_\d+_\d+$'))
-    application.add_handler(CallbackQueryHandler(schedule_save_changes, pattern=r'^schedule_save_\d+$'))
-    application.add_handler(CallbackQueryHandler(schedule_cancel_changes, pattern=r'^schedule_cancel_\d+$'))
+    # ===== Кнопки вне диалогов (разделы мастера и админ-панель) =====
+    # Один обработчик с деревом маршрутов вместо цепочки CallbackQueryHandler;
+    # регистрируется после диалогов, чтобы их состояния и fallbacks имели приоритет
+    application.add_handler(CallbackRouter.from_modules(CALLBACK_ROUTE_MODULES))
     
     # ===== Админ-панель =====
-    # Важно: сначала регистрируем конкретные обработчики, потом ConversationHandler
-    application.add_handler(CallbackQueryHandler(admin_panel, pattern='^admin_panel$'))
-    application.add_handler(CallbackQueryHandler(admin_masters_list, pattern=r'^admin_masters_list_\d+$'))
-    application.add_handler(CallbackQueryHandler(admin_master_detail, pattern=r'^admin_master_detail_\d+$'))
-    application.add_handler(CallbackQueryHandler(admin_unblock_master, pattern=r'^admin_unblock_\d+$'))
-    application.add_handler(CallbackQueryHandler(admin_delete_confirm, pattern=r'^admin_delete_confirm_\d+$'))
-    application.add_handler(CallbackQueryHandler(admin_delete_execute, pattern=r'^admin_delete_execute_\d+$'))
-    application.add_handler(CallbackQueryHandler(admin_change_subscription, pattern=r'^admin_change_sub_\d+$'))
-    application.add_handler(CallbackQueryHandler(admin_set_subscription, pattern=r'^admin_set_sub_\d+_(free|basic|premium)$'))
-    application.add_handler(CallbackQueryHandler(admin_blocked_masters, pattern='^admin_blocked_masters$'))
-    application.add_handler(CallbackQueryHandler(admin_impersonate_master, pattern=r'^admin_impersonate_\d+$'))
-    # ConversationHandler должен быть последним, чтобы не перехватывать callback'и
+    # Кнопки админки - в маршрутизаторе выше; ConversationHandler должен быть последним,
+    # чтобы не перехватывать callback'и
     application.add_handler(create_admin_conversation_handler())
     
     # Обработчик ошибок
     application.add_error_handler(error_handler)
     
+    return application
+
+
+def main():
+    """Запуск бота для мастеров"""
+    
+    # Проверка токена
+    if not BOT_TOKEN:
+        logger.error("[ERROR] BOT_TOKEN не установлен! Проверьте файл .env")
+        return
+    
+    # Инициализация базы данных
+    logger.info("[INFO] Инициализация базы данных...")
+    init_db()
+    
+    # Создание приложения
+    logger.info("[INFO] Запуск мастер-бота...")
+    
+    # Принудительный IPv4: на некоторых серверах IPv6 вызывает проблемы с TLS
+    force_ipv4()
+    
+    # Настраиваем HTTP-клиент с увеличенными таймаутами для медленных соединений
+    from telegram.request import HTTPXRequest
+    
+    # Используем HTTPXRequest с увеличенными таймаутами
+    # HTTP/1.1 вместо HTTP/2 для лучшей совместимости
+    request = HTTPXRequest(
+        connect_timeout=60.0,  # Увеличен для медленных соединений
+        read_timeout=90.0,     # Увеличен для long polling
+        write_timeout=60.0,
+        http_version="1.1"     # Используем HTTP/1.1 для стабильности
+    )
+    
+    application = build_application(request)
+    
     # Запуск бота с настройками polling
     logger.info("[OK] Мастер-бот успешно запущен!")
     logger.info("[INFO] Ожидание обновлений от Telegram...")
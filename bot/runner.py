@@ -0,0 +1,186 @@
+"""Мастер-бот, клиентский бот и REST API в одном процессе на одном event loop"""
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from fastapi import FastAPI
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+BOT_MODES = ('polling', 'webhook')
+
+
+def build_bot_request():
+    """HTTP-пул к Bot API для ботов без long polling (большие таймауты чтения не нужны)"""
+    from telegram.request import HTTPXRequest
+
+    return HTTPXRequest(
+        connect_timeout=60.0,
+        read_timeout=30.0,
+        write_timeout=60.0,
+        http_version="1.1"
+    )
+
+
+def build_applications(request_factory: Optional[Callable[[], object]] = None,
+                       webhook: bool = False) -> Dict[str, Application]:
+    """
+    Приложения ботов, для которых задан токен (ключ - имя бота в пути вебхука)
+
+    У каждого бота свой request (HTTP-пул к Bot API) из request_factory:
+    Application.shutdown() закрывает request своего бота, и общий пул закрылся бы
+    при остановке первого бота, пока второй еще отправляет сообщения.
+    """
+    from bot.config import BOT_TOKEN, CLIENT_BOT_TOKEN
+
+    def new_request():
+        return request_factory() if request_factory else None
+
+    applications = {}
+    if BOT_TOKEN:
+        from bot.main_master import build_application as build_master_application
+        applications['master'] = build_master_application(new_request(), webhook=webhook)
+    if CLIENT_BOT_TOKEN:
+        from bot.main_client import build_application as build_client_application
+        applications['client'] = build_client_application(new_request(), webhook=webhook)
+    return applications
+
+
+async def _run_step(step: Awaitable, name: str, action: str):
+    """Шаг остановки: ошибка одного бота не мешает остановить остальных"""
+    try:
+        await step
+    except Exception as e:
+        logger.error(f"[ERROR] Ошибка при остановке бота {name} ({action}): {e}", exc_info=True)
+
+
+async def start_applications(applications: Dict[str, Application], mode: str = 'webhook',
+                             secret: Optional[str] = None, base_url: Optional[str] = None):
+    """
+    Запустить приложения ботов
+
+    Порядок: initialize и post_init всех ботов (мастер-бот первым - его бот
+    становится общим для уведомлений), затем start - обработчики готовы,
+    и только потом источник апдейтов: polling или регистрация вебхука.
+    Если base_url не задан (локальный запуск, тесты), вебхуки у Telegram не регистрируются.
+    """
+    for application in applications.values():
+        await application.initialize()
+        if application.post_init:
+            await application.post_init(application)
+    for application in applications.values():
+        await application.start()
+
+    for name, application in applications.items():
+        if mode == 'polling':
+            await application.updater.start_polling(
+                allowed_updates=Update.ALL_TYPES,
+                poll_interval=1.0,
+                timeout=30
+            )
+        elif base_url:
+            from bot.webhook import register_webhook
+            await register_webhook(application.bot, name, secret, base_url)
+        logger.info(f"[OK] Бот {name} запущен ({mode})")
+
+
+async def stop_applications(applications: Dict[str, Application]):
+    """
+    Остановить приложения ботов в обратном порядке
+
+    Сначала все боты перестают получать апдейты, затем дожидаются своих
+    обработчиков и в post_stop останавливают фоновую отправку (воркеры outbox,
+    рассылки), и только после этого закрываются соединения - когда ни один бот
+    уже ничего не отправляет. Вебхук у Telegram не удаляется - пока сервер
+    перезапускается, Telegram копит апдейты.
+    """
+    stopping = list(reversed(list(applications.items())))
+    for name, application in stopping:
+        if application.updater and application.updater.running:
+            await _run_step(application.updater.stop(), name, 'updater')
+    for name, application in stopping:
+        if application.running:
+            await _run_step(application.stop(), name, 'stop')
+            if application.post_stop:
+                await _run_step(application.post_stop(application), name, 'post_stop')
+    for name, application in stopping:
+        await _run_step(application.shutdown(), name, 'shutdown')
+        if application.post_shutdown:
+            await _run_step(application.post_shutdown(application), name, 'post_shutdown')
+
+
+def mount_applications(app: FastAPI, applications: Dict[str, Application], mode: str = 'webhook',
+                       secret: Optional[str] = None, base_url: Optional[str] = None):
+    """
+    Запускать и останавливать ботов вместе с ASGI-сервером
+
+    В режиме webhook к приложению добавляются маршруты приема апдейтов.
+    Боты останавливаются раньше остальных обработчиков остановки API, чтобы
+    общие HTTP-клиенты (ЮKassa и др.) закрывались, когда боты уже не работают.
+    """
+    if mode not in BOT_MODES:
+        raise ValueError(f"Unknown bot mode: {mode}")
+    if mode == 'webhook':
+        if not secret:
+            raise ValueError("Webhook secret is required")
+        from bot.webhook import create_webhook_router
+        app.include_router(create_webhook_router(applications, secret))
+
+    async def startup():
+        await start_applications(applications, mode, secret, base_url)
+
+    async def shutdown():
+        await stop_applications(applications)
+
+    app.router.on_startup.append(startup)
+    app.router.on_shutdown.insert(0, shutdown)
+
+
+def main(mode: Optional[str] = None):
+    """Запуск обоих ботов и REST API в одном процессе"""
+    from bot.config import BOT_MODE, SERVER_HOST, SERVER_PORT, WEBHOOK_SECRET, WEBHOOK_URL
+    from bot.database.db import engine, init_db
+    from bot.utils.network import force_ipv4
+
+    started = time.perf_counter()
+    mode = mode or BOT_MODE
+    if mode not in BOT_MODES:
+        logger.error(f"[ERROR] Неизвестный BOT_MODE: {mode} (polling или webhook)")
+        return
+    if mode == 'webhook' and not WEBHOOK_SECRET:
+        logger.error("[ERROR] WEBHOOK_SECRET не установлен! Проверьте файл .env")
+        return
+    if mode == 'webhook' and not WEBHOOK_URL:
+        logger.warning("[WARNING] WEBHOOK_URL не установлен: вебхуки не будут зарегистрированы у Telegram")
+
+    # У каждого бота свой HTTP-пул к Bot API; long polling использует свои соединения getUpdates
+    applications = build_applications(build_bot_request, webhook=(mode == 'webhook'))
+    if not applications:
+        logger.error("[ERROR] Не задан ни BOT_TOKEN, ни CLIENT_BOT_TOKEN! Проверьте файл .env")
+        return
+
+    # Одна инициализация БД и один пул соединений (engine) на все сервисы процесса
+    logger.info("[INFO] Инициализация базы данных...")
+    init_db()
+    force_ipv4()
+
+    import uvicorn
+    from mobile_app.api.main import app
+
+    mount_applications(app, applications, mode, WEBHOOK_SECRET, WEBHOOK_URL)
+
+    async def log_startup_time():
+        logger.info(f"[OK] Боты ({', '.join(applications)}) и REST API запущены за "
+                    f"{time.perf_counter() - started:.1f} с, {SERVER_HOST}:{SERVER_PORT}")
+
+    app.router.on_startup.append(log_startup_time)
+    try:
+        uvicorn.run(app, host=SERVER_HOST, port=SERVER_PORT)
+    finally:
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
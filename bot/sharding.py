@@ -0,0 +1,279 @@
+"""Шардирование ботов по пользователям: диспетчер вебхуков и процессы-воркеры с общей БД"""
+import argparse
+import asyncio
+import logging
+import os
+import subprocess
+import sys
+from itertools import groupby
+from typing import Any, Dict, Iterable, List, Optional
+
+import httpx
+from fastapi import APIRouter, FastAPI, HTTPException, Request
+
+from bot.webhook import (
+    SECRET_TOKEN_HEADER, WEBHOOK_PATH_PREFIX, get_webhook_path, get_webhook_secret, verify_secret_token
+)
+
+logger = logging.getLogger(__name__)
+
+# Сколько апдейтов одного шарда пересылать воркеру одним запросом
+FORWARD_BATCH_SIZE = 100
+# Пауза перед повтором пересылки, если воркер недоступен (секунды, удваивается до FORWARD_MAX_DELAY)
+FORWARD_RETRY_DELAY = 0.5
+FORWARD_MAX_DELAY = 10.0
+# Сколько ждать доставки очереди воркерам при остановке диспетчера (секунды)
+DRAIN_TIMEOUT = 10.0
+# Поля апдейта с пользователем, как в Update.effective_user
+_USER_FIELDS = ('from', 'user')
+
+
+def get_update_user_id(data: Dict[str, Any]) -> Optional[int]:
+    """
+    Id пользователя апдейта по сырому JSON
+
+    Диспетчер не разбирает апдейт целиком (Update.de_json), а берет
+    отправителя сообщения, нажатия кнопки, ответа на опрос и т.д. Для апдейтов
+    без пользователя (посты в канале) - id чата.
+    """
+    for key, value in data.items():
+        if key == 'update_id' or not isinstance(value, dict):
+            continue
+        for field in _USER_FIELDS:
+            user = value.get(field)
+            if isinstance(user, dict) and 'id' in user:
+                return user['id']
+        chat = value.get('chat') or (value.get('message') or {}).get('chat')
+        if isinstance(chat, dict) and 'id' in chat:
+            return chat['id']
+    return None
+
+
+def get_shard(data: Dict[str, Any], shards: int) -> int:
+    """
+    Номер шарда апдейта
+
+    Остаток от деления id, а не hash(): номер одинаков во всех процессах и
+    после перезапуска, поэтому все апдейты пользователя попадают в один воркер
+    (и в его user_data/ConversationHandler).
+    """
+    return (get_update_user_id(data) or 0) % shards
+
+
+class ShardDispatcher:
+    """
+    Пересылка апдейтов в процессы-воркеры
+
+    У каждого шарда своя очередь и одна задача пересылки: следующая пачка
+    уходит только после того, как воркер принял предыдущую, поэтому апдейты
+    пользователя приходят в воркер в порядке поступления (дальше порядок
+    сохраняет PerUserUpdateProcessor). Пока воркер недоступен (перезапуск),
+    апдейты его шарда ждут в очереди, остальные шарды работают.
+    """
+
+    def __init__(self, worker_urls: List[str], secret: str, batch_size: int = FORWARD_BATCH_SIZE,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        if not worker_urls:
+            raise ValueError("At least one worker is required")
+        self.worker_urls = [url.rstrip('/') for url in worker_urls]
+        self.secret = secret
+        self.batch_size = batch_size
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._queues: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+        self.metrics = {'forwarded': [0] * len(worker_urls), 'retried': 0, 'dropped': 0}
+
+    @property
+    def shards(self) -> int:
+        return len(self.worker_urls)
+
+    def dispatch(self, bot_name: str, data: Dict[str, Any]) -> int:
+        """Поставить апдейт в очередь его шарда. Возвращает номер шарда"""
+        shard = get_shard(data, self.shards)
+        self._queues[shard].put_nowait((bot_name, data))
+        return shard
+
+    async def start(self):
+        self._client = httpx.AsyncClient(timeout=httpx.Timeout(10.0), transport=self._transport)
+        self._queues = [asyncio.Queue() for _ in self.worker_urls]
+        self._tasks = [
+            asyncio.create_task(self._forward(shard), name=f"shard_forwarder_{shard}")
+            for shard in range(self.shards)
+        ]
+        logger.info(f"Shard dispatcher started: {self.shards} workers")
+
+    async def stop(self, timeout: float = DRAIN_TIMEOUT):
+        """Доставить оставшиеся апдейты (не дольше timeout) и остановить пересылку"""
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self._queues)), timeout)
+        except asyncio.TimeoutError:
+            left = sum(queue.qsize() for queue in self._queues)
+            logger.warning(f"Shard dispatcher stopped with {left} undelivered updates")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        logger.info(f"Shard dispatcher stopped, metrics: {self.metrics}")
+
+    async def _forward(self, shard: int):
+        queue = self._queues[shard]
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            # Апдейты разных ботов - отдельными запросами, порядок внутри бота сохраняется
+            for bot_name, items in groupby(batch, key=lambda item: item[0]):
+                await self._send(shard, bot_name, [data for _, data in items])
+            for _ in batch:
+                queue.task_done()
+
+    async def _send(self, shard: int, bot_name: str, updates: List[Dict[str, Any]]):
+        url = self.worker_urls[shard] + get_webhook_path(bot_name)
+        headers = {SECRET_TOKEN_HEADER: get_webhook_secret(self.secret, bot_name)}
+        delay = FORWARD_RETRY_DELAY
+        while True:
+            try:
+                response = await self._client.post(url, json=updates, headers=headers)
+                if response.status_code == 200:
+                    self.metrics['forwarded'][shard] += len(updates)
+                    return
+                if response.status_code in (400, 403, 404):
+                    # Повтор не поможет (неверный апдейт или настройка) - не блокируем очередь шарда
+                    self.metrics['dropped'] += len(updates)
+                    logger.error(f"Shard {shard} rejected {len(updates)} {bot_name} updates: {response.status_code}")
+                    return
+                logger.warning(f"Shard {shard} is not ready ({response.status_code}), retry in {delay}s")
+            except httpx.HTTPError as e:
+                logger.warning(f"Shard {shard} is unavailable ({e!r}), retry in {delay}s")
+            self.metrics['retried'] += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, FORWARD_MAX_DELAY)
+
+
+def create_dispatcher_router(dispatcher: ShardDispatcher, bot_names: Iterable[str], secret: str) -> APIRouter:
+    """Маршруты приема апдейтов от Telegram: те же пути и проверка токена, что и в режиме webhook"""
+    router = APIRouter()
+    secrets = {name: get_webhook_secret(secret, name) for name in bot_names}
+
+    @router.post(WEBHOOK_PATH_PREFIX + "/{bot_name}")
+    async def telegram_webhook(bot_name: str, request: Request):
+        if bot_name not in secrets:
+            raise HTTPException(status_code=404, detail="Unknown bot")
+        verify_secret_token(request, bot_name, secrets[bot_name])
+        try:
+            data = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid JSON")
+        if not isinstance(data, dict):
+            raise HTTPException(status_code=400, detail="Invalid update")
+        dispatcher.dispatch(bot_name, data)
+        return {"ok": True}
+
+    return router
+
+
+def mount_dispatcher(app: FastAPI, dispatcher: ShardDispatcher, tokens: Dict[str, str], secret: str,
+                     base_url: Optional[str] = None):
+    """
+    Подключить диспетчер к ASGI-приложению
+
+    Вебхуки у Telegram регистрирует диспетчер (воркеры о публичном адресе не знают).
+    """
+    if not secret:
+        raise ValueError("Webhook secret is required")
+    app.include_router(create_dispatcher_router(dispatcher, tokens, secret))
+
+    async def startup():
+        await dispatcher.start()
+        if base_url:
+            from telegram import Bot
+            from bot.webhook import register_webhook
+            for name, token in tokens.items():
+                async with Bot(token) as bot:
+                    await register_webhook(bot, name, secret, base_url)
+
+    app.router.on_startup.append(startup)
+    app.router.on_shutdown.insert(0, dispatcher.stop)
+
+
+def run_worker(shard: int, port: int):
+    """Процесс-воркер: приложения ботов за внутренним вебхуком на 127.0.0.1"""
+    import uvicorn
+    from bot.config import WEBHOOK_SECRET
+    from bot.runner import build_applications, build_bot_request, mount_applications
+    from bot.utils.network import force_ipv4
+
+    force_ipv4()
+    applications = build_applications(build_bot_request, webhook=True)
+    app = FastAPI(title=f"Lumi bots shard {shard}")
+    mount_applications(app, applications, 'webhook', WEBHOOK_SECRET)
+    logger.info(f"[INFO] Шард {shard}: боты {', '.join(applications)} на 127.0.0.1:{port}")
+    uvicorn.run(app, host='127.0.0.1', port=port)
+
+
+def _stop_workers(workers: List[subprocess.Popen], timeout: float = 30.0):
+    """Остановить воркеры (SIGTERM - uvicorn дождется обработчиков), зависшие - завершить принудительно"""
+    for process in workers:
+        if process.poll() is None:
+            process.terminate()
+    for process in workers:
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    """Запуск диспетчера (вместе с REST API) и SHARD_COUNT процессов-воркеров"""
+    import uvicorn
+    from bot.config import (
+        BOT_TOKEN, CLIENT_BOT_TOKEN, RUN_BACKGROUND_JOBS, SERVER_HOST, SERVER_PORT,
+        SHARD_BASE_PORT, SHARD_COUNT, WEBHOOK_SECRET, WEBHOOK_URL
+    )
+    from bot.database.db import engine, init_db
+
+    if not WEBHOOK_SECRET:
+        logger.error("[ERROR] WEBHOOK_SECRET не установлен! Проверьте файл .env")
+        return
+    tokens = {name: token for name, token in (('master', BOT_TOKEN), ('client', CLIENT_BOT_TOKEN)) if token}
+    if not tokens:
+        logger.error("[ERROR] Не задан ни BOT_TOKEN, ни CLIENT_BOT_TOKEN! Проверьте файл .env")
+        return
+
+    # Миграции выполняются один раз до запуска воркеров
+    logger.info("[INFO] Инициализация базы данных...")
+    init_db()
+
+    ports = [SHARD_BASE_PORT + shard for shard in range(SHARD_COUNT)]
+    workers = []
+    for shard, port in enumerate(ports):
+        env = dict(os.environ, RUN_BACKGROUND_JOBS='true' if shard == 0 and RUN_BACKGROUND_JOBS else 'false')
+        workers.append(subprocess.Popen(
+            [sys.executable, '-m', 'bot.sharding', '--worker', str(shard), '--port', str(port)], env=env
+        ))
+
+    from mobile_app.api.main import app
+
+    dispatcher = ShardDispatcher([f"http://127.0.0.1:{port}" for port in ports], WEBHOOK_SECRET)
+    mount_dispatcher(app, dispatcher, tokens, WEBHOOK_SECRET, WEBHOOK_URL)
+    logger.info(f"[INFO] Диспетчер на {SERVER_HOST}:{SERVER_PORT}, воркеров: {SHARD_COUNT}")
+    try:
+        uvicorn.run(app, host=SERVER_HOST, port=SERVER_PORT)
+    finally:
+        _stop_workers(workers)
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Шардированный запуск ботов")
+    parser.add_argument('--worker', type=int, help="Запустить процесс-воркер с этим номером шарда")
+    parser.add_argument('--port', type=int, help="Порт воркера")
+    args = parser.parse_args()
+    if args.worker is not None:
+        run_worker(args.worker, args.port)
+    else:
+        main()
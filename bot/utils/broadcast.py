@@ -0,0 +1,154 @@
+"""Рассылки администратора с ограничением частоты и продолжением после перезапуска"""
+import asyncio
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Сколько получателей читать из БД за раз
+BROADCAST_PAGE_SIZE = 500
+# Контрольная точка сохраняется каждые BROADCAST_CHECKPOINT_EVERY сообщений:
+# после перезапуска повторно могут уйти не больше этого числа сообщений
+BROADCAST_CHECKPOINT_EVERY = 20
+
+AUDIENCE_NAMES = {
+    'masters': 'мастерам',
+    'clients': 'клиентам',
+}
+
+_tasks: Dict[int, asyncio.Task] = {}
+
+
+def get_broadcast_bot(audience: str, master_bot=None):
+    """Бот для рассылки: мастерам пишет мастер-бот, клиентам - клиентский бот"""
+    if audience == 'masters':
+        if master_bot is not None:
+            return master_bot
+        from bot.utils.shared_bot import get_master_bot
+        return get_master_bot()
+    from bot.utils.shared_bot import get_client_bot
+    return get_client_bot()
+
+
+async def run_broadcast(broadcast_id: int, bot, rate: Optional[float] = None) -> Optional[str]:
+    """
+    Выполнить рассылку с контрольной точки
+
+    Получатели читаются страницами по id, сообщения отправляются не чаще rate
+    в секунду через очередь bulk ограничителя запросов. Прогресс (id последнего
+    получателя, счетчики доставленных и ошибок) сохраняется в таблице broadcasts,
+    поэтому после перезапуска рассылка продолжается, а администратор видит
+    прогресс в админ-панели. При отмене задачи (остановка бота) сохраняется
+    последняя контрольная точка, статус остается running.
+
+    Returns:
+        Итоговый статус рассылки: done или cancelled
+    """
+    from bot.config import BROADCAST_RATE
+    from bot.database.db import (
+        get_session, get_broadcast, get_broadcast_recipients_page, update_broadcast_progress
+    )
+    from bot.utils.notifications import send_with_retry
+    from bot.utils.rate_limiter import LANE_BULK, lane_kwargs
+
+    interval = 1.0 / (rate or BROADCAST_RATE)
+    with get_session() as session:
+        broadcast = get_broadcast(session, broadcast_id)
+        if not broadcast or broadcast.status != 'running':
+            return broadcast.status if broadcast else None
+        audience, text = broadcast.audience, broadcast.text
+        last_id, sent, failed = broadcast.last_recipient_id, broadcast.sent, broadcast.failed
+
+    logger.info(f"Broadcast {broadcast_id} to {audience} started from recipient {last_id}")
+    kwargs = lane_kwargs(bot, LANE_BULK)
+    since_checkpoint = 0
+    try:
+        while True:
+            with get_session() as session:
+                page = get_broadcast_recipients_page(session, audience, last_id, BROADCAST_PAGE_SIZE)
+            if not page:
+                break
+
+            for recipient_id, telegram_id in page:
+                if await send_with_retry(bot, telegram_id, text, **kwargs):
+                    sent += 1
+                else:
+                    failed += 1
+                last_id = recipient_id
+                since_checkpoint += 1
+                if since_checkpoint >= BROADCAST_CHECKPOINT_EVERY:
+                    since_checkpoint = 0
+                    with get_session() as session:
+                        status = update_broadcast_progress(session, broadcast_id, last_id, sent, failed)
+                    if status != 'running':
+                        logger.info(f"Broadcast {broadcast_id} stopped: {status}, sent={sent}, failed={failed}")
+                        return status
+                await asyncio.sleep(interval)
+    except asyncio.CancelledError:
+        with get_session() as session:
+            update_broadcast_progress(session, broadcast_id, last_id, sent, failed)
+        logger.info(f"Broadcast {broadcast_id} paused at recipient {last_id}, sent={sent}, failed={failed}")
+        raise
+
+    with get_session() as session:
+        status = update_broadcast_progress(session, broadcast_id, last_id, sent, failed, finished=True)
+    logger.info(f"Broadcast {broadcast_id} finished: {status}, sent={sent}, failed={failed}")
+    return status
+
+
+def start_broadcast(application, broadcast_id: int, audience: str) -> bool:
+    """
+    Запустить рассылку фоновой задачей
+
+    Задача не регистрируется в Application.create_task: Application.stop()
+    дожидается таких задач, и остановка бота ждала бы конца рассылки.
+    Задачи останавливает stop_broadcasts() в post_stop.
+
+    Returns:
+        False, если для аудитории нет бота (не задан токен)
+    """
+    task = _tasks.get(broadcast_id)
+    if task is not None and not task.done():
+        return True
+    bot = get_broadcast_bot(audience, application.bot)
+    if bot is None:
+        return False
+
+    async def runner():
+        try:
+            await run_broadcast(broadcast_id, bot)
+        except Exception as e:
+            logger.error(f"Broadcast {broadcast_id} failed: {e}", exc_info=True)
+        finally:
+            _tasks.pop(broadcast_id, None)
+
+    _tasks[broadcast_id] = asyncio.create_task(runner(), name=f"broadcast_{broadcast_id}")
+    return True
+
+
+async def stop_broadcasts() -> int:
+    """
+    Остановить рассылки этого процесса (вызывается в post_stop)
+
+    Каждая рассылка сохраняет контрольную точку и остается в статусе running -
+    при следующем запуске ее продолжит resume_broadcasts().
+    """
+    tasks = list(_tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    if tasks:
+        logger.info(f"Paused {len(tasks)} broadcasts")
+    return len(tasks)
+
+
+def resume_broadcasts(application) -> int:
+    """Продолжить незавершенные рассылки после перезапуска (вызывается в post_init)"""
+    from bot.database.db import get_session, get_running_broadcasts
+
+    with get_session() as session:
+        running = [(broadcast.id, broadcast.audience) for broadcast in get_running_broadcasts(session)]
+    resumed = sum(1 for broadcast_id, audience in running if start_broadcast(application, broadcast_id, audience))
+    if resumed:
+        logger.info(f"Resumed {resumed} broadcasts")
+    return resumed
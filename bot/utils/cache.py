@@ -88,6 +88,8 @@ class CacheKeys:
     PARTICIPATION_PRICING = "participation_pricing"
     SERVICES = "services"
     ADDONS = "addons"
+    SERVICE_DESCRIPTION = "service_description"
+    CITIES = "cities"
     # УДАЛЕНО: LOCATIONS, get_locations_key - старый код для paintball проекта
     
     @staticmethod
@@ -101,6 +103,10 @@ class CacheKeys:
     @staticmethod
     def get_addons_key(service_id: int) -> str:
         return f"{CacheKeys.ADDONS}:{service_id}"
+    
+    @staticmethod
+    def get_service_description_key(service_name: str, variation: int) -> str:
+        return f"{CacheKeys.SERVICE_DESCRIPTION}:{service_name}:{variation}"
 
 # Периодическая очистка кэша
 async def cleanup_cache_task():
@@ -0,0 +1,174 @@
+"""Маршрутизация нажатий inline-кнопок по префиксному дереву callback_data"""
+import logging
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from telegram import Update
+from telegram.ext import BaseHandler
+
+logger = logging.getLogger(__name__)
+
+# Разделитель сегментов callback_data: edit_service_12 -> ['edit', 'service', '12']
+SEPARATOR = '_'
+
+Route = Tuple[str, Callable]
+
+
+def _parse_int(segment: str) -> Optional[int]:
+    return int(segment) if segment.isdecimal() else None
+
+
+def _parse_str(segment: str) -> Optional[str]:
+    return segment or None
+
+
+# Типы аргументов в шаблоне. Порядок - приоритет при совпадении нескольких:
+# сначала литерал, затем <int>, <a|b>, <str> и последним <rest>
+_CONVERTERS: Dict[str, Callable[[str], Any]] = {
+    'int': _parse_int,
+    'str': _parse_str,
+}
+
+
+class _Node:
+    __slots__ = ('literals', 'params', 'rest', 'callback', 'pattern')
+
+    def __init__(self):
+        self.literals: Dict[str, '_Node'] = {}
+        # (тип, допустимые значения для <a|b>, узел)
+        self.params: List[Tuple[str, Optional[frozenset], '_Node']] = []
+        self.rest: Optional[Tuple[Callable, str]] = None
+        self.callback: Optional[Callable] = None
+        self.pattern: Optional[str] = None
+
+
+def _param_order(param: Tuple[str, Optional[frozenset], '_Node']) -> int:
+    kind = param[0]
+    return 0 if kind == 'int' else 1 if kind == 'choice' else 2
+
+
+class CallbackRouter(BaseHandler[Update, Any, Any]):
+    """
+    Один обработчик вместо цепочки CallbackQueryHandler с регулярными выражениями
+
+    Шаблон маршрута - сегменты callback_data через '_': литералы и типизированные
+    аргументы, например 'edit_service_<int>', 'admin_set_sub_<int>_<free|basic|premium>'.
+    <int> - неотрицательное число, <str> - один непустой сегмент, <a|b> - одно из
+    значений, <rest> - весь остаток (может содержать '_', только в конце шаблона).
+
+    Поиск обработчика - проход по дереву сегментов, его стоимость не зависит от
+    числа маршрутов. Разобранные аргументы передаются обработчику в context.args.
+    """
+
+    __slots__ = ('_root', '_count')
+
+    def __init__(self, routes: Iterable[Route] = (), block: bool = True):
+        super().__init__(self._dispatch, block=block)
+        self._root = _Node()
+        self._count = 0
+        self.include(routes)
+
+    @classmethod
+    def from_modules(cls, modules: Sequence[Any], attribute: str = 'CALLBACK_ROUTES') -> 'CallbackRouter':
+        """Собрать маршрутизатор из таблиц маршрутов модулей обработчиков"""
+        router = cls()
+        for module in modules:
+            router.include(getattr(module, attribute, ()))
+        return router
+
+    def __len__(self) -> int:
+        return self._count
+
+    def include(self, routes: Iterable[Route]):
+        for pattern, callback in routes:
+            self.add(pattern, callback)
+
+    def add(self, pattern: str, callback: Callable):
+        """Зарегистрировать маршрут. Повторная регистрация того же шаблона - ошибка"""
+        node = self._root
+        segments = pattern.split(SEPARATOR)
+        for index, segment in enumerate(segments):
+            if segment == '<rest>':
+                if index != len(segments) - 1:
+                    raise ValueError(f"<rest> must be the last segment: {pattern}")
+                if node.rest is not None:
+                    raise ValueError(f"Duplicate callback route: {pattern}")
+                node.rest = (callback, pattern)
+                self._count += 1
+                return
+            node = self._child(node, segment, pattern)
+        if node.callback is not None:
+            raise ValueError(f"Duplicate callback route: {pattern} (already {node.pattern})")
+        node.callback = callback
+        node.pattern = pattern
+        self._count += 1
+
+    @staticmethod
+    def _child(node: _Node, segment: str, pattern: str) -> _Node:
+        if not (segment.startswith('<') and segment.endswith('>')):
+            return node.literals.setdefault(segment, _Node())
+        spec = segment[1:-1]
+        if '|' in spec:
+            kind, choices = 'choice', frozenset(spec.split('|'))
+        elif spec in _CONVERTERS:
+            kind, choices = spec, None
+        else:
+            raise ValueError(f"Unknown argument type <{spec}> in {pattern}")
+        for param_kind, param_choices, child in node.params:
+            if param_kind == kind and param_choices == choices:
+                return child
+        child = _Node()
+        node.params.append((kind, choices, child))
+        node.params.sort(key=_param_order)
+        return child
+
+    def resolve(self, data: str) -> Optional[Tuple[Callable, List[Any]]]:
+        """Обработчик и аргументы для callback_data (None - маршрута нет)"""
+        return self._match(self._root, data.split(SEPARATOR), 0, [])
+
+    def _match(self, node: _Node, segments: List[str], index: int,
+               args: List[Any]) -> Optional[Tuple[Callable, List[Any]]]:
+        if index == len(segments):
+            return (node.callback, args) if node.callback is not None else None
+        segment = segments[index]
+        child = node.literals.get(segment)
+        if child is not None:
+            found = self._match(child, segments, index + 1, args)
+            if found:
+                return found
+        for kind, choices, child in node.params:
+            if kind == 'choice':
+                value = segment if segment in choices else None
+            else:
+                value = _CONVERTERS[kind](segment)
+            if value is None:
+                continue
+            found = self._match(child, segments, index + 1, args + [value])
+            if found:
+                return found
+        if node.rest is not None:
+            rest = SEPARATOR.join(segments[index:])
+            if rest:
+                return node.rest[0], args + [rest]
+        return None
+
+    def check_update(self, update: object) -> Optional[Tuple[Callable, List[Any]]]:
+        if not isinstance(update, Update) or not update.callback_query:
+            return None
+        data = update.callback_query.data
+        if not isinstance(data, str):
+            return None
+        return self.resolve(data)
+
+    def collect_additional_context(self, context, update, application, check_result):
+        context.args = check_result[1]
+
+    async def handle_update(self, update, application, check_result, context):
+        self.collect_additional_context(context, update, application, check_result)
+        return await check_result[0](update, context)
+
+    async def _dispatch(self, update, context):
+        """Обработчик по умолчанию для BaseHandler (вызов идет через handle_update)"""
+        found = self.check_update(update)
+        if found:
+            context.args = found[1]
+            return await found[0](update, context)
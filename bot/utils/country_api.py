@@ -8,6 +8,29 @@ logger = logging.getLogger(__name__)
 # REST Countries API endpoint
 REST_COUNTRIES_API_URL = "https://restcountries.com/v3.1/alpha/{code}"
 
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Общий HTTP-клиент с keep-alive соединениями к REST Countries"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        # Увеличенные таймауты для медленных соединений
+        # Используем HTTP/1.1 для лучшей совместимости
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(connect=10.0, read=15.0, write=10.0, pool=10.0),
+            http2=False
+        )
+    return _http_client
+
+
+async def close_http_client():
+    """Закрыть общий HTTP-клиент (вызывается при остановке бота)"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+    _http_client = None
+
 
 async def get_currency_from_api(country_code: str) -> Optional[Dict[str, str]]:
     """
@@ -33,45 +56,40 @@ async def get_currency_from_api(country_code: str) -> Optional[Dict[str, str]]:
         url = REST_COUNTRIES_API_URL.format(code=country_code.upper())
         logger.info(f"Fetching currency from API: {url}")
         
-        # Увеличенные таймауты для медленных соединений
-        # Используем HTTP/1.1 для лучшей совместимости
-        timeout = httpx.Timeout(connect=10.0, read=15.0, write=10.0, pool=10.0)
+        logger.debug(f"Sending GET request to {url}")
+        response = await get_http_client().get(url)
+        logger.debug(f"Received response: {response.status_code}")
+        response.raise_for_status()
         
-        async with httpx.AsyncClient(timeout=timeout, http2=False) as client:
-            logger.debug(f"Sending GET request to {url}")
-            response = await client.get(url)
-            logger.debug(f"Received response: {response.status_code}")
-            response.raise_for_status()
-            
-            data = response.json()
-            
-            # API может вернуть массив или объект
-            if isinstance(data, list):
-                if not data:
-                    logger.warning(f"No data returned for country code: {country_code}")
-                    return None
-                data = data[0]
-            
-            # Получаем информацию о валютах
-            currencies = data.get('currencies', {})
-            
-            if not currencies:
-                logger.warning(f"No currencies found for country code: {country_code}")
+        data = response.json()
+        
+        # API может вернуть массив или объект
+        if isinstance(data, list):
+            if not data:
+                logger.warning(f"No data returned for country code: {country_code}")
                 return None
-            
-            # Берем первую валюту (обычно это основная валюта страны)
-            currency_code = list(currencies.keys())[0]
-            currency_info = currencies[currency_code]
-            
-            result = {
-                'currency_code': currency_code,
-                'currency_name': currency_info.get('name', ''),
-                'currency_symbol': currency_info.get('symbol', '')
-            }
-            
-            logger.info(f"Successfully retrieved currency {currency_code} for country {country_code}")
-            return result
-            
+            data = data[0]
+        
+        # Получаем информацию о валютах
+        currencies = data.get('currencies', {})
+        
+        if not currencies:
+            logger.warning(f"No currencies found for country code: {country_code}")
+            return None
+        
+        # Берем первую валюту (обычно это основная валюта страны)
+        currency_code = list(currencies.keys())[0]
+        currency_info = currencies[currency_code]
+        
+        result = {
+            'currency_code': currency_code,
+            'currency_name': currency_info.get('name', ''),
+            'currency_symbol': currency_info.get('symbol', '')
+        }
+        
+        logger.info(f"Successfully retrieved currency {currency_code} for country {country_code}")
+        return result
+        
     except httpx.TimeoutException:
         logger.error(f"Timeout while fetching currency for country code: {country_code}")
         return None
@@ -1,5 +1,6 @@
 """Утилиты для работы с валютами"""
 from typing import Dict, Optional
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -170,10 +171,157 @@ CURRENCY_NAMES_RU_PREPOSITIONAL: Dict[str, str] = {
 }
 
 
+class CurrencyRegistry:
+    """
+    Реестр валют стран в памяти
+
+    Объединяет статические словари модуля и записи таблицы CountryCurrency,
+    которые загружаются один раз при старте бота. Валюты, найденные через API,
+    сначала сохраняются в БД, затем добавляются в память (write-through).
+    Одновременные запросы для одной страны используют один запрос к API.
+    Статические словари модуля при этом не изменяются.
+    """
+
+    def __init__(self):
+        self._country_to_currency: Dict[str, str] = dict(COUNTRY_TO_CURRENCY)
+        self._symbols: Dict[str, str] = dict(CURRENCY_SYMBOLS)
+        self._names_prepositional: Dict[str, str] = dict(CURRENCY_NAMES_RU_PREPOSITIONAL)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.loaded = False
+
+    def load(self, session) -> int:
+        """Загрузить все валюты стран из БД. Возвращает количество записей"""
+        from bot.database.models import CountryCurrency
+
+        rows = session.query(CountryCurrency).all()
+        for row in rows:
+            self._remember(row.country_code, row.currency_code, row.currency_name, row.currency_symbol)
+        self.loaded = True
+        logger.info(f"Currency registry loaded: {len(rows)} countries from DB, {len(self._country_to_currency)} total")
+        return len(rows)
+
+    def _remember(self, country_code: str, currency_code: str,
+                  currency_name: Optional[str] = None, currency_symbol: Optional[str] = None):
+        """Добавить валюту страны в память (известные символы и названия не перезаписываются)"""
+        self._country_to_currency[country_code.upper()] = currency_code
+        if currency_symbol and currency_code not in self._symbols:
+            self._symbols[currency_code] = currency_symbol
+        if currency_code not in self._names_prepositional:
+            # Название из API на английском, но это лучше чем ничего
+            self._names_prepositional[currency_code] = (currency_name or currency_code).lower()
+
+    def get_currency(self, country_code: Optional[str]) -> Optional[str]:
+        """Код валюты страны из памяти или None"""
+        if not country_code:
+            return None
+        return self._country_to_currency.get(country_code.upper())
+
+    def get_symbol(self, currency_code: str) -> Optional[str]:
+        return self._symbols.get(currency_code.upper())
+
+    def get_name_prepositional(self, currency_code: str) -> Optional[str]:
+        return self._names_prepositional.get(currency_code.upper())
+
+    async def resolve(self, country_code: Optional[str], session=None) -> str:
+        """
+        Получить код валюты страны: из памяти, а при промахе - из API
+
+        Args:
+            country_code: Двухбуквенный код страны (ISO 3166-1 alpha-2)
+            session: SQLAlchemy session (для загрузки реестра, если он еще не загружен)
+
+        Returns:
+            Код валюты (ISO 4217), по умолчанию RUB
+        """
+        if not country_code:
+            return 'RUB'
+        country_code_upper = country_code.upper()
+
+        if not self.loaded:
+            if session is not None:
+                self.load(session)
+            else:
+                from bot.database.db import get_session
+                with get_session() as own_session:
+                    self.load(own_session)
+
+        currency_code = self._country_to_currency.get(country_code_upper)
+        if currency_code:
+            logger.debug(f"Currency {currency_code} found in registry for country {country_code_upper}")
+            return currency_code
+
+        task = self._inflight.get(country_code_upper)
+        if task is None:
+            task = asyncio.create_task(self._fetch_and_store(country_code_upper))
+            self._inflight[country_code_upper] = task
+            task.add_done_callback(lambda _: self._inflight.pop(country_code_upper, None))
+        return await asyncio.shield(task)
+
+    async def _fetch_and_store(self, country_code: str) -> str:
+        """Запросить валюту из API и сохранить в БД и память"""
+        logger.info(f"Currency not found in registry for country {country_code}, fetching from API...")
+
+        from bot.utils.country_api import get_currency_from_api
+
+        # Добавляем общий таймаут для всего запроса к API (20 секунд)
+        try:
+            currency_data = await asyncio.wait_for(get_currency_from_api(country_code), timeout=20.0)
+        except asyncio.TimeoutError:
+            logger.warning(f"Timeout while fetching currency from API for {country_code} (exceeded 20 seconds)")
+            currency_data = None
+        except Exception as e:
+            logger.error(f"Error while fetching currency from API for {country_code}: {e}", exc_info=True)
+            currency_data = None
+
+        if not currency_data:
+            # API недоступно или ошибка - используем fallback (в память не сохраняем, попробуем позже)
+            logger.warning(f"Could not fetch currency from API for {country_code}, using RUB fallback")
+            return 'RUB'
+
+        currency_code = currency_data['currency_code']
+        try:
+            from bot.database.db import get_session, get_or_create_country_currency
+            with get_session() as session:
+                get_or_create_country_currency(
+                    session,
+                    country_code=country_code,
+                    currency_code=currency_code,
+                    currency_name=currency_data.get('currency_name'),
+                    currency_symbol=currency_data.get('currency_symbol')
+                )
+        except Exception as e:
+            # Не сохранили в БД - не добавляем и в память, чтобы они не расходились
+            logger.error(f"Error saving currency for country {country_code}: {e}", exc_info=True)
+            return currency_code
+
+        self._remember(country_code, currency_code,
+                       currency_data.get('currency_name'), currency_data.get('currency_symbol'))
+        logger.info(f"Currency {currency_code} saved to DB for country {country_code}")
+        return currency_code
+
+
+currency_registry = CurrencyRegistry()
+
+
+def load_currency_registry(force: bool = False) -> int:
+    """
+    Загрузить реестр валют из БД (вызывается при старте бота)
+
+    Реестр общий для процесса: если оба бота запущены в одном процессе,
+    второй не загружает его повторно (если не передан force).
+    """
+    from bot.database.db import get_session
+
+    if currency_registry.loaded and not force:
+        return 0
+    with get_session() as session:
+        return currency_registry.load(session)
+
+
 def get_currency_by_country(country_code: Optional[str]) -> str:
     """
     Получить код валюты по коду страны (синхронная версия)
-    Использует статический маппинг как fallback
+    Использует реестр в памяти без обращения к API
     
     Args:
         country_code: Двухбуквенный код страны (ISO 3166-1 alpha-2)
@@ -181,23 +329,18 @@ def get_currency_by_country(country_code: Optional[str]) -> str:
     Returns:
         Код валюты (ISO 4217), по умолчанию RUB
     """
-    if not country_code:
-        return 'RUB'
-    
-    country_code_upper = country_code.upper()
-    return COUNTRY_TO_CURRENCY.get(country_code_upper, 'RUB')
+    return currency_registry.get_currency(country_code) or 'RUB'
 
 
 async def get_currency_by_country_async(session, country_code: Optional[str]) -> str:
     """
-    Получить код валюты по коду страны с проверкой статического маппинга, базы данных и запросом к API
+    Получить код валюты по коду страны с запросом к API при необходимости
     
     Логика:
-    1. Проверяет статический маппинг (самый быстрый способ)
-    2. Если нет в статическом маппинге - проверяет базу данных
-    3. Если нет в БД - запрашивает из API
-    4. Сохраняет результат в БД (для новых валют из API)
-    5. Использует RUB как fallback
+    1. Проверяет реестр в памяти (статический маппинг + таблица CountryCurrency)
+    2. Если нет - запрашивает из API (один запрос на страну, даже при одновременных вызовах)
+    3. Сохраняет результат в БД и в реестр
+    4. Использует RUB как fallback
     
     Args:
         session: SQLAlchemy session
@@ -206,86 +349,7 @@ async def get_currency_by_country_async(session, country_code: Optional[str]) ->
     Returns:
         Код валюты (ISO 4217), по умолчанию RUB
     """
-    if not country_code:
-        return 'RUB'
-    
-    country_code_upper = country_code.upper()
-    
-    # Сначала проверяем статический маппинг (самый быстрый способ)
-    if country_code_upper in COUNTRY_TO_CURRENCY:
-        currency_code = COUNTRY_TO_CURRENCY[country_code_upper]
-        logger.debug(f"Currency {currency_code} found in static mapping for country {country_code_upper}")
-        return currency_code
-    
-    # Если нет в статическом маппинге - проверяем базу данных
-    from bot.database.models import CountryCurrency
-    from bot.database.db import get_or_create_country_currency
-    
-    country_currency = session.query(CountryCurrency).filter_by(
-        country_code=country_code_upper
-    ).first()
-    
-    if country_currency:
-        # Есть в базе данных
-        logger.debug(f"Currency {country_currency.currency_code} found in DB for country {country_code_upper}")
-        return country_currency.currency_code
-    
-    # Нет в статическом маппинге и в БД - запрашиваем из API
-    logger.info(f"Currency not found in static mapping or DB for country {country_code_upper}, fetching from API...")
-    
-    from bot.utils.country_api import get_currency_from_api
-    import asyncio
-    
-    # Добавляем общий таймаут для всего запроса к API (20 секунд)
-    try:
-        currency_data = await asyncio.wait_for(
-            get_currency_from_api(country_code_upper),
-            timeout=20.0
-        )
-    except asyncio.TimeoutError:
-        logger.warning(f"Timeout while fetching currency from API for {country_code_upper} (exceeded 20 seconds)")
-        currency_data = None
-    except Exception as e:
-        logger.error(f"Error while fetching currency from API for {country_code_upper}: {e}", exc_info=True)
-        currency_data = None
-    
-    if currency_data:
-        # Сохраняем в базу данных
-        currency_code = currency_data['currency_code']
-        
-        # Обновляем символы валют, если их еще нет в словаре
-        if currency_code not in CURRENCY_SYMBOLS and currency_data.get('currency_symbol'):
-            CURRENCY_SYMBOLS[currency_code] = currency_data['currency_symbol']
-            logger.info(f"Added currency symbol {currency_data.get('currency_symbol')} for {currency_code}")
-        
-        # Добавляем название валюты в предложном падеже, если его нет
-        if currency_code not in CURRENCY_NAMES_RU_PREPOSITIONAL:
-            currency_name = currency_data.get('currency_name', '').lower()
-            if currency_name:
-                # Используем название из API (на английском, но это лучше чем ничего)
-                CURRENCY_NAMES_RU_PREPOSITIONAL[currency_code] = currency_name
-                logger.info(f"Added currency name '{currency_name}' for {currency_code}")
-            else:
-                # Fallback: используем код валюты
-                CURRENCY_NAMES_RU_PREPOSITIONAL[currency_code] = currency_code.lower()
-        
-        # Сохраняем в БД
-        from bot.database.db import get_or_create_country_currency
-        
-        get_or_create_country_currency(
-            session,
-            country_code=country_code_upper,
-            currency_code=currency_code,
-            currency_name=currency_data.get('currency_name'),
-            currency_symbol=currency_data.get('currency_symbol')
-        )
-        
-        logger.info(f"Currency {currency_code} saved to DB for country {country_code_upper}")
-        return currency_code
-    
-    # API недоступно или ошибка - используем fallback
-    logger.warning(f"Could not fetch currency from API for {country_code_upper}, using RUB fallback")
-    return 'RUB'
+    return await currency_registry.resolve(country_code, session=session)
 
 
 def get_currency_symbol(currency_code: str) -> str:
@@ -301,10 +365,21 @@ def get_currency_symbol(currency_code: str) -> str:
     if not currency_code:
         return '₽'
     currency_code_upper = currency_code.upper()
-    if currency_code_upper in CURRENCY_SYMBOLS:
-        return CURRENCY_SYMBOLS[currency_code_upper]
     # Если символа нет, возвращаем код валюты
-    return currency_code_upper
+    return currency_registry.get_symbol(currency_code_upper) or currency_code_upper
+
+
+def get_currency_name_prepositional(currency_code: Optional[str], default: str = 'рублях') -> str:
+    """
+    Получить название валюты в предложном падеже ("в рублях", "в тенге")
+    
+    Args:
+        currency_code: Код валюты (ISO 4217)
+        default: Значение, если валюта неизвестна
+    """
+    if not currency_code:
+        return default
+    return currency_registry.get_name_prepositional(currency_code) or default
 
 
 def format_price(amount: float, currency_code: str = 'RUB', use_symbol: bool = True) -> str:
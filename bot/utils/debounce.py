@@ -1,91 +1,95 @@
 """
 Утилиты для защиты от спама и дебаунсинга
+
+Счетчики хранятся в ведрах токенов (bot.utils.user_rate_limit): проверка O(1),
+простаивающие пользователи вытесняются, а при RATE_LIMIT_STORAGE=sqlite
+лимиты общие для всех процессов ботов.
 """
 import asyncio
-from typing import Dict, Any, Callable
-from datetime import datetime, timedelta
+import math
+from typing import Callable, Optional, Set
 from functools import wraps
 
-# Словарь для хранения последних действий пользователей
-_user_last_action: Dict[int, datetime] = {}
-_user_processing: Dict[int, bool] = {}
+from bot.utils.user_rate_limit import RateLimitStorage, TokenBucketLimiter
+
+# Пользователи, чей запрос сейчас обрабатывается в этом процессе
+_user_processing: Set[int] = set()
+
+
+async def _reject(update, text: str, show_alert: bool = False):
+    """Ответить на отклоненное действие: на нажатие кнопки - всплывающим уведомлением"""
+    if update.callback_query:
+        await update.callback_query.answer(text, show_alert=show_alert)
+    elif update.effective_message:
+        await update.effective_message.reply_text(text)
+
 
-def debounce(seconds: float = 0.5):
+def debounce(seconds: float = 0.5, storage: Optional[RateLimitStorage] = None):
     """
     Декоратор для защиты от спама - блокирует повторные вызовы в течение указанного времени
-    
+
     Args:
         seconds: Минимальный интервал между вызовами в секундах
+        storage: Хранилище ведер (по умолчанию - из RATE_LIMIT_STORAGE)
     """
+    # Ведро на одно действие, которое наполняется за seconds; общее для всех обработчиков с debounce
+    limiter = TokenBucketLimiter(rate=1 / seconds, capacity=1, namespace='debounce', storage=storage)
+
     def decorator(func: Callable) -> Callable:
         @wraps(func)
         async def wrapper(update, context, *args, **kwargs):
             user_id = update.effective_user.id
-            now = datetime.now()
-            
+
             # Проверяем, не обрабатывается ли уже запрос от этого пользователя
-            if _user_processing.get(user_id, False):
-                await update.callback_query.answer("⏳ Обрабатываю предыдущий запрос...")
+            if user_id in _user_processing:
+                await _reject(update, "⏳ Обрабатываю предыдущий запрос...")
                 return
-            
+
             # Проверяем дебаунс
-            last_action = _user_last_action.get(user_id)
-            if last_action and (now - last_action).total_seconds() < seconds:
-                await update.callback_query.answer("⏳ Слишком быстро! Подождите немного...")
+            if await limiter.acheck(user_id):
+                await _reject(update, "⏳ Слишком быстро! Подождите немного...")
                 return
-            
-            # Устанавливаем флаг обработки
-            _user_processing[user_id] = True
-            _user_last_action[user_id] = now
-            
+
+            _user_processing.add(user_id)
             try:
-                result = await func(update, context, *args, **kwargs)
-                return result
+                return await func(update, context, *args, **kwargs)
             finally:
-                # Снимаем флаг обработки
-                _user_processing[user_id] = False
-                
+                _user_processing.discard(user_id)
+
         return wrapper
     return decorator
 
-def rate_limit(max_calls: int = 10, window_seconds: int = 60):
+
+def rate_limit(max_calls: int = 10, window_seconds: int = 60, storage: Optional[RateLimitStorage] = None):
     """
     Декоратор для ограничения частоты вызовов
-    
+
+    Допускает всплеск до max_calls вызовов, дальше - в среднем max_calls за window_seconds.
+
     Args:
         max_calls: Максимальное количество вызовов
         window_seconds: Окно времени в секундах
+        storage: Хранилище ведер (по умолчанию - из RATE_LIMIT_STORAGE)
     """
-    _user_calls: Dict[int, list] = {}
-    
     def decorator(func: Callable) -> Callable:
+        limiter = TokenBucketLimiter(
+            rate=max_calls / window_seconds, capacity=max_calls,
+            namespace=f"rate_limit:{func.__module__}.{func.__qualname__}", storage=storage
+        )
+
         @wraps(func)
         async def wrapper(update, context, *args, **kwargs):
-            user_id = update.effective_user.id
-            now = datetime.now()
-            
-            # Очищаем старые вызовы
-            if user_id in _user_calls:
-                _user_calls[user_id] = [
-                    call_time for call_time in _user_calls[user_id]
-                    if (now - call_time).total_seconds() < window_seconds
-                ]
-            else:
-                _user_calls[user_id] = []
-            
-            # Проверяем лимит
-            if len(_user_calls[user_id]) >= max_calls:
-                await update.callback_query.answer(
-                    f"🚫 Слишком много запросов! Попробуйте через {window_seconds} секунд.",
+            wait = await limiter.acheck(update.effective_user.id)
+            if wait:
+                await _reject(
+                    update,
+                    f"🚫 Слишком много запросов! Попробуйте через {math.ceil(wait)} секунд.",
                     show_alert=True
                 )
                 return
-            
-            # Добавляем текущий вызов
-            _user_calls[user_id].append(now)
-            
+
             return await func(update, context, *args, **kwargs)
-            
+
         return wrapper
     return decorator
 
@@ -0,0 +1,108 @@
+"""Библиотека заранее сгенерированных описаний для шаблонов услуг"""
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from bot.data.service_templates import PREDEFINED_CATEGORIES
+
+logger = logging.getLogger(__name__)
+
+
+def get_template_names() -> List[str]:
+    """Уникальные названия всех предустановленных шаблонов услуг"""
+    names = []
+    seen = set()
+    for category in PREDEFINED_CATEGORIES.values():
+        for template in category.get('templates', []):
+            name = template['name']
+            if name not in seen:
+                seen.add(name)
+                names.append(name)
+    return names
+
+
+def is_template_name(service_name: str) -> bool:
+    """Совпадает ли название услуги с одним из шаблонов"""
+    from bot.utils.openai_client import normalize_service_name
+
+    normalized = normalize_service_name(service_name)
+    return any(normalize_service_name(name) == normalized for name in get_template_names())
+
+
+def get_library_description(service_name: str, retry_count: int = 0) -> Optional[str]:
+    """
+    Получить готовое описание шаблона из библиотеки
+
+    Варианты перебираются по кругу при повторных генерациях.
+    Для пользовательских названий БД не запрашивается.
+
+    Returns:
+        Описание или None, если для услуги нет сохраненных вариантов
+    """
+    from bot.database.db import get_session, get_template_descriptions
+    from bot.utils.openai_client import normalize_service_name
+
+    if not is_template_name(service_name):
+        return None
+
+    with get_session() as session:
+        variants = [entry.description for entry in get_template_descriptions(session, normalize_service_name(service_name))]
+    if not variants:
+        return None
+    return variants[retry_count % len(variants)]
+
+
+async def build_description_library(variations: Optional[int] = None, force: bool = False) -> Dict[str, int]:
+    """
+    Сгенерировать и сохранить варианты описаний для всех шаблонов
+
+    Запросы к API выполняются параллельно (с общим ограничением
+    одновременных запросов клиента OpenAI). Уже сохраненные варианты
+    пропускаются, если не указан force. С force сохраненный вариант заменяется
+    только после успешной генерации нового - при сбое API библиотека не пустеет.
+
+    Returns:
+        Dict со статистикой: {'templates': ..., 'generated': ..., 'skipped': ..., 'failed': ...}
+    """
+    from bot.database.db import (
+        get_session, get_template_descriptions, save_template_description
+    )
+    from bot.utils.openai_client import (
+        VARIATION_INSTRUCTIONS, generate_service_description, normalize_service_name
+    )
+
+    variations = min(variations or len(VARIATION_INSTRUCTIONS), len(VARIATION_INSTRUCTIONS))
+    names = get_template_names()
+    stats = {'templates': len(names), 'generated': 0, 'skipped': 0, 'failed': 0}
+
+    existing = {name: set() for name in names}
+    if not force:
+        with get_session() as session:
+            existing = {
+                name: {entry.variation for entry in get_template_descriptions(session, normalize_service_name(name))}
+                for name in names
+            }
+
+    jobs = []
+    for name in names:
+        for variation in range(variations):
+            if variation in existing[name]:
+                stats['skipped'] += 1
+            else:
+                jobs.append((name, variation))
+
+    results = await asyncio.gather(*[
+        generate_service_description(name, variation, use_library=False) for name, variation in jobs
+    ])
+
+    with get_session() as session:
+        for (name, variation), description in zip(jobs, results):
+            if not description:
+                stats['failed'] += 1
+                logger.warning(f"No description generated for template '{name}' (variation {variation})")
+                continue
+            save_template_description(session, normalize_service_name(name), variation, description)
+            stats['generated'] += 1
+
+    logger.info(f"Description library built: {stats}")
+    return stats
@@ -0,0 +1,124 @@
+"""Сводки уведомлений мастерам: одно сообщение за час или за день вместо сообщения на каждую запись"""
+import logging
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_MODES = ('instant', 'hourly', 'daily')
+NOTIFICATION_MODE_NAMES = {
+    'instant': 'сразу',
+    'hourly': 'раз в час',
+    'daily': 'раз в день',
+}
+# Час (локальное время сервера), в который отправляется дневная сводка
+DAILY_DIGEST_HOUR = 9
+# Как часто проверять, не пора ли отправить сводки (секунды)
+DIGEST_CHECK_INTERVAL = 300
+# Сколько отложенных уведомлений собирать за один проход
+DIGEST_BATCH_SIZE = 1000
+# Лимит Telegram - 4096 символов, длинная сводка делится на несколько сообщений
+DIGEST_MAX_LENGTH = 3500
+
+DIGEST_HEADER = "📋 <b>Сводка новых записей</b>\n\n"
+DIGEST_FOOTER = "\n\nПроверьте раздел \"📋 Записи\" для просмотра всех записей."
+
+
+def next_notification_mode(mode: Optional[str]) -> str:
+    """Следующий режим уведомлений (для переключателя в профиле)"""
+    index = NOTIFICATION_MODES.index(mode) if mode in NOTIFICATION_MODES else 0
+    return NOTIFICATION_MODES[(index + 1) % len(NOTIFICATION_MODES)]
+
+
+def get_digest_release_time(mode: Optional[str], now: Optional[datetime] = None) -> Optional[datetime]:
+    """
+    Время отправки сводки для уведомления, созданного сейчас
+
+    Args:
+        mode: Режим уведомлений мастера
+        now: Текущее время UTC (как next_attempt_at в notification_outbox)
+
+    Returns:
+        Время UTC или None для режима instant
+    """
+    now = now or datetime.utcnow()
+    if mode == 'hourly':
+        return now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    if mode == 'daily':
+        local_now = now.replace(tzinfo=timezone.utc).astimezone()
+        release = local_now.replace(hour=DAILY_DIGEST_HOUR, minute=0, second=0, microsecond=0)
+        if release <= local_now:
+            release += timedelta(days=1)
+        return release.astimezone(timezone.utc).replace(tzinfo=None)
+    return None
+
+
+def format_booking_digest_line(client_name: str, service_title: str, start_dt: datetime,
+                               price: float, currency: str) -> str:
+    """Строка сводки о новой записи"""
+    from bot.utils.currency import format_price
+    return f"• {start_dt.strftime('%d.%m %H:%M')} — <b>{client_name}</b>, {service_title} ({format_price(price, currency)})"
+
+
+def _split_digest(lines: List[str]) -> List[str]:
+    messages = []
+    current: List[str] = []
+    length = 0
+    for line in lines:
+        if current and length + len(line) + 1 > DIGEST_MAX_LENGTH:
+            messages.append(current)
+            current, length = [], 0
+        current.append(line)
+        length += len(line) + 1
+    if current:
+        messages.append(current)
+    return [DIGEST_HEADER + "\n".join(chunk) + DIGEST_FOOTER for chunk in messages]
+
+
+def build_master_digests(now: Optional[datetime] = None) -> int:
+    """
+    Собрать отложенные уведомления, время сводки которых наступило, в сводки
+
+    Уведомления одного мастера объединяются в одно сообщение (или несколько,
+    если сводка длиннее лимита Telegram), которое ставится в notification_outbox;
+    исходные записи помечаются digested в той же транзакции.
+
+    Returns:
+        Количество поставленных в очередь сводок
+    """
+    from bot.database.db import get_session, enqueue_notification
+    from bot.database.models import NotificationOutbox
+
+    now = now or datetime.utcnow()
+    digests = 0
+    while True:
+        with get_session() as session:
+            entries = session.query(NotificationOutbox).filter(
+                NotificationOutbox.status == 'held',
+                NotificationOutbox.next_attempt_at <= now
+            ).order_by(NotificationOutbox.chat_id, NotificationOutbox.id).limit(DIGEST_BATCH_SIZE).all()
+            if not entries:
+                return digests
+
+            for chat_id, group in groupby(entries, key=lambda entry: entry.chat_id):
+                group = list(group)
+                for text in _split_digest([entry.text for entry in group]):
+                    enqueue_notification(session, chat_id, text, kind='digest',
+                                         master_id=group[0].master_account_id)
+                    digests += 1
+                for entry in group:
+                    entry.status = 'digested'
+
+            if len(entries) < DIGEST_BATCH_SIZE:
+                return digests
+
+
+async def master_digest_job(context):
+    """Периодическая задача JobQueue: отправка сводок уведомлений мастерам"""
+    try:
+        digests = build_master_digests()
+        if digests:
+            logger.info(f"Queued {digests} master notification digests")
+    except Exception as e:
+        logger.error(f"Error building master digests: {e}", exc_info=True)
@@ -0,0 +1,203 @@
+"""Локальный справочник городов для офлайн-геокодирования по координатам"""
+import csv
+import logging
+import math
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0
+
+# Радиус города по умолчанию (города из БД и датасета без колонки radius_km).
+# Точка дальше радиуса ближайшего города разрешается запросом в сеть: ложное
+# совпадение (город-спутник -> соседний мегаполис) навсегда попало бы в кэш сетки
+DEFAULT_CITY_RADIUS_KM = 8.0
+
+# Колонки файла-датасета (CSV с заголовком); radius_km - необязательная
+DATASET_FIELDS = ('name_ru', 'name_local', 'name_en', 'country_code', 'latitude', 'longitude')
+
+
+def _to_xyz(latitude: float, longitude: float) -> Tuple[float, float, float]:
+    """Перевести координаты в точку на единичной сфере"""
+    lat = math.radians(latitude)
+    lon = math.radians(longitude)
+    cos_lat = math.cos(lat)
+    return (cos_lat * math.cos(lon), cos_lat * math.sin(lon), math.sin(lat))
+
+
+def _chord_to_km(chord: float) -> float:
+    """Перевести длину хорды единичной сферы в расстояние по поверхности Земли"""
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+class _KDTree:
+    """
+    Статическое k-d дерево по 3D-точкам на единичной сфере
+
+    Ближайший сосед по евклидову расстоянию (хорде) совпадает с ближайшим
+    по дуге большого круга, поэтому нет проблем на 180-м меридиане и у полюсов.
+    """
+
+    __slots__ = ('_points', '_index', '_left', '_right', '_axis', '_root')
+
+    def __init__(self, points: List[Tuple[float, float, float]]):
+        self._points = points
+        size = len(points)
+        self._index = [0] * size
+        self._left = [-1] * size
+        self._right = [-1] * size
+        self._axis = [0] * size
+        self._root = self._build(list(range(size)), 0) if size else -1
+
+    def _build(self, ids: List[int], depth: int) -> int:
+        if not ids:
+            return -1
+        axis = depth % 3
+        ids.sort(key=lambda i: self._points[i][axis])
+        median = len(ids) // 2
+        node = ids[median]
+        self._axis[node] = axis
+        self._left[node] = self._build(ids[:median], depth + 1)
+        self._right[node] = self._build(ids[median + 1:], depth + 1)
+        return node
+
+    def nearest(self, target: Tuple[float, float, float]) -> Tuple[int, float]:
+        """Найти ближайшую точку: (индекс, квадрат расстояния)"""
+        best_id, best_dist = -1, float('inf')
+        stack = [self._root] if self._root >= 0 else []
+        points = self._points
+        while stack:
+            node = stack.pop()
+            point = points[node]
+            dx = point[0] - target[0]
+            dy = point[1] - target[1]
+            dz = point[2] - target[2]
+            dist = dx * dx + dy * dy + dz * dz
+            if dist < best_dist:
+                best_id, best_dist = node, dist
+
+            axis = self._axis[node]
+            diff = target[axis] - point[axis]
+            near, far = (self._left[node], self._right[node]) if diff < 0 else (self._right[node], self._left[node])
+            # Дальнюю ветку проверяем, только если разделяющая плоскость ближе лучшего результата
+            if far >= 0 and diff * diff < best_dist:
+                stack.append(far)
+            if near >= 0:
+                stack.append(near)
+        return best_id, best_dist
+
+
+class CityGazetteer:
+    """Справочник городов с поиском ближайшего города по координатам"""
+
+    def __init__(self):
+        self._cities: List[Dict] = []
+        self._radii: List[float] = []
+        self._keys = set()
+        self._tree: Optional[_KDTree] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._cities)
+
+    def add_cities(self, cities: Iterable[Dict]) -> int:
+        """Добавить города и перестроить индекс. Возвращает количество добавленных"""
+        added = 0
+        with self._lock:
+            for city in cities:
+                if city.get('latitude') is None or city.get('longitude') is None:
+                    continue
+                key = (city['name_ru'], round(float(city['latitude']), 3), round(float(city['longitude']), 3))
+                if key in self._keys:
+                    continue
+                self._keys.add(key)
+                self._cities.append({
+                    'name_ru': city['name_ru'],
+                    'name_local': city.get('name_local') or city['name_ru'],
+                    'name_en': city.get('name_en') or city['name_ru'],
+                    'country_code': (city.get('country_code') or '').upper(),
+                    'latitude': float(city['latitude']),
+                    'longitude': float(city['longitude']),
+                })
+                self._radii.append(float(city.get('radius_km') or DEFAULT_CITY_RADIUS_KM))
+                added += 1
+            if added:
+                self._tree = _KDTree([_to_xyz(c['latitude'], c['longitude']) for c in self._cities])
+        return added
+
+    def load_from_db(self, session) -> int:
+        """Загрузить города с координатами из таблицы City"""
+        from bot.database.models import City
+
+        rows = session.query(
+            City.name_ru, City.name_local, City.name_en,
+            City.country_code, City.latitude, City.longitude
+        ).filter(City.latitude.isnot(None), City.longitude.isnot(None)).all()
+        return self.add_cities(dict(zip(DATASET_FIELDS, row)) for row in rows)
+
+    def load_dataset(self, path: str) -> int:
+        """
+        Загрузить города из CSV-файла
+
+        Формат: заголовок name_ru,name_local,name_en,country_code,latitude,longitude[,radius_km]
+        """
+        with open(path, encoding='utf-8', newline='') as f:
+            reader = csv.DictReader(f)
+            missing = set(DATASET_FIELDS) - set(reader.fieldnames or [])
+            if missing:
+                raise ValueError(f"City dataset {path} is missing columns: {', '.join(sorted(missing))}")
+            return self.add_cities(reader)
+
+    def nearest(self, latitude: float, longitude: float,
+                max_distance_km: Optional[float] = None) -> Optional[Dict]:
+        """
+        Найти ближайший город, если точка в его радиусе
+
+        Args:
+            max_distance_km: Предельное расстояние до центра (по умолчанию - радиус найденного города)
+
+        Returns:
+            Dict с ключами name_ru, name_local, name_en, country_code, latitude, longitude
+            или None, если точка вне радиуса ближайшего известного города
+        """
+        tree = self._tree
+        if tree is None:
+            return None
+        city_id, dist_sq = tree.nearest(_to_xyz(latitude, longitude))
+        if city_id < 0:
+            return None
+        if max_distance_km is None:
+            max_distance_km = self._radii[city_id]
+        if _chord_to_km(math.sqrt(dist_sq)) > max_distance_km:
+            return None
+        return dict(self._cities[city_id])
+
+
+_gazetteer: Optional[CityGazetteer] = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer() -> CityGazetteer:
+    """Получить общий справочник (загружается из БД и датасета при первом обращении)"""
+    global _gazetteer
+    if _gazetteer is not None:
+        return _gazetteer
+
+    with _gazetteer_lock:
+        if _gazetteer is None:
+            from bot.config import CITY_DATASET_PATH
+            from bot.database.db import get_session
+
+            gazetteer = CityGazetteer()
+            if CITY_DATASET_PATH:
+                try:
+                    loaded = gazetteer.load_dataset(CITY_DATASET_PATH)
+                    logger.info(f"Loaded {loaded} cities from dataset {CITY_DATASET_PATH}")
+                except (OSError, ValueError) as e:
+                    logger.error(f"Could not load city dataset {CITY_DATASET_PATH}: {e}")
+            with get_session() as session:
+                loaded = gazetteer.load_from_db(session)
+            logger.info(f"City gazetteer ready: {len(gazetteer)} cities ({loaded} from DB)")
+            _gazetteer = gazetteer
+    return _gazetteer
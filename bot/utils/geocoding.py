@@ -1,265 +1,364 @@
 """Утилиты для определения города по геолокации"""
+import asyncio
 import logging
-import requests
+import time
+import httpx
 from typing import Optional, Dict, Tuple, List, Any
 
+from bot.config import NOMINATIM_URL, NOMINATIM_MIN_INTERVAL
+from bot.utils.gazetteer import get_gazetteer
+
 logger = logging.getLogger(__name__)
 
-# Кэш для переводов названий городов (чтобы не делать лишние запросы)
-CITY_NAME_CACHE = {}
+# Nominatim требует User-Agent с названием приложения
+NOMINATIM_HEADERS = {
+    'User-Agent': 'LumiBot/1.0'
+}
+
+# Страны СНГ, для которых русское название города - основное
+CIS_COUNTRY_CODES = ['RU', 'BY', 'KZ', 'UA', 'KG', 'TJ', 'UZ', 'TM', 'MD', 'AM', 'AZ', 'GE']
+
+# Шаг сетки для кэша обратного геокодирования в градусах (~1.1 км по широте)
+GEOCODE_GRID_STEP = 0.01
+
+# Кэш городов по ячейкам сетки в памяти процесса (поверх таблицы geocode_cache)
+CITY_NAME_CACHE: Dict[Tuple[int, int], Dict[str, Any]] = {}
+CITY_NAME_CACHE_MAX_SIZE = 10000
+
+
+def _grid_cell(latitude: float, longitude: float) -> Tuple[int, int]:
+    """Квантовать координаты в ячейку сетки кэша"""
+    return round(latitude / GEOCODE_GRID_STEP), round(longitude / GEOCODE_GRID_STEP)
+
 
+def _remember_cell(cell: Tuple[int, int], city_data: Dict[str, Any]):
+    """Положить город в кэш в памяти, вытесняя самые старые ячейки"""
+    if len(CITY_NAME_CACHE) >= CITY_NAME_CACHE_MAX_SIZE:
+        CITY_NAME_CACHE.pop(next(iter(CITY_NAME_CACHE)))
+    CITY_NAME_CACHE[cell] = city_data
 
-def get_city_from_location(latitude: float, longitude: float) -> Optional[Dict[str, str]]:
+
+async def resolve_city_from_location(latitude: float, longitude: float) -> Optional[Dict[str, Any]]:
     """
-    Определить город по координатам используя Nominatim API
-    
-    Args:
-        latitude: Широта
-        longitude: Долгота
-    
+    Определить город по координатам, обращаясь к сети только при промахе
+
+    Порядок поиска: кэш в памяти -> кэш сетки в БД -> офлайн-справочник городов -> Nominatim.
+    Найденный город сохраняется в кэш сетки, чтобы соседние точки не требовали повторного поиска.
+    Ответы Nominatim в офлайн-справочник не добавляются: это точка обратного геокодирования,
+    а не центр города, и каждое добавление перестраивало бы весь индекс.
+
     Returns:
-        Dict с ключами: name_ru, name_local, name_en, country_code, latitude, longitude
-        или None, если не удалось определить
-        
-    Note:
-        latitude и longitude в возвращаемом словаре - это координаты центра города
+        Dict в формате get_city_from_location_async или None
     """
-    try:
-        # Используем Nominatim API (OpenStreetMap) - бесплатный и не требует API ключа
-        url = "https://nominatim.openstreetmap.org/reverse"
-        params = {
-            'lat': latitude,
-            'lon': longitude,
-            'format': 'json',
-            'accept-language': 'ru,en',  # Приоритет русскому и английскому
-            'addressdetails': 1
-        }
-        
-        headers = {
-            'User-Agent': 'LumiBot/1.0'  # Требуется Nominatim
-        }
-        
-        response = requests.get(url, params=params, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        if not data or 'address' not in data:
-            logger.warning(f"Could not get address from Nominatim for {latitude}, {longitude}")
-            return None
-        
-        address = data.get('address', {})
-        
-        # Определяем название города
-        # В разных странах город может быть в разных полях
-        city_name = (
-            address.get('city') or 
-            address.get('town') or 
-            address.get('village') or 
-            address.get('municipality') or
-            address.get('city_district') or
-            address.get('county')
-        )
-        
-        if not city_name:
-            logger.warning(f"Could not find city name in address: {address}")
-            return None
-        
-        # Получаем страну
-        country = address.get('country', '')
-        country_code = address.get('country_code', '').upper()
-        
-        # Получаем координаты центра города (если есть)
-        lat = float(data.get('lat', latitude))
-        lon = float(data.get('lon', longitude))
-        
-        # Определяем названия на разных языках
-        # Для русскоязычных стран используем русское название как основное
-        name_ru = city_name
-        name_local = city_name
-        name_en = city_name
-        
-        # Пытаемся получить английское название через дополнительный запрос
-        if country_code in ['RU', 'BY', 'KZ', 'UA', 'KG', 'TJ', 'UZ', 'TM', 'MD', 'AM', 'AZ', 'GE']:
-            # Для стран СНГ русское название - основное
-            name_ru = city_name
-            name_local = city_name
-            
-            # Пробуем получить английское название
+    from bot.database.db import get_session, get_geocode_cache, outside_transaction, save_geocode_cache
+
+    cell = _grid_cell(latitude, longitude)
+    city_data = CITY_NAME_CACHE.get(cell)
+    if city_data:
+        return dict(city_data)
+
+    with get_session() as session:
+        entry = get_geocode_cache(session, *cell)
+        if entry:
+            city_data = {
+                'name_ru': entry.name_ru,
+                'name_local': entry.name_local,
+                'name_en': entry.name_en,
+                'country_code': entry.country_code or '',
+                'latitude': entry.latitude,
+                'longitude': entry.longitude
+            }
+
+    if city_data is None:
+        city_data = get_gazetteer().nearest(latitude, longitude)
+
+        if city_data is None:
+            logger.info(f"City for {latitude}, {longitude} not found offline, falling back to Nominatim")
+            # Чтение кэша выше открыло транзакцию апдейта - на время запроса к Nominatim ее завершаем
+            city_data = await outside_transaction(get_city_from_location_async(latitude, longitude))
+            if city_data is None:
+                return None
+
+        with get_session() as session:
             try:
-                en_response = requests.get(
-                    url,
-                    params={
-                        'lat': latitude,
-                        'lon': longitude,
-                        'format': 'json',
-                        'accept-language': 'en',
-                        'addressdetails': 1
-                    },
-                    headers=headers,
-                    timeout=10
-                )
-                if en_response.status_code == 200:
-                    en_data = en_response.json()
-                    en_address = en_data.get('address', {})
-                    name_en = (
-                        en_address.get('city') or 
-                        en_address.get('town') or 
-                        en_address.get('village') or 
-                        en_address.get('municipality') or
-                        city_name
-                    )
+                # Точка сохранения: ошибка записи в кэш не откатывает остальные изменения апдейта
+                with session.begin_nested():
+                    save_geocode_cache(session, *cell, city_data)
             except Exception as e:
-                logger.warning(f"Could not get English name for city: {e}")
-                name_en = city_name
-        else:
-            # Для других стран местное название - основное, русское и английское одинаковые
-            name_local = city_name
-            name_ru = city_name
-            name_en = city_name
-        
-        return {
-            'name_ru': name_ru,
-            'name_local': name_local,
-            'name_en': name_en,
-            'country_code': country_code,
-            'latitude': lat,
-            'longitude': lon
-        }
-        
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error getting city from location: {e}")
+                # Параллельная запись той же ячейки - не критично, результат уже есть
+                logger.warning(f"Could not save geocode cache for cell {cell}: {e}")
+
+    _remember_cell(cell, city_data)
+    return dict(city_data)
+
+
+# ===== Разбор ответов Nominatim =====
+
+def _reverse_params(latitude: float, longitude: float, language: str) -> Dict[str, Any]:
+    """Параметры запроса обратного геокодирования"""
+    return {
+        'lat': latitude,
+        'lon': longitude,
+        'format': 'json',
+        'accept-language': language,
+        'addressdetails': 1
+    }
+
+
+def _search_params(query: str, limit: int) -> Dict[str, Any]:
+    """Параметры запроса поиска города по названию"""
+    return {
+        'q': query,
+        'format': 'json',
+        'limit': limit,
+        'addressdetails': 1,
+        'accept-language': 'ru,en',
+        'type': 'city',  # Ищем только города
+        'featuretype': 'city,town,village'  # Типы населенных пунктов
+    }
+
+
+def _address_city_name(address: Dict[str, Any]) -> Optional[str]:
+    """Название города из адреса ответа (в разных странах город может быть в разных полях)"""
+    return (
+        address.get('city') or
+        address.get('town') or
+        address.get('village') or
+        address.get('municipality') or
+        address.get('city_district') or
+        address.get('county')
+    )
+
+
+def _needs_english_name(data: Optional[Dict[str, Any]]) -> bool:
+    """Нужен ли запрос на английском: город в стране СНГ, а название в ответе на кириллице"""
+    if not data or 'address' not in data:
+        return False
+    address = data['address']
+    if address.get('country_code', '').upper() not in CIS_COUNTRY_CODES:
+        return False
+    city_name = _address_city_name(address) or ''
+    return any('\u0400' <= char <= '\u04ff' for char in city_name)
+
+
+def _parse_reverse_result(data: Optional[Dict[str, Any]], en_data: Optional[Dict[str, Any]],
+                          latitude: float, longitude: float) -> Optional[Dict[str, Any]]:
+    """
+    Собрать данные города из ответов обратного геокодирования
+
+    Args:
+        data: Ответ с accept-language=ru,en
+        en_data: Ответ с accept-language=en (для английского названия в странах СНГ)
+    """
+    if not data or 'address' not in data:
+        logger.warning(f"Could not get address from Nominatim for {latitude}, {longitude}")
         return None
-    except Exception as e:
-        logger.error(f"Unexpected error in get_city_from_location: {e}", exc_info=True)
+
+    address = data.get('address', {})
+
+    city_name = _address_city_name(address)
+
+    if not city_name:
+        logger.warning(f"Could not find city name in address: {address}")
         return None
 
+    country_code = address.get('country_code', '').upper()
+
+    # Получаем координаты центра города (если есть)
+    lat = float(data.get('lat', latitude))
+    lon = float(data.get('lon', longitude))
+
+    # Для русскоязычных стран русское название - основное, английское берем из второго ответа,
+    # для других стран местное название - основное, русское и английское одинаковые
+    name_en = city_name
+    if country_code in CIS_COUNTRY_CODES and en_data:
+        en_address = en_data.get('address', {})
+        name_en = (
+            en_address.get('city') or
+            en_address.get('town') or
+            en_address.get('village') or
+            en_address.get('municipality') or
+            city_name
+        )
+
+    return {
+        'name_ru': city_name,
+        'name_local': city_name,
+        'name_en': name_en,
+        'country_code': country_code,
+        'latitude': lat,
+        'longitude': lon
+    }
+
+
+def _parse_search_results(data: Any, query: str) -> List[Dict[str, Any]]:
+    """Собрать список городов из ответа поиска Nominatim"""
+    if not data or not isinstance(data, list):
+        logger.warning(f"No results found for city query: {query}")
+        return []
+
+    results = []
+    for item in data:
+        address = item.get('address', {})
+
+        # Определяем название города и его тип
+        city_name = None
+        city_type = None
+        for field in ('city', 'town', 'village', 'municipality', 'city_district'):
+            if address.get(field):
+                city_name = address.get(field)
+                city_type = field
+                break
+
+        if not city_name:
+            continue
+
+        # Для стран СНГ английское название может быть в display_name или нужно искать отдельно,
+        # пока используем то же название на всех языках
+        results.append({
+            'name_ru': city_name,
+            'name_local': city_name,
+            'name_en': city_name,
+            'country_code': address.get('country_code', '').upper(),
+            'country': address.get('country', ''),
+            'latitude': float(item.get('lat', 0)),
+            'longitude': float(item.get('lon', 0)),
+            'display_name': item.get('display_name', city_name),  # Полное название для отображения
+            'city_type': city_type  # Тип населенного пункта
+        })
+
+    logger.info(f"Found {len(results)} cities for query '{query}'")
+    return results
+
+
+# ===== Названия городов =====
 
 def normalize_city_name(name: str) -> str:
     """Нормализовать название города (убрать лишние пробелы, привести к нужному формату)"""
     return name.strip()
 
 
-def search_city_by_name(query: str, limit: int = 10) -> List[Dict[str, Any]]:
+# ===== Асинхронный клиент (httpx) =====
+
+class NominatimRateLimiter:
+    """Ограничитель частоты запросов: не чаще одного запроса в min_interval секунд"""
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self._next_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        """Дождаться своей очереди на запрос"""
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_at - now
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_at = max(now, self._next_at) + self.min_interval
+
+
+_http_client: Optional[httpx.AsyncClient] = None
+_rate_limiter: Optional[NominatimRateLimiter] = None
+# Выполняющиеся запросы: одинаковые запросы ждут один и тот же ответ
+_inflight: Dict[Tuple, asyncio.Task] = {}
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Общий HTTP-клиент с keep-alive соединениями к Nominatim"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            base_url=NOMINATIM_URL,
+            headers=NOMINATIM_HEADERS,
+            timeout=httpx.Timeout(10.0),
+            limits=httpx.Limits(max_connections=4, max_keepalive_connections=2)
+        )
+    return _http_client
+
+
+def get_rate_limiter() -> NominatimRateLimiter:
+    """Общий ограничитель частоты запросов к Nominatim (политика: 1 запрос в секунду)"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = NominatimRateLimiter(NOMINATIM_MIN_INTERVAL)
+    return _rate_limiter
+
+
+async def close_http_client():
+    """Закрыть общий HTTP-клиент (вызывается при остановке бота)"""
+    global _http_client, _rate_limiter
+    if _http_client is not None:
+        await _http_client.aclose()
+    _http_client = None
+    _rate_limiter = None
+    _inflight.clear()
+
+
+async def _fetch_json(path: str, params: Dict[str, Any]) -> Optional[Any]:
+    """Выполнить запрос к Nominatim с учетом ограничения частоты"""
+    try:
+        await get_rate_limiter().wait()
+        response = await get_http_client().get(path, params=params)
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPError as e:
+        logger.error(f"Error requesting Nominatim {path}: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"Unexpected error requesting Nominatim {path}: {e}", exc_info=True)
+        return None
+
+
+async def _nominatim_get(path: str, params: Dict[str, Any]) -> Optional[Any]:
+    """
+    GET-запрос к Nominatim с объединением одинаковых запросов
+
+    Если такой же запрос уже выполняется, ждем его результат вместо нового запроса.
+    Запрос не отменяется, если отменен один из ожидающих его обработчиков.
+    """
+    key = (path, tuple(sorted(params.items())))
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_fetch_json(path, params))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    return await asyncio.shield(task)
+
+
+async def get_city_from_location_async(latitude: float, longitude: float) -> Optional[Dict[str, Any]]:
+    """
+    Определить город по координатам используя Nominatim API
+
+    Запрос на английском отправляется, только если в первом ответе нет
+    пригодного английского названия (город в стране СНГ с названием на кириллице).
+
+    Returns:
+        Dict с ключами: name_ru, name_local, name_en, country_code, latitude, longitude
+        (координаты центра города) или None, если не удалось определить
+    """
+    data = await _nominatim_get('/reverse', _reverse_params(latitude, longitude, 'ru,en'))
+    en_data = None
+    if _needs_english_name(data):
+        en_data = await _nominatim_get('/reverse', _reverse_params(latitude, longitude, 'en'))
+    try:
+        return _parse_reverse_result(data, en_data, latitude, longitude)
+    except Exception as e:
+        logger.error(f"Unexpected error in get_city_from_location_async: {e}", exc_info=True)
+        return None
+
+
+async def search_city_by_name_async(query: str, limit: int = 10) -> List[Dict[str, Any]]:
     """
     Поиск города по названию используя Nominatim API (forward geocoding)
-    
-    Args:
-        query: Название города для поиска
-        limit: Максимальное количество результатов
-    
+
     Returns:
-        Список словарей с информацией о городах:
-        [{
-            'name_ru': str,
-            'name_local': str,
-            'name_en': str,
-            'country_code': str,
-            'latitude': float,
-            'longitude': float,
-            'display_name': str  # Полное название для отображения
-        }, ...]
+        Список словарей с ключами name_ru, name_local, name_en, country_code, country,
+        latitude, longitude, display_name (полное название для отображения) и city_type
     """
+    data = await _nominatim_get('/search', _search_params(query, limit))
     try:
-        url = "https://nominatim.openstreetmap.org/search"
-        params = {
-            'q': query,
-            'format': 'json',
-            'limit': limit,
-            'addressdetails': 1,
-            'accept-language': 'ru,en',
-            'type': 'city',  # Ищем только города
-            'featuretype': 'city,town,village'  # Типы населенных пунктов
-        }
-        
-        headers = {
-            'User-Agent': 'LumiBot/1.0'
-        }
-        
-        response = requests.get(url, params=params, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        if not data or not isinstance(data, list):
-            logger.warning(f"No results found for city query: {query}")
-            return []
-        
-        results = []
-        for item in data:
-            address = item.get('address', {})
-            
-            # Определяем название города и его тип
-            city_name = None
-            city_type = None
-            
-            if address.get('city'):
-                city_name = address.get('city')
-                city_type = 'city'
-            elif address.get('town'):
-                city_name = address.get('town')
-                city_type = 'town'
-            elif address.get('village'):
-                city_name = address.get('village')
-                city_type = 'village'
-            elif address.get('municipality'):
-                city_name = address.get('municipality')
-                city_type = 'municipality'
-            elif address.get('city_district'):
-                city_name = address.get('city_district')
-                city_type = 'city_district'
-            
-            if not city_name:
-                continue
-            
-            country_code = address.get('country_code', '').upper()
-            country = address.get('country', '')
-            
-            # Получаем координаты
-            lat = float(item.get('lat', 0))
-            lon = float(item.get('lon', 0))
-            
-            # Получаем полное название для отображения
-            display_name = item.get('display_name', city_name)
-            
-            # Определяем названия на разных языках
-            name_ru = city_name
-            name_local = city_name
-            name_en = city_name
-            
-            # Для стран СНГ пытаемся получить английское название
-            if country_code in ['RU', 'BY', 'KZ', 'UA', 'KG', 'TJ', 'UZ', 'TM', 'MD', 'AM', 'AZ', 'GE']:
-                # Для стран СНГ русское название - основное
-                name_ru = city_name
-                name_local = city_name
-                # Английское название может быть в display_name или нужно искать отдельно
-                # Пока используем русское название
-                name_en = city_name
-            else:
-                # Для других стран местное название - основное
-                name_local = city_name
-                name_ru = city_name
-                name_en = city_name
-            
-            results.append({
-                'name_ru': name_ru,
-                'name_local': name_local,
-                'name_en': name_en,
-                'country_code': country_code,
-                'country': country,
-                'latitude': lat,
-                'longitude': lon,
-                'display_name': display_name,
-                'city_type': city_type  # Тип населенного пункта
-            })
-        
-        logger.info(f"Found {len(results)} cities for query '{query}'")
-        return results
-        
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error searching city by name: {e}")
-        return []
+        return _parse_search_results(data, query)
     except Exception as e:
-        logger.error(f"Unexpected error in search_city_by_name: {e}", exc_info=True)
+        logger.error(f"Unexpected error in search_city_by_name_async: {e}", exc_info=True)
         return []
-
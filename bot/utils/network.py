@@ -0,0 +1,52 @@
+"""Сетевые настройки процесса ботов"""
+import asyncio
+import logging
+import socket
+
+logger = logging.getLogger(__name__)
+
+_ipv4_forced = False
+
+
+def force_ipv4():
+    """
+    Принудительно использовать IPv4 для исходящих подключений
+
+    Это необходимо, так как на некоторых серверах IPv6 вызывает проблемы с TLS.
+    Патч глобальный (socket.getaddrinfo и asyncio.getaddrinfo), повторный вызов
+    ничего не делает - несколько ботов в одном процессе не оборачивают его дважды.
+    """
+    global _ipv4_forced
+    if _ipv4_forced:
+        return
+    _ipv4_forced = True
+
+    original_getaddrinfo = socket.getaddrinfo
+
+    def getaddrinfo_ipv4_only(host, port, family=0, type=0, proto=0, flags=0):
+        """Переопределяем getaddrinfo для использования только IPv4"""
+        # Принудительно используем IPv4 вместо AF_UNSPEC (0) или AF_INET6
+        if family == socket.AF_UNSPEC or family == 0:
+            family = socket.AF_INET
+        elif family == socket.AF_INET6:
+            family = socket.AF_INET  # Заменяем IPv6 на IPv4
+        return original_getaddrinfo(host, port, family, type, proto, flags)
+
+    socket.getaddrinfo = getaddrinfo_ipv4_only
+
+    # Патч для asyncio.getaddrinfo (если доступен)
+    if hasattr(asyncio, 'getaddrinfo'):
+        original_asyncio_getaddrinfo = asyncio.getaddrinfo
+
+        async def asyncio_getaddrinfo_ipv4_only(host, port, family=0, type=0, proto=0, flags=0):
+            """Асинхронная версия getaddrinfo для использования только IPv4"""
+            if family == socket.AF_UNSPEC or family == 0:
+                family = socket.AF_INET
+            elif family == socket.AF_INET6:
+                family = socket.AF_INET
+            return await original_asyncio_getaddrinfo(host, port, family, type, proto, flags)
+
+        asyncio.getaddrinfo = asyncio_getaddrinfo_ipv4_only
+        logger.info("[INFO] Настроен принудительный IPv4 для подключений (socket и asyncio)")
+    else:
+        logger.info("[INFO] Настроен принудительный IPv4 для подключений (socket)")
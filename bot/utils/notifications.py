@@ -0,0 +1,74 @@
+"""Массовая отправка уведомлений с ограничением частоты"""
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Iterable, Tuple
+
+from telegram.error import Forbidden, RetryAfter, TelegramError
+
+from bot.utils.rate_limiter import LANE_BULK, lane_kwargs
+
+logger = logging.getLogger(__name__)
+
+# Лимит Telegram для рассылок - около 30 сообщений в секунду, оставляем запас
+NOTIFICATIONS_PER_SECOND = 20
+
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    delay = error.retry_after
+    if isinstance(delay, timedelta):
+        return delay.total_seconds()
+    return float(delay)
+
+
+async def send_with_retry(bot, chat_id: int, text: str, **kwargs) -> bool:
+    """
+    Отправить одно сообщение: при RetryAfter ждет указанное Telegram время и повторяет один раз
+
+    Returns:
+        True, если сообщение доставлено (заблокировавшие бота пользователи и ошибки - False)
+    """
+    for attempt in range(2):
+        try:
+            await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+            return True
+        except RetryAfter as e:
+            delay = _retry_after_seconds(e)
+            logger.warning(f"Flood control while notifying {chat_id}, waiting {delay}s")
+            await asyncio.sleep(delay)
+        except Forbidden:
+            logger.info(f"User {chat_id} blocked the bot, notification skipped")
+            return False
+        except TelegramError as e:
+            logger.error(f"Error notifying {chat_id}: {e}")
+            return False
+    return False
+
+
+async def send_throttled(bot, messages: Iterable[Tuple[int, str]],
+                         per_second: float = NOTIFICATIONS_PER_SECOND, **kwargs) -> int:
+    """
+    Отправить сообщения по очереди, не превышая per_second сообщений в секунду
+
+    Сообщения идут через очередь bulk ограничителя запросов, поэтому не
+    задерживают ответы пользователям.
+    При RetryAfter ждет указанное Telegram время и повторяет сообщение один раз.
+    Пользователи, заблокировавшие бота, пропускаются.
+
+    Args:
+        bot: telegram.Bot
+        messages: Пары (chat_id, текст)
+        per_second: Максимальная частота отправки
+        **kwargs: Дополнительные параметры send_message (parse_mode и т.п.)
+
+    Returns:
+        Количество доставленных сообщений
+    """
+    interval = 1.0 / per_second
+    kwargs = {**lane_kwargs(bot, LANE_BULK), **kwargs}
+    sent = 0
+    for chat_id, text in messages:
+        if await send_with_retry(bot, chat_id, text, **kwargs):
+            sent += 1
+        await asyncio.sleep(interval)
+    return sent
@@ -1,57 +1,97 @@
 """Утилита для работы с OpenAI API для генерации описаний услуг"""
+import asyncio
 import logging
 import os
-from typing import Optional
-from openai import OpenAI
+import re
+from typing import Dict, Optional, Tuple
+from openai import AsyncOpenAI
+
+from bot.utils.cache import CacheManager, CacheKeys
 
 logger = logging.getLogger(__name__)
 
-# Инициализация клиента OpenAI
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-client = None
+# Адрес API (можно указать прокси или локальный тестовый сервер)
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL') or None
+# Сколько запросов к OpenAI может выполняться одновременно на весь процесс
+OPENAI_MAX_CONCURRENCY = int(os.getenv('OPENAI_MAX_CONCURRENCY', '4'))
+# Сколько хранить сгенерированные описания в кэше (сутки)
+DESCRIPTION_CACHE_TTL = 24 * 60 * 60
 
-if OPENAI_API_KEY:
-    try:
-        client = OpenAI(api_key=OPENAI_API_KEY)
-        logger.info("OpenAI client initialized successfully")
-    except Exception as e:
-        logger.error(f"Failed to initialize OpenAI client: {e}")
-        client = None
-else:
+OPENAI_MODEL = "gpt-4o-mini"
+SYSTEM_PROMPT = "Ты — профессиональный копирайтер, создающий короткие продающие описания услуг для мастеров красоты и здоровья."
+
+# Добавляем вариативность через разные инструкции для повторных генераций
+VARIATION_INSTRUCTIONS = [
+    "Акцент на профессиональный подход и качество результата.",
+    "Подчеркни удобство и комфорт для клиента.",
+    "Сделай акцент на уникальности и индивидуальном подходе.",
+    "Выдели преимущества и выгоды для клиента.",
+    "Сфокусируйся на результате и положительных эмоциях."
+]
+
+client: Optional[AsyncOpenAI] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+# Генерации в процессе: master_id -> (ключ описания, задача)
+_inflight: Dict[int, Tuple[Tuple[str, int], asyncio.Task]] = {}
+
+if not OPENAI_API_KEY:
     logger.warning("OPENAI_API_KEY not found in environment variables")
 
 
-async def generate_service_description(service_name: str, retry_count: int = 0) -> Optional[str]:
-    """
-    Генерирует описание услуги с помощью GPT-4o mini
-    
-    Args:
-        service_name: Название услуги
-        retry_count: Количество попыток (для вариативности при повторных генерациях)
-    
-    Returns:
-        Сгенерированное описание или None в случае ошибки
-    """
-    if not client:
-        logger.error("OpenAI client is not initialized")
-        return None
-    
-    # Промпт для генерации описания
-    # Добавляем вариативность через разные инструкции для повторных генераций
-    variation_instructions = [
-        "Акцент на профессиональный подход и качество результата.",
-        "Подчеркни удобство и комфорт для клиента.",
-        "Сделай акцент на уникальности и индивидуальном подходе.",
-        "Выдели преимущества и выгоды для клиента.",
-        "Сфокусируйся на результате и положительных эмоциях."
-    ]
-    
-    variation = variation_instructions[retry_count % len(variation_instructions)]
-    
-    prompt = f"""Создай короткое, продающее описание услуги на русском языке (до 40 слов).
+def get_client() -> Optional[AsyncOpenAI]:
+    """Получить общий асинхронный клиент OpenAI (создается при первом обращении)"""
+    global client
+    if client is None and OPENAI_API_KEY:
+        try:
+            client = AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, max_retries=1)
+            logger.info("OpenAI client initialized successfully")
+        except Exception as e:
+            logger.error(f"Failed to initialize OpenAI client: {e}")
+            client = None
+    return client
+
+
+async def close_client():
+    """Закрыть клиент OpenAI (при остановке бота)"""
+    global client
+    if client is not None:
+        await client.close()
+        client = None
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+    return _semaphore
+
+
+def normalize_service_name(service_name: str) -> str:
+    """Нормализовать название услуги для ключа кэша"""
+    return re.sub(r'\s+', ' ', service_name).strip().lower().replace('ё', 'е')
+
+
+def get_variation_index(retry_count: int) -> int:
+    """Номер варианта описания для попытки генерации"""
+    return retry_count % len(VARIATION_INSTRUCTIONS)
+
+
+def _description_cache_key(service_name: str, variation: int) -> str:
+    return CacheKeys.get_service_description_key(normalize_service_name(service_name), variation)
+
+
+def is_generation_in_progress(master_id: int) -> bool:
+    """Идет ли сейчас генерация описания для мастера"""
+    entry = _inflight.get(master_id)
+    return entry is not None and not entry[1].done()
+
+
+def _build_prompt(service_name: str, variation: int) -> str:
+    return f"""Создай короткое, продающее описание услуги на русском языке (до 40 слов).
 
 Стиль — лёгкий, дружелюбный, с 1–2 уместными эмодзи.
-{variation}
+{VARIATION_INSTRUCTIONS[variation]}
 Не указывай цены, контакты, ссылки или упоминания брендов.
 Описание должно звучать естественно и привлекательно для клиента.
 
@@ -59,40 +99,111 @@ async def generate_service_description(service_name: str, retry_count: int = 0)
 
 Ответь только описанием услуги, без дополнительных пояснений."""
 
+
+def _clean_description(text: str) -> str:
+    description = text.strip()
+
+    # Очищаем описание от кавычек, если они есть
+    description = description.strip('"\'«»')
+
+    # Проверяем длину (до 40 слов = примерно 300 символов)
+    if len(description) > 300:
+        # Обрезаем до 300 символов и добавляем ...
+        description = description[:297] + "..."
+    return description
+
+
+async def _request_description(service_name: str, retry_count: int) -> Optional[str]:
+    """Запросить описание у API (с ограничением числа одновременных запросов)"""
+    api_client = get_client()
+    if not api_client:
+        logger.error("OpenAI client is not initialized")
+        return None
+
+    variation = get_variation_index(retry_count)
     try:
-        logger.info(f"Generating description for service: {service_name} (attempt {retry_count + 1})")
-        
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Ты — профессиональный копирайтер, создающий короткие продающие описания услуг для мастеров красоты и здоровья."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0.8 + (retry_count * 0.1),  # Увеличиваем температуру для вариативности
-            max_tokens=150,
-            timeout=10.0
-        )
-        
-        description = response.choices[0].message.content.strip()
-        
-        # Очищаем описание от кавычек, если они есть
-        description = description.strip('"\'«»')
-        
-        # Проверяем длину (до 40 слов = примерно 300 символов)
-        if len(description) > 300:
-            # Обрезаем до 300 символов и добавляем ...
-            description = description[:297] + "..."
-        
+        async with _get_semaphore():
+            logger.info(f"Generating description for service: {service_name} (attempt {retry_count + 1})")
+            response = await api_client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": _build_prompt(service_name, variation)}
+                ],
+                # Увеличиваем температуру для вариативности (API допускает не больше 2.0)
+                temperature=min(0.8 + (retry_count * 0.1), 1.3),
+                max_tokens=150,
+                timeout=10.0
+            )
+
+        description = _clean_description(response.choices[0].message.content or "")
+        if not description:
+            return None
+
+        CacheManager.set(_description_cache_key(service_name, variation), description, DESCRIPTION_CACHE_TTL)
         logger.info(f"Generated description: {description[:50]}...")
         return description
-        
+
     except Exception as e:
         logger.error(f"Error generating service description: {e}", exc_info=True)
         return None
 
+
+async def generate_service_description(service_name: str, retry_count: int = 0,
+                                       master_id: Optional[int] = None,
+                                       use_library: bool = True) -> Optional[str]:
+    """
+    Генерирует описание услуги с помощью GPT-4o mini
+
+    Для предустановленных шаблонов описание берется из библиотеки заранее
+    сгенерированных вариантов (см. description_library), API не вызывается.
+    Готовые описания кэшируются по нормализованному названию и номеру варианта.
+    Повторный запрос того же мастера, пока генерация еще идет, не создает
+    новый запрос к API, а дожидается уже запущенного.
+
+    Args:
+        service_name: Название услуги
+        retry_count: Количество попыток (для вариативности при повторных генерациях)
+        master_id: ID мастера (для объединения повторных нажатий)
+        use_library: Искать описание в библиотеке шаблонов
+
+    Returns:
+        Сгенерированное описание или None в случае ошибки
+    """
+    if use_library:
+        from bot.utils.description_library import get_library_description
+        try:
+            description = get_library_description(service_name, retry_count)
+        except Exception as e:
+            logger.error(f"Error reading description library: {e}")
+            description = None
+        if description:
+            logger.info(f"Description library hit for service: {service_name}")
+            return description
+
+    variation = get_variation_index(retry_count)
+    cached = CacheManager.get(_description_cache_key(service_name, variation))
+    if cached is not None:
+        logger.info(f"Description cache hit for service: {service_name} (variation {variation})")
+        return cached
+
+    # Чтение библиотеки открыло транзакцию апдейта - не держим ее, пока ждем OpenAI
+    from bot.database.db import release_update_session
+    release_update_session()
+
+    if master_id is None:
+        return await _request_description(service_name, retry_count)
+
+    key = (normalize_service_name(service_name), variation)
+    entry = _inflight.get(master_id)
+    if entry is not None and entry[0] == key and not entry[1].done():
+        logger.info(f"Description generation already in progress for master {master_id}")
+        return await asyncio.shield(entry[1])
+
+    task = asyncio.create_task(_request_description(service_name, retry_count))
+    _inflight[master_id] = (key, task)
+    try:
+        return await asyncio.shield(task)
+    finally:
+        if _inflight.get(master_id, (None, None))[1] is task:
+            del _inflight[master_id]
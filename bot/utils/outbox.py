@@ -0,0 +1,186 @@
+"""Фоновая доставка уведомлений из таблицы notification_outbox"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+from bot.utils.notifications import _retry_after_seconds
+from bot.utils.rate_limiter import LANE_NOTIFICATION, lane_kwargs
+
+logger = logging.getLogger(__name__)
+
+# Сколько уведомлений брать из очереди за один проход
+OUTBOX_BATCH_SIZE = 50
+# Пауза между проверками пустой очереди (секунды)
+OUTBOX_POLL_INTERVAL = 1.0
+# Не чаще одного сообщения в секунду в один чат (ограничение Telegram)
+PER_CHAT_INTERVAL = 1.0
+# После стольких неудачных попыток уведомление помечается failed
+MAX_ATTEMPTS = 5
+# Задержка повтора: 2, 4, 8, ... секунд, но не больше 5 минут
+RETRY_BASE_DELAY = 2.0
+RETRY_MAX_DELAY = 300.0
+
+
+class OutboxWorker:
+    """
+    Воркер, доставляющий уведомления из outbox через общий Bot
+
+    Записи попадают в очередь в той же транзакции, что и событие (например,
+    бронирование), поэтому уведомление не теряется при сбое отправки и не
+    задерживает ответ пользователю.
+    """
+
+    def __init__(self, bot, bot_name: str = 'master', batch_size: int = OUTBOX_BATCH_SIZE,
+                 poll_interval: float = OUTBOX_POLL_INTERVAL,
+                 per_chat_interval: float = PER_CHAT_INTERVAL,
+                 max_attempts: int = MAX_ATTEMPTS):
+        self.bot = bot
+        self.bot_name = bot_name  # Какие записи outbox доставляет этот воркер: master или client
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.per_chat_interval = per_chat_interval
+        self.max_attempts = max_attempts
+        self.metrics: Dict[str, float] = {
+            'sent': 0,
+            'failed': 0,
+            'retried': 0,
+            'deferred': 0,
+            'last_latency': 0.0,  # Секунды от постановки в очередь до доставки
+            'max_latency': 0.0,
+        }
+        self._last_sent: Dict[int, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def start(self):
+        """Запустить фоновую доставку"""
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Notification outbox worker started ({self.bot_name} bot)")
+
+    async def stop(self):
+        """Остановить фоновую доставку"""
+        self._stopping = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        logger.info(f"Notification outbox worker stopped ({self.bot_name} bot), metrics: {self.metrics}")
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                processed = await self.drain_once()
+            except Exception as e:
+                logger.error(f"Error draining notification outbox: {e}", exc_info=True)
+                processed = 0
+            if not processed:
+                await asyncio.sleep(self.poll_interval)
+
+    def _retry_delay(self, attempts: int) -> float:
+        return min(RETRY_BASE_DELAY * (2 ** (attempts - 1)), RETRY_MAX_DELAY)
+
+    async def drain_once(self) -> int:
+        """
+        Отправить уведомления, которые пора доставить
+
+        Пачка читается в простые значения и сессия закрывается до отправки: транзакция
+        не держится открытой на время запросов к Bot API. Результат каждой отправки
+        записывается отдельной короткой транзакцией.
+
+        Returns:
+            Количество обработанных записей (доставленных, отложенных повторов и ошибок)
+        """
+        from bot.database.db import get_session, get_due_notifications, update_notification
+
+        loop = asyncio.get_running_loop()
+        # Забываем чаты, интервал для которых уже истек, чтобы словарь не рос
+        self._last_sent = {
+            chat_id: sent_at for chat_id, sent_at in self._last_sent.items()
+            if loop.time() - sent_at < self.per_chat_interval
+        }
+        with get_session() as session:
+            batch = [
+                (entry.id, entry.chat_id, entry.text, entry.parse_mode, entry.attempts, entry.created_at)
+                for entry in get_due_notifications(session, limit=self.batch_size, bot=self.bot_name)
+            ]
+
+        processed = 0
+        for entry_id, chat_id, text, parse_mode, attempts, created_at in batch:
+            # Соблюдаем интервал между сообщениями в один чат - запись подождет следующего прохода
+            last_sent = self._last_sent.get(chat_id)
+            if last_sent is not None and loop.time() - last_sent < self.per_chat_interval:
+                self.metrics['deferred'] += 1
+                continue
+
+            processed += 1
+            now = datetime.utcnow()
+            try:
+                await self.bot.send_message(
+                    chat_id=chat_id,
+                    text=text,
+                    parse_mode=parse_mode,
+                    **lane_kwargs(self.bot, LANE_NOTIFICATION)
+                )
+            except RetryAfter as e:
+                # Flood control - не считаем попыткой, просто ждем
+                delay = _retry_after_seconds(e)
+                result = {'next_attempt_at': now + timedelta(seconds=delay)}
+                self.metrics['retried'] += 1
+                logger.warning(f"Flood control for outbox entry {entry_id}, retry in {delay}s")
+            except (Forbidden, BadRequest) as e:
+                # Бот заблокирован или сообщение некорректно - повтор не поможет
+                result = {'status': 'failed', 'last_error': str(e)[:255]}
+                self.metrics['failed'] += 1
+                logger.warning(f"Outbox entry {entry_id} for chat {chat_id} failed: {e}")
+            except TelegramError as e:
+                attempts += 1
+                result = {'attempts': attempts, 'last_error': str(e)[:255]}
+                if attempts >= self.max_attempts:
+                    result['status'] = 'failed'
+                    self.metrics['failed'] += 1
+                    logger.error(f"Outbox entry {entry_id} failed after {attempts} attempts: {e}")
+                else:
+                    result['next_attempt_at'] = now + timedelta(seconds=self._retry_delay(attempts))
+                    self.metrics['retried'] += 1
+            else:
+                result = {'status': 'sent', 'sent_at': now}
+                self._last_sent[chat_id] = loop.time()
+                latency = (now - created_at).total_seconds() if created_at else 0.0
+                self.metrics['sent'] += 1
+                self.metrics['last_latency'] = latency
+                self.metrics['max_latency'] = max(self.metrics['max_latency'], latency)
+            # Фиксируем результат сразу, чтобы не отправить сообщение повторно после сбоя
+            with get_session() as session:
+                update_notification(session, entry_id, **result)
+        return processed
+
+
+_workers: Dict[str, OutboxWorker] = {}
+
+
+def start_outbox_worker(bot, bot_name: str = 'master') -> OutboxWorker:
+    """Запустить воркер outbox для бота (вызывается в post_init)"""
+    worker = _workers.get(bot_name)
+    if worker is None:
+        worker = _workers[bot_name] = OutboxWorker(bot, bot_name=bot_name)
+    worker.start()
+    return worker
+
+
+def get_outbox_worker(bot_name: str = 'master') -> Optional[OutboxWorker]:
+    return _workers.get(bot_name)
+
+
+async def stop_outbox_worker(bot_name: str = 'master'):
+    """Остановить воркер outbox бота"""
+    worker = _workers.pop(bot_name, None)
+    if worker is not None:
+        await worker.stop()
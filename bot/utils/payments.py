@@ -0,0 +1,218 @@
+"""Применение статусов платежей ЮKassa: уведомления webhook и фоновая сверка"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import or_
+
+logger = logging.getLogger(__name__)
+
+# Статусы, после которых платеж больше не проверяется
+FINAL_STATUSES = ('succeeded', 'canceled')
+# Статус для давно зависших платежей (сверка их больше не опрашивает,
+# но уведомление об успешной оплате все еще будет применено)
+EXPIRED_STATUS = 'expired'
+
+# Первые минуты после создания платежа ждем webhook и не опрашиваем ЮKassa
+RECONCILE_MIN_AGE = timedelta(minutes=5)
+# Задержка между проверками одного платежа: 1, 2, 4, ... минут, но не больше 6 часов
+RECONCILE_BASE_DELAY = timedelta(minutes=1)
+RECONCILE_MAX_DELAY = timedelta(hours=6)
+# Платежи старше этого срока помечаются истекшими без запросов к API
+PAYMENT_MAX_AGE = timedelta(days=2)
+# Сколько платежей проверять за один проход сверки
+RECONCILE_BATCH_SIZE = 50
+
+
+def next_check_delay(attempts: int) -> timedelta:
+    """Задержка до следующей проверки платежа после attempts проверок"""
+    return min(RECONCILE_BASE_DELAY * (2 ** min(attempts, 16)), RECONCILE_MAX_DELAY)
+
+
+def apply_payment_status(session, payment_id: str, status: Optional[str], paid: bool = False) -> bool:
+    """
+    Применить статус платежа от ЮKassa к Payment и подписке мастера
+
+    Идемпотентно: меняет только платежи в статусе pending (или expired),
+    поэтому повторное уведомление или одновременная сверка не продлят
+    подписку дважды.
+
+    Returns:
+        True, если статус платежа изменился
+    """
+    from bot.config import PREMIUM_DURATION_DAYS
+    from bot.database.db import update_master_subscription
+    from bot.database.models import Payment
+
+    if status == 'succeeded' and paid:
+        now = datetime.utcnow()
+        values = {
+            'status': 'succeeded',
+            'paid_at': now,
+            'expires_at': now + timedelta(days=PREMIUM_DURATION_DAYS),
+            'next_check_at': None,
+        }
+    elif status == 'canceled':
+        values = {'status': 'canceled', 'next_check_at': None}
+    else:
+        return False
+
+    # Условный UPDATE: изменение применит только один из конкурирующих обработчиков
+    updated = session.query(Payment).filter(
+        Payment.payment_id == payment_id,
+        Payment.status.in_(('pending', EXPIRED_STATUS))
+    ).update(values, synchronize_session=False)
+    session.commit()
+
+    if not updated:
+        logger.debug(f"Payment {payment_id} is unknown or already final, status {status} ignored")
+        return False
+
+    payment = session.query(Payment).filter_by(payment_id=payment_id).first()
+    if values['status'] == 'succeeded':
+        update_master_subscription(
+            session,
+            payment.master_account_id,
+            payment.subscription_type or 'premium',
+            values['expires_at']
+        )
+        logger.info(f"Payment {payment_id} succeeded, subscription activated for master {payment.master_account_id}")
+    else:
+        logger.info(f"Payment {payment_id} canceled")
+    return True
+
+
+def schedule_next_check(session, payment_id: str, now: Optional[datetime] = None):
+    """Отложить следующую проверку платежа с экспоненциальной задержкой"""
+    from bot.database.models import Payment
+
+    now = now or datetime.utcnow()
+    payment = session.query(Payment).filter_by(payment_id=payment_id).first()
+    if not payment or payment.status != 'pending':
+        return
+    attempts = (payment.check_attempts or 0) + 1
+    payment.check_attempts = attempts
+    payment.next_check_at = now + next_check_delay(attempts - 1)
+    session.commit()
+
+
+async def refresh_payment_status(payment_id: str) -> Optional[str]:
+    """
+    Обновить статус платежа по запросу мастера
+
+    ЮKassa опрашивается, только если платеж еще pending и подошло время
+    следующей проверки; иначе возвращается статус из БД (его обновляет webhook).
+
+    Returns:
+        Текущий статус платежа или None, если платеж не найден
+    """
+    from bot.database.db import get_session, get_payment_by_id, outside_transaction
+    from bot.utils.yookassa_api import get_payment_status
+
+    now = datetime.utcnow()
+    with get_session() as session:
+        payment = get_payment_by_id(session, payment_id)
+        if not payment:
+            return None
+        if payment.status != 'pending' or (payment.next_check_at and payment.next_check_at > now):
+            return payment.status
+
+    data = await outside_transaction(get_payment_status(payment_id))
+
+    with get_session() as session:
+        if data and apply_payment_status(session, payment_id, data.get('status'), data.get('paid', False)):
+            return data.get('status')
+        schedule_next_check(session, payment_id, now)
+        return get_payment_by_id(session, payment_id).status
+
+
+async def handle_yookassa_notification(notification: Dict[str, Any]) -> bool:
+    """
+    Обработать HTTP-уведомление ЮKassa о платеже
+
+    Уведомления не подписываются, поэтому (если включено YOOKASSA_WEBHOOK_VERIFY)
+    статус берется из API ЮKassa, а тело уведомления служит только сигналом.
+
+    Returns:
+        True, если уведомление обработано (повторять его не нужно),
+        False, если статус не удалось проверить (ЮKassa повторит доставку)
+    """
+    from bot.config import YOOKASSA_WEBHOOK_VERIFY
+    from bot.database.db import get_session, get_payment_by_id, outside_transaction
+    from bot.utils.yookassa_api import get_payment_status
+
+    payment_object = notification.get('object') or {}
+    payment_id = payment_object.get('id')
+    event = notification.get('event', '')
+    if not payment_id or not event.startswith('payment.'):
+        logger.info(f"Ignoring YooKassa notification: {event or 'unknown event'}")
+        return True
+
+    with get_session() as session:
+        if not get_payment_by_id(session, payment_id):
+            logger.warning(f"YooKassa notification for unknown payment {payment_id}")
+            return True
+
+    if YOOKASSA_WEBHOOK_VERIFY:
+        payment_object = await outside_transaction(get_payment_status(payment_id))
+        if not payment_object:
+            logger.error(f"Could not verify YooKassa notification for payment {payment_id}")
+            return False
+
+    with get_session() as session:
+        apply_payment_status(session, payment_id, payment_object.get('status'), payment_object.get('paid', False))
+    return True
+
+
+async def reconcile_pending_payments(batch_size: int = RECONCILE_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Сверить зависшие платежи с ЮKassa
+
+    Опрашиваются только pending-платежи старше RECONCILE_MIN_AGE, у которых
+    подошло время следующей проверки; после каждой безрезультатной проверки
+    задержка удваивается. Платежи старше PAYMENT_MAX_AGE помечаются истекшими.
+
+    Returns:
+        Dict со статистикой: {'expired': ..., 'checked': ..., 'updated': ...}
+    """
+    from bot.database.db import get_session
+    from bot.database.models import Payment
+    from bot.utils.yookassa_api import get_payment_status
+
+    now = datetime.utcnow()
+    with get_session() as session:
+        expired = session.query(Payment).filter(
+            Payment.status == 'pending',
+            Payment.created_at < now - PAYMENT_MAX_AGE
+        ).update({'status': EXPIRED_STATUS, 'next_check_at': None}, synchronize_session=False)
+
+        payment_ids: List[str] = [row.payment_id for row in session.query(Payment.payment_id).filter(
+            Payment.status == 'pending',
+            Payment.created_at <= now - RECONCILE_MIN_AGE,
+            or_(Payment.next_check_at.is_(None), Payment.next_check_at <= now)
+        ).order_by(Payment.created_at).limit(batch_size)]
+
+    stats = {'expired': expired, 'checked': len(payment_ids), 'updated': 0}
+    if not payment_ids:
+        return stats
+
+    results = await asyncio.gather(*[get_payment_status(payment_id) for payment_id in payment_ids])
+
+    with get_session() as session:
+        for payment_id, data in zip(payment_ids, results):
+            if data and apply_payment_status(session, payment_id, data.get('status'), data.get('paid', False)):
+                stats['updated'] += 1
+            else:
+                schedule_next_check(session, payment_id, now)
+
+    logger.info(f"Payment reconciliation: {stats}")
+    return stats
+
+
+async def reconcile_payments_job(context):
+    """Периодическая задача JobQueue: сверка зависших платежей"""
+    try:
+        await reconcile_pending_payments()
+    except Exception as e:
+        logger.error(f"Error reconciling payments: {e}", exc_info=True)
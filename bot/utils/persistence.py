@@ -0,0 +1,214 @@
+"""Хранение user_data, chat_data и состояний ConversationHandler между перезапусками ботов"""
+import asyncio
+import json
+import logging
+import pickle
+import time
+import zlib
+from typing import Any, Dict, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+# Данные больше порога сжимаются zlib (user_data с черновиками услуг, расписания и т.п.)
+COMPRESS_THRESHOLD = 256
+_PLAIN = b'p'
+_COMPRESSED = b'z'
+
+# Бюджет на апдейт (мс): запоминание изменения и его доля в записи пачкой (scripts/benchmark_persistence.py)
+PER_UPDATE_BUDGET_MS = 1.0
+
+PersistenceKey = Tuple[str, str, str]  # (kind, name, key)
+
+
+def encode_state(data: Any) -> Optional[bytes]:
+    """
+    Сериализовать состояние
+
+    Returns:
+        Байты или None для пустого состояния - его запись просто удаляется
+    """
+    if data is None or data == {}:
+        return None
+    raw = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+    if len(raw) > COMPRESS_THRESHOLD:
+        compressed = zlib.compress(raw, 6)
+        if len(compressed) < len(raw):
+            return _COMPRESSED + compressed
+    return _PLAIN + raw
+
+
+def decode_state(data: bytes) -> Any:
+    """Восстановить состояние, сохраненное encode_state"""
+    payload = data[1:]
+    if data[:1] == _COMPRESSED:
+        payload = zlib.decompress(payload)
+    return pickle.loads(payload)
+
+
+def _conversation_key(key: Tuple) -> str:
+    return json.dumps(list(key), separators=(',', ':'))
+
+
+class DatabasePersistence(BasePersistence):
+    """
+    Persistence для Application: состояние бота хранится в таблице bot_persistence
+
+    Application сам отслеживает, чьи данные изменились, и раз в update_interval
+    секунд передает их в update_* - эти вызовы только запоминают данные.
+    Все изменения одного прохода сериализуются и записываются одной транзакцией
+    в отдельном потоке (write-behind), поэтому обработка апдейта не ждет БД.
+    При остановке бота flush записывает то, что осталось.
+
+    Ошибка записи не теряет данные: пачка возвращается в очередь и будет
+    записана со следующим проходом.
+    """
+
+    def __init__(self, bot_name: str, update_interval: float = 5.0):
+        super().__init__(store_data=PersistenceInput(callback_data=False), update_interval=update_interval)
+        self.bot_name = bot_name
+        self._pending: Dict[PersistenceKey, Any] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self.metrics = {
+            'flushes': 0,
+            'entries': 0,
+            'bytes': 0,
+            'errors': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+        }
+
+    # ===== Загрузка при старте =====
+
+    def _load(self, kind: str) -> list:
+        from bot.database.db import get_session, get_persistence_entries
+
+        with get_session() as session:
+            entries = get_persistence_entries(session, self.bot_name, kind)
+        result = []
+        for name, key, data in entries:
+            try:
+                result.append((name, key, decode_state(data)))
+            except Exception as e:
+                logger.warning(f"Persistence {self.bot_name}: cannot decode {kind} {name}/{key}: {e}")
+        return result
+
+    async def _load_by_id(self, kind: str) -> Dict[int, Any]:
+        return {int(key): data for _, key, data in await asyncio.to_thread(self._load, kind)}
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        return await self._load_by_id('user')
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        return await self._load_by_id('chat')
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        entries = await asyncio.to_thread(self._load, 'bot')
+        return entries[0][2] if entries else {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> Dict[Tuple, object]:
+        return {
+            tuple(json.loads(key)): state
+            for entry_name, key, state in await asyncio.to_thread(self._load, 'conversation')
+            if entry_name == name
+        }
+
+    # ===== Изменения: только запоминаются до записи пачкой =====
+
+    def _mark(self, kind: str, key: str, data: Any, name: str = ''):
+        self._pending[(kind, name, key)] = data
+        if self._flush_task is None:
+            # Задача запустится после остальных update_* этого прохода Application
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def update_user_data(self, user_id: int, data: Dict) -> None:
+        self._mark('user', str(user_id), data)
+
+    async def update_chat_data(self, chat_id: int, data: Dict) -> None:
+        self._mark('chat', str(chat_id), data)
+
+    async def update_bot_data(self, data: Dict) -> None:
+        self._mark('bot', '', data)
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def update_conversation(self, name: str, key: Tuple, new_state: Optional[object]) -> None:
+        self._mark('conversation', _conversation_key(key), new_state, name=name)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._mark('user', str(user_id), None)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._mark('chat', str(chat_id), None)
+
+    # Данные в памяти Application - единственный источник, перечитывать из БД перед апдейтом не нужно
+    async def refresh_user_data(self, user_id: int, user_data: Dict) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Dict) -> None:
+        pass
+
+    # ===== Запись =====
+
+    def _write(self, batch: Dict[PersistenceKey, Any]) -> Tuple[int, int]:
+        """Сериализовать и записать пачку (выполняется в потоке). Возвращает (записей, байт)"""
+        from bot.database.db import get_session, save_persistence_entries
+
+        encoded: Dict[PersistenceKey, Optional[bytes]] = {}
+        for entry_key, data in batch.items():
+            try:
+                encoded[entry_key] = encode_state(data)
+            except Exception as e:
+                # Несериализуемое значение в user_data - пропускаем запись, а не всю пачку
+                logger.warning(f"Persistence {self.bot_name}: cannot serialize {entry_key}: {e}")
+        with get_session() as session:
+            save_persistence_entries(session, self.bot_name, encoded)
+        return len(encoded), sum(len(data) for data in encoded.values() if data)
+
+    async def _flush_pending(self) -> bool:
+        """Записать накопленные изменения. Returns: False, если запись не удалась"""
+        if not self._pending:
+            return True
+        batch, self._pending = self._pending, {}
+        started = time.perf_counter()
+        try:
+            entries, size = await asyncio.to_thread(self._write, batch)
+        except Exception as e:
+            # Более новые изменения, пришедшие во время записи, важнее возвращенных
+            batch.update(self._pending)
+            self._pending = batch
+            self.metrics['errors'] += 1
+            logger.error(f"Persistence {self.bot_name}: flush of {len(batch)} entries failed: {e}", exc_info=True)
+            return False
+        elapsed = (time.perf_counter() - started) * 1000
+        self.metrics['flushes'] += 1
+        self.metrics['entries'] += entries
+        self.metrics['bytes'] += size
+        self.metrics['last_flush_ms'] = elapsed
+        self.metrics['max_flush_ms'] = max(self.metrics['max_flush_ms'], elapsed)
+        return True
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(0)
+            # Изменения, пришедшие во время записи, пишутся следующей пачкой; после ошибки - со следующим проходом
+            while self._pending and await self._flush_pending():
+                pass
+        finally:
+            self._flush_task = None
+
+    async def flush(self) -> None:
+        """Записать все оставшиеся изменения (вызывается при остановке Application)"""
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self._flush_pending()
+        logger.info(f"Persistence {self.bot_name} flushed, metrics: {self.metrics}")
+
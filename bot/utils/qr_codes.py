@@ -0,0 +1,115 @@
+"""Генерация и кэширование QR-кодов приглашения клиентов"""
+import asyncio
+import io
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import qrcode
+
+from bot.config import CLIENT_BOT_USERNAME
+
+logger = logging.getLogger(__name__)
+
+
+def build_invite_link(master_id: int) -> str:
+    """Сформировать диплинк (или инструкцию, если username клиентского бота не задан)"""
+    if CLIENT_BOT_USERNAME:
+        return f"https://t.me/{CLIENT_BOT_USERNAME}?start=m_{master_id}"
+    return f"Используйте команду /start m_{master_id} в клиентском боте"
+
+
+def render_qr_png(data: str) -> bytes:
+    """
+    Отрисовать QR-код в PNG (CPU-bound, вызывать вне event loop)
+
+    Args:
+        data: Данные для кодирования (диплинк)
+
+    Returns:
+        PNG-изображение в байтах
+    """
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    img = qr.make_image(fill_color="black", back_color="white")
+
+    bio = io.BytesIO()
+    img.save(bio, format='PNG')
+    return bio.getvalue()
+
+
+def get_cached_invite_qr(session, master_id: int, deep_link: str) -> Tuple[Optional[bytes], Optional[str]]:
+    """
+    Получить закэшированный QR-код мастера
+
+    Returns:
+        (png, file_id) - file_id есть, если фото уже отправлялось в Telegram
+    """
+    from bot.database.db import get_invite_qr
+
+    qr_code = get_invite_qr(session, master_id, deep_link)
+    if not qr_code:
+        return None, None
+    return qr_code.png, qr_code.file_id
+
+
+async def render_invite_qr(master_id: int, deep_link: str) -> bytes:
+    """Отрисовать QR-код в рабочем потоке и сохранить его в кэш"""
+    from bot.database.db import get_session, save_invite_qr
+
+    png = await asyncio.to_thread(render_qr_png, deep_link)
+
+    with get_session() as session:
+        save_invite_qr(session, master_id, deep_link, png)
+
+    logger.info(f"Rendered invite QR for master {master_id} ({len(png)} bytes)")
+    return png
+
+
+def remember_invite_qr_file_id(master_id: int, deep_link: str, file_id: Optional[str]):
+    """Запомнить file_id отправленного QR-кода (None - сбросить устаревший file_id)"""
+    from bot.database.db import get_session, set_invite_qr_file_id
+
+    with get_session() as session:
+        set_invite_qr_file_id(session, master_id, deep_link, file_id)
+
+
+def prerender_all_invite_qr(workers: Optional[int] = None, force: bool = False) -> Dict[str, int]:
+    """
+    Пакетно отрисовать QR-коды приглашения для всех мастеров
+
+    Отрисовка выполняется в пуле процессов, запись в БД - в основном процессе.
+
+    Args:
+        workers: Количество процессов (по умолчанию - число ядер)
+        force: Перерисовать даже уже закэшированные коды
+
+    Returns:
+        Статистика: {'total': ..., 'rendered': ..., 'skipped': ...}
+    """
+    from bot.database.db import get_session, get_invite_qr, save_invite_qr
+    from bot.database.models import MasterAccount
+
+    with get_session() as session:
+        master_ids = [row[0] for row in session.query(MasterAccount.id).all()]
+        pending: List[Tuple[int, str]] = []
+        for master_id in master_ids:
+            deep_link = build_invite_link(master_id)
+            if force or not get_invite_qr(session, master_id, deep_link):
+                pending.append((master_id, deep_link))
+
+    stats = {'total': len(master_ids), 'rendered': 0, 'skipped': len(master_ids) - len(pending)}
+    if not pending:
+        return stats
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        images = executor.map(render_qr_png, [deep_link for _, deep_link in pending], chunksize=16)
+        with get_session() as session:
+            for (master_id, deep_link), png in zip(pending, images):
+                save_invite_qr(session, master_id, deep_link, png)
+                stats['rendered'] += 1
+
+    logger.info(f"Pre-rendered invite QR codes: {stats}")
+    return stats
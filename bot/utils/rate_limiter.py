@@ -0,0 +1,200 @@
+"""Ограничение частоты исходящих запросов к Telegram Bot API с приоритетами"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Очереди (lanes) в порядке приоритета: ответы пользователю, уведомления, рассылки
+LANE_INTERACTIVE = 'interactive'
+LANE_NOTIFICATION = 'notification'
+LANE_BULK = 'bulk'
+LANES = (LANE_INTERACTIVE, LANE_NOTIFICATION, LANE_BULK)
+
+# Лимиты Telegram: около 30 сообщений в секунду на бота,
+# около 1 сообщения в секунду в личный чат и 20 в минуту в группу
+GLOBAL_RATE = 30.0
+PRIVATE_CHAT_RATE = 1.0
+PRIVATE_CHAT_BURST = 3
+GROUP_CHAT_RATE = 20 / 60
+GROUP_CHAT_BURST = 20
+# Сколько раз повторить запрос после RetryAfter перед тем, как отдать ошибку вызывающему коду
+MAX_RETRIES = 1
+# При стольких ведрах чатов удаляем неиспользуемые (полные) ведра
+CHAT_BUCKETS_CLEANUP_SIZE = 1000
+
+
+class TokenBucket:
+    """
+    Ведро токенов: rate токенов в секунду, не больше capacity накопленных
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, now: Optional[float] = None) -> float:
+        """
+        Взять токен
+
+        Returns:
+            0, если токен получен, иначе сколько секунд подождать до следующего токена
+        """
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def is_full(self, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+def _lane_of(rate_limit_args: Any) -> str:
+    """Очередь запроса: строка-lane или словарь {'lane': ...}, по умолчанию interactive"""
+    if isinstance(rate_limit_args, dict):
+        rate_limit_args = rate_limit_args.get('lane')
+    return rate_limit_args if rate_limit_args in LANES else LANE_INTERACTIVE
+
+
+def _is_group_chat(chat_id: Any) -> bool:
+    # У групп и каналов отрицательный id, каналы также адресуются по @username
+    if isinstance(chat_id, int):
+        return chat_id < 0
+    if isinstance(chat_id, str):
+        return chat_id.startswith('@') or chat_id.startswith('-')
+    return False
+
+
+def lane_kwargs(bot, lane: str) -> Dict[str, Any]:
+    """
+    Параметры вызова метода бота для отправки через заданную очередь
+
+    rate_limit_args принимает только бот приложения с ограничителем (ExtBot),
+    для остальных ботов возвращает пустой словарь.
+    """
+    if getattr(bot, 'rate_limiter', None) is None:
+        return {}
+    return {'rate_limit_args': lane}
+
+
+class TelegramRateLimiter(BaseRateLimiter[Any]):
+    """
+    Ограничитель исходящих запросов для Application
+
+    Каждый запрос берет токен из ведра своего чата (если у запроса есть chat_id)
+    и из общего ведра бота. Пока запросы более приоритетной очереди ждут общий
+    токен, менее приоритетные не отправляются, поэтому массовые уведомления не
+    задерживают ответы пользователям. После RetryAfter все запросы ждут
+    указанное Telegram время.
+
+    Очередь задается через rate_limit_args: bot.send_message(..., rate_limit_args='bulk').
+    """
+
+    def __init__(self, global_rate: float = GLOBAL_RATE, max_retries: int = MAX_RETRIES):
+        self.global_rate = global_rate
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: Dict[Any, TokenBucket] = {}
+        self._waiting: Dict[str, int] = {lane: 0 for lane in LANES}
+        self._paused_until = 0.0
+        self._counters = {'requests': 0, 'throttled': 0, 'retry_after': 0}
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        logger.info(f"Rate limiter stopped, metrics: {self.get_metrics()}")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Глубина очередей и счетчики ограничителя"""
+        return {
+            'queue_depth': dict(self._waiting),
+            'chat_buckets': len(self._chats),
+            'paused_for': max(0.0, self._paused_until - time.monotonic()),
+            **self._counters,
+        }
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= CHAT_BUCKETS_CLEANUP_SIZE:
+                now = time.monotonic()
+                self._chats = {key: b for key, b in self._chats.items() if not b.is_full(now)}
+            if _is_group_chat(chat_id):
+                bucket = TokenBucket(GROUP_CHAT_RATE, GROUP_CHAT_BURST)
+            else:
+                bucket = TokenBucket(PRIVATE_CHAT_RATE, PRIVATE_CHAT_BURST)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _has_higher_priority_waiters(self, lane: str) -> bool:
+        for other in LANES:
+            if other == lane:
+                return False
+            if self._waiting[other]:
+                return True
+        return False
+
+    async def _acquire(self, lane: str, chat_id: Any):
+        throttled = False
+        # Лимит чата не зависит от остальных запросов, очередь приоритетов - только за общим токеном
+        if chat_id is not None:
+            bucket = self._chat_bucket(chat_id)
+            while (delay := bucket.try_acquire()) > 0:
+                throttled = True
+                await asyncio.sleep(delay)
+
+        self._waiting[lane] += 1
+        try:
+            while True:
+                delay = self._paused_until - time.monotonic()
+                if delay <= 0:
+                    if self._has_higher_priority_waiters(lane):
+                        delay = 1 / self.global_rate
+                    else:
+                        delay = self._global.try_acquire()
+                        if delay <= 0:
+                            break
+                throttled = True
+                await asyncio.sleep(delay)
+        finally:
+            self._waiting[lane] -= 1
+            if throttled:
+                self._counters['throttled'] += 1
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        from bot.database.db import release_update_session
+
+        # Все запросы ботов к Bot API проходят здесь: транзакция апдейта не должна
+        # оставаться открытой на время ожидания очереди и ответа Telegram
+        release_update_session()
+        lane = _lane_of(rate_limit_args)
+        chat_id = data.get('chat_id')
+        self._counters['requests'] += 1
+
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(lane, chat_id)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                from bot.utils.notifications import _retry_after_seconds
+                delay = _retry_after_seconds(e)
+                self._counters['retry_after'] += 1
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                logger.warning(f"Flood control on {endpoint} ({lane}), pausing requests for {delay}s")
+                if attempt >= self.max_retries:
+                    raise
@@ -0,0 +1,164 @@
+"""Напоминания клиентам о записях на основе постоянной очереди scheduled_jobs"""
+import heapq
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# В памяти держим только задачи ближайшего окна, не больше REMINDER_HEAP_LIMIT
+REMINDER_WINDOW = timedelta(hours=1)
+REMINDER_HEAP_LIMIT = 1000
+# Сколько напоминаний обрабатывать за одно срабатывание
+REMINDER_BATCH_SIZE = 100
+# Как часто перечитывать окно из БД (подхватывает записи, созданные другими процессами)
+REMINDER_REFILL_INTERVAL = 60
+
+WEEKDAYS = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
+
+
+def format_booking_reminder(master_name: str, service_title: str, start_dt: datetime) -> str:
+    """Текст напоминания клиенту о записи"""
+    return f"""⏰ <b>Напоминание о записи</b>
+
+👤 Мастер: <b>{master_name}</b>
+💼 Услуга: {service_title}
+📅 Дата и время: {start_dt.strftime('%d.%m.%Y %H:%M')} ({WEEKDAYS[start_dt.weekday()]})
+
+Если планы изменились, предупредите мастера заранее."""
+
+
+def fire_booking_reminders(job_ids: List[int], now: Optional[datetime] = None) -> int:
+    """
+    Поставить напоминания по задачам в очередь отправки клиентского бота
+
+    Задача помечается выполненной в той же транзакции, в которой напоминание
+    попадает в notification_outbox, поэтому после перезапуска напоминание не
+    будет отправлено повторно и не потеряется.
+
+    Returns:
+        Количество поставленных в очередь напоминаний
+    """
+    from bot.database.db import get_session, claim_scheduled_job, enqueue_notification
+    from bot.database.models import Booking, ScheduledJob
+
+    now = now or datetime.now()
+    queued = 0
+    with get_session() as session:
+        jobs = session.query(ScheduledJob).filter(ScheduledJob.id.in_(job_ids)).all()
+        for job in jobs:
+            booking = session.query(Booking).filter_by(id=job.booking_id).first() if job.booking_id else None
+            # Запись удалена или уже началась (например, бот был выключен) - напоминать поздно
+            if booking is None or booking.start_dt <= now:
+                claim_scheduled_job(session, job.id, status='skipped')
+                continue
+            if not claim_scheduled_job(session, job.id):
+                continue
+            enqueue_notification(
+                session,
+                booking.user.telegram_id,
+                format_booking_reminder(booking.master_account.name, booking.service.title, booking.start_dt),
+                kind='booking_reminder',
+                master_id=booking.master_account_id,
+                bot='client'
+            )
+            queued += 1
+    return queued
+
+
+class ReminderScheduler:
+    """
+    Планировщик напоминаний поверх таблицы scheduled_jobs
+
+    В памяти хранится куча (fire_at, id) только для ближайшего окна
+    (не больше heap_limit задач), поэтому память не зависит от числа будущих
+    записей. Срабатывание планируется через JobQueue на время ближайшей задачи.
+    """
+
+    def __init__(self, job_queue, window: timedelta = REMINDER_WINDOW,
+                 heap_limit: int = REMINDER_HEAP_LIMIT, batch_size: int = REMINDER_BATCH_SIZE):
+        self.job_queue = job_queue
+        self.window = window
+        self.heap_limit = heap_limit
+        self.batch_size = batch_size
+        self._heap: List[Tuple[datetime, int]] = []
+        self._truncated = False  # Окно не поместилось в heap_limit - в БД есть еще задачи окна
+        self._fire_job = None
+        self._refill_job = None
+
+    def refill(self, now: Optional[datetime] = None):
+        """Перечитать ближайшее окно задач из БД и запланировать срабатывание"""
+        from bot.database.db import get_session, get_upcoming_scheduled_jobs
+
+        now = now or datetime.now()
+        with get_session() as session:
+            # Строки приходят отсортированными по fire_at - это уже корректная куча
+            self._heap = get_upcoming_scheduled_jobs(session, now + self.window, self.heap_limit)
+        self._truncated = len(self._heap) >= self.heap_limit
+        self._arm(now)
+
+    def _arm(self, now: Optional[datetime] = None):
+        if self._fire_job is not None:
+            self._fire_job.schedule_removal()
+            self._fire_job = None
+        if not self._heap:
+            return
+        now = now or datetime.now()
+        delay = max(0.0, (self._heap[0][0] - now).total_seconds())
+        self._fire_job = self.job_queue.run_once(self._on_fire, when=delay, name='booking_reminders')
+
+    def pop_due(self, now: Optional[datetime] = None) -> List[int]:
+        """Извлечь из кучи до batch_size задач, время которых наступило"""
+        now = now or datetime.now()
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+            due.append(heapq.heappop(self._heap)[1])
+        return due
+
+    def fire_due(self, now: Optional[datetime] = None) -> int:
+        """Обработать все наступившие задачи из кучи пачками"""
+        now = now or datetime.now()
+        queued = 0
+        while True:
+            due = self.pop_due(now)
+            if not due:
+                # Куча была обрезана лимитом - дочитываем следующие задачи окна
+                if self._heap or not self._truncated:
+                    break
+                self.refill(now)
+                continue
+            queued += fire_booking_reminders(due, now)
+        return queued
+
+    async def _on_fire(self, context):
+        self._fire_job = None
+        try:
+            queued = self.fire_due()
+            if queued:
+                logger.info(f"Queued {queued} booking reminders")
+        except Exception as e:
+            logger.error(f"Error firing booking reminders: {e}", exc_info=True)
+        self._arm()
+
+    async def _on_refill(self, context):
+        try:
+            self.refill()
+        except Exception as e:
+            logger.error(f"Error loading booking reminders: {e}", exc_info=True)
+
+    def start(self):
+        """Загрузить окно задач и запустить периодическое перечитывание"""
+        self.refill()
+        self._refill_job = self.job_queue.run_repeating(
+            self._on_refill,
+            interval=REMINDER_REFILL_INTERVAL,
+            first=REMINDER_REFILL_INTERVAL,
+            name='booking_reminders_refill'
+        )
+        logger.info(f"Booking reminder scheduler started, {len(self._heap)} reminders in the next window")
+
+    def stop(self):
+        for job in (self._fire_job, self._refill_job):
+            if job is not None:
+                job.schedule_removal()
+        self._fire_job = self._refill_job = None
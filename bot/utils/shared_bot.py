@@ -0,0 +1,100 @@
+"""Общий долгоживущий экземпляр мастер-бота (один HTTP-пул на процесс)"""
+import logging
+from typing import Optional
+
+from telegram import Bot
+
+logger = logging.getLogger(__name__)
+
+_master_bot: Optional[Bot] = None
+# Бот создан здесь (а не передан приложением) - его нужно закрыть при остановке
+_owns_master_bot = False
+
+
+def set_master_bot(bot: Bot):
+    """Использовать бот приложения мастер-бота (вызывается в post_init мастер-бота)"""
+    global _master_bot, _owns_master_bot
+    _master_bot = bot
+    _owns_master_bot = False
+
+
+def get_master_bot() -> Optional[Bot]:
+    """
+    Получить общий экземпляр мастер-бота
+
+    В процессе мастер-бота это application.bot, в остальных процессах
+    (клиентский бот, API) - один Bot на процесс вместо нового на каждый вызов.
+
+    Returns:
+        Bot или None, если BOT_TOKEN не задан
+    """
+    global _master_bot, _owns_master_bot
+    if _master_bot is None:
+        from bot.config import BOT_TOKEN
+        if not BOT_TOKEN:
+            logger.warning("BOT_TOKEN не установлен, мастер-бот недоступен")
+            return None
+        from telegram.ext import ExtBot
+        from bot.utils.rate_limiter import TelegramRateLimiter
+        # Через ограничитель, как и боты приложений: перед запросом он завершает транзакцию апдейта
+        _master_bot = ExtBot(token=BOT_TOKEN, rate_limiter=TelegramRateLimiter())
+        _owns_master_bot = True
+    return _master_bot
+
+
+async def close_master_bot():
+    """Закрыть HTTP-соединения общего бота, если он был создан этим модулем"""
+    global _master_bot, _owns_master_bot
+    if _master_bot is not None and _owns_master_bot:
+        try:
+            await _master_bot.shutdown()
+        except Exception as e:
+            logger.warning(f"Error shutting down shared master bot: {e}")
+    _master_bot = None
+    _owns_master_bot = False
+
+
+_client_bot = None
+_owns_client_bot = False
+
+
+def set_client_bot(bot):
+    """Использовать бот приложения клиентского бота (вызывается в post_init клиентского бота)"""
+    global _client_bot, _owns_client_bot
+    _client_bot = bot
+    _owns_client_bot = False
+
+
+def get_client_bot():
+    """
+    Получить общий экземпляр клиентского бота (для рассылок клиентам из мастер-бота)
+
+    Бот создается со своим ограничителем запросов, поэтому рассылка идет
+    через очередь bulk так же, как в приложении клиентского бота.
+
+    Returns:
+        ExtBot или None, если CLIENT_BOT_TOKEN не задан
+    """
+    global _client_bot, _owns_client_bot
+    if _client_bot is None:
+        from telegram.ext import ExtBot
+        from bot.config import CLIENT_BOT_TOKEN
+        from bot.utils.rate_limiter import TelegramRateLimiter
+        if not CLIENT_BOT_TOKEN:
+            logger.warning("CLIENT_BOT_TOKEN не установлен, клиентский бот недоступен")
+            return None
+        _client_bot = ExtBot(token=CLIENT_BOT_TOKEN, rate_limiter=TelegramRateLimiter())
+        _owns_client_bot = True
+    return _client_bot
+
+
+async def close_client_bot():
+    """Закрыть HTTP-соединения общего клиентского бота, если он был создан этим модулем"""
+    global _client_bot, _owns_client_bot
+    if _client_bot is not None and _owns_client_bot:
+        try:
+            await _client_bot.shutdown()
+        except Exception as e:
+            logger.warning(f"Error shutting down shared client bot: {e}")
+    _client_bot = None
+    _owns_client_bot = False
@@ -0,0 +1,39 @@
+"""
+__slots__ для датаклассов на Python 3.9
+
+@dataclass(slots=True) появился только в 3.10, а __slots__, объявленный вручную,
+конфликтует со значениями полей по умолчанию. slotted() пересоздает готовый
+датакласс со __slots__, как это делает dataclass(slots=True).
+"""
+import dataclasses
+
+
+def _frozen_getstate(self):
+    return [getattr(self, f.name) for f in dataclasses.fields(self)]
+
+
+def _frozen_setstate(self, state):
+    for f, value in zip(dataclasses.fields(self), state):
+        object.__setattr__(self, f.name, value)
+
+
+def slotted(cls):
+    """
+    Декоратор поверх @dataclass: класс без __dict__ с полями в __slots__
+
+    Для frozen-классов добавляет __getstate__/__setstate__, иначе pickle
+    не сможет восстановить поля через запрещенный __setattr__.
+    """
+    field_names = tuple(f.name for f in dataclasses.fields(cls))
+    namespace = dict(cls.__dict__)
+    for name in field_names:
+        namespace.pop(name, None)
+    namespace.pop('__dict__', None)
+    namespace.pop('__weakref__', None)
+    namespace['__slots__'] = field_names
+    if cls.__dataclass_params__.frozen:
+        namespace['__getstate__'] = _frozen_getstate
+        namespace['__setstate__'] = _frozen_setstate
+    new_cls = type(cls)(cls.__name__, cls.__bases__, namespace)
+    new_cls.__qualname__ = cls.__qualname__
+    return new_cls
@@ -0,0 +1,46 @@
+"""Фоновое снятие истекших подписок мастеров"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+EXPIRED_SUBSCRIPTION_TEXT = (
+    "⌛ <b>Срок премиум подписки истек</b>\n\n"
+    "Ваш аккаунт переведен на бесплатный тариф.\n"
+    "Продлить подписку можно в разделе «Премиум»."
+)
+
+
+async def sweep_expired_subscriptions(bot) -> int:
+    """
+    Перевести мастеров с истекшей подпиской на бесплатный тариф и уведомить их
+
+    После прохода subscription_level актуален, поэтому проверки тарифа
+    (например, лимит портфолио) не сравнивают даты при каждом запросе.
+
+    Returns:
+        Количество переведенных мастеров
+    """
+    from bot.database.db import get_session, downgrade_expired_subscriptions
+    from bot.utils.notifications import send_throttled
+
+    with get_session() as session:
+        expired = downgrade_expired_subscriptions(session)
+
+    if not expired:
+        return 0
+
+    logger.info(f"Downgraded {len(expired)} masters with expired subscriptions")
+    await send_throttled(
+        bot,
+        ((telegram_id, EXPIRED_SUBSCRIPTION_TEXT) for _, telegram_id, _ in expired),
+        parse_mode='HTML'
+    )
+    return len(expired)
+
+
+async def subscription_expiry_job(context):
+    """Периодическая задача JobQueue: снятие истекших подписок"""
+    try:
+        await sweep_expired_subscriptions(context.bot)
+    except Exception as e:
+        logger.error(f"Error sweeping expired subscriptions: {e}", exc_info=True)
@@ -0,0 +1,107 @@
+"""Параллельная обработка апдейтов с сохранением порядка для каждого пользователя"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+# Сколько апдейтов обрабатывается одновременно (разные пользователи)
+UPDATE_WORKERS = 16
+# Сколько апдейтов может ждать своей очереди, прежде чем Application перестанет брать новые
+MAX_PENDING_UPDATES = 256
+
+
+def get_ordering_key(update: object) -> Optional[Hashable]:
+    """
+    Ключ, апдейты с которым обрабатываются строго по очереди
+
+    Пользователь (или чат, если пользователя нет, например, для постов в канале).
+    Для прочих объектов в очереди Application порядок не требуется.
+    """
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user:
+        return ('user', update.effective_user.id)
+    if update.effective_chat:
+        return ('chat', update.effective_chat.id)
+    return None
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Обработчик апдейтов для Application.concurrent_updates
+
+    Апдейты разных пользователей обрабатываются параллельно (не больше
+    max_workers одновременно), а апдейты одного пользователя - строго по
+    очереди в порядке поступления. Так медленный обработчик (геокодинг,
+    генерация описания, пересылка фото) задерживает только своего
+    пользователя, а user_data и ConversationHandler не видят гонок.
+
+    Ожидание очереди пользователя не занимает рабочий слот: слот берется
+    только после того, как подошла очередь апдейта.
+    """
+
+    def __init__(self, max_workers: int = UPDATE_WORKERS, max_pending: int = MAX_PENDING_UPDATES):
+        super().__init__(max(max_pending, max_workers))
+        self.max_workers = max_workers
+        # Семафор создается в event loop, где обрабатываются апдейты (как и блокировки
+        # пользователей): на Python 3.9 он привязывается к циклу при создании, а
+        # Application собирается до запуска цикла uvicorn
+        self._workers: Optional[asyncio.Semaphore] = None
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._queued: Dict[Hashable, int] = {}
+        self._active = 0
+        self._processed = 0
+
+    async def initialize(self) -> None:
+        self._workers = asyncio.Semaphore(self.max_workers)
+
+    async def shutdown(self) -> None:
+        logger.info(f"Update processor stopped, metrics: {self.get_metrics()}")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Активные и ожидающие апдейты"""
+        return {
+            'active': self._active,
+            'queued_users': len(self._locks),
+            'pending': self.current_concurrent_updates,
+            'processed': self._processed,
+        }
+
+    async def _run(self, coroutine: Awaitable[Any]):
+        from bot.database.db import update_session_scope
+
+        if self._workers is None:
+            self._workers = asyncio.Semaphore(self.max_workers)
+        async with self._workers:
+            self._active += 1
+            try:
+                # Одна сессия БД на апдейт, коммит - в конце обработки
+                async with update_session_scope():
+                    await coroutine
+            finally:
+                self._active -= 1
+                self._processed += 1
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = get_ordering_key(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._queued[key] = self._queued.get(key, 0) + 1
+        try:
+            # asyncio.Lock отдается ожидающим в порядке очереди - порядок апдейтов сохраняется
+            async with lock:
+                await self._run(coroutine)
+        finally:
+            self._queued[key] -= 1
+            if not self._queued[key]:
+                del self._queued[key]
+                del self._locks[key]
@@ -0,0 +1,216 @@
+"""
+Ограничение частоты действий пользователей: ведро токенов с подключаемым хранилищем
+
+Каждый ключ (пользователь в пространстве имен ограничителя) - ведро из трех чисел:
+токены, время обновления и время, когда ведро снова станет полным. Проверка - O(1).
+Полное ведро ничем не отличается от отсутствующего, поэтому простаивающие
+пользователи забываются: в памяти - по порядку последнего обращения (LRU),
+в SQLite - периодическим удалением полных ведер.
+
+Хранилища: MemoryRateLimitStorage (один процесс) и SqliteRateLimitStorage
+(общий файл для всех процессов ботов и REST API на одной машине). Обращение к SQLite
+блокирующее (ожидание блокировки файла до timeout), поэтому асинхронный код
+проверяет лимит через TokenBucketLimiter.acheck - в отдельном потоке.
+"""
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Ведро: (токены, время обновления, время, когда ведро станет полным)
+Bucket = Tuple[float, float, float]
+
+
+def take_tokens(bucket: Optional[Bucket], rate: float, capacity: float, cost: float,
+                now: float) -> Tuple[Bucket, float]:
+    """
+    Пополнить ведро на момент now и взять cost токенов
+
+    Returns:
+        (новое состояние ведра, 0 - токены взяты, иначе сколько секунд ждать)
+    """
+    if bucket is None:
+        tokens = float(capacity)
+    else:
+        tokens = min(capacity, bucket[0] + max(0.0, now - bucket[1]) * rate)
+    if tokens >= cost:
+        tokens -= cost
+        wait = 0.0
+    else:
+        wait = (cost - tokens) / rate
+    return (tokens, now, now + (capacity - tokens) / rate), wait
+
+
+class RateLimitStorage(ABC):
+    """Хранилище ведер: take() атомарно пополняет ведро ключа и берет из него токены"""
+
+    # take() может надолго заблокировать поток (файловые блокировки) - из event loop только через поток
+    blocking: bool = False
+
+    @abstractmethod
+    def take(self, key: str, rate: float, capacity: float, cost: float, now: float) -> float:
+        """Взять cost токенов: 0 - взяты, иначе сколько секунд ждать"""
+
+    @abstractmethod
+    def reset(self, key: str):
+        """Забыть ведро ключа"""
+
+    def close(self):
+        pass
+
+
+class MemoryRateLimitStorage(RateLimitStorage):
+    """
+    Ведра в памяти процесса, упорядоченные по последнему обращению
+
+    При каждом обращении из начала очереди удаляются ведра, которые уже
+    наполнились (пользователь простаивает), а при превышении max_keys -
+    самые давние, так что память ограничена числом активных пользователей.
+    """
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._buckets: 'OrderedDict[str, Bucket]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def take(self, key: str, rate: float, capacity: float, cost: float, now: float) -> float:
+        buckets = self._buckets
+        bucket, wait = take_tokens(buckets.pop(key, None), rate, capacity, cost, now)
+        buckets[key] = bucket
+        # Вытеснение: сначала наполнившиеся ведра из начала очереди, затем - сверх лимита
+        while buckets:
+            oldest_key, oldest = next(iter(buckets.items()))
+            if oldest_key == key or (oldest[2] > now and len(buckets) <= self.max_keys):
+                break
+            del buckets[oldest_key]
+        return wait
+
+    def reset(self, key: str):
+        self._buckets.pop(key, None)
+
+
+class SqliteRateLimitStorage(RateLimitStorage):
+    """
+    Ведра в таблице SQLite, общей для нескольких процессов
+
+    Чтение и запись ведра - одна транзакция BEGIN IMMEDIATE, поэтому процессы
+    не теряют обновления друг друга. Время - time.time(), общее для процессов.
+    Наполнившиеся ведра удаляются раз в prune_interval секунд.
+    """
+    blocking = True
+
+    def __init__(self, path: str, prune_interval: float = 60.0, timeout: float = 5.0):
+        self.path = path
+        self.prune_interval = prune_interval
+        self._lock = threading.Lock()
+        self._pruned_at = 0.0
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_buckets ("
+            "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, full_at REAL NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_rate_limit_buckets_full_at ON rate_limit_buckets (full_at)")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM rate_limit_buckets").fetchone()[0]
+
+    def take(self, key: str, rate: float, capacity: float, cost: float, now: float) -> float:
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT tokens, updated_at, full_at FROM rate_limit_buckets WHERE key = ?", (key,)
+                ).fetchone()
+                bucket, wait = take_tokens(row, rate, capacity, cost, now)
+                conn.execute(
+                    "INSERT INTO rate_limit_buckets (key, tokens, updated_at, full_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, "
+                    "updated_at = excluded.updated_at, full_at = excluded.full_at",
+                    (key, *bucket)
+                )
+                if now - self._pruned_at >= self.prune_interval:
+                    self._pruned_at = now
+                    conn.execute("DELETE FROM rate_limit_buckets WHERE full_at <= ?", (now,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return wait
+
+    def reset(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM rate_limit_buckets WHERE key = ?", (key,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_storage: Optional[RateLimitStorage] = None
+
+
+def get_rate_limit_storage() -> RateLimitStorage:
+    """Хранилище по умолчанию (RATE_LIMIT_STORAGE), одно на процесс"""
+    global _default_storage
+    if _default_storage is None:
+        from bot.config import RATE_LIMIT_DB_PATH, RATE_LIMIT_MAX_KEYS, RATE_LIMIT_STORAGE
+        if RATE_LIMIT_STORAGE == 'sqlite':
+            _default_storage = SqliteRateLimitStorage(RATE_LIMIT_DB_PATH)
+        else:
+            _default_storage = MemoryRateLimitStorage(RATE_LIMIT_MAX_KEYS)
+        logger.info(f"Rate limit storage: {type(_default_storage).__name__}")
+    return _default_storage
+
+
+class TokenBucketLimiter:
+    """
+    Ограничитель: rate токенов в секунду, всплеск до capacity
+
+    Ключи разных ограничителей не пересекаются в общем хранилище - к ним
+    добавляется namespace.
+    """
+
+    def __init__(self, rate: float, capacity: float, namespace: str,
+                 storage: Optional[RateLimitStorage] = None):
+        self.rate = rate
+        self.capacity = capacity
+        self.namespace = namespace
+        self._storage = storage
+
+    @property
+    def storage(self) -> RateLimitStorage:
+        if self._storage is None:
+            self._storage = get_rate_limit_storage()
+        return self._storage
+
+    def check(self, key, cost: float = 1.0, now: Optional[float] = None) -> float:
+        """
+        Взять токен для ключа
+
+        Returns:
+            0, если действие разрешено, иначе сколько секунд подождать
+        """
+        now = time.time() if now is None else now
+        return self.storage.take(f"{self.namespace}:{key}", self.rate, self.capacity, cost, now)
+
+    async def acheck(self, key, cost: float = 1.0, now: Optional[float] = None) -> float:
+        """check() для асинхронного кода: блокирующее хранилище опрашивается в отдельном потоке"""
+        if self.storage.blocking:
+            return await asyncio.to_thread(self.check, key, cost, now)
+        return self.check(key, cost, now)
+
+    def reset(self, key):
+        self.storage.reset(f"{self.namespace}:{key}")
@@ -0,0 +1,190 @@
+"""Состояние пользователя в context.user_data: компактные объекты с вытеснением по простою"""
+import logging
+import pickle
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Any, ClassVar, Dict, List, Mapping, MutableMapping, Optional, Tuple, Type, TypeVar
+
+from bot.utils.slots import slotted
+
+logger = logging.getLogger(__name__)
+
+# Ключи user_data старого формата (словари поиска и workflow, россыпь booking_*) - удаляются при очистке
+LEGACY_KEYS = ('client_search_state', 'workflow_name', 'workflow_step', 'workflow_data')
+LEGACY_PREFIXES = ('booking_',)
+
+
+@slotted
+@dataclass
+class SearchState:
+    """
+    Поиск мастеров клиентом: выбранные город, категория, услуга и курсор по списку мастеров
+
+    Категории и услуги города не хранятся - они пересобираются из БД по city_id
+    (порядок стабилен: сортировка по названию). От списка мастеров хранятся
+    только id в порядке показа и номер страницы, данные страницы читаются из БД.
+    """
+    KEY: ClassVar[str] = 'search'
+
+    city_id: Optional[int] = None
+    city_name: Optional[str] = None
+    category_idx: Optional[int] = None
+    category_title: Optional[str] = None
+    has_services: bool = False
+    service_idx: Optional[int] = None
+    service_title: Optional[str] = None
+    # Текущий список мастеров: 'city', 'category' или 'service'
+    display_type: Optional[str] = None
+    master_ids: Tuple[int, ...] = ()
+    # Для списка по услуге - id услуги каждого мастера (цена и длительность в строке списка)
+    service_ids: Tuple[int, ...] = ()
+    total: int = 0
+    page: int = 0
+    touched_at: float = field(default_factory=time.time)
+
+    def reset_list(self):
+        """Забыть текущий список мастеров (возврат к категориям или услугам)"""
+        self.display_type = None
+        self.master_ids = ()
+        self.service_ids = ()
+        self.total = 0
+        self.page = 0
+
+
+@slotted
+@dataclass
+class BookingState:
+    """Запись клиента на услугу: выбранные услуга, дата и время"""
+    KEY: ClassVar[str] = 'booking'
+
+    service_id: int
+    master_id: int
+    duration: int
+    price: float
+    cooling: int = 0
+    available_dates: Tuple[date, ...] = ()
+    date_page: int = 0
+    portfolio_photo_ids: Tuple[int, ...] = ()
+    selected_date: Optional[date] = None
+    start_dt: Optional[datetime] = None
+    end_dt: Optional[datetime] = None
+    comment: str = ''
+    touched_at: float = field(default_factory=time.time)
+
+
+@slotted
+@dataclass
+class WorkflowState:
+    """
+    Прохождение workflow (bot/core/workflow.py): имя, ID текущего шага и введенные данные
+
+    Хранится ID шага, а не его номер в скомпилированной таблице: состояние переживает
+    перезапуск, а после деплоя с новыми шагами номер указывал бы на другой шаг.
+    """
+    KEY: ClassVar[str] = 'workflow'
+
+    workflow: str
+    step: str
+    data: Dict[str, Any] = field(default_factory=dict)
+    touched_at: float = field(default_factory=time.time)
+
+
+STATE_TYPES = (SearchState, BookingState, WorkflowState)
+
+State = TypeVar('State', SearchState, BookingState, WorkflowState)
+
+
+def get_state(user_data: MutableMapping, state_type: Type[State]) -> Optional[State]:
+    """Состояние нужного типа (или None) - обращение продлевает его жизнь"""
+    state = user_data.get(state_type.KEY)
+    if not isinstance(state, state_type):
+        return None
+    state.touched_at = time.time()
+    return state
+
+
+def set_state(user_data: MutableMapping, state: State) -> State:
+    """Сохранить новое состояние вместо предыдущего того же типа"""
+    user_data[type(state).KEY] = state
+    return state
+
+
+def clear_state(user_data: MutableMapping, state_type: Type[State]):
+    user_data.pop(state_type.KEY, None)
+
+
+def _is_legacy_key(key) -> bool:
+    return isinstance(key, str) and (key in LEGACY_KEYS or key.startswith(LEGACY_PREFIXES))
+
+
+def evict_idle_states(users: Mapping[int, MutableMapping], ttl: float,
+                      now: Optional[float] = None) -> Tuple[Dict[str, int], List[int], List[int]]:
+    """
+    Удалить состояния, к которым не обращались дольше ttl секунд, и ключи старого формата
+
+    Returns:
+        (удалено по типам, id пользователей с изменившимися данными, id пользователей, у которых данных не осталось)
+    """
+    now = time.time() if now is None else now
+    evicted: Dict[str, int] = {}
+    changed: List[int] = []
+    emptied: List[int] = []
+    for user_id, data in users.items():
+        stale = [
+            key for key, value in data.items()
+            if (isinstance(value, STATE_TYPES) and now - value.touched_at > ttl) or _is_legacy_key(key)
+        ]
+        if not stale:
+            continue
+        for key in stale:
+            value = data.pop(key)
+            kind = type(value).__name__ if isinstance(value, STATE_TYPES) else 'legacy'
+            evicted[kind] = evicted.get(kind, 0) + 1
+        (changed if data else emptied).append(user_id)
+    return evicted, changed, emptied
+
+
+def memory_report(users: Mapping[int, Mapping]) -> Dict[str, Dict[str, int]]:
+    """
+    Объем user_data по типам состояний: количество, суммарный и максимальный размер (байт)
+
+    Размер - длина pickle, то есть столько же состояние занимает в persistence.
+    Значения без типа учитываются под своим ключом user_data.
+    """
+    report: Dict[str, Dict[str, int]] = {}
+    for data in users.values():
+        for key, value in data.items():
+            kind = type(value).__name__ if isinstance(value, STATE_TYPES) else str(key)
+            try:
+                size = len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+            except Exception:
+                size = 0
+            entry = report.setdefault(kind, {'count': 0, 'bytes': 0, 'max_bytes': 0})
+            entry['count'] += 1
+            entry['bytes'] += size
+            entry['max_bytes'] = max(entry['max_bytes'], size)
+    return report
+
+
+async def sweep_user_states(context):
+    """
+    Задача JobQueue: вытеснить простаивающие состояния и записать отчет об объеме user_data
+
+    Выполняется в каждом процессе с ботом: user_data у каждого шарда свой.
+    Пользователи без оставшихся данных удаляются целиком (и из persistence).
+    """
+    from bot.config import USER_STATE_TTL
+
+    application = context.application
+    evicted, changed, emptied = evict_idle_states(application.user_data, USER_STATE_TTL)
+    if changed:
+        application.mark_data_for_update_persistence(user_ids=changed)
+    for user_id in emptied:
+        application.drop_user_data(user_id)
+    if evicted:
+        logger.info(f"User states evicted: {evicted}, users dropped: {len(emptied)}")
+
+    report = memory_report(application.user_data)
+    total = sum(entry['bytes'] for entry in report.values())
+    logger.info(f"User data: {len(application.user_data)} users, {total} bytes, by type: {report}")
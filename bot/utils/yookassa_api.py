@@ -1,5 +1,6 @@
 """Интеграция с API ЮKassa для приема платежей"""
-import requests
+import asyncio
+import httpx
 import uuid
 import logging
 from typing import Optional, Dict, Any
@@ -13,34 +14,105 @@ from bot.config import (
 
 logger = logging.getLogger(__name__)
 
+# Сколько раз повторять запрос при сетевой ошибке, 429 или 5xx
+MAX_RETRIES = 3
+# Базовая задержка между повторами (удваивается с каждой попыткой)
+RETRY_BACKOFF = 0.5
+# Коды ответа, при которых запрос безопасно повторить
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
 
-def create_payment(
+_http_client: Optional[httpx.AsyncClient] = None
+# Выполняющиеся запросы статуса: одновременные проверки одного платежа ждут один ответ
+_status_inflight: Dict[str, asyncio.Task] = {}
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Общий HTTP-клиент с keep-alive соединениями к ЮKassa"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            auth=(YOOKASSA_SHOP_ID, YOOKASSA_SECRET_KEY),  # Basic Auth (shop_id:secret_key)
+            timeout=httpx.Timeout(10.0),
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=5)
+        )
+    return _http_client
+
+
+async def close_http_client():
+    """Закрыть общий HTTP-клиент (вызывается при остановке бота)"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+    _http_client = None
+    _status_inflight.clear()
+
+
+async def _request(method: str, url: str, json: Optional[Dict[str, Any]] = None,
+                   idempotence_key: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Выполнить запрос к ЮKassa с повторами и экспоненциальной задержкой
+
+    Ключ идемпотентности один для всех повторов, поэтому повтор после
+    обрыва соединения не создаст второй платеж.
+
+    Returns:
+        JSON ответа или None, если запрос не удался
+    """
+    headers = {}
+    if idempotence_key:
+        headers["Idempotence-Key"] = idempotence_key
+
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = await get_http_client().request(method, url, json=json, headers=headers)
+            if response.status_code == 200:
+                return response.json()
+            if response.status_code not in RETRYABLE_STATUSES:
+                logger.error(f"YooKassa {method} {url} failed: {response.status_code} - {response.text}")
+                return None
+            logger.warning(f"YooKassa {method} {url} returned {response.status_code} (attempt {attempt + 1})")
+        except httpx.TransportError as e:
+            logger.warning(f"YooKassa {method} {url} transport error: {e} (attempt {attempt + 1})")
+        except Exception as e:
+            logger.error(f"Error requesting YooKassa {method} {url}: {e}", exc_info=True)
+            return None
+
+        if attempt < MAX_RETRIES:
+            await asyncio.sleep(RETRY_BACKOFF * (2 ** attempt))
+
+    logger.error(f"YooKassa {method} {url} failed after {MAX_RETRIES + 1} attempts")
+    return None
+
+
+async def create_payment(
     amount: float,
     description: str,
     return_url: str,
     master_id: int,
-    subscription_type: str = 'premium'
+    subscription_type: str = 'premium',
+    idempotence_key: Optional[str] = None
 ) -> Optional[Dict[str, Any]]:
     """
     Создать платеж в ЮKassa
-    
+
     Args:
         amount: Сумма платежа
         description: Описание платежа
         return_url: URL для возврата пользователя после оплаты
         master_id: ID мастера
         subscription_type: Тип подписки (premium, basic, etc.)
-    
+        idempotence_key: Ключ идемпотентности (по умолчанию генерируется новый)
+
     Returns:
         Словарь с данными платежа или None в случае ошибки
     """
     if not YOOKASSA_SECRET_KEY:
         logger.error("YOOKASSA_SECRET_KEY not configured")
         return None
-    
-    # Генерируем уникальный ключ идемпотентности
-    idempotence_key = str(uuid.uuid4())
-    
+
+    # Генерируем уникальный ключ идемпотентности (один на все повторы запроса)
+    idempotence_key = idempotence_key or str(uuid.uuid4())
+
     # Подготовка данных для запроса
     payment_data = {
         "amount": {
@@ -58,90 +130,54 @@ def create_payment(
             "subscription_type": subscription_type
         }
     }
-    
-    try:
-        # Аутентификация через Basic Auth (shop_id:secret_key)
-        auth = (YOOKASSA_SHOP_ID, YOOKASSA_SECRET_KEY)
-        
-        headers = {
-            "Idempotence-Key": idempotence_key,
-            "Content-Type": "application/json"
-        }
-        
-        logger.info(f"Creating payment for master {master_id}, amount: {amount} RUB")
-        
-        response = requests.post(
-            YOOKASSA_API_URL,
-            json=payment_data,
-            auth=auth,
-            headers=headers,
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            payment = response.json()
-            logger.info(f"Payment created successfully: {payment.get('id')}")
-            return payment
-        else:
-            logger.error(f"Failed to create payment: {response.status_code} - {response.text}")
-            return None
-            
-    except Exception as e:
-        logger.error(f"Error creating payment: {e}", exc_info=True)
-        return None
 
+    logger.info(f"Creating payment for master {master_id}, amount: {amount} RUB")
+    payment = await _request("POST", YOOKASSA_API_URL, json=payment_data, idempotence_key=idempotence_key)
+    if payment:
+        logger.info(f"Payment created successfully: {payment.get('id')}")
+    return payment
 
-def get_payment_status(payment_id: str) -> Optional[Dict[str, Any]]:
+
+async def get_payment_status(payment_id: str) -> Optional[Dict[str, Any]]:
     """
     Получить статус платежа по ID
-    
+
+    Одновременные проверки одного платежа объединяются в один запрос.
+
     Args:
         payment_id: ID платежа от ЮKassa
-    
+
     Returns:
         Словарь с данными платежа или None в случае ошибки
     """
     if not YOOKASSA_SECRET_KEY:
         logger.error("YOOKASSA_SECRET_KEY not configured")
         return None
-    
-    try:
-        auth = (YOOKASSA_SHOP_ID, YOOKASSA_SECRET_KEY)
-        
-        response = requests.get(
-            f"{YOOKASSA_API_URL}/{payment_id}",
-            auth=auth,
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
-            logger.error(f"Failed to get payment status: {response.status_code} - {response.text}")
-            return None
-            
-    except Exception as e:
-        logger.error(f"Error getting payment status: {e}", exc_info=True)
-        return None
 
+    task = _status_inflight.get(payment_id)
+    if task is None:
+        task = asyncio.create_task(_request("GET", f"{YOOKASSA_API_URL}/{payment_id}"))
+        _status_inflight[payment_id] = task
+        task.add_done_callback(lambda _: _status_inflight.pop(payment_id, None))
+    return await asyncio.shield(task)
 
-def create_premium_payment(master_id: int, return_url: str) -> Optional[Dict[str, Any]]:
+
+async def create_premium_payment(master_id: int, return_url: str) -> Optional[Dict[str, Any]]:
     """
     Создать платеж для премиум подписки
-    
+
     Args:
         master_id: ID мастера
         return_url: URL для возврата после оплаты
-    
+
     Returns:
         Словарь с данными платежа или None в случае ошибки
     """
     description = f"Премиум подписка на {PREMIUM_DURATION_DAYS} дней"
-    return create_payment(
+    return await create_payment(
         amount=PREMIUM_PRICE,
         description=description,
         return_url=return_url,
         master_id=master_id,
         subscription_type='premium'
     )
-
@@ -0,0 +1,93 @@
+"""Режим webhook: мастер-бот, клиентский бот и REST API на одном ASGI-сервере"""
+import hashlib
+import hmac
+import logging
+from typing import Dict, Optional
+
+from fastapi import APIRouter, FastAPI, HTTPException, Request
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH_PREFIX = '/telegram'
+SECRET_TOKEN_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+def get_webhook_path(bot_name: str) -> str:
+    """Путь, на который Telegram присылает апдейты бота"""
+    return f"{WEBHOOK_PATH_PREFIX}/{bot_name}"
+
+
+def get_webhook_secret(secret: str, bot_name: str) -> str:
+    """
+    Секретный токен вебхука бота
+
+    Производный от общего секрета, поэтому у каждого бота свой токен: заголовок
+    одного бота не подходит к пути другого. Hex укладывается в алфавит,
+    разрешенный Telegram для secret_token (A-Z, a-z, 0-9, _ и -).
+    """
+    return hmac.new(secret.encode(), bot_name.encode(), hashlib.sha256).hexdigest()
+
+
+def verify_secret_token(request: Request, bot_name: str, expected: str):
+    """Проверить заголовок X-Telegram-Bot-Api-Secret-Token (403, если не совпадает)"""
+    token = request.headers.get(SECRET_TOKEN_HEADER, '')
+    if not hmac.compare_digest(token, expected):
+        logger.warning(f"Webhook {bot_name}: invalid secret token from {request.client.host if request.client else '?'}")
+        raise HTTPException(status_code=403, detail="Invalid secret token")
+
+
+def create_webhook_router(applications: Dict[str, Application], secret: str) -> APIRouter:
+    """
+    Маршруты приема апдейтов: POST /telegram/<bot_name>
+
+    Апдейт проверяется по секретному токену и кладется в update_queue
+    приложения бота; дальше его обрабатывает Application так же, как при
+    polling. Ответ Telegram отдается сразу, не дожидаясь обработчиков.
+    Диспетчер шардов пересылает апдейты пачками - список кладется в очередь по порядку.
+    """
+    router = APIRouter()
+    secrets = {name: get_webhook_secret(secret, name) for name in applications}
+
+    @router.post(WEBHOOK_PATH_PREFIX + "/{bot_name}")
+    async def telegram_webhook(bot_name: str, request: Request):
+        application = applications.get(bot_name)
+        if application is None:
+            raise HTTPException(status_code=404, detail="Unknown bot")
+
+        verify_secret_token(request, bot_name, secrets[bot_name])
+
+        try:
+            data = await request.json()
+            updates = [Update.de_json(item, application.bot) for item in (data if isinstance(data, list) else [data])]
+        except Exception as e:
+            logger.warning(f"Webhook {bot_name}: invalid update: {e}")
+            raise HTTPException(status_code=400, detail="Invalid update")
+
+        # Ответ не 200 - Telegram повторит доставку апдейта позже
+        if not application.running:
+            raise HTTPException(status_code=503, detail="Bot is not running")
+        for update in updates:
+            await application.update_queue.put(update)
+        return {"ok": True}
+
+    return router
+
+
+async def register_webhook(bot, bot_name: str, secret: str, base_url: str):
+    """Зарегистрировать вебхук бота у Telegram"""
+    url = base_url + get_webhook_path(bot_name)
+    await bot.set_webhook(
+        url=url,
+        secret_token=get_webhook_secret(secret, bot_name),
+        allowed_updates=Update.ALL_TYPES
+    )
+    logger.info(f"[INFO] Webhook {bot_name} зарегистрирован: {url}")
+
+
+def mount_telegram_webhooks(app: FastAPI, applications: Dict[str, Application], secret: str,
+                            base_url: Optional[str] = None):
+    """Подключить вебхуки ботов к ASGI-приложению: маршруты и запуск/остановка вместе с сервером"""
+    from bot.runner import mount_applications
+    mount_applications(app, applications, 'webhook', secret, base_url)
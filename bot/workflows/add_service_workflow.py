@@ -1,10 +1,12 @@
 """Workflow для добавления услуги - декларативное описание шагов"""
-from bot.core.workflow import Workflow, Step, StepType, workflow_manager
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from typing import Optional
+from bot.core.workflow import CALLBACK_PREFIX, Workflow, Step, StepType, workflow_data
+from telegram import Update
 from telegram.ext import ContextTypes
-from bot.database.db import get_session, get_master_by_telegram, get_categories_by_master
+from bot.database.db import get_session, get_master_by_telegram, get_categories_by_master, create_service
 from bot.data.service_templates import get_predefined_categories_list, get_category_templates, get_category_info
-from bot.database.db import get_or_create_predefined_category
+from bot.database.db import get_or_create_predefined_category, create_service_category
+from bot.utils.impersonation import get_master_telegram_id
 import logging
 
 logger = logging.getLogger(__name__)
@@ -49,102 +51,77 @@ def validate_cooling(cooling_str: str, context: ContextTypes.DEFAULT_TYPE) -> bo
         return "❌ Введите число. Попробуйте снова:"
 
 
-async def step_category_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработчик шага выбора категории"""
-    query = update.callback_query
-    if not query:
-        return None
-    
-    from bot.handlers.master import get_master_telegram_id
-    
-    predefined_categories = get_predefined_categories_list()
-    user_categories_data = []
-    
-    with get_session() as session:
-        master = get_master_by_telegram(session, get_master_telegram_id(update, context))
-        if not master:
-            await query.message.edit_text("❌ Аккаунт не найден")
-            return None
-        
-        user_categories = get_categories_by_master(session, master.id)
-        for cat in user_categories:
-            if not cat.is_predefined:
-                emoji = cat.emoji if cat.emoji else "📁"
-                user_categories_data.append((cat.id, emoji, cat.title))
-    
-    # Формируем клавиатуру
+def category_keyboard(update: Update, context: ContextTypes.DEFAULT_TYPE) -> list:
+    """Кнопки шага выбора категории: предустановленные и собственные категории мастера"""
     keyboard = []
     has_other = False
-    
-    for key, emoji, name in predefined_categories:
+
+    for key, emoji, name in get_predefined_categories_list():
         keyboard.append([{
             'text': f"{emoji} {name}",
-            'callback_data': f"workflow_callback_{key}"
+            'callback_data': f"{CALLBACK_PREFIX}{key}"
         }])
         if key == "other":
             has_other = True
-    
-    if user_categories_data:
-        for cat_id, emoji, cat_title in user_categories_data:
-            keyboard.append([{
-                'text': f"{emoji} {cat_title}",
-                'callback_data': f"workflow_callback_user_{cat_id}"
-            }])
-    
+
+    with get_session() as session:
+        master = get_master_by_telegram(session, get_master_telegram_id(update, context))
+        if master:
+            for cat in get_categories_by_master(session, master.id):
+                if not cat.is_predefined:
+                    emoji = cat.emoji if cat.emoji else "📁"
+                    keyboard.append([{
+                        'text': f"{emoji} {cat.title}",
+                        'callback_data': f"{CALLBACK_PREFIX}user_{cat.id}"
+                    }])
+
     if not has_other:
         keyboard.append([{
             'text': "➕ Другое",
-            'callback_data': "workflow_callback_custom"
+            'callback_data': f"{CALLBACK_PREFIX}custom"
         }])
-    
-    # Обновляем шаг с клавиатурой
-    step = workflow_manager.workflows['add_service'].steps['category']
-    step.keyboard = keyboard
-    
-    return None
 
+    return keyboard
 
-async def step_category_callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, callback_data: str):
-    """Обработчик callback выбора категории"""
-    query = update.callback_query
-    await query.answer()
-    
-    parts = callback_data.split('_')
-    
-    if len(parts) < 3:
-        return None
-    
-    if parts[2] == 'custom' or (len(parts) >= 3 and parts[2] == 'other'):
-        # Создание новой категории
-        await query.message.edit_text(
-            "➕ <b>Создание категории</b>\n\nВведите название новой категории:",
-            parse_mode='HTML',
-            reply_markup=InlineKeyboardMarkup([[
-                InlineKeyboardButton("« Отмена", callback_data="workflow_cancel")
-            ]])
-        )
-        context.user_data['workflow_step'] = 'category_name'
-        return 'category_name'
-    
-    # Определяем следующий шаг на основе категории
-    category_key = parts[2] if len(parts) > 2 else None
-    if category_key:
-        context.user_data['workflow_data']['category_key'] = category_key
-        
-        # Проверяем есть ли шаблоны
-        templates = get_category_templates(category_key) if category_key else []
-        if templates:
-            context.user_data['workflow_step'] = 'template'
-        else:
-            context.user_data['workflow_step'] = 'name'
-    
+
+def template_keyboard(update: Update, context: ContextTypes.DEFAULT_TYPE) -> list:
+    """Кнопки шага выбора шаблона услуги для выбранной категории"""
+    templates = get_category_templates(workflow_data(context).get('category', ''))
+    return [
+        [{'text': template['name'], 'callback_data': f"{CALLBACK_PREFIX}{index}"}]
+        for index, template in enumerate(templates)
+    ]
+
+
+def next_after_category(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
+    """Шаг после выбора категории: новая категория, шаблоны или ввод названия"""
+    category = workflow_data(context).get('category', '')
+    if category in ('custom', 'other'):
+        return "category_name"
+    return "template" if get_category_templates(category) else "name"
+
+
+def resolve_category_id(session, master_id: int, data: dict) -> Optional[int]:
+    """ID категории услуги по данным workflow (создает новую или предустановленную категорию)"""
+    category = data.get('category', '')
+    if category.startswith('user_') and category[len('user_'):].isdecimal():
+        return int(category[len('user_'):])
+    if category in ('custom', 'other'):
+        return create_service_category(session, master_id, data.get('category_name', ''), emoji="📁").id
+    if get_category_info(category):
+        return get_or_create_predefined_category(session, master_id, category).id
     return None
 
 
 async def on_complete_add_service(update: Update, context: ContextTypes.DEFAULT_TYPE, data: dict):
     """Действие при завершении добавления услуги"""
-    from bot.handlers.master import get_master_telegram_id, create_service
-    
+    title = data.get('name', '')
+    if not title and str(data.get('template_index', '')).isdecimal():
+        templates = get_category_templates(data.get('category', ''))
+        index = int(data['template_index'])
+        if index < len(templates):
+            title = templates[index]['name']
+
     with get_session() as session:
         master = get_master_by_telegram(session, get_master_telegram_id(update, context))
         if not master:
@@ -155,11 +132,11 @@ async def on_complete_add_service(update: Update, context: ContextTypes.DEFAULT_
             service = create_service(
                 session=session,
                 master_id=master.id,
-                title=data.get('name', ''),
+                title=title,
                 price=float(data.get('price', 0)),
                 duration=int(data.get('duration', 0)),
                 cooling=int(data.get('cooling', 0)),
-                category_id=data.get('category_id'),
+                category_id=resolve_category_id(session, master.id, data),
                 description=data.get('description', '')
             )
             
@@ -181,24 +158,33 @@ def create_add_service_workflow() -> Workflow:
                 type=StepType.CALLBACK,
                 title="Выбор категории",
                 message="➕ <b>Добавление услуги</b>\n\nВыберите категорию для новой услуги:",
-                handler=step_category_handler,
-                data_key="category_id",
-                next_step="check_template",
-                keyboard=[]  # Будет заполнено в handler
+                keyboard_builder=category_keyboard,
+                data_key="category",
+                next_step="check_template"
             ),
             "check_template": Step(
                 id="check_template",
                 type=StepType.CONDITIONAL,
                 title="Проверка шаблонов",
                 message="",
-                condition=lambda u, c: "template" if get_category_templates(c.user_data['workflow_data'].get('category_key', '')) else "name",
-                next_step=None
+                condition=next_after_category,
+                next_step="name"
+            ),
+            "category_name": Step(
+                id="category_name",
+                type=StepType.INPUT,
+                title="Новая категория",
+                message="➕ <b>Создание категории</b>\n\nВведите название новой категории:",
+                validator=lambda text, ctx: True if text and len(text) <= 50 else "❌ Название должно быть не пустым и не более 50 символов. Попробуйте снова:",
+                data_key="category_name",
+                next_step="name"
             ),
             "template": Step(
                 id="template",
                 type=StepType.CALLBACK,
                 title="Выбор шаблона",
-                message="➕ <b>Добавление услуги</b>\n\nВыберите шаблон или создайте услугу с нуля:",
+                message="➕ <b>Добавление услуги</b>\n\nВыберите шаблон услуги:",
+                keyboard_builder=template_keyboard,
                 data_key="template_index",
                 next_step="price"
             ),
@@ -241,10 +227,9 @@ def create_add_service_workflow() -> Workflow:
             )
         },
         fallbacks=["cancel"],
-        context_keys=["service_category_id", "service_category_key", "service_category_name", "service_category_emoji"]
+        context_keys=["service_category_id", "service_category_key", "service_category_name", "service_category_emoji"],
+        on_complete=on_complete_add_service
     )
     
-    workflow.on_complete = on_complete_add_service
-    
     return workflow
 
@@ -1,7 +1,9 @@
 """Workflow для онбординга - декларативное описание шагов"""
+from telegram import Update
+from telegram.ext import ContextTypes
 from bot.core.workflow import Workflow, Step, StepType
 from bot.database.db import get_session, get_master_by_telegram, get_services_by_master, get_work_periods
-from bot.handlers.master import get_master_telegram_id, get_onboarding_status
+from bot.utils.impersonation import get_master_telegram_id
 
 
 def create_onboarding_workflow() -> Workflow:
@@ -2,7 +2,7 @@
 REST API для Android приложения Lumi Beauty
 Использует FastAPI для взаимодействия с базой данных
 """
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
@@ -13,22 +13,22 @@ from bot.database.db import (
     get_or_create_user,
     get_master_by_id,
     get_master_by_telegram,
-    get_client_masters,
     get_services_by_master,
     get_bookings_for_client,
     create_booking,
     check_booking_conflict,
     add_user_master_link,
     remove_user_master_link,
-    get_all_cities,
-    get_masters_by_city,
     get_work_periods,
     get_portfolio_photos
 )
+from bot.database.read_models import list_cities, list_city_masters, list_client_masters
 from bot.utils.schedule_utils import get_available_time_slots, has_available_slots_on_date
+from bot.utils.user_rate_limit import TokenBucketLimiter
 from bot.database.models import Service
-from bot.config import DATABASE_URL
+from bot.config import API_RATE_LIMIT_BURST, API_RATE_LIMIT_PER_MINUTE, DATABASE_URL
 import logging
+import math
 
 logger = logging.getLogger(__name__)
 
@@ -122,33 +122,36 @@ def get_user_id(credentials: HTTPAuthorizationCredentials = Depends(security)):
         )
 
 
+api_rate_limiter = TokenBucketLimiter(
+    rate=API_RATE_LIMIT_PER_MINUTE / 60, capacity=API_RATE_LIMIT_BURST, namespace='api'
+)
+
+
+def get_limited_user_id(user_id: int = Depends(get_user_id)):
+    """user_id с проверкой частоты запросов пользователя (429 и Retry-After при превышении)"""
+    wait = api_rate_limiter.check(user_id)
+    if wait:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests",
+            headers={"Retry-After": str(math.ceil(wait))}
+        )
+    return user_id
+
+
 @app.get("/")
 async def root():
     return {"message": "Lumi Beauty API", "version": "1.0.0"}
 
 
 @app.get("/api/masters", response_model=List[MasterResponse])
-async def get_masters(user_id: int = Depends(get_user_id)):
+async def get_masters(user_id: int = Depends(get_limited_user_id)):
     """Получить список мастеров клиента"""
     with get_session() as session:
-        user = get_or_create_user(session, user_id)
-        masters = get_client_masters(session, user)
-        
-        result = []
-        for master in masters:
-            services = get_services_by_master(session, master.id, active_only=True)
-            city_name = master.city.name_ru if master.city else None
-            
-            result.append(MasterResponse(
-                id=master.id,
-                name=master.name,
-                description=master.description,
-                avatar_url=master.avatar_url,
-                city_name=city_name,
-                services_count=len(services)
-            ))
-        
-        return result
+        get_or_create_user(session, user_id)
+        masters = list_client_masters(session, user_id)
+    
+    return [MasterResponse.model_validate(master) for master in masters]
 
 
 class MasterDetailResponse(BaseModel):
@@ -165,7 +168,7 @@ class MasterDetailResponse(BaseModel):
 
 
 @app.get("/api/masters/{master_id}", response_model=MasterDetailResponse)
-async def get_master_detail(master_id: int, user_id: int = Depends(get_user_id)):
+async def get_master_detail(master_id: int, user_id: int = Depends(get_limited_user_id)):
     """Получить детальную информацию о мастере"""
     with get_session() as session:
         master = get_master_by_id(session, master_id)
@@ -214,7 +217,7 @@ async def get_time_slots(
     service_id: int,
     date_from: str,  # YYYY-MM-DD
     date_to: str,    # YYYY-MM-DD
-    user_id: int = Depends(get_user_id)
+    user_id: int = Depends(get_limited_user_id)
 ):
     """Получить доступные слоты времени для услуги"""
     with get_session() as session:
@@ -252,7 +255,7 @@ async def get_time_slots(
 @app.post("/api/bookings", response_model=BookingResponse)
 async def create_booking_endpoint(
     booking: BookingRequest,
-    user_id: int = Depends(get_user_id)
+    user_id: int = Depends(get_limited_user_id)
 ):
     """Создать бронирование"""
     with get_session() as session:
@@ -268,6 +271,9 @@ async def create_booking_endpoint(
         
         # Парсим datetime
         start_dt = datetime.fromisoformat(booking.start_datetime.replace('Z', '+00:00'))
+        if start_dt.tzinfo is not None:
+            # В БД время хранится без пояса, в локальном времени сервера
+            start_dt = start_dt.astimezone().replace(tzinfo=None)
         end_dt = start_dt + timedelta(minutes=service.duration_mins)
         
         # Проверяем конфликты
@@ -301,7 +307,7 @@ async def create_booking_endpoint(
 
 
 @app.get("/api/bookings", response_model=List[BookingResponse])
-async def get_bookings(user_id: int = Depends(get_user_id)):
+async def get_bookings(user_id: int = Depends(get_limited_user_id)):
     """Получить список бронирований клиента"""
     with get_session() as session:
         user = get_or_create_user(session, user_id)
@@ -323,7 +329,7 @@ async def get_bookings(user_id: int = Depends(get_user_id)):
 
 
 @app.post("/api/masters/{master_id}/add")
-async def add_master(master_id: int, user_id: int = Depends(get_user_id)):
+async def add_master(master_id: int, user_id: int = Depends(get_limited_user_id)):
     """Добавить мастера в список клиента"""
     with get_session() as session:
         user = get_or_create_user(session, user_id)
@@ -337,7 +343,7 @@ async def add_master(master_id: int, user_id: int = Depends(get_user_id)):
 
 
 @app.delete("/api/masters/{master_id}/remove")
-async def remove_master(master_id: int, user_id: int = Depends(get_user_id)):
+async def remove_master(master_id: int, user_id: int = Depends(get_limited_user_id)):
     """Удалить мастера из списка клиента"""
     with get_session() as session:
         user = get_or_create_user(session, user_id)
@@ -354,38 +360,47 @@ async def remove_master(master_id: int, user_id: int = Depends(get_user_id)):
 async def get_cities():
     """Получить список городов"""
     with get_session() as session:
-        cities = get_all_cities(session)
-        return [CityResponse(
-            id=city.id,
-            name_ru=city.name_ru,
-            name_local=city.name_local,
-            name_en=city.name_en
-        ) for city in cities]
+        cities = list_cities(session)
+    
+    return [CityResponse.model_validate(city) for city in cities]
 
 
 @app.get("/api/cities/{city_id}/masters", response_model=List[MasterResponse])
 async def get_city_masters(
     city_id: int,
-    user_id: int = Depends(get_user_id)
+    user_id: int = Depends(get_limited_user_id)
 ):
     """Получить мастеров в городе"""
     with get_session() as session:
-        masters = get_masters_by_city(session, city_id, exclude_user_id=user_id, active_only=True)
-        
-        result = []
-        for master in masters:
-            services = get_services_by_master(session, master.id, active_only=True)
-            
-            result.append(MasterResponse(
-                id=master.id,
-                name=master.name,
-                description=master.description,
-                avatar_url=master.avatar_url,
-                city_name=master.city.name_ru if master.city else None,
-                services_count=len(services)
-            ))
-        
-        return result
+        masters = list_city_masters(session, city_id, exclude_user_telegram_id=user_id)
+    
+    return [MasterResponse.model_validate(master) for master in masters]
+
+
+@app.post("/webhooks/yookassa")
+async def yookassa_webhook(request: Request):
+    """Уведомления ЮKassa о смене статуса платежа (payment.succeeded, payment.canceled)"""
+    from bot.utils.payments import handle_yookassa_notification
+    
+    try:
+        notification = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    
+    if not isinstance(notification, dict):
+        raise HTTPException(status_code=400, detail="Invalid notification")
+    
+    # Ответ не 200 - ЮKassa повторит доставку уведомления позже
+    if not await handle_yookassa_notification(notification):
+        raise HTTPException(status_code=503, detail="Payment status could not be verified")
+    return {"success": True}
+
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    """Закрыть общий HTTP-клиент ЮKassa при остановке API"""
+    from bot.utils.yookassa_api import close_http_client
+    await close_http_client()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,5 @@
+"""Скрипт запуска обоих ботов и REST API в одном процессе (режим из BOT_MODE)"""
+from bot.runner import main
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,5 @@
+"""Скрипт запуска ботов с шардированием по пользователям (диспетчер + SHARD_COUNT воркеров)"""
+from bot.sharding import main
+
+if __name__ == '__main__':
+    main()
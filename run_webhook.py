@@ -0,0 +1,5 @@
+"""Скрипт запуска обоих ботов в режиме webhook вместе с REST API"""
+from bot.runner import main
+
+if __name__ == '__main__':
+    main('webhook')
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Бенчмарк выбора обработчика нажатия кнопки в мастер-боте: дерево маршрутов против цепочки regex"""
+import argparse
+import os
+import re
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+
+def sample_data(pattern: str) -> str:
+    """callback_data, подходящая под шаблон маршрута"""
+    def value(segment: str) -> str:
+        if segment == '<int>':
+            return '123'
+        if segment in ('<str>', '<rest>'):
+            return 'abc'
+        if segment.startswith('<') and '|' in segment:
+            return segment[1:-1].split('|')[0]
+        return segment
+    return '_'.join(value(segment) for segment in pattern.split('_'))
+
+
+def pattern_to_regex(pattern: str) -> str:
+    """Регулярное выражение, которым маршрут был бы задан для CallbackQueryHandler"""
+    parts = []
+    for segment in pattern.split('_'):
+        if segment == '<int>':
+            parts.append(r'\d+')
+        elif segment == '<str>':
+            parts.append(r'[^_]+')
+        elif segment == '<rest>':
+            parts.append(r'.+')
+        elif segment.startswith('<'):
+            parts.append(f"({segment[1:-1]})")
+        else:
+            parts.append(re.escape(segment))
+    return '^' + '_'.join(parts) + '$'
+
+
+def with_regex_chain(application, modules):
+    """Копия обработчиков группы 0, где маршрутизаторы заменены цепочками CallbackQueryHandler"""
+    from telegram.ext import CallbackQueryHandler
+    from bot.utils.callback_router import CallbackRouter
+
+    navigation = [route for module in modules for route in getattr(module, 'NAVIGATION_ROUTES', ())]
+    routes = [route for module in modules for route in getattr(module, 'CALLBACK_ROUTES', ())]
+    handlers = []
+    seen_routers = 0
+    for handler in application.handlers[0]:
+        if isinstance(handler, CallbackRouter):
+            chain = navigation if seen_routers == 0 else routes
+            handlers.extend(CallbackQueryHandler(callback, pattern=pattern_to_regex(pattern)) for pattern, callback in chain)
+            seen_routers += 1
+        else:
+            handlers.append(handler)
+    return handlers
+
+
+def route(handlers, update):
+    """Выбор обработчика так же, как Application.process_update: первый подходящий в группе"""
+    for handler in handlers:
+        check = handler.check_update(update)
+        if check is not None and check is not False:
+            return handler
+    return None
+
+
+def measure(handlers, updates, rounds: int) -> float:
+    """Микросекунды на выбор обработчика для одного апдейта"""
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for update in updates:
+            route(handlers, update)
+    return (time.perf_counter() - started) * 1e6 / (rounds * len(updates))
+
+
+def main():
+    project_root = Path(__file__).parent.parent
+    if str(project_root) not in sys.path:
+        sys.path.insert(0, str(project_root))
+    os.environ.setdefault('BOT_TOKEN', '1:benchmark')
+
+    parser = argparse.ArgumentParser(description="Бенчмарк маршрутизации кнопок мастер-бота")
+    parser.add_argument('--rounds', type=int, default=200, help="Сколько раз прогнать все кнопки")
+    args = parser.parse_args()
+
+    import warnings
+    warnings.filterwarnings('ignore')
+    from telegram import CallbackQuery, Chat, Message, Update, User
+    from bot.main_master import CALLBACK_ROUTE_MODULES, build_application
+
+    application = build_application()
+    patterns = [
+        pattern
+        for module in CALLBACK_ROUTE_MODULES
+        for attribute in ('NAVIGATION_ROUTES', 'CALLBACK_ROUTES')
+        for pattern, _ in getattr(module, attribute, ())
+    ]
+    user = User(id=7, first_name='Bench', is_bot=False)
+    message = Message(message_id=1, date=datetime.now(timezone.utc), chat=Chat(id=7, type=Chat.PRIVATE))
+    updates = [
+        Update(update_id=n, callback_query=CallbackQuery(
+            id=str(n), from_user=user, chat_instance='bench', message=message, data=sample_data(pattern)
+        ))
+        for n, pattern in enumerate(patterns)
+    ]
+
+    router_handlers = list(application.handlers[0])
+    regex_handlers = with_regex_chain(application, CALLBACK_ROUTE_MODULES)
+    assert all(route(router_handlers, update) is not None for update in updates)
+
+    regex_us = measure(regex_handlers, updates, args.rounds)
+    router_us = measure(router_handlers, updates, args.rounds)
+    print(f"{len(patterns)} routes, group 0: {len(regex_handlers)} handlers with regex chain, "
+          f"{len(router_handlers)} with router")
+    print(f"regex chain: {regex_us:.1f} us per update")
+    print(f"prefix trie: {router_us:.1f} us per update (x{regex_us / router_us:.1f})")
+
+    # Только кнопки вне диалогов, без проверки ConversationHandler'ов
+    from bot.utils.callback_router import CallbackRouter
+    chain_only = [handler for handler in regex_handlers if handler not in router_handlers]
+    routers_only = [handler for handler in router_handlers if isinstance(handler, CallbackRouter)]
+    chain_us = measure(chain_only, updates, args.rounds)
+    trie_us = measure(routers_only, updates, args.rounds)
+    print(f"routing only: regex {chain_us:.1f} us, trie {trie_us:.1f} us (x{chain_us / trie_us:.1f})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
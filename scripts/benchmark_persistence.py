@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Бенчмарк стоимости persistence на апдейт: Application с DatabasePersistence и без нее"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+
+def build_offline_bot():
+    from telegram.ext import ExtBot
+
+    class OfflineBot(ExtBot):
+        async def _do_post(self, endpoint, data, *args, **kwargs):
+            if endpoint == 'getMe':
+                return {'id': 1, 'is_bot': True, 'first_name': 'Benchmark', 'username': 'benchmark_bot'}
+            return True
+
+    return OfflineBot(token='1:benchmark')
+
+
+def make_updates(users: int, per_user: int):
+    from telegram import Chat, Message, Update, User
+
+    now = datetime.now(timezone.utc)
+    updates = []
+    for n in range(per_user):
+        for user_id in range(1, users + 1):
+            update_id = len(updates) + 1
+            message = Message(
+                message_id=update_id, date=now, text=str(n),
+                chat=Chat(id=user_id, type=Chat.PRIVATE),
+                from_user=User(id=user_id, first_name=f"user{user_id}", is_bot=False),
+            )
+            updates.append(Update(update_id=update_id, message=message))
+    return updates
+
+
+async def handler(update, context):
+    """Типичный шаг диалога: черновик услуги и временное расписание в user_data"""
+    draft = context.user_data.setdefault('service_draft', {'title': 'Маникюр', 'description': 'x' * 300})
+    draft['step'] = int(update.message.text)
+    context.user_data['schedule_temp'] = [{'day': day, 'start': '10:00', 'end': '19:00'} for day in range(7)]
+
+
+async def run(updates, persistence):
+    """Секунды на обработку всех апдейтов, включая остановку (запись оставшегося)"""
+    from telegram import Update
+    from telegram.ext import Application, TypeHandler
+
+    builder = Application.builder().bot(build_offline_bot()).updater(None)
+    if persistence is not None:
+        builder = builder.persistence(persistence)
+    application = builder.build()
+    application.add_handler(TypeHandler(Update, handler))
+
+    async with application:
+        await application.start()
+        started = time.perf_counter()
+        for update in updates:
+            await application.process_update(update)
+            # Уступаем циклу, как при реальном потоке апдейтов (периодическая запись persistence)
+            await asyncio.sleep(0)
+        await application.stop()
+        return time.perf_counter() - started
+
+
+def main():
+    project_root = Path(__file__).parent.parent
+    if str(project_root) not in sys.path:
+        sys.path.insert(0, str(project_root))
+
+    parser = argparse.ArgumentParser(description="Бенчмарк стоимости persistence на апдейт")
+    parser.add_argument('--users', type=int, default=500, help="Количество пользователей")
+    parser.add_argument('--per-user', type=int, default=10, help="Апдейтов от каждого пользователя")
+    parser.add_argument('--interval', type=float, default=0.02, help="Интервал записи пачкой (секунды)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f"sqlite:///{Path(tmp) / 'benchmark.db'}"
+        from bot.database.db import init_db
+        from bot.utils.persistence import DatabasePersistence, PER_UPDATE_BUDGET_MS
+        init_db()
+
+        updates = make_updates(args.users, args.per_user)
+        baseline = asyncio.run(run(updates, None))
+        persistence = DatabasePersistence('master', update_interval=args.interval)
+        elapsed = asyncio.run(run(updates, persistence))
+
+    overhead_ms = (elapsed - baseline) * 1000 / len(updates)
+    metrics = persistence.metrics
+    print(f"{len(updates)} updates: without persistence {baseline:.2f}s, with {elapsed:.2f}s")
+    print(f"overhead per update: {overhead_ms:.3f} ms (budget {PER_UPDATE_BUDGET_MS} ms): "
+          f"{'OK' if overhead_ms < PER_UPDATE_BUDGET_MS else 'OVER BUDGET'}")
+    print(f"flushes: {metrics['flushes']}, entries written: {metrics['entries']}, "
+          f"avg entry {metrics['bytes'] / max(metrics['entries'], 1):.0f} bytes, "
+          f"max flush {metrics['max_flush_ms']:.1f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
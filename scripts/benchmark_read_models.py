@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Бенчмарк экрана «Мои мастера»: ORM-сущности против DTO из запросов по колонкам"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+
+def orm_listing(session, user_telegram_id: int):
+    """Старый путь: связи клиента, мастер и город через ORM, услуги - запрос на каждого мастера"""
+    from bot.database.db import get_client_masters, get_or_create_user, get_services_by_master
+
+    user = get_or_create_user(session, user_telegram_id)
+    result = []
+    for link in get_client_masters(session, user):
+        master = link.master_account
+        services = get_services_by_master(session, master.id, active_only=True)
+        result.append((master, master.city.name_ru if master.city else None, services))
+    return result
+
+
+def dto_listing(session, user_telegram_id: int):
+    """Модели чтения: два запроса на весь список"""
+    from bot.database.read_models import list_active_services, list_client_masters
+
+    masters = list_client_masters(session, user_telegram_id)
+    return masters, list_active_services(session, [master.id for master in masters])
+
+
+def measure(listing, rounds: int):
+    """(миллисекунды на список, пик памяти при построении в КБ)"""
+    from bot.database.db import SessionLocal
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        session = SessionLocal()
+        listing(session, 1)
+        session.close()
+    elapsed_ms = (time.perf_counter() - started) * 1000 / rounds
+
+    session = SessionLocal()
+    tracemalloc.start()
+    result = listing(session, 1)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    session.close()
+    return elapsed_ms, peak / 1024
+
+
+def main():
+    project_root = Path(__file__).parent.parent
+    if str(project_root) not in sys.path:
+        sys.path.insert(0, str(project_root))
+
+    parser = argparse.ArgumentParser(description="Бенчмарк списков: ORM против моделей чтения")
+    parser.add_argument('--masters', type=int, default=30, help="Мастеров у клиента")
+    parser.add_argument('--services', type=int, default=8, help="Услуг у каждого мастера")
+    parser.add_argument('--rounds', type=int, default=50, help="Сколько раз построить список")
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = f"sqlite:///{Path(tempfile.mkdtemp()) / 'bench.db'}"
+    from bot.database import db
+
+    db.Base.metadata.create_all(db.engine)
+    with db.get_session() as session:
+        city = db.get_or_create_city(session, 'Москва', 'Москва', 'Moscow', country_code='RU')
+        client = db.get_or_create_user(session, 1)
+        for n in range(args.masters):
+            master = db.create_master_account(session, 1000 + n, f"Мастер {n}", description="Описание " * 20,
+                                              city_id=city.id)
+            for k in range(args.services):
+                db.create_service(session, master.id, f"Услуга {k}", 1000 + k, 60, 0, description="Текст " * 40)
+            db.add_user_master_link(session, client, master)
+
+    orm_ms, orm_kb = measure(orm_listing, args.rounds)
+    dto_ms, dto_kb = measure(dto_listing, args.rounds)
+    print(f"{args.masters} masters x {args.services} services")
+    print(f"ORM entities: {orm_ms:.2f} ms per listing, peak {orm_kb:.0f} KB")
+    print(f"read models:  {dto_ms:.2f} ms per listing, peak {dto_kb:.0f} KB "
+          f"(x{orm_ms / dto_ms:.1f} faster, x{orm_kb / dto_kb:.1f} less memory)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
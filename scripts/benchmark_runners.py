@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""Память и время запуска: три процесса (мастер-бот, клиентский бот, API) vs один общий процесс"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+ROLES = {
+    'master': ('master',),
+    'client': ('client',),
+    'api': ('api',),
+    'all': ('master', 'client', 'api'),
+}
+
+
+def build_offline_request():
+    """Bot API без сети: getMe возвращает бота, остальные методы - True"""
+    from telegram.request import BaseRequest
+
+    class OfflineRequest(BaseRequest):
+        @property
+        def read_timeout(self):
+            return None
+
+        async def initialize(self):
+            pass
+
+        async def shutdown(self):
+            pass
+
+        async def do_request(self, url, method, request_data=None, **kwargs):
+            result = True
+            if url.endswith('/getMe'):
+                result = {'id': 1, 'is_bot': True, 'first_name': 'Benchmark', 'username': 'benchmark_bot'}
+            return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+    return OfflineRequest()
+
+
+def rss_kb() -> int:
+    """Текущий RSS процесса (Linux)"""
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+async def run_child(role: str):
+    """Запустить сервисы роли так же, как их запускают точки входа, и сообщить RSS"""
+    from bot.runner import start_applications, stop_applications
+
+    services = ROLES[role]
+    applications = {}
+    if 'master' in services or 'client' in services:
+        from bot.database.db import init_db
+        init_db()
+    # Как в bot.runner.build_applications: у каждого бота свой request
+    if 'master' in services:
+        from bot.main_master import build_application
+        applications['master'] = build_application(build_offline_request(), webhook=True)
+    if 'client' in services:
+        from bot.main_client import build_application
+        applications['client'] = build_application(build_offline_request(), webhook=True)
+    if 'api' in services:
+        # Измеряется стоимость импорта: создание FastAPI-приложения и его зависимостей
+        importlib.import_module('mobile_app.api.main')
+
+    await start_applications(applications, mode='webhook')
+    print(json.dumps({'role': role, 'rss_kb': rss_kb()}), flush=True)
+    await stop_applications(applications)
+
+
+def spawn(role: str, env):
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, __file__, '--child', role],
+        cwd=PROJECT_ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    )
+    return process, started
+
+
+def collect(process, started):
+    """Время до готовности (строка с RSS) и RSS дочернего процесса"""
+    report = None
+    for line in process.stdout:
+        if line.startswith('{'):
+            report = json.loads(line)
+            report['startup'] = time.perf_counter() - started
+            break
+    process.wait()
+    if report is None:
+        raise RuntimeError(f"Child process failed with code {process.returncode}")
+    return report
+
+
+def measure(setup: str, env):
+    if setup == 'three-process':
+        children = [spawn(role, env) for role in ('master', 'client', 'api')]
+    else:
+        children = [spawn('all', env)]
+    reports = [collect(process, started) for process, started in children]
+    return sum(r['rss_kb'] for r in reports), max(r['startup'] for r in reports), reports
+
+
+def main():
+    if str(PROJECT_ROOT) not in sys.path:
+        sys.path.insert(0, str(PROJECT_ROOT))
+
+    parser = argparse.ArgumentParser(description="Сравнение трех процессов и общего процесса")
+    parser.add_argument('--runs', type=int, default=3, help="Количество запусков каждой схемы")
+    parser.add_argument('--child', choices=ROLES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(run_child(args.child))
+        return 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            BOT_TOKEN='1:benchmark',
+            CLIENT_BOT_TOKEN='2:benchmark',
+            DATABASE_URL=f"sqlite:///{Path(tmp) / 'benchmark.db'}",
+            PYTHONPATH=str(PROJECT_ROOT),
+        )
+        # Первый запуск создает схему БД - не учитываем его
+        measure('combined', env)
+        for setup in ('three-process', 'combined'):
+            results = [measure(setup, env) for _ in range(args.runs)]
+            rss = min(r[0] for r in results)
+            startup = min(r[1] for r in results)
+            details = ", ".join(f"{r['role']}={r['rss_kb'] / 1024:.0f} MB" for r in results[0][2])
+            print(f"{setup:>14}: RSS {rss / 1024:.0f} MB ({details}), startup {startup:.2f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Бенчмарк сессий БД на апдейт: отдельная сессия на каждый блок get_session() против общей сессии апдейта"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+async def handle_update(blocks: int, telegram_id: int):
+    """Обработчик как select_date/confirm_booking: несколько блоков чтения и запрос к Bot API между ними"""
+    from bot.database.db import get_master_by_telegram, get_session, release_update_session
+
+    for _ in range(blocks):
+        with get_session() as session:
+            get_master_by_telegram(session, telegram_id)
+    # Запрос к Bot API: TelegramRateLimiter завершает транзакцию перед отправкой
+    release_update_session()
+
+
+async def run(rounds: int, blocks: int, scoped: bool) -> float:
+    """Микросекунды на апдейт"""
+    from bot.database.db import update_session_scope
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        if scoped:
+            async with update_session_scope():
+                await handle_update(blocks, 1)
+        else:
+            await handle_update(blocks, 1)
+    return (time.perf_counter() - started) * 1e6 / rounds
+
+
+def main():
+    project_root = Path(__file__).parent.parent
+    if str(project_root) not in sys.path:
+        sys.path.insert(0, str(project_root))
+
+    parser = argparse.ArgumentParser(description="Бенчмарк сессий БД на апдейт")
+    parser.add_argument('--rounds', type=int, default=2000, help="Сколько апдейтов обработать")
+    parser.add_argument('--blocks', type=int, default=3, help="Блоков get_session() в обработчике")
+    args = parser.parse_args()
+
+    db_path = Path(tempfile.mkdtemp()) / 'bench.db'
+    os.environ['DATABASE_URL'] = f"sqlite:///{db_path}"
+    from sqlalchemy import event
+    from bot.database import db
+
+    db.Base.metadata.create_all(db.engine)
+    with db.get_session() as session:
+        db.create_master_account(session, 1, "Мастер")
+
+    counters = {'checkouts': 0, 'commits': 0}
+    event.listen(db.engine, 'checkout', lambda *a: counters.__setitem__('checkouts', counters['checkouts'] + 1))
+    event.listen(db.engine, 'commit', lambda *a: counters.__setitem__('commits', counters['commits'] + 1))
+
+    for scoped in (False, True):
+        counters.update(checkouts=0, commits=0)
+        us = asyncio.run(run(args.rounds, args.blocks, scoped))
+        label = 'update scope' if scoped else 'per block'
+        print(f"{label}: {us:.1f} us per update, "
+              f"{counters['checkouts'] / args.rounds:.1f} connection checkouts, "
+              f"{counters['commits'] / args.rounds:.1f} commits")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
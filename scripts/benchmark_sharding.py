@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""Бенчмарк шардирования: пропускная способность 1..N процессов-воркеров за диспетчером"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+SECRET = 'benchmark-secret'
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def run_worker(port: int, work_ms: float):
+    """
+    Воркер с фейковым ботом: обработчик занимает CPU на work_ms (как разбор
+    апдейта, ORM и форматирование в реальном обработчике) и запоминает порядок
+    апдейтов каждого пользователя. GET /stats - сколько обработано и соблюден ли порядок.
+    """
+    import uvicorn
+    from fastapi import FastAPI
+    from telegram import Update
+    from telegram.ext import Application, ExtBot, TypeHandler
+    from bot.runner import mount_applications
+    from bot.utils.update_processor import PerUserUpdateProcessor
+
+    class OfflineBot(ExtBot):
+        async def _do_post(self, endpoint, data, *args, **kwargs):
+            if endpoint == 'getMe':
+                return {'id': 1, 'is_bot': True, 'first_name': 'Benchmark', 'username': 'benchmark_bot'}
+            return True
+
+    seen = {}
+
+    async def handler(update: Update, context):
+        deadline = time.perf_counter() + work_ms / 1000
+        while time.perf_counter() < deadline:
+            pass
+        seen.setdefault(update.effective_user.id, []).append(update.update_id)
+
+    application = (
+        Application.builder()
+        .bot(OfflineBot(token='1:benchmark'))
+        .updater(None)
+        .concurrent_updates(PerUserUpdateProcessor())
+        .build()
+    )
+    application.add_handler(TypeHandler(Update, handler))
+
+    app = FastAPI()
+    mount_applications(app, {'master': application}, 'webhook', SECRET)
+
+    @app.get('/stats')
+    async def stats():
+        return {
+            'processed': sum(len(ids) for ids in seen.values()),
+            'ordered': all(ids == sorted(ids) for ids in seen.values()),
+        }
+
+    uvicorn.run(app, host='127.0.0.1', port=port, log_level='warning')
+
+
+def make_updates(users: int, per_user: int):
+    updates = []
+    for n in range(per_user):
+        for user_id in range(1, users + 1):
+            update_id = len(updates) + 1
+            updates.append({'update_id': update_id, 'message': {
+                'message_id': update_id, 'date': 0, 'text': str(n),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'},
+            }})
+    return updates
+
+
+async def wait_ready(client, urls):
+    for url in urls:
+        for _ in range(200):
+            try:
+                if (await client.get(url + '/stats')).status_code == 200:
+                    break
+            except Exception:
+                pass
+            await asyncio.sleep(0.05)
+        else:
+            raise RuntimeError(f"Worker {url} did not start")
+
+
+async def measure(shards: int, updates, work_ms: float):
+    """Время обработки всех апдейтов shards воркерами и соблюден ли порядок каждого пользователя"""
+    import httpx
+    from bot.sharding import ShardDispatcher
+
+    ports = [free_port() for _ in range(shards)]
+    env = dict(os.environ, PYTHONPATH=str(PROJECT_ROOT))
+    workers = [
+        subprocess.Popen([sys.executable, __file__, '--worker', str(port), '--work-ms', str(work_ms)],
+                         cwd=PROJECT_ROOT, env=env)
+        for port in ports
+    ]
+    urls = [f"http://127.0.0.1:{port}" for port in ports]
+    try:
+        async with httpx.AsyncClient() as client:
+            await wait_ready(client, urls)
+            dispatcher = ShardDispatcher(urls, SECRET)
+            await dispatcher.start()
+            started = time.perf_counter()
+            for update in updates:
+                dispatcher.dispatch('master', update)
+            while True:
+                stats = [(await client.get(url + '/stats')).json() for url in urls]
+                if sum(s['processed'] for s in stats) >= len(updates):
+                    break
+                await asyncio.sleep(0.02)
+            elapsed = time.perf_counter() - started
+            await dispatcher.stop()
+        return elapsed, all(s['ordered'] for s in stats)
+    finally:
+        for process in workers:
+            process.terminate()
+        for process in workers:
+            process.wait()
+
+
+def main():
+    if str(PROJECT_ROOT) not in sys.path:
+        sys.path.insert(0, str(PROJECT_ROOT))
+
+    parser = argparse.ArgumentParser(description="Бенчмарк шардирования ботов по пользователям")
+    parser.add_argument('--shards', type=int, default=os.cpu_count() or 1, help="Максимальное число воркеров")
+    parser.add_argument('--users', type=int, default=200, help="Количество пользователей")
+    parser.add_argument('--per-user', type=int, default=10, help="Апдейтов от каждого пользователя")
+    parser.add_argument('--work-ms', type=float, default=2.0, help="CPU-время обработчика (мс)")
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.work_ms)
+        return 0
+
+    updates = make_updates(args.users, args.per_user)
+    print(f"CPU cores: {os.cpu_count()}, {len(updates)} updates, {args.work_ms} ms CPU per update")
+    counts = sorted({1, *[n for n in (2, 4, 8, 16) if n <= args.shards], args.shards})
+    baseline = None
+    for shards in counts:
+        elapsed, ordered = asyncio.run(measure(shards, updates, args.work_ms))
+        rate = len(updates) / elapsed
+        baseline = baseline or rate
+        print(f"{shards:>3} shards: {rate:7.1f} updates/s, speedup x{rate / baseline:.2f}, "
+              f"per-user order kept: {ordered}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Бенчмарк пропускной способности обработки апдейтов: последовательно vs параллельно по пользователям"""
+import argparse
+import asyncio
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+
+def build_offline_bot(latency: float):
+    """ExtBot, который не ходит в сеть: каждый запрос к API "выполняется" latency секунд"""
+    from telegram.ext import ExtBot
+
+    class OfflineBot(ExtBot):
+        async def _do_post(self, endpoint, data, *args, **kwargs):
+            if endpoint == 'getMe':
+                return {'id': 1, 'is_bot': True, 'first_name': 'Benchmark', 'username': 'benchmark_bot'}
+            await asyncio.sleep(latency)
+            return True
+
+    return OfflineBot(token='1:benchmark')
+
+
+def make_updates(users: int, per_user: int):
+    """Синтетические текстовые сообщения: пользователи чередуются, как в реальном потоке"""
+    from telegram import Chat, Message, Update, User
+
+    now = datetime.now(timezone.utc)
+    updates = []
+    for n in range(per_user):
+        for user_id in range(1, users + 1):
+            update_id = len(updates) + 1
+            user = User(id=user_id, first_name=f"user{user_id}", is_bot=False)
+            message = Message(
+                message_id=update_id,
+                date=now,
+                chat=Chat(id=user_id, type=Chat.PRIVATE),
+                from_user=user,
+                text=str(n)
+            )
+            updates.append(Update(update_id=update_id, message=message))
+    return updates
+
+
+async def run(processor, updates, latency: float, handler_calls: int):
+    """
+    Прогнать апдейты через Application с фейковым ботом
+
+    Returns:
+        (секунды, соблюден ли порядок апдейтов каждого пользователя)
+    """
+    from telegram import Update
+    from telegram.ext import Application, TypeHandler
+
+    seen = {}
+    done = asyncio.Event()
+
+    async def handler(update: Update, context):
+        # Имитация обработчика, который несколько раз обращается к Telegram API
+        for _ in range(handler_calls):
+            await context.bot.send_chat_action(chat_id=update.effective_chat.id, action='typing')
+        seen.setdefault(update.effective_user.id, []).append(int(update.message.text))
+        if sum(len(v) for v in seen.values()) == len(updates):
+            done.set()
+
+    application = (
+        Application.builder()
+        .bot(build_offline_bot(latency))
+        .updater(None)
+        .concurrent_updates(processor)
+        .build()
+    )
+    application.add_handler(TypeHandler(Update, handler))
+
+    async with application:
+        await application.start()
+        started = time.perf_counter()
+        for update in updates:
+            await application.update_queue.put(update)
+        await done.wait()
+        elapsed = time.perf_counter() - started
+        await application.stop()
+
+    ordered = all(values == sorted(values) for values in seen.values())
+    return elapsed, ordered
+
+
+def main():
+    project_root = Path(__file__).parent.parent
+    if str(project_root) not in sys.path:
+        sys.path.insert(0, str(project_root))
+
+    parser = argparse.ArgumentParser(description="Бенчмарк обработки апдейтов с фейковым ботом")
+    parser.add_argument('--users', type=int, default=50, help="Количество пользователей")
+    parser.add_argument('--per-user', type=int, default=4, help="Апдейтов от каждого пользователя")
+    parser.add_argument('--latency', type=float, default=0.05, help="Задержка одного запроса к API (секунды)")
+    parser.add_argument('--calls', type=int, default=2, help="Запросов к API в одном обработчике")
+    parser.add_argument('--workers', type=int, default=16, help="Рабочих слотов параллельной обработки")
+    args = parser.parse_args()
+
+    from telegram.ext import SimpleUpdateProcessor
+    from bot.utils.update_processor import PerUserUpdateProcessor
+
+    updates = make_updates(args.users, args.per_user)
+    for name, processor in (
+        ("sequential", SimpleUpdateProcessor(1)),
+        (f"per-user x{args.workers}", PerUserUpdateProcessor(args.workers)),
+    ):
+        elapsed, ordered = asyncio.run(run(processor, updates, args.latency, args.calls))
+        print(f"{name:>16}: {len(updates)} updates in {elapsed:.2f}s "
+              f"({len(updates) / elapsed:.1f} updates/s), per-user order kept: {ordered}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Бенчмарк ограничения частоты: списки времен вызовов на пользователя против ведер токенов"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+
+class ListRateLimit:
+    """Старый rate_limit: список времен вызовов, пересобираемый при каждом вызове, без вытеснения"""
+
+    def __init__(self, max_calls: int, window_seconds: int):
+        self.max_calls = max_calls
+        self.window_seconds = window_seconds
+        self.calls = {}
+
+    def check(self, user_id, now: datetime) -> bool:
+        calls = [t for t in self.calls.get(user_id, []) if (now - t).total_seconds() < self.window_seconds]
+        self.calls[user_id] = calls
+        if len(calls) >= self.max_calls:
+            return False
+        calls.append(now)
+        return True
+
+
+def workload(users: int, calls: int, seed: int = 1):
+    """(пользователь, секунда от начала): равномерный поток, 20% пользователей делают 80% вызовов"""
+    rng = random.Random(seed)
+    hot = max(1, users // 5)
+    return [
+        (rng.randrange(hot) if rng.random() < 0.8 else rng.randrange(users), i * 0.01)
+        for i in range(calls)
+    ]
+
+
+def measure(make_check, events):
+    """(микросекунды на проверку, пик памяти в КБ); make_check() - проверка с чистым состоянием"""
+    check = make_check()
+    started = time.perf_counter()
+    for user_id, offset in events:
+        check(user_id, offset)
+    elapsed_us = (time.perf_counter() - started) * 1e6 / len(events)
+
+    tracemalloc.start()
+    check = make_check()
+    for user_id, offset in events:
+        check(user_id, offset)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed_us, peak / 1024
+
+
+def main():
+    project_root = Path(__file__).parent.parent
+    if str(project_root) not in sys.path:
+        sys.path.insert(0, str(project_root))
+
+    parser = argparse.ArgumentParser(description="Бенчмарк ограничения частоты действий пользователей")
+    parser.add_argument('--users', type=int, default=20000, help="Разных пользователей")
+    parser.add_argument('--calls', type=int, default=200000, help="Вызовов (по 100 в секунду)")
+    parser.add_argument('--max-calls', type=int, default=10, help="Вызовов в окне")
+    parser.add_argument('--window', type=int, default=60, help="Окно в секундах")
+    parser.add_argument('--max-keys', type=int, default=10000, help="RATE_LIMIT_MAX_KEYS для ведер в памяти")
+    args = parser.parse_args()
+
+    from bot.utils.user_rate_limit import MemoryRateLimitStorage, SqliteRateLimitStorage, TokenBucketLimiter
+
+    events = workload(args.users, args.calls)
+    rate = args.max_calls / args.window
+
+    started = datetime.now()
+    old = {}
+
+    def make_old():
+        old['limit'] = ListRateLimit(args.max_calls, args.window)
+        return lambda user_id, offset: old['limit'].check(user_id, started + timedelta(seconds=offset))
+
+    old_us, old_kb = measure(make_old, events)
+
+    memory = {}
+
+    def make_memory():
+        memory['storage'] = MemoryRateLimitStorage(args.max_keys)
+        limiter = TokenBucketLimiter(rate, args.max_calls, 'bench', storage=memory['storage'])
+        return lambda user_id, offset: limiter.check(user_id, now=1000.0 + offset)
+
+    new_us, new_kb = measure(make_memory, events)
+
+    sqlite_dir = Path(tempfile.mkdtemp())
+    sqlite = {}
+
+    def make_sqlite():
+        sqlite['storage'] = SqliteRateLimitStorage(str(sqlite_dir / f"limits{len(sqlite)}.db"))
+        limiter = TokenBucketLimiter(rate, args.max_calls, 'bench', storage=sqlite['storage'])
+        return lambda user_id, offset: limiter.check(user_id, now=1000.0 + offset)
+
+    sqlite_events = events[:min(len(events), 20000)]
+    sqlite_us, _ = measure(make_sqlite, sqlite_events)
+    sqlite_rows = len(sqlite['storage'])
+    sqlite['storage'].close()
+
+    print(f"{args.calls} calls from {args.users} users, {args.max_calls} per {args.window} s")
+    print(f"timestamp lists: {old_us:.2f} us per check, peak {old_kb:.0f} KB, {len(old['limit'].calls)} users kept")
+    print(f"memory buckets:  {new_us:.2f} us per check, peak {new_kb:.0f} KB, {len(memory['storage'])} users kept")
+    print(f"sqlite buckets:  {sqlite_us:.2f} us per check ({len(sqlite_events)} calls), {sqlite_rows} rows")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
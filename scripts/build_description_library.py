@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""Пакетная генерация библиотеки описаний для предустановленных шаблонов услуг"""
+import argparse
+import asyncio
+import logging
+import sys
+from pathlib import Path
+
+
+def main():
+    # Добавляем корень проекта в sys.path для импорта модулей
+    project_root = Path(__file__).parent.parent
+    if str(project_root) not in sys.path:
+        sys.path.insert(0, str(project_root))
+
+    parser = argparse.ArgumentParser(description="Генерация вариантов описаний для шаблонов услуг")
+    parser.add_argument('--variations', type=int, default=None, help="Вариантов на шаблон (по умолчанию - все)")
+    parser.add_argument('--force', action='store_true', help="Перегенерировать уже сохраненные описания")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+
+    from bot.database.db import init_db
+    from bot.utils.description_library import build_description_library
+    from bot.utils.openai_client import close_client
+
+    async def run():
+        try:
+            return await build_description_library(variations=args.variations, force=args.force)
+        finally:
+            await close_client()
+
+    init_db()
+    stats = asyncio.run(run())
+    print(f"[OK] Шаблонов: {stats['templates']}, сгенерировано: {stats['generated']}, "
+          f"уже в библиотеке: {stats['skipped']}, ошибок: {stats['failed']}")
+    return 1 if stats['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
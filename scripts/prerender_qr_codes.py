@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""Пакетная отрисовка QR-кодов приглашения для всех мастеров"""
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+
+def main():
+    # Добавляем корень проекта в sys.path для импорта модулей
+    project_root = Path(__file__).parent.parent
+    if str(project_root) not in sys.path:
+        sys.path.insert(0, str(project_root))
+
+    parser = argparse.ArgumentParser(description="Пре-рендер QR-кодов приглашения для всех мастеров")
+    parser.add_argument('--workers', type=int, default=None, help="Количество процессов (по умолчанию - число ядер)")
+    parser.add_argument('--force', action='store_true', help="Перерисовать уже закэшированные QR-коды")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+
+    from bot.database.db import init_db
+    from bot.utils.qr_codes import prerender_all_invite_qr
+
+    init_db()
+    stats = prerender_all_invite_qr(workers=args.workers, force=args.force)
+    print(f"[OK] Мастеров: {stats['total']}, отрисовано: {stats['rendered']}, уже в кэше: {stats['skipped']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,10 @@
 """Pytest configuration and fixtures"""
 import pytest
 import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
 from unittest.mock import Mock, AsyncMock
 from telegram import Update, User, Chat, CallbackQuery, Message
 from telegram.ext import ContextTypes
@@ -9,6 +13,7 @@ from bot.database.db import get_session, init_db
 from bot.database.models import Base
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
 
 @pytest.fixture(scope="session")
@@ -97,6 +102,86 @@ def test_db():
     session.close()
 
 
+@pytest.fixture
+def memory_db(monkeypatch):
+    """In-memory БД с актуальной схемой, подключенная к bot.database.db.get_session()"""
+    import bot.database.db as db
+    
+    engine = create_engine(
+        "sqlite://",
+        echo=False,
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(engine)
+    
+    SessionLocal = sessionmaker(bind=engine)
+    monkeypatch.setattr(db, "engine", engine)
+    monkeypatch.setattr(db, "SessionLocal", SessionLocal)
+    
+    yield SessionLocal
+    engine.dispose()
+
+
+class StubHTTPServer:
+    """Локальный HTTP-сервер для тестов внешних API (Nominatim, OpenAI, ЮKassa)"""
+    
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = []
+        stub = self
+        
+        class RequestHandler(BaseHTTPRequestHandler):
+            def _handle(self):
+                parts = urlsplit(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                raw_body = self.rfile.read(length) if length else b''
+                request = {
+                    'method': self.command,
+                    'path': parts.path,
+                    'query': {k: v[0] for k, v in parse_qs(parts.query).items()},
+                    'headers': dict(self.headers),
+                    'json': json.loads(raw_body) if raw_body else None,
+                }
+                stub.requests.append(request)
+                status, payload = stub.handler(request)
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            do_GET = do_POST = _handle
+            
+            def log_message(self, format, *args):
+                pass
+        
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), RequestHandler)
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+    
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def stub_http_server():
+    """Фабрика локальных HTTP-серверов: handler(request) -> (status, json)"""
+    servers = []
+    
+    def start(handler):
+        server = StubHTTPServer(handler)
+        servers.append(server)
+        return server
+    
+    yield start
+    for server in servers:
+        server.close()
+
+
 @pytest.fixture
 def mock_update():
     """Create a mock Update object"""
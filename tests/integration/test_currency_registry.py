@@ -0,0 +1,97 @@
+"""Integration tests for in-memory currency registry with REST Countries fallback"""
+import asyncio
+import time
+
+import pytest
+import pytest_asyncio
+
+from bot.database.db import get_session, get_country_currency, get_or_create_country_currency
+from bot.utils import country_api, currency
+from bot.utils.currency import CurrencyRegistry
+
+
+def countries_handler(delay=0.0):
+    def handle(request):
+        time.sleep(delay)
+        if request['path'] == '/v3.1/alpha/BR':
+            return 200, [{'currencies': {'BRL': {'name': 'Brazilian real', 'symbol': 'R$'}}}]
+        return 404, {}
+    return handle
+
+
+@pytest_asyncio.fixture
+async def registry(stub_http_server, memory_db, monkeypatch):
+    """Свежий реестр валют и адрес REST Countries на локальном сервере"""
+    fresh = CurrencyRegistry()
+    monkeypatch.setattr(currency, "currency_registry", fresh)
+
+    def start(handler):
+        server = stub_http_server(handler)
+        monkeypatch.setattr(country_api, "REST_COUNTRIES_API_URL", server.url + "/v3.1/alpha/{code}")
+        return server
+
+    await country_api.close_http_client()
+    yield fresh, start
+    await country_api.close_http_client()
+
+
+class TestCurrencyRegistry:
+    """Test registry preload, single-flight fallback and write-through"""
+
+    @pytest.mark.asyncio
+    async def test_db_rows_are_served_from_memory(self, registry):
+        reg, start = registry
+        server = start(countries_handler())
+        with get_session() as session:
+            get_or_create_country_currency(session, 'MX', 'MXN', 'Mexican peso', 'Mex$')
+
+        assert currency.load_currency_registry() == 1
+        assert currency.get_currency_by_country('mx') == 'MXN'
+        assert currency.get_currency_symbol('MXN') == 'Mex$'
+        assert await currency.get_currency_by_country_async(None, 'MX') == 'MXN'
+        assert server.requests == []
+
+    @pytest.mark.asyncio
+    async def test_concurrent_misses_share_one_request(self, registry):
+        reg, start = registry
+        server = start(countries_handler(delay=0.2))
+        reg.loaded = True
+
+        results = await asyncio.gather(*[reg.resolve('br') for _ in range(5)])
+
+        assert results == ['BRL'] * 5
+        assert len(server.requests) == 1
+
+        # Write-through: и БД, и память содержат новую валюту
+        with get_session() as session:
+            stored = get_country_currency(session, 'BR')
+            assert stored.currency_code == 'BRL'
+            assert stored.currency_symbol == 'R$'
+        assert reg.get_currency('BR') == 'BRL'
+        assert currency.get_currency_symbol('BRL') == 'R$'
+        assert currency.get_currency_name_prepositional('BRL') == 'brazilian real'
+
+        # Повторный запрос обслуживается из памяти
+        assert await reg.resolve('BR') == 'BRL'
+        assert len(server.requests) == 1
+
+    @pytest.mark.asyncio
+    async def test_api_failure_falls_back_without_caching(self, registry):
+        reg, start = registry
+        server = start(lambda request: (500, {}))
+        reg.loaded = True
+
+        assert await reg.resolve('ZZ') == 'RUB'
+        assert await reg.resolve('ZZ') == 'RUB'
+        assert reg.get_currency('ZZ') is None
+        assert len(server.requests) == 2
+
+    def test_module_dicts_are_not_mutated(self, registry):
+        reg, _ = registry
+        reg._remember('XX', 'XXX', 'Test money', 'X$')
+
+        assert 'XXX' not in currency.CURRENCY_SYMBOLS
+        assert 'XXX' not in currency.CURRENCY_NAMES_RU_PREPOSITIONAL
+        assert currency.get_currency_symbol('XXX') == 'X$'
+        assert currency.get_currency_name_prepositional('RUB') == 'рублях'
+        assert currency.get_currency_name_prepositional(None) == 'рублях'
@@ -0,0 +1,123 @@
+"""Integration tests for async Nominatim client against a local stub server"""
+import asyncio
+import time
+
+import pytest
+import pytest_asyncio
+
+from bot.utils import geocoding
+
+
+REVERSE_RU = {
+    'lat': '55.7961', 'lon': '49.1064',
+    'address': {'city': 'Казань', 'country': 'Россия', 'country_code': 'ru'}
+}
+REVERSE_EN = {
+    'lat': '55.7961', 'lon': '49.1064',
+    'address': {'city': 'Kazan', 'country': 'Russia', 'country_code': 'ru'}
+}
+SEARCH = [
+    {'lat': '53.9006', 'lon': '27.5590', 'display_name': 'Минск, Беларусь',
+     'address': {'city': 'Минск', 'country': 'Беларусь', 'country_code': 'by'}},
+    {'lat': '0', 'lon': '0', 'address': {'road': 'без города'}},
+]
+
+
+def nominatim_handler(delay=0.0):
+    def handle(request):
+        time.sleep(delay)
+        if request['path'] == '/reverse':
+            if request['query'].get('accept-language') == 'en':
+                return 200, REVERSE_EN
+            return 200, REVERSE_RU
+        if request['path'] == '/search':
+            return 200, SEARCH
+        return 404, {}
+    return handle
+
+
+@pytest_asyncio.fixture
+async def nominatim(stub_http_server, monkeypatch):
+    """Подменить адрес Nominatim на локальный сервер"""
+    def start(handler, min_interval=0.0):
+        server = stub_http_server(handler)
+        monkeypatch.setattr(geocoding, "NOMINATIM_URL", server.url)
+        monkeypatch.setattr(geocoding, "NOMINATIM_MIN_INTERVAL", min_interval)
+        return server
+
+    await geocoding.close_http_client()
+    yield start
+    await geocoding.close_http_client()
+
+
+class TestAsyncNominatimClient:
+    """Test pooled async geocoding"""
+
+    @pytest.mark.asyncio
+    async def test_reverse_lookup_asks_english_for_cyrillic_name(self, nominatim):
+        server = nominatim(nominatim_handler())
+
+        city = await geocoding.get_city_from_location_async(55.79, 49.12)
+
+        assert city == {
+            'name_ru': 'Казань', 'name_local': 'Казань', 'name_en': 'Kazan',
+            'country_code': 'RU', 'latitude': 55.7961, 'longitude': 49.1064
+        }
+        assert [r['query']['accept-language'] for r in server.requests] == ['ru,en', 'en']
+        assert server.requests[0]['headers']['User-Agent'] == 'LumiBot/1.0'
+
+    @pytest.mark.asyncio
+    async def test_reverse_lookup_single_request_for_latin_name(self, nominatim):
+        berlin = {'lat': '52.52', 'lon': '13.405', 'address': {'city': 'Berlin', 'country_code': 'de'}}
+        server = nominatim(lambda request: (200, berlin))
+
+        city = await geocoding.get_city_from_location_async(52.5, 13.4)
+
+        assert city['name_en'] == 'Berlin' and city['country_code'] == 'DE'
+        assert len(server.requests) == 1
+
+    @pytest.mark.asyncio
+    async def test_identical_queries_are_coalesced(self, nominatim):
+        server = nominatim(nominatim_handler(delay=0.1))
+
+        results = await asyncio.gather(*[
+            geocoding.search_city_by_name_async("Минск") for _ in range(5)
+        ])
+
+        assert len(server.requests) == 1
+        assert all(r == results[0] for r in results)
+        assert results[0][0]['name_ru'] == 'Минск'
+        assert results[0][0]['country_code'] == 'BY'
+        assert len(results[0]) == 1
+
+    @pytest.mark.asyncio
+    async def test_rate_limiter_spaces_requests(self, nominatim):
+        server = nominatim(nominatim_handler(), min_interval=0.2)
+
+        started = time.monotonic()
+        await asyncio.gather(
+            geocoding.search_city_by_name_async("A"),
+            geocoding.search_city_by_name_async("B"),
+            geocoding.search_city_by_name_async("C"),
+        )
+        elapsed = time.monotonic() - started
+
+        assert len(server.requests) == 3
+        assert elapsed >= 0.4
+
+    @pytest.mark.asyncio
+    async def test_server_error_returns_empty_result(self, nominatim):
+        nominatim(lambda request: (500, {}))
+
+        assert await geocoding.search_city_by_name_async("Минск") == []
+        assert await geocoding.get_city_from_location_async(1.0, 2.0) is None
+
+    @pytest.mark.asyncio
+    async def test_connection_is_reused(self, nominatim):
+        nominatim(nominatim_handler())
+
+        await geocoding.search_city_by_name_async("A")
+        client = geocoding.get_http_client()
+        await geocoding.search_city_by_name_async("B")
+
+        assert geocoding.get_http_client() is client
@@ -0,0 +1,142 @@
+"""Integration tests for async OpenAI description generation against a local stub server"""
+import asyncio
+import threading
+import time
+
+import pytest
+import pytest_asyncio
+
+from bot.utils import openai_client
+from bot.utils.cache import CacheManager
+
+
+def completions_handler(delay=0.0, text="«Аккуратный маникюр 💅»"):
+    state = {'active': 0, 'peak': 0}
+    lock = threading.Lock()
+
+    def handle(request):
+        if request['path'] != '/v1/chat/completions':
+            return 404, {}
+        with lock:
+            state['active'] += 1
+            state['peak'] = max(state['peak'], state['active'])
+        time.sleep(delay)
+        with lock:
+            state['active'] -= 1
+        return 200, {
+            'id': 'chatcmpl-test', 'object': 'chat.completion', 'created': 0,
+            'model': request['json']['model'],
+            'choices': [{
+                'index': 0, 'finish_reason': 'stop',
+                'message': {'role': 'assistant', 'content': text}
+            }],
+            'usage': {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2}
+        }
+
+    handle.state = state
+    return handle
+
+
+@pytest_asyncio.fixture
+async def openai_api(stub_http_server, memory_db, monkeypatch):
+    """Подменить адрес OpenAI API на локальный сервер"""
+    def start(handler, max_concurrency=4):
+        server = stub_http_server(handler)
+        monkeypatch.setattr(openai_client, "OPENAI_API_KEY", "test-key")
+        monkeypatch.setattr(openai_client, "OPENAI_BASE_URL", server.url + "/v1")
+        monkeypatch.setattr(openai_client, "OPENAI_MAX_CONCURRENCY", max_concurrency)
+        monkeypatch.setattr(openai_client, "_semaphore", None)
+        return server
+
+    await openai_client.close_client()
+    CacheManager.clear()
+    yield start
+    await openai_client.close_client()
+    CacheManager.clear()
+
+
+class TestAsyncDescriptionGeneration:
+    """Test non-blocking generation, caching and deduplication"""
+
+    @pytest.mark.asyncio
+    async def test_generates_and_cleans_description(self, openai_api):
+        server = openai_api(completions_handler())
+
+        description = await openai_client.generate_service_description("Маникюр")
+
+        assert description == "Аккуратный маникюр 💅"
+        assert len(server.requests) == 1
+        prompt = server.requests[0]['json']['messages'][1]['content']
+        assert "Услуга: Маникюр" in prompt
+        assert openai_client.VARIATION_INSTRUCTIONS[0] in prompt
+
+    @pytest.mark.asyncio
+    async def test_cache_by_normalized_name_and_variation(self, openai_api):
+        server = openai_api(completions_handler())
+
+        await openai_client.generate_service_description("Маникюр  + гель-лак")
+        await openai_client.generate_service_description(" маникюр + гель-лак ")
+        assert len(server.requests) == 1
+
+        # Другой вариант - новый запрос
+        await openai_client.generate_service_description("Маникюр + гель-лак", retry_count=1)
+        assert len(server.requests) == 2
+        # Тот же вариант по кругу берется из кэша
+        await openai_client.generate_service_description("Маникюр + гель-лак", retry_count=5)
+        assert len(server.requests) == 2
+
+    @pytest.mark.asyncio
+    async def test_repeated_clicks_share_one_request(self, openai_api):
+        server = openai_api(completions_handler(delay=0.2))
+
+        task = asyncio.create_task(
+            openai_client.generate_service_description("Стрижка", master_id=42)
+        )
+        await asyncio.sleep(0.05)
+        assert openai_client.is_generation_in_progress(42)
+        assert not openai_client.is_generation_in_progress(43)
+
+        results = await asyncio.gather(
+            task, openai_client.generate_service_description("Стрижка", master_id=42)
+        )
+
+        assert results[0] == results[1] == "Аккуратный маникюр 💅"
+        assert len(server.requests) == 1
+        assert not openai_client.is_generation_in_progress(42)
+
+    @pytest.mark.asyncio
+    async def test_concurrency_is_capped(self, openai_api):
+        handler = completions_handler(delay=0.15)
+        server = openai_api(handler, max_concurrency=2)
+
+        await asyncio.gather(*[
+            openai_client.generate_service_description(f"Услуга {i}", master_id=i) for i in range(5)
+        ])
+
+        assert len(server.requests) == 5
+        assert handler.state['peak'] == 2
+
+    @pytest.mark.asyncio
+    async def test_event_loop_is_not_blocked(self, openai_api):
+        openai_api(completions_handler(delay=0.3))
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.02)
+                ticks += 1
+
+        ticker_task = asyncio.create_task(ticker())
+        await openai_client.generate_service_description("Массаж")
+        ticker_task.cancel()
+
+        assert ticks >= 5
+
+    @pytest.mark.asyncio
+    async def test_api_error_returns_none_and_is_not_cached(self, openai_api):
+        server = openai_api(lambda request: (500, {'error': {'message': 'boom'}}))
+
+        assert await openai_client.generate_service_description("Педикюр") is None
+        assert await openai_client.generate_service_description("Педикюр") is None
+        assert len(server.requests) >= 2
@@ -0,0 +1,113 @@
+"""Integration tests for YooKassa webhook endpoint"""
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+from fastapi.testclient import TestClient
+
+from bot.database.db import get_session, get_master_by_id, get_payment_by_id
+from bot.database.models import MasterAccount, Payment
+from bot.utils import yookassa_api
+from mobile_app.api.main import app
+
+
+def notification(payment_id, event="payment.succeeded", status="succeeded"):
+    return {
+        'type': 'notification',
+        'event': event,
+        'object': {'id': payment_id, 'status': status, 'paid': status == 'succeeded'}
+    }
+
+
+@pytest.fixture
+def master_id(memory_db):
+    with get_session() as session:
+        master = MasterAccount(telegram_id=3001, name="Webhook Master")
+        session.add(master)
+        session.flush()
+        session.add(Payment(
+            master_account_id=master.id, payment_id="pay_w", amount=299.0,
+            status='pending', subscription_type='premium', created_at=datetime.utcnow()
+        ))
+        return master.id
+
+
+@pytest.fixture
+def gateway(monkeypatch):
+    """Статусы платежей, которые вернет ЮKassa при проверке уведомления"""
+    statuses = {}
+
+    async def fake_status(payment_id):
+        status = statuses.get(payment_id)
+        return {'id': payment_id, 'status': status, 'paid': status == 'succeeded'} if status else None
+
+    monkeypatch.setattr(yookassa_api, "get_payment_status", fake_status)
+    monkeypatch.setattr("bot.config.YOOKASSA_WEBHOOK_VERIFY", True)
+    return statuses
+
+
+class TestYooKassaWebhook:
+    """Test webhook applies verified status changes immediately"""
+
+    def test_succeeded_notification_activates_subscription(self, master_id, gateway):
+        gateway["pay_w"] = "succeeded"
+        with TestClient(app) as client:
+            response = client.post("/webhooks/yookassa", json=notification("pay_w"))
+            repeat = client.post("/webhooks/yookassa", json=notification("pay_w"))
+
+        assert response.status_code == 200
+        assert repeat.status_code == 200
+        with get_session() as session:
+            assert get_payment_by_id(session, "pay_w").status == 'succeeded'
+            assert get_master_by_id(session, master_id).subscription_level == 'premium'
+
+    def test_forged_notification_is_not_trusted(self, master_id, gateway):
+        gateway["pay_w"] = "pending"
+        with TestClient(app) as client:
+            response = client.post("/webhooks/yookassa", json=notification("pay_w"))
+
+        assert response.status_code == 200
+        with get_session() as session:
+            assert get_payment_by_id(session, "pay_w").status == 'pending'
+            assert get_master_by_id(session, master_id).subscription_level == 'free'
+
+    def test_unverifiable_notification_asks_for_retry(self, master_id, gateway):
+        with TestClient(app) as client:
+            response = client.post("/webhooks/yookassa", json=notification("pay_w"))
+
+        assert response.status_code == 503
+
+    def test_unknown_payment_and_events_are_acknowledged(self, master_id, gateway):
+        with TestClient(app) as client:
+            unknown = client.post("/webhooks/yookassa", json=notification("other"))
+            refund = client.post("/webhooks/yookassa", json={'event': 'refund.succeeded', 'object': {'id': 'r1'}})
+            invalid = client.post("/webhooks/yookassa", content=b"not json")
+
+        assert unknown.status_code == 200
+        assert refund.status_code == 200
+        assert invalid.status_code == 400
+
+    def test_canceled_without_verification(self, master_id, gateway, monkeypatch):
+        monkeypatch.setattr("bot.config.YOOKASSA_WEBHOOK_VERIFY", False)
+        with TestClient(app) as client:
+            response = client.post("/webhooks/yookassa",
+                                   json=notification("pay_w", "payment.canceled", "canceled"))
+
+        assert response.status_code == 200
+        with get_session() as session:
+            assert get_payment_by_id(session, "pay_w").status == 'canceled'
+
+    @pytest.mark.asyncio
+    async def test_status_button_after_webhook(self, master_id, gateway):
+        from bot.handlers.master.premium import premium_check_status
+
+        gateway["pay_w"] = "succeeded"
+        with TestClient(app) as client:
+            client.post("/webhooks/yookassa", json=notification("pay_w"))
+
+        query = SimpleNamespace(answer=AsyncMock(), message=SimpleNamespace(edit_text=AsyncMock()))
+        update = SimpleNamespace(callback_query=query, effective_user=SimpleNamespace(id=3001))
+        await premium_check_status(update, SimpleNamespace(user_data={}))
+
+        assert "Платеж успешно обработан" in query.message.edit_text.await_args.args[0]
@@ -0,0 +1,136 @@
+"""End-to-end tests for the webhook mode: synthetic updates through the ASGI app"""
+import time
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from telegram import Chat, Message, Update, User
+from telegram.ext import Application, ExtBot, TypeHandler
+
+from bot.webhook import SECRET_TOKEN_HEADER, get_webhook_secret, mount_telegram_webhooks
+
+SECRET = "test-webhook-secret"
+
+
+class OfflineBot(ExtBot):
+    """Бот без сети: getMe отвечает сразу, остальные запросы - успешно"""
+
+    async def _do_post(self, endpoint, data, *args, **kwargs):
+        if endpoint == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Webhook', 'username': 'webhook_bot'}
+        return True
+
+
+def make_update(update_id, user_id, text):
+    message = Message(
+        message_id=update_id,
+        date=datetime.now(timezone.utc),
+        chat=Chat(id=user_id, type=Chat.PRIVATE),
+        from_user=User(id=user_id, first_name=f"user{user_id}", is_bot=False),
+        text=text
+    )
+    return Update(update_id=update_id, message=message).to_dict()
+
+
+def headers(bot_name, secret=SECRET):
+    return {SECRET_TOKEN_HEADER: get_webhook_secret(secret, bot_name)}
+
+
+@pytest.fixture
+def server():
+    """ASGI-приложение с двумя ботами; received - тексты апдейтов, дошедших до обработчиков"""
+    received = {'master': [], 'client': []}
+    lifecycle = []
+    applications = {}
+    for name in received:
+        async def handler(update, context, name=name):
+            received[name].append(update.message.text)
+
+        async def post_init(application, name=name):
+            lifecycle.append(f"init_{name}")
+
+        async def post_shutdown(application, name=name):
+            lifecycle.append(f"shutdown_{name}")
+
+        application = (
+            Application.builder()
+            .bot(OfflineBot(token=f"1:{name}"))
+            .updater(None)
+            .post_init(post_init)
+            .post_shutdown(post_shutdown)
+            .build()
+        )
+        application.add_handler(TypeHandler(Update, handler))
+        applications[name] = application
+
+    app = FastAPI()
+    mount_telegram_webhooks(app, applications, SECRET)
+    with TestClient(app) as client:
+        yield client, received, lifecycle
+    assert lifecycle[-2:] == ['shutdown_client', 'shutdown_master']
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class TestTelegramWebhook:
+    """Test updates posted to the webhook reach the right Application"""
+
+    def test_updates_reach_their_bot(self, server):
+        client, received, lifecycle = server
+        assert lifecycle == ['init_master', 'init_client']
+
+        for n in range(3):
+            response = client.post("/telegram/master", json=make_update(n + 1, 10, f"m{n}"), headers=headers('master'))
+            assert response.status_code == 200
+        response = client.post("/telegram/client", json=make_update(1, 20, "c0"), headers=headers('client'))
+        assert response.status_code == 200
+
+        assert wait_for(lambda: len(received['master']) == 3 and len(received['client']) == 1)
+        assert received == {'master': ['m0', 'm1', 'm2'], 'client': ['c0']}
+
+    def test_batch_is_queued_in_order(self, server):
+        client, received, _ = server
+
+        batch = [make_update(n + 1, 10, f"b{n}") for n in range(5)]
+        response = client.post("/telegram/master", json=batch, headers=headers('master'))
+
+        assert response.status_code == 200
+        assert wait_for(lambda: len(received['master']) == 5)
+        assert received['master'] == [f"b{n}" for n in range(5)]
+
+    def test_wrong_secret_is_rejected(self, server):
+        client, received, _ = server
+
+        missing = client.post("/telegram/master", json=make_update(1, 10, "x"))
+        wrong = client.post("/telegram/master", json=make_update(2, 10, "x"), headers=headers('master', "other"))
+        # Токен клиентского бота не подходит к вебхуку мастер-бота
+        foreign = client.post("/telegram/master", json=make_update(3, 10, "x"), headers=headers('client'))
+
+        assert [r.status_code for r in (missing, wrong, foreign)] == [403, 403, 403]
+        time.sleep(0.05)
+        assert received['master'] == []
+
+    def test_unknown_bot_and_bad_payload(self, server):
+        client, _, _ = server
+
+        unknown = client.post("/telegram/other", json=make_update(1, 10, "x"), headers=headers('other'))
+        bad_json = client.post("/telegram/master", content=b"not json", headers=headers('master'))
+
+        assert unknown.status_code == 404
+        assert bad_json.status_code == 400
+
+
+class TestMountValidation:
+    """Test the webhook mode refuses to run without a secret"""
+
+    def test_secret_is_required(self):
+        with pytest.raises(ValueError):
+            mount_telegram_webhooks(FastAPI(), {}, "")
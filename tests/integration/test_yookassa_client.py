@@ -0,0 +1,99 @@
+"""Integration tests for async YooKassa client against a local fake server"""
+import asyncio
+import base64
+import time
+
+import pytest
+import pytest_asyncio
+
+from bot.utils import yookassa_api
+
+
+def payment_json(payment_id="pay_1", status="pending"):
+    return {
+        'id': payment_id, 'status': status, 'paid': status == 'succeeded',
+        'amount': {'value': '299.00', 'currency': 'RUB'},
+        'confirmation': {'type': 'redirect', 'confirmation_url': f'https://yookassa.test/{payment_id}'}
+    }
+
+
+@pytest_asyncio.fixture
+async def yookassa(stub_http_server, monkeypatch):
+    """Подменить адрес ЮKassa на локальный сервер"""
+    def start(handler):
+        server = stub_http_server(handler)
+        monkeypatch.setattr(yookassa_api, "YOOKASSA_API_URL", server.url + "/v3/payments")
+        monkeypatch.setattr(yookassa_api, "YOOKASSA_SHOP_ID", "shop")
+        monkeypatch.setattr(yookassa_api, "YOOKASSA_SECRET_KEY", "secret")
+        monkeypatch.setattr(yookassa_api, "RETRY_BACKOFF", 0.01)
+        return server
+
+    await yookassa_api.close_http_client()
+    yield start
+    await yookassa_api.close_http_client()
+
+
+class TestAsyncYooKassaClient:
+    """Test pooled client with retries and idempotence"""
+
+    @pytest.mark.asyncio
+    async def test_create_payment_retries_with_same_idempotence_key(self, yookassa):
+        responses = [(503, {}), (500, {}), (200, payment_json())]
+        server = yookassa(lambda request: responses.pop(0))
+
+        payment = await yookassa_api.create_premium_payment(7, "https://t.me/test_bot")
+
+        assert payment['id'] == 'pay_1'
+        assert len(server.requests) == 3
+        keys = {r['headers']['Idempotence-Key'] for r in server.requests}
+        assert len(keys) == 1
+        request = server.requests[0]
+        assert request['method'] == 'POST'
+        assert request['path'] == '/v3/payments'
+        assert request['json']['metadata'] == {'master_id': '7', 'subscription_type': 'premium'}
+        assert request['headers']['Authorization'] == 'Basic ' + base64.b64encode(b'shop:secret').decode()
+
+    @pytest.mark.asyncio
+    async def test_client_error_is_not_retried(self, yookassa):
+        server = yookassa(lambda request: (400, {'type': 'error', 'code': 'invalid_request'}))
+
+        assert await yookassa_api.create_payment(10, "test", "https://t.me/x", 1) is None
+        assert len(server.requests) == 1
+
+    @pytest.mark.asyncio
+    async def test_gives_up_after_max_retries(self, yookassa, monkeypatch):
+        monkeypatch.setattr(yookassa_api, "MAX_RETRIES", 2)
+        server = yookassa(lambda request: (502, {}))
+
+        assert await yookassa_api.get_payment_status("pay_1") is None
+        assert len(server.requests) == 3
+
+    @pytest.mark.asyncio
+    async def test_concurrent_status_polls_share_one_request(self, yookassa):
+        def handle(request):
+            time.sleep(0.1)
+            return 200, payment_json(request['path'].rsplit('/', 1)[-1], 'succeeded')
+        server = yookassa(handle)
+
+        results = await asyncio.gather(*[yookassa_api.get_payment_status("pay_9") for _ in range(4)])
+
+        assert all(r['status'] == 'succeeded' for r in results)
+        assert [r['path'] for r in server.requests] == ['/v3/payments/pay_9']
+
+    @pytest.mark.asyncio
+    async def test_connection_is_reused(self, yookassa):
+        yookassa(lambda request: (200, payment_json()))
+
+        await yookassa_api.get_payment_status("pay_1")
+        client = yookassa_api.get_http_client()
+        await yookassa_api.get_payment_status("pay_2")
+
+        assert yookassa_api.get_http_client() is client
+
+    @pytest.mark.asyncio
+    async def test_missing_secret_key_skips_request(self, yookassa, monkeypatch):
+        server = yookassa(lambda request: (200, payment_json()))
+        monkeypatch.setattr(yookassa_api, "YOOKASSA_SECRET_KEY", "")
+
+        assert await yookassa_api.get_payment_status("pay_1") is None
+        assert server.requests == []
@@ -0,0 +1,124 @@
+"""Unit tests for admin broadcasts"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import Forbidden
+
+from bot.database.db import get_session, create_broadcast, get_broadcast, cancel_broadcast
+from bot.database.models import MasterAccount, User
+from bot.utils import broadcast as broadcast_module
+from bot.utils.broadcast import run_broadcast, start_broadcast, stop_broadcasts
+
+
+class FakeBot:
+    def __init__(self, blocked=(), on_send=None):
+        self.sent = []
+        self.blocked = set(blocked)
+        self.on_send = on_send
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if chat_id in self.blocked:
+            raise Forbidden("bot was blocked by the user")
+        self.sent.append(chat_id)
+        if self.on_send:
+            self.on_send(len(self.sent))
+
+
+@pytest.fixture
+def recipients(memory_db, monkeypatch):
+    monkeypatch.setattr(broadcast_module, 'BROADCAST_PAGE_SIZE', 3)
+    monkeypatch.setattr(broadcast_module, 'BROADCAST_CHECKPOINT_EVERY', 2)
+    with get_session() as session:
+        session.add_all([User(telegram_id=1000 + i) for i in range(7)])
+        session.add_all([
+            MasterAccount(telegram_id=1, name="Active"),
+            MasterAccount(telegram_id=2, name="Blocked", is_blocked=True),
+        ])
+
+
+def _create(audience, text="Новости"):
+    with get_session() as session:
+        return create_broadcast(session, audience, text, created_by=42).id
+
+
+def _progress(broadcast_id):
+    with get_session() as session:
+        broadcast = get_broadcast(session, broadcast_id)
+        return broadcast.status, broadcast.sent, broadcast.failed
+
+
+class TestRunBroadcast:
+    """Test fan-out, failure counting and resumable progress"""
+
+    @pytest.mark.asyncio
+    async def test_sends_to_all_clients(self, recipients):
+        broadcast_id = _create('clients')
+        bot = FakeBot(blocked={1003})
+
+        assert await run_broadcast(broadcast_id, bot, rate=1000) == 'done'
+
+        assert bot.sent == [1000, 1001, 1002, 1004, 1005, 1006]
+        assert _progress(broadcast_id) == ('done', 6, 1)
+
+    @pytest.mark.asyncio
+    async def test_blocked_masters_are_skipped(self, recipients):
+        broadcast_id = _create('masters')
+        bot = FakeBot()
+
+        await run_broadcast(broadcast_id, bot, rate=1000)
+
+        assert bot.sent == [1]
+        with get_session() as session:
+            assert get_broadcast(session, broadcast_id).total == 1
+
+    @pytest.mark.asyncio
+    async def test_resumes_from_checkpoint(self, recipients):
+        broadcast_id = _create('clients')
+
+        def stop_after_four(sent):
+            if sent == 4:
+                with get_session() as session:
+                    cancel_broadcast(session, broadcast_id)
+
+        first = FakeBot(on_send=stop_after_four)
+        assert await run_broadcast(broadcast_id, first, rate=1000) == 'cancelled'
+        assert first.sent == [1000, 1001, 1002, 1003]
+
+        # Как после перезапуска: продолжаем с сохраненной контрольной точки
+        with get_session() as session:
+            get_broadcast(session, broadcast_id).status = 'running'
+        second = FakeBot()
+        assert await run_broadcast(broadcast_id, second, rate=1000) == 'done'
+
+        assert second.sent == [1004, 1005, 1006]
+        assert _progress(broadcast_id) == ('done', 7, 0)
+
+    @pytest.mark.asyncio
+    async def test_finished_broadcast_is_not_rerun(self, recipients):
+        broadcast_id = _create('clients')
+        await run_broadcast(broadcast_id, FakeBot(), rate=1000)
+        bot = FakeBot()
+
+        assert await run_broadcast(broadcast_id, bot, rate=1000) == 'done'
+        assert bot.sent == []
+
+    @pytest.mark.asyncio
+    async def test_stop_saves_checkpoint_for_resume(self, recipients, monkeypatch):
+        broadcast_id = _create('clients')
+        three_sent = asyncio.Event()
+        bot = FakeBot(on_send=lambda sent: sent == 3 and three_sent.set())
+        monkeypatch.setattr(broadcast_module, 'get_broadcast_bot', lambda audience, master_bot=None: bot)
+
+        assert start_broadcast(SimpleNamespace(bot=None), broadcast_id, 'clients')
+        await asyncio.wait_for(three_sent.wait(), timeout=5)
+        assert await stop_broadcasts() == 1
+
+        # Контрольная точка сохранена при остановке, рассылка ждет следующего запуска
+        assert bot.sent == [1000, 1001, 1002]
+        assert _progress(broadcast_id) == ('running', 3, 0)
+        assert not broadcast_module._tasks
+
+        second = FakeBot()
+        assert await run_broadcast(broadcast_id, second, rate=1000) == 'done'
+        assert second.sent == [1003, 1004, 1005, 1006]
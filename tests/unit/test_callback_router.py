@@ -0,0 +1,115 @@
+"""Unit tests for the prefix-trie callback router"""
+from datetime import datetime, timezone
+
+import pytest
+from telegram import CallbackQuery, Chat, Message, Update, User
+from telegram.ext import Application, ExtBot
+
+from bot.utils.callback_router import CallbackRouter
+
+
+async def noop(update, context):
+    return None
+
+
+async def other(update, context):
+    return None
+
+
+class OfflineBot(ExtBot):
+    async def _do_post(self, endpoint, data, *args, **kwargs):
+        if endpoint == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Router', 'username': 'router_bot'}
+        return True
+
+
+def make_callback_update(data: str) -> Update:
+    user = User(id=5, first_name='U', is_bot=False)
+    message = Message(message_id=1, date=datetime.now(timezone.utc), chat=Chat(id=5, type=Chat.PRIVATE))
+    return Update(update_id=1, callback_query=CallbackQuery(
+        id='1', from_user=user, chat_instance='test', message=message, data=data
+    ))
+
+
+class TestResolve:
+    """Разбор callback_data по шаблонам"""
+
+    def test_literals_and_typed_arguments(self):
+        router = CallbackRouter([
+            ('portfolio_delete', noop),
+            ('portfolio_delete_confirm_<int>', other),
+            ('schedule_delete_temp_<int>_<int>', noop),
+            ('admin_set_sub_<int>_<free|basic|premium>', other),
+            ('premium_check_<rest>', noop),
+        ])
+
+        assert router.resolve('portfolio_delete') == (noop, [])
+        assert router.resolve('portfolio_delete_confirm_12') == (other, [12])
+        assert router.resolve('schedule_delete_temp_3_0') == (noop, [3, 0])
+        assert router.resolve('admin_set_sub_7_basic') == (other, [7, 'basic'])
+        assert router.resolve('premium_check_2c1f-ab_9') == (noop, ['2c1f-ab_9'])
+
+        for data in ('portfolio_delete_confirm_x', 'portfolio_delete_confirm_', 'admin_set_sub_7_gold',
+                     'premium_check_', 'portfolio', 'unknown'):
+            assert router.resolve(data) is None, data
+
+    def test_literal_wins_over_argument(self):
+        router = CallbackRouter([
+            ('service_category_<int>', noop),
+            ('service_category_custom', other),
+            ('service_category_<str>', noop),
+            ('service_portfolio_<int>', noop),
+            ('service_portfolio_add_<int>', other),
+        ])
+
+        assert router.resolve('service_category_custom') == (other, [])
+        assert router.resolve('service_category_15') == (noop, [15])
+        assert router.resolve('service_category_nails') == (noop, ['nails'])
+        assert router.resolve('service_portfolio_add_4') == (other, [4])
+
+    def test_duplicate_and_invalid_patterns(self):
+        router = CallbackRouter([('master_menu', noop)])
+        with pytest.raises(ValueError):
+            router.add('master_menu', other)
+        with pytest.raises(ValueError):
+            router.add('edit_<float>', noop)
+        with pytest.raises(ValueError):
+            router.add('a_<rest>_b', noop)
+
+
+class TestDispatch:
+    """Маршрутизатор как обработчик Application"""
+
+    @pytest.mark.asyncio
+    async def test_arguments_passed_in_context(self):
+        calls = []
+
+        async def edit_service(update, context):
+            calls.append(('edit', context.args))
+
+        async def master_menu(update, context):
+            calls.append(('menu', context.args))
+
+        application = Application.builder().bot(OfflineBot(token='1:router')).updater(None).build()
+        application.add_handler(CallbackRouter([('edit_service_<int>', edit_service), ('master_menu', master_menu)]))
+
+        async with application:
+            for data in ('edit_service_42', 'master_menu', 'edit_service_x'):
+                await application.process_update(make_callback_update(data))
+
+        assert calls == [('edit', [42]), ('menu', [])]
+
+    def test_master_route_tables(self):
+        from bot.handlers import admin
+        from bot.handlers.master import menu, schedule, services
+
+        modules = (menu, services, schedule, admin)
+        navigation = CallbackRouter.from_modules(modules, 'NAVIGATION_ROUTES')
+        routes = CallbackRouter.from_modules(modules)
+
+        assert navigation.resolve('master_services')[0] is services.master_services
+        assert routes.resolve('master_services') is None
+        assert routes.resolve('edit_service_3') == (services.edit_service, [3])
+        assert routes.resolve('service_category_predef_nails') == (services.service_category_selected, ['nails'])
+        assert routes.resolve('schedule_delete_temp_1_2') == (schedule.schedule_delete_temp_period, [1, 2])
+        assert routes.resolve('admin_set_sub_5_premium')[1] == [5, 'premium']
@@ -0,0 +1,98 @@
+"""Unit tests for pre-generated template description library"""
+import pytest
+
+from bot.database.db import get_session, get_template_descriptions
+from bot.utils import description_library, openai_client
+from bot.utils.cache import CacheManager
+
+
+@pytest.fixture
+def fake_api(memory_db, monkeypatch):
+    """Подменить запрос к API, записывая вызовы"""
+    calls = []
+
+    async def fake_request(service_name, retry_count):
+        calls.append((service_name, retry_count))
+        return f"{service_name} #{retry_count}"
+
+    monkeypatch.setattr(openai_client, "_request_description", fake_request)
+    CacheManager.clear()
+    yield calls
+    CacheManager.clear()
+
+
+class TestDescriptionLibrary:
+    """Test offline generation and serving of template descriptions"""
+
+    def test_template_names_are_unique(self):
+        names = description_library.get_template_names()
+        assert len(names) == len(set(names))
+        assert "Маникюр + гель-лак" in names
+        assert description_library.is_template_name("  маникюр +  гель-лак")
+        assert not description_library.is_template_name("Мой авторский маникюр")
+
+    @pytest.mark.asyncio
+    async def test_build_stores_variations_and_skips_existing(self, fake_api):
+        templates = len(description_library.get_template_names())
+
+        first = await description_library.build_description_library(variations=2)
+        second = await description_library.build_description_library(variations=2)
+
+        assert first == {'templates': templates, 'generated': templates * 2, 'skipped': 0, 'failed': 0}
+        assert second == {'templates': templates, 'generated': 0, 'skipped': templates * 2, 'failed': 0}
+        assert len(fake_api) == templates * 2
+        with get_session() as session:
+            stored = get_template_descriptions(session, "маникюр + гель-лак")
+            assert [entry.variation for entry in stored] == [0, 1]
+
+    @pytest.mark.asyncio
+    async def test_templates_served_from_library_without_api(self, fake_api):
+        await description_library.build_description_library(variations=2)
+        fake_api.clear()
+
+        first = await openai_client.generate_service_description("Маникюр + гель-лак", 0, master_id=1)
+        second = await openai_client.generate_service_description("Маникюр + гель-лак", 1, master_id=1)
+        third = await openai_client.generate_service_description("Маникюр + гель-лак", 2, master_id=1)
+
+        assert first == "Маникюр + гель-лак #0"
+        assert second == "Маникюр + гель-лак #1"
+        assert third == first
+        assert fake_api == []
+
+    @pytest.mark.asyncio
+    async def test_custom_names_use_live_api(self, fake_api):
+        await description_library.build_description_library(variations=1)
+        fake_api.clear()
+
+        description = await openai_client.generate_service_description("Мой авторский маникюр", master_id=1)
+
+        assert description == "Мой авторский маникюр #0"
+        assert fake_api == [("Мой авторский маникюр", 0)]
+
+    @pytest.mark.asyncio
+    async def test_failed_generations_are_reported(self, memory_db, monkeypatch):
+        async def failing_request(service_name, retry_count):
+            return None
+        monkeypatch.setattr(openai_client, "_request_description", failing_request)
+
+        stats = await description_library.build_description_library(variations=1)
+
+        assert stats['generated'] == 0
+        assert stats['failed'] == stats['templates']
+
+    @pytest.mark.asyncio
+    async def test_force_keeps_descriptions_when_generation_fails(self, fake_api, monkeypatch):
+        await description_library.build_description_library(variations=1)
+
+        async def flaky_request(service_name, retry_count):
+            return None if service_name == "Маникюр + гель-лак" else f"{service_name} new"
+        monkeypatch.setattr(openai_client, "_request_description", flaky_request)
+
+        stats = await description_library.build_description_library(variations=1, force=True)
+
+        assert stats['failed'] == 1 and stats['generated'] == stats['templates'] - 1
+        with get_session() as session:
+            assert [e.description for e in get_template_descriptions(session, "маникюр + гель-лак")] == [
+                "Маникюр + гель-лак #0"
+            ]
+            assert [e.description for e in get_template_descriptions(session, "стрижка женская")] == ["Стрижка женская new"]
@@ -0,0 +1,67 @@
+"""Unit tests for master notification digests"""
+from datetime import datetime, timedelta
+
+from bot.database.db import get_session, enqueue_notification
+from bot.database.models import NotificationOutbox
+from bot.utils import digest
+from bot.utils.digest import (
+    build_master_digests,
+    get_digest_release_time,
+    next_notification_mode,
+)
+
+
+def _rows(status):
+    with get_session() as session:
+        return [(row.chat_id, row.text) for row in session.query(NotificationOutbox).filter_by(status=status)]
+
+
+class TestReleaseTime:
+    def test_instant_is_not_held(self):
+        assert get_digest_release_time('instant') is None
+        assert get_digest_release_time(None) is None
+
+    def test_hourly_releases_at_next_hour(self):
+        assert get_digest_release_time('hourly', datetime(2025, 1, 6, 10, 15)) == datetime(2025, 1, 6, 11, 0)
+
+    def test_daily_releases_within_a_day(self):
+        now = datetime.utcnow()
+        release = get_digest_release_time('daily', now)
+
+        assert now < release <= now + timedelta(days=1)
+        assert release.minute == 0
+
+    def test_mode_cycle(self):
+        assert [next_notification_mode(m) for m in ('instant', 'hourly', 'daily', None)] == \
+            ['hourly', 'daily', 'instant', 'hourly']
+
+
+class TestBuildDigests:
+    """Test grouping held notifications into one message per master"""
+
+    def test_groups_due_entries_per_master(self, memory_db):
+        now = datetime.utcnow()
+        with get_session() as session:
+            for i in range(3):
+                enqueue_notification(session, 1, f"line {i}", kind='new_booking', hold_until=now)
+            enqueue_notification(session, 2, "other master", kind='new_booking', hold_until=now)
+            enqueue_notification(session, 3, "not yet", kind='new_booking', hold_until=now + timedelta(hours=1))
+
+        assert build_master_digests(now) == 2
+
+        digests = dict(_rows('pending'))
+        assert set(digests) == {1, 2}
+        assert all(f"line {i}" in digests[1] for i in range(3))
+        assert len(_rows('digested')) == 4
+        assert _rows('held') == [(3, "not yet")]
+        # Повторный проход ничего не собирает
+        assert build_master_digests(now) == 0
+
+    def test_long_digest_is_split(self, memory_db, monkeypatch):
+        monkeypatch.setattr(digest, 'DIGEST_MAX_LENGTH', 60)
+        now = datetime.utcnow()
+        with get_session() as session:
+            for i in range(4):
+                enqueue_notification(session, 1, f"booking line number {i}", hold_until=now)
+
+        assert build_master_digests(now) == 2
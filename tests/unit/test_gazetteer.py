@@ -0,0 +1,150 @@
+"""Unit tests for offline city gazetteer and location resolving"""
+import math
+import random
+
+import pytest
+
+from bot.database.db import get_session, get_geocode_cache
+from bot.database.models import City
+from bot.utils import gazetteer as gazetteer_module
+from bot.utils import geocoding
+from bot.utils.gazetteer import CityGazetteer, EARTH_RADIUS_KM
+
+
+def _haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def _city(name, lat, lon, country='RU'):
+    return {'name_ru': name, 'name_local': name, 'name_en': name,
+            'country_code': country, 'latitude': lat, 'longitude': lon}
+
+
+class TestCityGazetteer:
+    """Test nearest-neighbour lookup"""
+
+    def test_nearest_matches_brute_force(self):
+        rnd = random.Random(42)
+        cities = [_city(f"c{i}", rnd.uniform(-80, 80), rnd.uniform(-180, 180)) for i in range(500)]
+        gaz = CityGazetteer()
+        assert gaz.add_cities(cities) == 500
+
+        for _ in range(200):
+            lat, lon = rnd.uniform(-80, 80), rnd.uniform(-180, 180)
+            expected = min(cities, key=lambda c: _haversine_km(lat, lon, c['latitude'], c['longitude']))
+            found = gaz.nearest(lat, lon, max_distance_km=float('inf'))
+            assert found['name_ru'] == expected['name_ru']
+
+    def test_nearest_respects_city_radius(self):
+        gaz = CityGazetteer()
+        gaz.add_cities([dict(_city("Москва", 55.7558, 37.6173), radius_km=15), _city("Казань", 55.7961, 49.1064)])
+
+        assert gaz.nearest(55.80, 37.70)['name_ru'] == "Москва"  # ~7 км
+        assert gaz.nearest(55.9116, 37.7308) is None  # Мытищи, ~19 км
+        assert gaz.nearest(55.9116, 37.7308, max_distance_km=25)['name_ru'] == "Москва"
+        assert gaz.nearest(55.85, 49.25) is None  # ~11 км, радиус по умолчанию - 8 км
+
+    @pytest.mark.parametrize("lat, lon, expected", [
+        (55.9116, 37.7308, "Мытищи"),
+        (55.7963, 37.9382, "Балашиха"),
+        (55.8970, 37.4297, "Химки"),
+        (59.7230, 30.4106, "Пушкин"),
+        (55.7520, 37.6175, "Москва"),
+        (55.99, 38.20, None),  # между городами-спутниками - в сеть
+    ])
+    def test_bundled_dataset_keeps_satellite_towns_apart(self, lat, lon, expected):
+        from bot.config import CITY_DATASET_PATH
+        gaz = CityGazetteer()
+        gaz.load_dataset(CITY_DATASET_PATH)
+
+        found = gaz.nearest(lat, lon)
+        assert (found and found['name_ru']) == expected
+
+    def test_nearest_across_antimeridian(self):
+        gaz = CityGazetteer()
+        gaz.add_cities([_city("East", 0.0, 179.98), _city("Far", 0.0, 170.0)])
+
+        assert gaz.nearest(0.0, -179.98)['name_ru'] == "East"
+
+    def test_empty_gazetteer_returns_none(self):
+        assert CityGazetteer().nearest(0, 0) is None
+
+    def test_load_dataset_and_dedup(self, tmp_path):
+        path = tmp_path / "cities.csv"
+        path.write_text(
+            "name_ru,name_local,name_en,country_code,latitude,longitude\n"
+            "Минск,Мінск,Minsk,by,53.9006,27.5590\n",
+            encoding='utf-8'
+        )
+        gaz = CityGazetteer()
+        assert gaz.load_dataset(str(path)) == 1
+        assert gaz.load_dataset(str(path)) == 0
+
+        minsk = gaz.nearest(53.91, 27.56)
+        assert minsk['name_local'] == "Мінск"
+        assert minsk['country_code'] == "BY"
+
+    def test_load_dataset_rejects_missing_columns(self, tmp_path):
+        path = tmp_path / "bad.csv"
+        path.write_text("name,lat,lon\nX,1,2\n", encoding='utf-8')
+        with pytest.raises(ValueError):
+            CityGazetteer().load_dataset(str(path))
+
+    def test_bundled_dataset_is_valid(self):
+        from bot.config import CITY_DATASET_PATH
+        gaz = CityGazetteer()
+        assert gaz.load_dataset(CITY_DATASET_PATH) > 0
+
+
+class TestResolveCityFromLocation:
+    """Test local-first resolving with persistent grid cache"""
+
+    @pytest.fixture(autouse=True)
+    def fresh_state(self, memory_db, monkeypatch):
+        monkeypatch.setattr(gazetteer_module, "_gazetteer", None)
+        monkeypatch.setattr("bot.config.CITY_DATASET_PATH", "")
+        geocoding.CITY_NAME_CACHE.clear()
+        with get_session() as session:
+            session.add(City(name_ru="Казань", name_local="Казань", name_en="Kazan",
+                             latitude=55.7961, longitude=49.1064, country_code="RU"))
+        yield
+        geocoding.CITY_NAME_CACHE.clear()
+
+    @pytest.mark.asyncio
+    async def test_resolves_locally_without_network(self, monkeypatch):
+        async def fail(*args):
+            raise AssertionError("network must not be used")
+        monkeypatch.setattr(geocoding, "get_city_from_location_async", fail)
+
+        city = await geocoding.resolve_city_from_location(55.79, 49.12)
+
+        assert city['name_en'] == "Kazan"
+        with get_session() as session:
+            assert get_geocode_cache(session, *geocoding._grid_cell(55.79, 49.12)) is not None
+
+    @pytest.mark.asyncio
+    async def test_network_fallback_result_is_cached(self, monkeypatch):
+        calls = []
+
+        async def fake_lookup(lat, lon):
+            calls.append((lat, lon))
+            return _city("Тикси", 71.64, 128.87)
+        monkeypatch.setattr(geocoding, "get_city_from_location_async", fake_lookup)
+
+        first = await geocoding.resolve_city_from_location(71.64, 128.87)
+        geocoding.CITY_NAME_CACHE.clear()
+        second = await geocoding.resolve_city_from_location(71.641, 128.871)
+
+        assert first['name_ru'] == second['name_ru'] == "Тикси"
+        assert len(calls) == 1
+        # Справочник не растет от единичных ответов Nominatim - промахи обслуживает кэш сетки
+        assert len(gazetteer_module.get_gazetteer()) == 1
+
+    @pytest.mark.asyncio
+    async def test_unknown_location_returns_none(self, monkeypatch):
+        async def not_found(lat, lon):
+            return None
+        monkeypatch.setattr(geocoding, "get_city_from_location_async", not_found)
+        assert await geocoding.resolve_city_from_location(0.0, -30.0) is None
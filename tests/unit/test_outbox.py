@@ -0,0 +1,145 @@
+"""Unit tests for the notification outbox worker"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+from telegram.error import Forbidden, NetworkError, RetryAfter
+
+from bot.database.db import get_session, enqueue_notification
+from bot.database.models import NotificationOutbox
+from bot.handlers.client import format_master_booking_notification
+from bot.utils.outbox import OutboxWorker
+
+
+class FakeBot:
+    def __init__(self, errors=None):
+        self.sent = []
+        self.errors = errors or {}
+
+    async def send_message(self, chat_id, text, **kwargs):
+        queue = self.errors.get(chat_id)
+        if queue:
+            raise queue.pop(0)
+        self.sent.append((chat_id, text))
+
+
+def _enqueue(*chat_ids):
+    with get_session() as session:
+        for chat_id in chat_ids:
+            enqueue_notification(session, chat_id, f"hello {chat_id}")
+
+
+def _statuses():
+    with get_session() as session:
+        return {row.id: (row.status, row.attempts) for row in session.query(NotificationOutbox).all()}
+
+
+class TestOutboxWorker:
+    """Test delivery, retries and pacing"""
+
+    @pytest.mark.asyncio
+    async def test_delivers_pending_notifications(self, memory_db):
+        _enqueue(1, 2)
+        bot = FakeBot()
+        worker = OutboxWorker(bot)
+
+        assert await worker.drain_once() == 2
+
+        assert bot.sent == [(1, "hello 1"), (2, "hello 2")]
+        assert {status for status, _ in _statuses().values()} == {'sent'}
+        assert worker.metrics['sent'] == 2
+        # Повторный проход ничего не отправляет
+        assert await worker.drain_once() == 0
+
+    @pytest.mark.asyncio
+    async def test_no_connection_held_while_sending(self, memory_db):
+        engine = memory_db.kw['bind']
+        connections = {'open': 0}
+        event.listen(engine, 'checkout', lambda *a: connections.__setitem__('open', connections['open'] + 1))
+        event.listen(engine, 'checkin', lambda *a: connections.__setitem__('open', connections['open'] - 1))
+        _enqueue(1, 2)
+        held = []
+
+        class CheckingBot(FakeBot):
+            async def send_message(self, chat_id, text, **kwargs):
+                held.append(connections['open'])
+                await super().send_message(chat_id, text, **kwargs)
+
+        assert await OutboxWorker(CheckingBot()).drain_once() == 2
+        assert held == [0, 0]
+        assert {status for status, _ in _statuses().values()} == {'sent'}
+
+    @pytest.mark.asyncio
+    async def test_not_committed_entries_are_not_sent(self, memory_db):
+        with pytest.raises(RuntimeError):
+            with get_session() as session:
+                enqueue_notification(session, 1, "lost")
+                raise RuntimeError("booking failed")
+
+        assert await OutboxWorker(FakeBot()).drain_once() == 0
+
+    @pytest.mark.asyncio
+    async def test_transient_error_is_retried_with_backoff(self, memory_db):
+        _enqueue(1)
+        bot = FakeBot(errors={1: [NetworkError("timeout")]})
+        worker = OutboxWorker(bot)
+
+        await worker.drain_once()
+        assert list(_statuses().values()) == [('pending', 1)]
+        # Следующая попытка отложена
+        assert await worker.drain_once() == 0
+
+        with get_session() as session:
+            session.query(NotificationOutbox).update({'next_attempt_at': datetime.utcnow()})
+        await worker.drain_once()
+        assert list(_statuses().values()) == [('sent', 1)]
+        assert worker.metrics['retried'] == 1
+
+    @pytest.mark.asyncio
+    async def test_permanent_failures(self, memory_db):
+        _enqueue(1, 2)
+        bot = FakeBot(errors={
+            1: [Forbidden("bot was blocked by the user")],
+            2: [NetworkError("timeout")],
+        })
+        worker = OutboxWorker(bot, max_attempts=1)
+
+        await worker.drain_once()
+
+        assert sorted(_statuses().values()) == [('failed', 0), ('failed', 1)]
+        assert worker.metrics['failed'] == 2
+
+    @pytest.mark.asyncio
+    async def test_retry_after_does_not_count_attempt(self, memory_db):
+        _enqueue(1)
+        worker = OutboxWorker(FakeBot(errors={1: [RetryAfter(30)]}))
+
+        await worker.drain_once()
+
+        with get_session() as session:
+            entry = session.query(NotificationOutbox).one()
+            assert (entry.status, entry.attempts) == ('pending', 0)
+            assert (entry.next_attempt_at - datetime.utcnow()).total_seconds() > 20
+
+    @pytest.mark.asyncio
+    async def test_per_chat_pacing(self, memory_db):
+        _enqueue(1, 1, 2)
+        bot = FakeBot()
+        worker = OutboxWorker(bot, per_chat_interval=60)
+
+        await worker.drain_once()
+
+        assert [chat_id for chat_id, _ in bot.sent] == [1, 2]
+        assert worker.metrics['deferred'] == 1
+        assert sorted(status for status, _ in _statuses().values()) == ['pending', 'sent', 'sent']
+
+
+class TestBookingNotificationText:
+    def test_format(self):
+        text = format_master_booking_notification(
+            "Анна", "Маникюр", datetime(2025, 1, 6, 10, 30), 1500, 'RUB', "Без лака"
+        )
+
+        assert "Анна" in text
+        assert "06.01.2025 10:30 (Понедельник)" in text
+        assert "Без лака" in text
@@ -0,0 +1,135 @@
+"""Unit tests for payment status application and reconciliation"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from bot.database.db import get_session, get_master_by_id, get_payment_by_id
+from bot.database.models import MasterAccount, Payment
+from bot.utils import payments, yookassa_api
+
+
+@pytest.fixture
+def master_id(memory_db):
+    with get_session() as session:
+        master = MasterAccount(telegram_id=2001, name="Payer")
+        session.add(master)
+        session.flush()
+        return master.id
+
+
+def add_payment(master_id, payment_id, age=timedelta(minutes=10), status='pending', next_check_at=None):
+    with get_session() as session:
+        session.add(Payment(
+            master_account_id=master_id, payment_id=payment_id, amount=299.0,
+            status=status, subscription_type='premium',
+            created_at=datetime.utcnow() - age, next_check_at=next_check_at
+        ))
+
+
+@pytest.fixture
+def fake_gateway(monkeypatch):
+    """Подменить запрос статуса в ЮKassa"""
+    statuses = {}
+    calls = []
+
+    async def fake_status(payment_id):
+        calls.append(payment_id)
+        status = statuses.get(payment_id)
+        return {'id': payment_id, 'status': status, 'paid': status == 'succeeded'} if status else None
+
+    monkeypatch.setattr(yookassa_api, "get_payment_status", fake_status)
+    return statuses, calls
+
+
+class TestApplyPaymentStatus:
+    """Test idempotent status transitions"""
+
+    def test_success_activates_subscription_once(self, master_id):
+        add_payment(master_id, "p1")
+
+        with get_session() as session:
+            assert payments.apply_payment_status(session, "p1", "succeeded", paid=True)
+            first_expiry = get_master_by_id(session, master_id).subscription_expires_at
+            # Повторное уведомление ничего не меняет
+            assert not payments.apply_payment_status(session, "p1", "succeeded", paid=True)
+
+            master = get_master_by_id(session, master_id)
+            assert master.subscription_level == 'premium'
+            assert master.subscription_expires_at == first_expiry
+            payment = get_payment_by_id(session, "p1")
+            assert payment.status == 'succeeded'
+            assert payment.paid_at is not None
+
+    def test_cancel_and_pending_statuses(self, master_id):
+        add_payment(master_id, "p2")
+
+        with get_session() as session:
+            assert not payments.apply_payment_status(session, "p2", "pending")
+            assert not payments.apply_payment_status(session, "p2", "succeeded", paid=False)
+            assert payments.apply_payment_status(session, "p2", "canceled")
+            assert get_payment_by_id(session, "p2").status == 'canceled'
+            assert get_master_by_id(session, master_id).subscription_level == 'free'
+
+    def test_unknown_payment_is_ignored(self, master_id):
+        with get_session() as session:
+            assert not payments.apply_payment_status(session, "missing", "succeeded", paid=True)
+
+
+class TestReconcilePendingPayments:
+    """Test batch polling of stale pending payments with backoff"""
+
+    @pytest.mark.asyncio
+    async def test_polls_only_stale_due_payments(self, master_id, fake_gateway):
+        statuses, calls = fake_gateway
+        add_payment(master_id, "fresh", age=timedelta(minutes=1))
+        add_payment(master_id, "stale")
+        add_payment(master_id, "later", next_check_at=datetime.utcnow() + timedelta(hours=1))
+        add_payment(master_id, "done", status='succeeded')
+        add_payment(master_id, "ancient", age=timedelta(days=3))
+        statuses["stale"] = "succeeded"
+
+        stats = await payments.reconcile_pending_payments()
+
+        assert calls == ["stale"]
+        assert stats == {'expired': 1, 'checked': 1, 'updated': 1}
+        with get_session() as session:
+            assert get_payment_by_id(session, "stale").status == 'succeeded'
+            assert get_payment_by_id(session, "ancient").status == payments.EXPIRED_STATUS
+            assert get_master_by_id(session, master_id).subscription_level == 'premium'
+
+    @pytest.mark.asyncio
+    async def test_backoff_grows_between_checks(self, master_id, fake_gateway):
+        statuses, calls = fake_gateway
+        add_payment(master_id, "slow")
+        statuses["slow"] = "pending"
+
+        await payments.reconcile_pending_payments()
+        await payments.reconcile_pending_payments()
+        assert calls == ["slow"]
+
+        with get_session() as session:
+            payment = get_payment_by_id(session, "slow")
+            assert payment.check_attempts == 1
+            delay = payment.next_check_at - datetime.utcnow()
+            assert timedelta(seconds=50) < delay <= payments.RECONCILE_BASE_DELAY
+            payment.next_check_at = datetime.utcnow() - timedelta(seconds=1)
+
+        await payments.reconcile_pending_payments()
+        with get_session() as session:
+            payment = get_payment_by_id(session, "slow")
+            assert payment.check_attempts == 2
+            assert payment.next_check_at - datetime.utcnow() > payments.RECONCILE_BASE_DELAY
+
+    def test_backoff_is_capped(self):
+        assert payments.next_check_delay(0) == payments.RECONCILE_BASE_DELAY
+        assert payments.next_check_delay(100) == payments.RECONCILE_MAX_DELAY
+
+    @pytest.mark.asyncio
+    async def test_manual_refresh_respects_schedule(self, master_id, fake_gateway):
+        statuses, calls = fake_gateway
+        add_payment(master_id, "manual", age=timedelta(seconds=30))
+        statuses["manual"] = "pending"
+
+        assert await payments.refresh_payment_status("manual") == 'pending'
+        assert await payments.refresh_payment_status("manual") == 'pending'
+        assert calls == ["manual"]
@@ -0,0 +1,173 @@
+"""Unit tests for the database-backed PTB persistence"""
+import asyncio
+import time
+from datetime import datetime, timezone
+
+import pytest
+from telegram import Chat, Message, MessageEntity, Update, User
+from telegram.ext import (
+    Application, CommandHandler, ConversationHandler, ExtBot, MessageHandler, filters
+)
+
+from bot.database.db import get_session
+from bot.database.models import PersistenceEntry
+from bot.utils import persistence as persistence_module
+from bot.utils.persistence import DatabasePersistence, decode_state, encode_state
+
+WAITING_NAME = 1
+
+
+class OfflineBot(ExtBot):
+    async def _do_post(self, endpoint, data, *args, **kwargs):
+        if endpoint == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Persist', 'username': 'persist_bot'}
+        return True
+
+
+def make_update(update_id, user_id, text):
+    entities = [MessageEntity(MessageEntity.BOT_COMMAND, 0, len(text))] if text.startswith('/') else None
+    message = Message(
+        message_id=update_id,
+        date=datetime.now(timezone.utc),
+        chat=Chat(id=user_id, type=Chat.PRIVATE),
+        from_user=User(id=user_id, first_name="U", is_bot=False),
+        text=text,
+        entities=entities
+    )
+    return Update(update_id=update_id, message=message).to_dict()
+
+
+async def start(update, context):
+    context.user_data['started'] = True
+    return WAITING_NAME
+
+
+async def receive_name(update, context):
+    context.user_data['name'] = update.message.text
+    return ConversationHandler.END
+
+
+def build_application():
+    application = (
+        Application.builder()
+        .bot(OfflineBot(token="1:persist"))
+        .updater(None)
+        .persistence(DatabasePersistence('master', update_interval=60))
+        .build()
+    )
+    application.add_handler(ConversationHandler(
+        entry_points=[CommandHandler("start", start)],
+        states={WAITING_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_name)]},
+        fallbacks=[],
+        name="registration",
+        persistent=True
+    ))
+    return application
+
+
+async def process(application, *updates):
+    """Обработать апдейты в запущенном Application и остановить его (stop передает изменения в persistence)"""
+    await application.start()
+    for data in updates:
+        await application.process_update(Update.de_json(data, application.bot))
+    await application.stop()
+
+
+class TestEncoding:
+    """Test the compact serialization"""
+
+    def test_roundtrip_and_compression(self):
+        small = {'name': 'Мария'}
+        large = {'draft': {'description': 'Маникюр ' * 200, 'photos': list(range(50))}}
+
+        assert decode_state(encode_state(small)) == small
+        encoded = encode_state(large)
+        assert encoded[:1] == b'z'
+        assert decode_state(encoded) == large
+        assert encode_state({}) is None
+        assert encode_state(None) is None
+
+
+class TestDatabasePersistence:
+    """Test state survives a restart and is written in batches"""
+
+    @pytest.mark.asyncio
+    async def test_conversation_survives_restart(self, memory_db):
+        first = build_application()
+        async with first:
+            await process(first, make_update(1, 10, "/start"))
+        # Остановка Application записывает изменения (flush)
+
+        with get_session() as session:
+            kinds = sorted(row.kind for row in session.query(PersistenceEntry))
+        assert kinds == ['conversation', 'user']
+
+        second = build_application()
+        async with second:
+            assert second.user_data[10] == {'started': True}
+            # Разговор продолжается с сохраненного состояния: текст воспринимается как имя
+            await process(second, make_update(2, 10, "Мария"))
+            assert second.user_data[10]['name'] == "Мария"
+
+        third = build_application()
+        async with third:
+            assert third.user_data[10] == {'started': True, 'name': "Мария"}
+            with get_session() as session:
+                # Завершенный разговор удален из БД
+                assert session.query(PersistenceEntry).filter_by(kind='conversation').count() == 0
+
+    @pytest.mark.asyncio
+    async def test_changes_are_written_in_one_batch(self, memory_db):
+        persistence = DatabasePersistence('client')
+        # Так Application передает изменения одного прохода
+        await asyncio.gather(
+            *[persistence.update_user_data(user_id, {'n': user_id}) for user_id in range(100)],
+            persistence.drop_user_data(5)
+        )
+        await persistence.flush()
+
+        assert persistence.metrics['flushes'] == 1
+        user_data = await DatabasePersistence('client').get_user_data()
+        assert len(user_data) == 99 and user_data[7] == {'n': 7}
+        # Другой бот не видит чужие данные
+        assert await DatabasePersistence('master').get_user_data() == {}
+
+    @pytest.mark.asyncio
+    async def test_failed_flush_keeps_changes(self, memory_db, monkeypatch):
+        persistence = DatabasePersistence('master')
+        original = persistence._write
+        calls = {'n': 0}
+
+        def flaky_write(batch):
+            calls['n'] += 1
+            if calls['n'] == 1:
+                raise RuntimeError("database is locked")
+            return original(batch)
+
+        monkeypatch.setattr(persistence, "_write", flaky_write)
+        await persistence.update_user_data(1, {'old': True})
+        await asyncio.sleep(0.05)
+        assert persistence.metrics['errors'] == 1
+
+        await persistence.update_user_data(2, {'new': True})
+        await persistence.flush()
+
+        assert await DatabasePersistence('master').get_user_data() == {1: {'old': True}, 2: {'new': True}}
+
+    @pytest.mark.asyncio
+    async def test_per_update_cost_within_budget(self, memory_db):
+        """Запоминание изменений и запись пачкой укладываются в бюджет на апдейт"""
+        persistence = DatabasePersistence('master')
+        user_data = {
+            'service_draft': {'title': 'Маникюр', 'price': 1500, 'duration': 60, 'description': 'x' * 300},
+            'schedule_temp': [{'day': day, 'start': '10:00', 'end': '19:00'} for day in range(7)],
+        }
+        updates = 2000
+
+        started = time.perf_counter()
+        for user_id in range(updates):
+            await persistence.update_user_data(user_id, user_data)
+        await persistence.flush()
+        per_update_ms = (time.perf_counter() - started) * 1000 / updates
+
+        assert per_update_ms < persistence_module.PER_UPDATE_BUDGET_MS
@@ -0,0 +1,69 @@
+"""Unit tests for invite QR rendering and caching"""
+import pytest
+
+from bot.database.db import get_session, get_invite_qr, set_invite_qr_file_id
+from bot.database.models import MasterAccount
+from bot.utils import qr_codes
+
+
+@pytest.fixture
+def master_id(memory_db):
+    with get_session() as session:
+        master = MasterAccount(telegram_id=1001, name="Test Master")
+        session.add(master)
+        session.flush()
+        return master.id
+
+
+class TestInviteQRCache:
+    """Test QR rendering happens once per master and deep link"""
+
+    def test_render_qr_png_returns_png(self):
+        png = qr_codes.render_qr_png("https://t.me/test_bot?start=m_1")
+        assert png.startswith(b"\x89PNG")
+
+    @pytest.mark.asyncio
+    async def test_render_is_cached_per_master_and_link(self, master_id):
+        deep_link = "https://t.me/test_bot?start=m_%d" % master_id
+
+        png = await qr_codes.render_invite_qr(master_id, deep_link)
+
+        with get_session() as session:
+            cached_png, file_id = qr_codes.get_cached_invite_qr(session, master_id, deep_link)
+            assert cached_png == png
+            assert file_id is None
+
+            # Другой диплинк - промах кэша
+            other_png, _ = qr_codes.get_cached_invite_qr(session, master_id, deep_link + "_new")
+            assert other_png is None
+
+    @pytest.mark.asyncio
+    async def test_file_id_remembered_and_reset_on_rerender(self, master_id):
+        deep_link = "https://t.me/test_bot?start=m_%d" % master_id
+        await qr_codes.render_invite_qr(master_id, deep_link)
+
+        qr_codes.remember_invite_qr_file_id(master_id, deep_link, "AgACAgIAAxk")
+        with get_session() as session:
+            assert get_invite_qr(session, master_id, deep_link).file_id == "AgACAgIAAxk"
+
+        # Перерисовка сбрасывает file_id - он относится к старому изображению
+        await qr_codes.render_invite_qr(master_id, deep_link)
+        with get_session() as session:
+            assert get_invite_qr(session, master_id, deep_link).file_id is None
+
+    @pytest.mark.asyncio
+    async def test_new_deep_link_replaces_old_entry(self, master_id):
+        await qr_codes.render_invite_qr(master_id, "old_link")
+        await qr_codes.render_invite_qr(master_id, "new_link")
+
+        with get_session() as session:
+            assert get_invite_qr(session, master_id, "old_link") is None
+            assert get_invite_qr(session, master_id, "new_link") is not None
+            assert not set_invite_qr_file_id(session, master_id, "old_link", "x")
+
+    def test_prerender_skips_cached_masters(self, master_id):
+        first = qr_codes.prerender_all_invite_qr(workers=1)
+        second = qr_codes.prerender_all_invite_qr(workers=1)
+
+        assert first == {'total': 1, 'rendered': 1, 'skipped': 0}
+        assert second == {'total': 1, 'rendered': 0, 'skipped': 1}
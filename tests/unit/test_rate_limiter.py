@@ -0,0 +1,105 @@
+"""Unit tests for the outbound Telegram rate limiter"""
+import asyncio
+import time
+
+import pytest
+from telegram.error import RetryAfter
+
+from bot.utils.rate_limiter import (
+    LANE_BULK,
+    LANE_INTERACTIVE,
+    LANE_NOTIFICATION,
+    TelegramRateLimiter,
+    TokenBucket,
+    lane_kwargs,
+)
+
+
+class TestTokenBucket:
+    def test_burst_then_wait(self):
+        bucket = TokenBucket(rate=2, capacity=2)
+        now = bucket.updated_at
+
+        assert bucket.try_acquire(now) == 0
+        assert bucket.try_acquire(now) == 0
+        assert bucket.try_acquire(now) == pytest.approx(0.5)
+        assert bucket.try_acquire(now + 0.5) == 0
+
+
+class TestTelegramRateLimiter:
+    """Test priority lanes, per-chat limits and flood control"""
+
+    @pytest.mark.asyncio
+    async def test_higher_priority_lane_goes_first(self):
+        limiter = TelegramRateLimiter(global_rate=20)
+        limiter._global.tokens = 0
+        order = []
+
+        async def call(name):
+            order.append(name)
+            return True
+
+        requests = [
+            limiter.process_request(call, (lane,), {}, 'sendMessage', {'chat_id': i}, lane)
+            for i, lane in enumerate([LANE_BULK, LANE_NOTIFICATION, LANE_INTERACTIVE])
+        ]
+        await asyncio.gather(*requests)
+
+        assert order == [LANE_INTERACTIVE, LANE_NOTIFICATION, LANE_BULK]
+
+    @pytest.mark.asyncio
+    async def test_per_chat_limit(self):
+        limiter = TelegramRateLimiter(global_rate=1000)
+        sent = []
+
+        async def call():
+            sent.append(time.monotonic())
+            return True
+
+        for _ in range(4):
+            await limiter.process_request(call, (), {}, 'sendMessage', {'chat_id': 1}, None)
+
+        # Три сообщения уходят сразу, четвертое ждет токен личного чата
+        assert sent[3] - sent[0] >= 0.9
+        assert limiter.get_metrics()['throttled'] == 1
+
+    @pytest.mark.asyncio
+    async def test_retry_after_pauses_and_retries(self):
+        limiter = TelegramRateLimiter(global_rate=1000)
+        calls = []
+
+        async def call():
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                raise RetryAfter(1)
+            return True
+
+        assert await limiter.process_request(call, (), {}, 'sendMessage', {'chat_id': 1}, None) is True
+        assert calls[1] - calls[0] >= 0.9
+        assert limiter.get_metrics()['retry_after'] == 1
+
+    @pytest.mark.asyncio
+    async def test_retry_after_is_raised_when_retries_exhausted(self):
+        limiter = TelegramRateLimiter(global_rate=1000, max_retries=0)
+
+        async def call():
+            raise RetryAfter(0)
+
+        with pytest.raises(RetryAfter):
+            await limiter.process_request(call, (), {}, 'sendMessage', {}, LANE_BULK)
+
+    def test_metrics_and_lane_kwargs(self):
+        limiter = TelegramRateLimiter()
+
+        assert limiter.get_metrics()['queue_depth'] == {
+            LANE_INTERACTIVE: 0, LANE_NOTIFICATION: 0, LANE_BULK: 0
+        }
+
+        class PlainBot:
+            pass
+
+        class LimitedBot:
+            rate_limiter = limiter
+
+        assert lane_kwargs(PlainBot(), LANE_BULK) == {}
+        assert lane_kwargs(LimitedBot(), LANE_BULK) == {'rate_limit_args': LANE_BULK}
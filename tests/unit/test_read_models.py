@@ -0,0 +1,96 @@
+"""Unit tests for column-only read models used by listing screens"""
+import dataclasses
+import pickle
+
+import pytest
+from fastapi.testclient import TestClient
+
+from bot.database.db import (
+    add_user_master_link, create_master_account, create_service, create_service_category,
+    get_or_create_city, get_or_create_user, get_session
+)
+from bot.database.read_models import (
+    MasterItem, filter_master_ids_for_client, list_active_services, list_cities, list_city_masters,
+    list_client_masters, load_masters_page
+)
+from bot.utils.cache import CacheManager
+
+
+@pytest.fixture
+def catalog(memory_db):
+    """Город, три мастера (один заблокирован) и клиент с двумя добавленными мастерами"""
+    CacheManager.clear()
+    with get_session() as session:
+        city = get_or_create_city(session, 'Москва', 'Москва', 'Moscow', country_code='RU')
+        anna = create_master_account(session, 101, "Анна", description="Маникюр", city_id=city.id)
+        boris = create_master_account(session, 102, "Борис", city_id=city.id)
+        blocked = create_master_account(session, 103, "Вера", city_id=city.id)
+        blocked.is_blocked = True
+        nails = create_service_category(session, anna.id, "Ногти", emoji="💅")
+        create_service(session, anna.id, "Маникюр", 1500, 60, 0, category_id=nails.id)
+        create_service(session, anna.id, "Педикюр", 2000, 90, 0)
+        create_service(session, boris.id, "Стрижка", 1000, 45, 0).active = False
+        client = get_or_create_user(session, 500)
+        add_user_master_link(session, client, boris)
+        add_user_master_link(session, client, anna)
+        add_user_master_link(session, client, blocked)
+        session.commit()
+        ids = {'city': city.id, 'anna': anna.id, 'boris': boris.id, 'blocked': blocked.id}
+    yield ids
+    CacheManager.clear()
+
+
+class TestListings:
+    """Списки мастеров и услуг"""
+
+    def test_client_masters(self, catalog):
+        with get_session() as session:
+            masters = list_client_masters(session, 500)
+            services = list_active_services(session, [m.id for m in masters])
+
+        assert [(m.name, m.city_name, m.services_count) for m in masters] == [("Борис", 'Москва', 0), ("Анна", 'Москва', 2)]
+        assert [(s.title, s.category_title) for s in services[catalog['anna']]] == [("Маникюр", "Ногти"), ("Педикюр", None)]
+        assert catalog['boris'] not in services
+
+        master = masters[1]
+        assert isinstance(master, MasterItem) and not hasattr(master, '__dict__')
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            master.name = "Другое имя"
+        assert pickle.loads(pickle.dumps(master)) == master
+
+    def test_city_masters_and_search_page(self, catalog):
+        with get_session() as session:
+            assert [m.name for m in list_city_masters(session, catalog['city'])] == ["Анна", "Борис"]
+            assert list_city_masters(session, catalog['city'], exclude_user_telegram_id=500) == []
+
+            all_ids = [catalog['boris'], catalog['blocked'], catalog['anna']]
+            assert filter_master_ids_for_client(session, all_ids, None) == [catalog['anna'], catalog['boris']]
+            assert filter_master_ids_for_client(session, all_ids, 500) == []
+
+            page = load_masters_page(session, all_ids, user_telegram_id=500)
+            assert [(m.name, m.already_added, m.price) for m in page] == [("Борис", True, None), ("Анна", True, None)]
+
+    def test_cities_cached_until_new_city(self, catalog):
+        with get_session() as session:
+            first = list_cities(session)
+            assert list_cities(session) is first
+            get_or_create_city(session, 'Минск', 'Мінск', 'Minsk', country_code='BY')
+            assert [c.name_ru for c in list_cities(session)] == ['Минск', 'Москва']
+
+
+class TestMobileApiListings:
+    """Эндпоинты списков мобильного API"""
+
+    def test_masters_and_cities(self, catalog):
+        from mobile_app.api.main import app
+
+        headers = {'Authorization': 'Bearer 500'}
+        with TestClient(app) as client:
+            masters = client.get('/api/masters', headers=headers).json()
+            cities = client.get('/api/cities').json()
+            city_masters = client.get(f"/api/cities/{catalog['city']}/masters", headers={'Authorization': 'Bearer 1'}).json()
+
+        assert [(m['name'], m['services_count']) for m in masters] == [("Борис", 0), ("Анна", 2)]
+        assert masters[1]['description'] == "Маникюр" and masters[1]['city_name'] == 'Москва'
+        assert cities == [{'id': catalog['city'], 'name_ru': 'Москва', 'name_local': 'Москва', 'name_en': 'Moscow'}]
+        assert [m['name'] for m in city_masters] == ["Анна", "Борис"]
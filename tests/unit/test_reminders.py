@@ -0,0 +1,180 @@
+"""Unit tests for booking reminders on the scheduled_jobs queue"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+from bot.config import BOOKING_REMINDER_OFFSETS_HOURS
+
+from bot.database.db import get_session, create_booking, delete_master
+from bot.database.models import (
+    MasterAccount, NotificationOutbox, ScheduledJob, Service, User
+)
+from bot.utils.reminders import ReminderScheduler, fire_booking_reminders
+
+
+class FakeJob:
+    def __init__(self, callback, when):
+        self.callback = callback
+        self.when = when
+        self.removed = False
+
+    def schedule_removal(self):
+        self.removed = True
+
+
+class FakeJobQueue:
+    def __init__(self):
+        self.jobs = []
+
+    def run_once(self, callback, when, name=None):
+        job = FakeJob(callback, when)
+        self.jobs.append(job)
+        return job
+
+    def run_repeating(self, callback, interval, first=None, name=None):
+        return self.run_once(callback, first)
+
+    @property
+    def active(self):
+        return [job for job in self.jobs if not job.removed]
+
+
+@pytest.fixture
+def booking_factory(memory_db):
+    with get_session() as session:
+        master = MasterAccount(telegram_id=100, name="Мария")
+        user = User(telegram_id=200)
+        session.add_all([master, user])
+        session.flush()
+        service = Service(master_account_id=master.id, title="Маникюр", price=1500, duration_mins=60)
+        session.add(service)
+        session.flush()
+        ids = (user.id, master.id, service.id)
+
+    def create(start_dt):
+        with get_session() as session:
+            booking = create_booking(session, ids[0], ids[1], ids[2], start_dt, start_dt + timedelta(hours=1), 1500)
+            return booking.id
+
+    create.master_id = ids[1]
+    return create
+
+
+def _jobs():
+    with get_session() as session:
+        return [(job.booking_id, job.status) for job in session.query(ScheduledJob).order_by(ScheduledJob.fire_at)]
+
+
+def _outbox():
+    with get_session() as session:
+        return [(row.chat_id, row.bot, row.kind) for row in session.query(NotificationOutbox)]
+
+
+class TestScheduling:
+    """Test that bookings create their reminder jobs"""
+
+    def test_booking_creates_reminders(self, booking_factory):
+        booking_id = booking_factory(datetime.now() + timedelta(days=3))
+
+        assert _jobs() == [(booking_id, 'pending'), (booking_id, 'pending')]
+
+    def test_past_offsets_are_not_scheduled(self, booking_factory):
+        booking_factory(datetime.now() + timedelta(hours=5))
+
+        assert len(_jobs()) == 1
+
+    def test_aware_start_is_converted_to_server_time(self, booking_factory):
+        start = (datetime.now() + timedelta(days=3)).astimezone(timezone.utc)
+        booking_factory(start)
+
+        with get_session() as session:
+            fire_at = [job.fire_at for job in session.query(ScheduledJob).order_by(ScheduledJob.fire_at)]
+        local_start = start.astimezone().replace(tzinfo=None)
+        assert fire_at[-1] == local_start - timedelta(hours=min(BOOKING_REMINDER_OFFSETS_HOURS))
+
+    def test_mobile_api_booking_with_utc_time(self, booking_factory):
+        from mobile_app.api.main import app
+
+        with get_session() as session:
+            service_id = session.query(Service.id).scalar()
+        start = (datetime.utcnow() + timedelta(days=3)).replace(microsecond=0)
+        with TestClient(app) as client:
+            response = client.post('/api/bookings', headers={'Authorization': 'Bearer 200'}, json={
+                'master_id': booking_factory.master_id, 'service_id': service_id,
+                'start_datetime': start.isoformat() + 'Z',
+            })
+
+        assert response.status_code == 200, response.text
+        assert len(_jobs()) == len(BOOKING_REMINDER_OFFSETS_HOURS)
+
+    def test_deleting_master_removes_jobs(self, booking_factory):
+        booking_factory(datetime.now() + timedelta(days=3))
+
+        with get_session() as session:
+            assert delete_master(session, booking_factory.master_id)
+        assert _jobs() == []
+
+
+class TestFiring:
+    """Test the exactly-once handoff to the outbox"""
+
+    def test_fires_into_client_outbox_once(self, booking_factory):
+        booking_factory(datetime.now() + timedelta(hours=5))
+        with get_session() as session:
+            job_id = session.query(ScheduledJob.id).scalar()
+
+        assert fire_booking_reminders([job_id]) == 1
+        # Повторное срабатывание (например, после перезапуска) ничего не дублирует
+        assert fire_booking_reminders([job_id]) == 0
+        assert _outbox() == [(200, 'client', 'booking_reminder')]
+
+    def test_started_booking_is_skipped(self, booking_factory):
+        booking_factory(datetime.now() + timedelta(hours=5))
+        with get_session() as session:
+            job_id = session.query(ScheduledJob.id).scalar()
+
+        assert fire_booking_reminders([job_id], now=datetime.now() + timedelta(hours=6)) == 0
+        assert _jobs()[0][1] == 'skipped'
+        assert _outbox() == []
+
+
+class TestReminderScheduler:
+    """Test the in-memory window over scheduled_jobs"""
+
+    def test_loads_only_next_window(self, booking_factory):
+        now = datetime.now()
+        booking_factory(now + timedelta(hours=2, minutes=30))  # Напоминание через 30 минут
+        booking_factory(now + timedelta(days=5))
+        queue = FakeJobQueue()
+
+        scheduler = ReminderScheduler(queue)
+        scheduler.refill(now)
+
+        assert len(scheduler._heap) == 1
+        assert queue.active[0].when == pytest.approx(30 * 60, abs=1)
+
+    def test_fire_due_batches_and_refills(self, booking_factory):
+        now = datetime.now()
+        for hours in (3, 3.5, 4):
+            booking_factory(now + timedelta(hours=hours))
+        scheduler = ReminderScheduler(FakeJobQueue(), window=timedelta(hours=4), heap_limit=2, batch_size=1)
+        scheduler.refill(now)
+        assert len(scheduler._heap) == 2
+
+        assert scheduler.fire_due(now + timedelta(hours=2, minutes=1)) == 3
+        assert [status for _, status in _jobs()] == ['done', 'done', 'done']
+        assert len(_outbox()) == 3
+
+    def test_restart_does_not_duplicate(self, booking_factory):
+        booking_factory(datetime.now() + timedelta(hours=2, seconds=1))
+        now = datetime.now() + timedelta(seconds=2)
+
+        first = ReminderScheduler(FakeJobQueue())
+        first.refill(now)
+        first.fire_due(now)
+        second = ReminderScheduler(FakeJobQueue())
+        second.refill(now)
+
+        assert second._heap == []
+        assert len(_outbox()) == 1
@@ -0,0 +1,144 @@
+"""Unit tests for running both bots and the API in one process"""
+import asyncio
+import time
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from telegram import Chat, Message, Update, User
+from telegram.ext import Application, ExtBot, TypeHandler
+
+from bot.runner import build_applications, mount_applications, start_applications, stop_applications
+
+
+class OfflineBot(ExtBot):
+    """Бот без сети: getUpdates отдает заранее подготовленные апдейты"""
+
+    def __init__(self, *args, updates=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pending = list(updates)
+
+    async def _do_post(self, endpoint, data, *args, **kwargs):
+        if endpoint == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Runner', 'username': 'runner_bot'}
+        if endpoint == 'getUpdates':
+            if not self._pending:
+                await asyncio.sleep(0.05)
+                return []
+            pending, self._pending = self._pending, []
+            return pending
+        return True
+
+
+def make_update(update_id, user_id, text):
+    message = Message(
+        message_id=update_id,
+        date=datetime.now(timezone.utc),
+        chat=Chat(id=user_id, type=Chat.PRIVATE),
+        from_user=User(id=user_id, first_name=f"user{user_id}", is_bot=False),
+        text=text
+    )
+    return Update(update_id=update_id, message=message).to_dict()
+
+
+def build(events, received, updates=None):
+    """Два приложения, записывающие шаги своего жизненного цикла в events"""
+    applications = {}
+    for name in ('master', 'client'):
+        async def handler(update, context, name=name):
+            received.append((name, update.message.text))
+
+        async def post_init(application, name=name):
+            events.append(f"init_{name}")
+
+        async def post_stop(application, name=name):
+            events.append(f"stop_{name}")
+
+        async def post_shutdown(application, name=name):
+            events.append(f"shutdown_{name}")
+
+        application = (
+            Application.builder()
+            .bot(OfflineBot(token=f"1:{name}", updates=(updates or {}).get(name, ())))
+            .post_init(post_init)
+            .post_stop(post_stop)
+            .post_shutdown(post_shutdown)
+            .build()
+        )
+        application.add_handler(TypeHandler(Update, handler))
+        applications[name] = application
+    return applications
+
+
+class TestLifecycle:
+    """Test start/stop ordering across both applications"""
+
+    @pytest.mark.asyncio
+    async def test_start_and_stop_order(self):
+        events = []
+        applications = build(events, [])
+
+        await start_applications(applications, mode='polling')
+        assert all(application.running for application in applications.values())
+        assert all(application.updater.running for application in applications.values())
+
+        await stop_applications(applications)
+        # Соединения закрываются только после того, как остановились оба бота
+        assert events == ['init_master', 'init_client', 'stop_client', 'stop_master',
+                          'shutdown_client', 'shutdown_master']
+        assert not any(application.updater.running for application in applications.values())
+
+
+class TestBuildApplications:
+    """Test each bot gets its own Bot API connection pool"""
+
+    def test_requests_are_not_shared(self, monkeypatch):
+        from telegram.request import HTTPXRequest
+        from bot import config
+
+        monkeypatch.setattr(config, 'BOT_TOKEN', '1:master')
+        monkeypatch.setattr(config, 'CLIENT_BOT_TOKEN', '2:client')
+        created = []
+
+        def request_factory():
+            created.append(HTTPXRequest())
+            return created[-1]
+
+        applications = build_applications(request_factory, webhook=True)
+
+        # Application.shutdown() закрывает request своего бота - общий пул закрылся бы раньше времени
+        assert len(created) == 2
+        assert [application.bot.request for application in applications.values()] == created
+
+
+class TestMountApplications:
+    """Test the bots run on the ASGI server's event loop next to the API"""
+
+    def test_polling_bots_and_api_share_the_server(self):
+        events, received = [], []
+        applications = build(events, received, updates={
+            'master': [make_update(1, 10, "to master")],
+            'client': [make_update(1, 20, "to client")],
+        })
+        app = FastAPI()
+
+        @app.get("/")
+        async def root():
+            return {"bots_running": [name for name, a in applications.items() if a.running]}
+
+        mount_applications(app, applications, mode='polling')
+        with TestClient(app) as client:
+            assert client.get("/").json() == {"bots_running": ['master', 'client']}
+            deadline = time.monotonic() + 5
+            while len(received) < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        assert sorted(received) == [('client', "to client"), ('master', "to master")]
+        assert events[-2:] == ['shutdown_client', 'shutdown_master']
+
+    def test_invalid_configuration(self):
+        with pytest.raises(ValueError):
+            mount_applications(FastAPI(), {}, mode='other')
+        with pytest.raises(ValueError):
+            mount_applications(FastAPI(), {}, mode='webhook', secret='')
@@ -0,0 +1,248 @@
+"""Unit tests for the per-update database session scope"""
+import ast
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from bot.database.db import (
+    get_or_create_user, get_session, outside_transaction, update_session_scope
+)
+from bot.database.models import GeocodeCache, User
+
+BOT_DIR = Path(__file__).resolve().parents[2] / 'bot'
+
+
+def count_users(memory_db) -> int:
+    session = memory_db()
+    try:
+        return session.query(User).count()
+    finally:
+        session.close()
+
+
+class TestUpdateSessionScope:
+    """Одна сессия и один коммит на апдейт"""
+
+    @pytest.mark.asyncio
+    async def test_blocks_share_session_and_commit_once(self, memory_db):
+        async with update_session_scope() as scope:
+            with get_session() as first:
+                get_or_create_user(first, 1)
+            with get_session() as second:
+                get_or_create_user(second, 2)
+            assert first is second
+
+        assert scope.closed and scope.session is None
+        assert count_users(memory_db) == 2
+
+    @pytest.mark.asyncio
+    async def test_error_in_block_rolls_back_update(self, memory_db):
+        from bot.database.db import SessionLocal
+
+        async with update_session_scope():
+            with pytest.raises(ValueError):
+                with get_session() as session:
+                    session.add(User(telegram_id=1))
+                    session.flush()
+                    raise ValueError("handler failed")
+            with get_session() as session:
+                session.add(User(telegram_id=2))
+
+        session = SessionLocal()
+        assert [u.telegram_id for u in session.query(User).all()] == [2]
+        session.close()
+
+    @pytest.mark.asyncio
+    async def test_transaction_released_before_bot_api_request(self, memory_db):
+        from bot.utils.rate_limiter import TelegramRateLimiter
+
+        limiter = TelegramRateLimiter()
+        seen = []
+
+        async def send_message():
+            seen.append((scope.has_transaction(), count_users(memory_db)))
+            return True
+
+        async def read_file():
+            seen.append((scope.has_transaction(), count_users(memory_db)))
+            return b'photo'
+
+        async with update_session_scope() as scope:
+            with get_session() as session:
+                session.add(User(telegram_id=1))
+                await limiter.process_request(send_message, (), {}, 'sendMessage', {'chat_id': 1}, None)
+                session.add(User(telegram_id=2))
+                assert await outside_transaction(read_file()) == b'photo'
+
+        assert seen == [(False, 1), (False, 2)]
+        assert scope.commits == 2
+
+    @pytest.mark.asyncio
+    async def test_geocoding_fallback_outside_transaction(self, memory_db, monkeypatch):
+        import bot.database.db as db
+        from bot.utils import geocoding
+        from bot.utils.gazetteer import CityGazetteer
+
+        city = {'name_ru': "Тикси", 'name_local': "Тикси", 'name_en': "Tiksi",
+                'country_code': 'RU', 'latitude': 71.64, 'longitude': 128.87}
+        seen = []
+
+        async def nominatim(latitude, longitude):
+            seen.append(scope.has_transaction())
+            return city
+
+        monkeypatch.setattr(geocoding, 'get_gazetteer', CityGazetteer)
+        monkeypatch.setattr(geocoding, 'get_city_from_location_async', nominatim)
+        monkeypatch.setattr(geocoding, 'CITY_NAME_CACHE', {})
+        # Ячейку уже записал другой процесс: вставка в кэш падает на уникальном индексе
+        session = memory_db()
+        session.add(GeocodeCache(lat_cell=7164, lon_cell=12887, **city))
+        session.commit()
+        session.close()
+        monkeypatch.setattr(db, 'get_geocode_cache', lambda *args: None)
+
+        async with update_session_scope() as scope:
+            with get_session() as session:
+                session.add(User(telegram_id=1))
+            assert await geocoding.resolve_city_from_location(71.64, 128.87) == city
+            with get_session() as session:
+                session.add(User(telegram_id=2))
+
+        assert seen == [False]
+        # Ошибка записи в кэш откатила только точку сохранения, а не изменения апдейта
+        assert count_users(memory_db) == 2
+
+    @pytest.mark.asyncio
+    async def test_description_request_outside_transaction(self, memory_db, monkeypatch):
+        from bot.utils import openai_client
+
+        seen = []
+
+        async def request_description(service_name, retry_count):
+            seen.append(scope.has_transaction())
+            return "Описание"
+
+        monkeypatch.setattr(openai_client, '_request_description', request_description)
+        monkeypatch.setattr(openai_client.CacheManager, 'get', staticmethod(lambda key: None))
+
+        async with update_session_scope() as scope:
+            with get_session() as session:
+                get_or_create_user(session, 1)
+            # Чтение библиотеки шаблонов открывает транзакцию апдейта перед запросом к OpenAI
+            assert await openai_client.generate_service_description("Маникюр + гель-лак") == "Описание"
+
+        assert seen == [False]
+
+    @pytest.mark.asyncio
+    async def test_spawned_tasks_use_own_sessions(self, memory_db):
+        async def background():
+            with get_session() as session:
+                get_or_create_user(session, 3)
+                return session
+
+        async with update_session_scope():
+            with get_session() as session:
+                own = await asyncio.create_task(background())
+                assert own is not session
+            assert count_users(memory_db) == 1
+
+
+def _callee_name(node: ast.Await):
+    """Имя вызываемой функции в await (для asyncio.wait_for - имя обернутого вызова)"""
+    call = node.value
+    if not isinstance(call, ast.Call):
+        return None
+    func = call.func
+    if isinstance(func, ast.Attribute) and func.attr == 'wait_for' and call.args:
+        return _callee_name(ast.Await(call.args[0]))
+    return func.attr if isinstance(func, ast.Attribute) else getattr(func, 'id', None)
+
+
+def _is_get_session(node: ast.With) -> bool:
+    return any(
+        isinstance(item.context_expr, ast.Call)
+        and (getattr(item.context_expr.func, 'id', None) or getattr(item.context_expr.func, 'attr', None)) == 'get_session'
+        for item in node.items
+    )
+
+
+class TestNoNetworkInTransaction:
+    """
+    Lint: обработчики не ждут внешнюю сеть внутри блока get_session() и после него
+
+    Сетевые - корутины клиентов внешних API (геокодинг, ЮKassa, OpenAI, валюты),
+    asyncio.to_thread и все корутины бота, которые их ждут. Запросы к Bot API
+    разрешены: транзакцию перед ними завершает TelegramRateLimiter. Остальное
+    оборачивается в outside_transaction().
+    """
+
+    NETWORK_MODULES = {'geocoding', 'country_api', 'yookassa_api', 'openai_client', 'payments', 'currency',
+                       'description_library'}
+    NETWORK_PRIMITIVES = {'to_thread'}
+    # Старая версия обработчиков мастера, не подключена к ботам
+    EXCLUDED = {'master_old.py'}
+
+    def _modules(self):
+        for path in sorted(BOT_DIR.rglob('*.py')):
+            if path.name not in self.EXCLUDED:
+                yield path, ast.parse(path.read_text(encoding='utf-8'))
+
+    def _network_coroutines(self, modules) -> set:
+        coroutines = {}
+        for path, tree in modules:
+            for node in ast.walk(tree):
+                if isinstance(node, ast.AsyncFunctionDef):
+                    coroutines.setdefault(node.name, []).append((path, node))
+
+        network = set(self.NETWORK_PRIMITIVES)
+        network.update(name for name, defs in coroutines.items()
+                       if any(path.stem in self.NETWORK_MODULES for path, _ in defs))
+        changed = True
+        while changed:
+            changed = False
+            for name, defs in coroutines.items():
+                if name not in network and any(
+                    isinstance(node, ast.Await) and _callee_name(node) in network
+                    for _, definition in defs for node in ast.walk(definition)
+                ):
+                    network.add(name)
+                    changed = True
+        return network
+
+    def test_no_network_awaits_inside_get_session(self):
+        modules = list(self._modules())
+        network = self._network_coroutines(modules)
+
+        violations = [
+            f"{path.relative_to(BOT_DIR.parent)}:{node.lineno} await {_callee_name(node)}"
+            for path, tree in modules
+            for block in ast.walk(tree) if isinstance(block, ast.With) and _is_get_session(block)
+            for statement in block.body
+            for node in ast.walk(statement)
+            if isinstance(node, ast.Await) and _callee_name(node) in network
+        ]
+        assert violations == []
+
+    def test_no_network_awaits_after_get_session(self):
+        """Внутри апдейта транзакция остается открытой и после выхода из блока get_session()"""
+        modules = list(self._modules())
+        network = self._network_coroutines(modules)
+
+        violations = []
+        for path, tree in modules:
+            for function in ast.walk(tree):
+                if not isinstance(function, ast.AsyncFunctionDef):
+                    continue
+                blocks = [block for block in ast.walk(function)
+                          if isinstance(block, ast.With) and _is_get_session(block)]
+                if not blocks:
+                    continue
+                first_block_end = min(block.end_lineno for block in blocks)
+                violations.extend(
+                    f"{path.relative_to(BOT_DIR.parent)}:{node.lineno} await {_callee_name(node)}"
+                    for node in ast.walk(function)
+                    if isinstance(node, ast.Await) and node.lineno > first_block_end
+                    and _callee_name(node) in network
+                )
+        assert violations == []
@@ -0,0 +1,123 @@
+"""Unit tests for routing updates to bot worker shards"""
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from bot import sharding
+from bot.sharding import ShardDispatcher, create_dispatcher_router, get_shard, get_update_user_id
+from bot.webhook import SECRET_TOKEN_HEADER, get_webhook_secret
+
+SECRET = "test-shard-secret"
+
+
+def message(update_id, user_id, text="hi"):
+    return {'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'text': text,
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'U'},
+    }}
+
+
+class TestShardKey:
+    """Test the user id is taken from the raw update"""
+
+    def test_user_sources(self):
+        callback = {'update_id': 1, 'callback_query': {
+            'id': 'q', 'from': {'id': 42}, 'message': {'chat': {'id': -5}}, 'data': 'x'
+        }}
+        poll_answer = {'update_id': 2, 'poll_answer': {'poll_id': 'p', 'user': {'id': 43}, 'option_ids': []}}
+        channel_post = {'update_id': 3, 'channel_post': {'message_id': 1, 'chat': {'id': -100}}}
+
+        assert get_update_user_id(message(1, 41)) == 41
+        assert get_update_user_id(callback) == 42
+        assert get_update_user_id(poll_answer) == 43
+        assert get_update_user_id(channel_post) == -100
+        assert get_update_user_id({'update_id': 4}) is None
+
+    def test_same_user_same_shard(self):
+        shards = {get_shard(message(n, 1234567), 4) for n in range(10)}
+
+        assert shards == {1234567 % 4}
+        assert {get_shard(message(1, user_id), 4) for user_id in range(8)} == {0, 1, 2, 3}
+
+
+class TestShardDispatcher:
+    """Test forwarding keeps per-user order and survives worker restarts"""
+
+    @pytest.mark.asyncio
+    async def test_order_is_kept_across_retries(self, monkeypatch):
+        monkeypatch.setattr(sharding, "FORWARD_RETRY_DELAY", 0.01)
+        received = {}
+        failures = {'left': 2}
+
+        def handler(request):
+            # Первые запросы к воркеру 1 падают, как будто он перезапускается
+            if request.url.port == 8101 and failures['left']:
+                failures['left'] -= 1
+                return httpx.Response(503)
+            assert request.headers[SECRET_TOKEN_HEADER] == get_webhook_secret(SECRET, 'master')
+            for update in json.loads(request.content):
+                user_id = update['message']['from']['id']
+                received.setdefault(user_id, []).append((request.url.port, update['update_id']))
+            return httpx.Response(200, json={'ok': True})
+
+        dispatcher = ShardDispatcher(["http://127.0.0.1:8100", "http://127.0.0.1:8101"], SECRET,
+                                     batch_size=3, transport=httpx.MockTransport(handler))
+        await dispatcher.start()
+        update_id = 0
+        for _ in range(5):
+            for user_id in (10, 11, 12, 13):
+                update_id += 1
+                dispatcher.dispatch('master', message(update_id, user_id))
+        await dispatcher.stop()
+
+        for user_id, deliveries in received.items():
+            assert {port for port, _ in deliveries} == {8100 + user_id % 2}
+            ids = [update_id for _, update_id in deliveries]
+            assert ids == sorted(ids) and len(ids) == 5
+        assert dispatcher.metrics['forwarded'] == [10, 10]
+        assert dispatcher.metrics['retried'] == 2
+
+    @pytest.mark.asyncio
+    async def test_rejected_batch_does_not_block_shard(self):
+        def handler(request):
+            return httpx.Response(400 if b'"bad"' in request.content else 200)
+
+        dispatcher = ShardDispatcher(["http://127.0.0.1:8100"], SECRET, batch_size=1,
+                                     transport=httpx.MockTransport(handler))
+        await dispatcher.start()
+        dispatcher.dispatch('master', message(1, 10, "bad"))
+        dispatcher.dispatch('master', message(2, 10, "good"))
+        await asyncio.wait_for(dispatcher.stop(), 5)
+
+        assert dispatcher.metrics['dropped'] == 1
+        assert dispatcher.metrics['forwarded'] == [1]
+
+
+class TestDispatcherRouter:
+    """Test the front endpoint verifies secrets before routing"""
+
+    def test_secret_and_routing(self):
+        class RecordingDispatcher:
+            def __init__(self):
+                self.dispatched = []
+
+            def dispatch(self, bot_name, data):
+                self.dispatched.append((bot_name, data['update_id']))
+
+        dispatcher = RecordingDispatcher()
+        app = FastAPI()
+        app.include_router(create_dispatcher_router(dispatcher, ['master'], SECRET))
+        headers = {SECRET_TOKEN_HEADER: get_webhook_secret(SECRET, 'master')}
+
+        with TestClient(app) as client:
+            ok = client.post("/telegram/master", json=message(1, 10), headers=headers)
+            forbidden = client.post("/telegram/master", json=message(2, 10))
+            unknown = client.post("/telegram/client", json=message(3, 10), headers=headers)
+
+        assert (ok.status_code, forbidden.status_code, unknown.status_code) == (200, 403, 404)
+        assert dispatcher.dispatched == [('master', 1)]
@@ -0,0 +1,113 @@
+"""Unit tests for subscription expiry sweeper and throttled notifications"""
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, inspect
+from sqlalchemy import update as sa_update
+from telegram.error import Forbidden, RetryAfter
+
+from bot.database.db import get_session, get_master_by_id, downgrade_expired_subscriptions
+from bot.database.models import MasterAccount
+from bot.utils.notifications import send_throttled
+from bot.utils.subscriptions import sweep_expired_subscriptions
+
+
+class FakeBot:
+    def __init__(self, errors=None):
+        self.sent = []
+        self.errors = errors or {}
+
+    async def send_message(self, chat_id, text, **kwargs):
+        error = self.errors.pop(chat_id, None)
+        if error:
+            raise error
+        self.sent.append((chat_id, time.monotonic()))
+
+
+@pytest.fixture
+def masters(memory_db):
+    now = datetime.utcnow()
+    with get_session() as session:
+        rows = [
+            MasterAccount(telegram_id=1, name="Expired", subscription_level='premium',
+                          subscription_expires_at=now - timedelta(hours=1)),
+            MasterAccount(telegram_id=2, name="Active", subscription_level='premium',
+                          subscription_expires_at=now + timedelta(days=3)),
+            MasterAccount(telegram_id=3, name="Free", subscription_level='free',
+                          subscription_expires_at=now - timedelta(days=30)),
+            MasterAccount(telegram_id=4, name="Expired too", subscription_level='premium',
+                          subscription_expires_at=now - timedelta(days=1)),
+        ]
+        session.add_all(rows)
+        session.flush()
+        return {row.telegram_id: row.id for row in rows}
+
+
+class TestSubscriptionSweeper:
+    """Test bulk downgrade of expired subscriptions"""
+
+    def test_expiry_column_is_indexed(self, memory_db):
+        engine = memory_db.kw['bind']
+        indexed = {col for index in inspect(engine).get_indexes('master_accounts') for col in index['column_names']}
+        assert 'subscription_expires_at' in indexed
+
+    def test_downgrades_only_expired_paid_masters(self, masters):
+        with get_session() as session:
+            expired = downgrade_expired_subscriptions(session)
+            assert sorted(telegram_id for _, telegram_id, _ in expired) == [1, 4]
+            assert get_master_by_id(session, masters[1]).subscription_level == 'free'
+            assert get_master_by_id(session, masters[2]).subscription_level == 'premium'
+            # Повторный проход ничего не находит
+            assert downgrade_expired_subscriptions(session) == []
+
+    def test_master_renewed_before_update_is_not_downgraded(self, masters):
+        with get_session() as session:
+            renewed = []
+
+            def renew_first(state):
+                # Webhook платежа продлил подписку между выборкой и переводом
+                if state.is_update and not renewed:
+                    renewed.append(True)
+                    session.execute(
+                        sa_update(MasterAccount).where(MasterAccount.telegram_id == 4)
+                        .values(subscription_expires_at=datetime.utcnow() + timedelta(days=30))
+                    )
+            event.listen(session, 'do_orm_execute', renew_first)
+
+            expired = downgrade_expired_subscriptions(session)
+
+            assert [telegram_id for _, telegram_id, _ in expired] == [1]
+            assert expired[0][2] == 'premium'
+            assert get_master_by_id(session, masters[4]).subscription_level == 'premium'
+
+    @pytest.mark.asyncio
+    async def test_sweep_notifies_downgraded_masters(self, masters):
+        bot = FakeBot()
+
+        assert await sweep_expired_subscriptions(bot) == 2
+        assert sorted(chat_id for chat_id, _ in bot.sent) == [1, 4]
+        assert await sweep_expired_subscriptions(bot) == 0
+
+
+class TestSendThrottled:
+    """Test rate-limited sending"""
+
+    @pytest.mark.asyncio
+    async def test_respects_rate(self):
+        bot = FakeBot()
+
+        sent = await send_throttled(bot, [(i, "hi") for i in range(5)], per_second=50)
+
+        assert sent == 5
+        times = [t for _, t in bot.sent]
+        assert all(b - a >= 0.018 for a, b in zip(times, times[1:]))
+
+    @pytest.mark.asyncio
+    async def test_retry_after_and_blocked_users(self):
+        bot = FakeBot(errors={1: RetryAfter(0), 2: Forbidden("bot was blocked by the user")})
+
+        sent = await send_throttled(bot, [(1, "a"), (2, "b"), (3, "c")], per_second=1000)
+
+        assert sent == 2
+        assert [chat_id for chat_id, _ in bot.sent] == [1, 3]
@@ -0,0 +1,109 @@
+"""Unit tests for per-user concurrent update processing"""
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from telegram import Chat, Message, Update, User
+
+from bot.utils.update_processor import PerUserUpdateProcessor, get_ordering_key
+
+
+def make_update(update_id, user_id):
+    message = Message(
+        message_id=update_id,
+        date=datetime.now(timezone.utc),
+        chat=Chat(id=user_id, type=Chat.PRIVATE),
+        from_user=User(id=user_id, first_name="u", is_bot=False),
+        text="hi"
+    )
+    return Update(update_id=update_id, message=message)
+
+
+class Recorder:
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.order = []
+        self.active = 0
+        self.max_active = 0
+
+    async def handle(self, user_id, n):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(self.delay)
+        self.order.append((user_id, n))
+        self.active -= 1
+
+
+class TestPerUserUpdateProcessor:
+    """Test ordering per user and bounded parallelism across users"""
+
+    @pytest.mark.asyncio
+    async def test_same_user_updates_are_serialized_in_order(self):
+        processor = PerUserUpdateProcessor(max_workers=8)
+        order = []
+        # Первый апдейт медленнее - следующие все равно ждут его
+        delays = [0.05, 0.0, 0.0]
+
+        async def handle(n):
+            await asyncio.sleep(delays[n])
+            order.append(n)
+
+        await asyncio.gather(*(
+            processor.process_update(make_update(n, 1), handle(n)) for n in range(3)
+        ))
+
+        assert order == [0, 1, 2]
+
+    @pytest.mark.asyncio
+    async def test_different_users_run_in_parallel_up_to_limit(self):
+        processor = PerUserUpdateProcessor(max_workers=4)
+        recorder = Recorder(delay=0.02)
+
+        await asyncio.gather(*(
+            processor.process_update(make_update(user_id, user_id), recorder.handle(user_id, 0))
+            for user_id in range(10)
+        ))
+
+        assert recorder.max_active == 4
+        assert processor.get_metrics()['processed'] == 10
+
+    @pytest.mark.asyncio
+    async def test_waiting_user_does_not_hold_worker_slot(self):
+        processor = PerUserUpdateProcessor(max_workers=1)
+        recorder = Recorder(delay=0.01)
+        tasks = [processor.process_update(make_update(n, 1), recorder.handle(1, n)) for n in range(3)]
+        tasks.append(processor.process_update(make_update(10, 2), recorder.handle(2, 0)))
+
+        await asyncio.wait_for(asyncio.gather(*tasks), timeout=1)
+
+        assert [n for user_id, n in recorder.order if user_id == 1] == [0, 1, 2]
+        assert (2, 0) in recorder.order
+
+    def test_built_before_event_loop(self):
+        # Как в bot/runner.py: обработчик создается до цикла uvicorn, затем Application перезапускается
+        processor = PerUserUpdateProcessor(max_workers=2)
+
+        async def serve():
+            await processor.initialize()
+            recorder = Recorder(delay=0.01)
+            await asyncio.gather(*(
+                processor.process_update(make_update(user_id, user_id), recorder.handle(user_id, 0))
+                for user_id in range(6)
+            ))
+            return recorder.max_active
+
+        assert asyncio.run(serve()) == 2
+        assert asyncio.run(serve()) == 2
+
+    @pytest.mark.asyncio
+    async def test_locks_are_released(self):
+        processor = PerUserUpdateProcessor()
+
+        await processor.process_update(make_update(1, 1), asyncio.sleep(0))
+        await processor.process_update(object(), asyncio.sleep(0))
+
+        assert processor.get_metrics()['queued_users'] == 0
+
+    def test_ordering_key(self):
+        assert get_ordering_key(make_update(1, 42)) == ('user', 42)
+        assert get_ordering_key(object()) is None
@@ -0,0 +1,140 @@
+"""Unit tests for token-bucket rate limiting with memory and SQLite storage"""
+import threading
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+from fastapi.testclient import TestClient
+
+from bot.utils.debounce import debounce, rate_limit
+from bot.utils.user_rate_limit import (
+    MemoryRateLimitStorage, RateLimitStorage, SqliteRateLimitStorage, TokenBucketLimiter
+)
+
+
+def make_update(user_id: int = 1):
+    return SimpleNamespace(
+        effective_user=SimpleNamespace(id=user_id),
+        callback_query=SimpleNamespace(answer=AsyncMock()),
+        effective_message=None,
+    )
+
+
+class TestTokenBucketLimiter:
+    """Ведро токенов и вытеснение простаивающих пользователей"""
+
+    def test_burst_then_refill(self):
+        limiter = TokenBucketLimiter(rate=1, capacity=3, namespace='t', storage=MemoryRateLimitStorage())
+
+        assert [limiter.check(1, now=100.0) for _ in range(3)] == [0, 0, 0]
+        assert limiter.check(1, now=100.0) == pytest.approx(1.0)
+        assert limiter.check(2, now=100.0) == 0
+        assert limiter.check(1, now=101.5) == 0
+        assert limiter.check(1, now=101.5) == pytest.approx(0.5)
+
+    def test_memory_storage_evicts_idle_and_least_recent(self):
+        storage = MemoryRateLimitStorage(max_keys=3)
+        limiter = TokenBucketLimiter(rate=1, capacity=2, namespace='t', storage=storage)
+
+        for user_id in range(5):
+            limiter.check(user_id, now=100.0)
+        assert len(storage) == 3
+        assert list(storage._buckets) == ['t:2', 't:3', 't:4']
+
+        # Через секунду ведра наполнились - пользователи простаивают и забываются
+        limiter.check(9, now=101.0)
+        assert list(storage._buckets) == ['t:9']
+
+    def test_sqlite_storage_shared_between_processes(self, tmp_path):
+        path = str(tmp_path / 'limits.db')
+        first, second = SqliteRateLimitStorage(path), SqliteRateLimitStorage(path, prune_interval=0)
+        try:
+            bot_limiter = TokenBucketLimiter(rate=1, capacity=2, namespace='t', storage=first)
+            api_limiter = TokenBucketLimiter(rate=1, capacity=2, namespace='t', storage=second)
+
+            assert bot_limiter.check(1, now=100.0) == 0
+            assert api_limiter.check(1, now=100.0) == 0
+            assert bot_limiter.check(1, now=100.0) == pytest.approx(1.0)
+
+            api_limiter.check(2, now=110.0)
+            assert len(second) == 1
+        finally:
+            first.close()
+            second.close()
+
+
+class TestDecorators:
+    """debounce и rate_limit поверх ведер"""
+
+    @pytest.mark.asyncio
+    async def test_debounce_rejects_fast_repeat(self):
+        handler = AsyncMock(return_value='ok')
+        wrapped = debounce(10, storage=MemoryRateLimitStorage())(handler)
+
+        assert await wrapped(make_update(), None) == 'ok'
+        update = make_update()
+        assert await wrapped(update, None) is None
+        update.callback_query.answer.assert_awaited_once()
+        assert handler.await_count == 1
+        assert await wrapped(make_update(2), None) == 'ok'
+
+    @pytest.mark.asyncio
+    async def test_rate_limit_per_function(self):
+        storage = MemoryRateLimitStorage()
+
+        @rate_limit(2, 60, storage=storage)
+        async def first(update, context):
+            return 'first'
+
+        @rate_limit(2, 60, storage=storage)
+        async def second(update, context):
+            return 'second'
+
+        assert [await first(make_update(), None) for _ in range(3)] == ['first', 'first', None]
+        assert await second(make_update(), None) == 'second'
+        assert len(storage) == 2
+
+    @pytest.mark.asyncio
+    async def test_sqlite_storage_checked_off_event_loop(self, tmp_path):
+        storage = SqliteRateLimitStorage(str(tmp_path / 'limits.db'))
+        threads = []
+        take = storage.take
+
+        def recording_take(*args):
+            threads.append(threading.get_ident())
+            return take(*args)
+
+        storage.take = recording_take
+
+        @rate_limit(1, 60, storage=storage)
+        async def handler(update, context):
+            return 'ok'
+
+        try:
+            assert await handler(make_update(), None) == 'ok'
+        finally:
+            storage.close()
+
+        assert threads and threads[0] != threading.get_ident()
+
+    def test_storage_interface_is_abstract(self):
+        with pytest.raises(TypeError):
+            RateLimitStorage()
+
+
+class TestMobileApiRateLimit:
+    """429 от REST API при превышении лимита"""
+
+    def test_too_many_requests(self, memory_db, monkeypatch):
+        from mobile_app.api import main
+
+        limiter = TokenBucketLimiter(rate=0.1, capacity=2, namespace='api', storage=MemoryRateLimitStorage())
+        monkeypatch.setattr(main, 'api_rate_limiter', limiter)
+        headers = {'Authorization': 'Bearer 700'}
+        with TestClient(main.app) as client:
+            codes = [client.get('/api/bookings', headers=headers) for _ in range(3)]
+            other = client.get('/api/bookings', headers={'Authorization': 'Bearer 701'})
+
+        assert [r.status_code for r in codes] == [200, 200, 429]
+        assert int(codes[2].headers['Retry-After']) == 10
+        assert other.status_code == 200
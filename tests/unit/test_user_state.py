@@ -0,0 +1,114 @@
+"""Unit tests for compact per-user state objects and idle eviction"""
+import time
+from datetime import date, datetime
+from types import SimpleNamespace
+
+import pytest
+from telegram.ext import Application
+
+from bot.utils.persistence import decode_state, encode_state
+from bot.utils.user_state import (
+    BookingState, SearchState, evict_idle_states, get_state, memory_report, set_state, sweep_user_states
+)
+
+
+class TestStateObjects:
+    """Доступ к состояниям и сериализация"""
+
+    def test_get_state_touches_and_checks_type(self):
+        user_data = {'search': {'city_id': 1}}
+        assert get_state(user_data, SearchState) is None
+
+        state = set_state(user_data, SearchState(city_id=1, touched_at=0))
+        assert get_state(user_data, SearchState) is state
+        assert state.touched_at > 0
+        assert get_state(user_data, BookingState) is None
+
+    def test_states_roundtrip_through_persistence(self):
+        booking = BookingState(
+            service_id=1, master_id=2, duration=60, price=1500.0,
+            available_dates=(date(2026, 1, 5), date(2026, 1, 6)),
+            selected_date=date(2026, 1, 5), start_dt=datetime(2026, 1, 5, 10, 0), end_dt=datetime(2026, 1, 5, 11, 0),
+        )
+        search = SearchState(city_id=3, display_type='city', master_ids=tuple(range(500)), total=500)
+        restored = decode_state(encode_state({'booking': booking, 'search': search}))
+        assert restored['booking'] == booking
+        assert restored['search'] == search
+        assert not hasattr(search, '__dict__')
+
+
+class TestEviction:
+    """Вытеснение по простою и отчет об объеме"""
+
+    def test_evicts_idle_and_legacy_entries(self):
+        now = time.time()
+        users = {
+            1: {'search': SearchState(touched_at=now - 7200), 'booking_price': 100, 'client_portfolio_index': 0},
+            2: {'booking': BookingState(service_id=1, master_id=1, duration=30, price=10, touched_at=now - 7200)},
+            3: {'search': SearchState(touched_at=now)},
+        }
+
+        evicted, changed, emptied = evict_idle_states(users, ttl=3600, now=now)
+
+        assert evicted == {'SearchState': 1, 'BookingState': 1, 'legacy': 1}
+        assert changed == [1] and emptied == [2]
+        assert users[1] == {'client_portfolio_index': 0}
+        assert 'search' in users[3]
+
+    def test_memory_report_by_type(self):
+        users = {
+            1: {'search': SearchState(master_ids=(1, 2, 3)), 'client_portfolio_photos': [1, 2]},
+            2: {'search': SearchState()},
+        }
+        report = memory_report(users)
+        assert report['SearchState']['count'] == 2
+        assert report['SearchState']['bytes'] >= report['SearchState']['max_bytes'] > 0
+        assert report['client_portfolio_photos']['count'] == 1
+
+    @pytest.mark.asyncio
+    async def test_sweep_drops_users_without_data(self, monkeypatch):
+        import bot.config as config
+        monkeypatch.setattr(config, 'USER_STATE_TTL', 60)
+
+        application = Application.builder().token('1:sweep').updater(None).build()
+        application._user_data[1]['search'] = SearchState(touched_at=time.time() - 120)
+        application._user_data[2]['search'] = SearchState()
+        application._user_data[2]['booking'] = BookingState(
+            service_id=1, master_id=1, duration=30, price=10, touched_at=time.time() - 120
+        )
+
+        await sweep_user_states(SimpleNamespace(application=application))
+
+        assert 1 not in application.user_data
+        assert list(application.user_data[2]) == ['search']
+
+
+class TestSearchPaging:
+    """Страница списка мастеров читается из БД по сохраненным id"""
+
+    def test_load_masters_page(self, memory_db):
+        from bot.database.db import create_master_account, get_or_create_user, get_session
+        from bot.database.models import City, UserMaster
+        from bot.handlers.client import MASTERS_PER_PAGE, _load_masters_page
+
+        with get_session() as session:
+            city = City(name_ru='Москва', name_local='Москва', name_en='Moscow', country_code='RU')
+            session.add(city)
+            session.commit()
+            masters = [
+                create_master_account(session, 1000 + n, f"Мастер {n:02d}", city_id=city.id)
+                for n in range(MASTERS_PER_PAGE + 2)
+            ]
+            client = get_or_create_user(session, 42)
+            session.add(UserMaster(user_id=client.id, master_account_id=masters[-1].id))
+            session.commit()
+            state = SearchState(
+                city_id=city.id, display_type='city',
+                master_ids=tuple(master.id for master in masters), total=len(masters)
+            )
+
+            first = _load_masters_page(session, state, 0, 42)
+            second = _load_masters_page(session, state, 1, 42)
+
+        assert [m.name for m in first] == [f"Мастер {n:02d}" for n in range(MASTERS_PER_PAGE)]
+        assert [m.already_added for m in second] == [False, True]
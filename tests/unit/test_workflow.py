@@ -0,0 +1,149 @@
+"""Unit tests for compiled workflows and their compact state"""
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+from bot.core.workflow import Step, StepType, Workflow, WorkflowManager, compile_workflow
+from bot.utils.persistence import decode_state, encode_state
+from bot.utils.user_state import WorkflowState, evict_idle_states
+
+
+def make_context():
+    return SimpleNamespace(user_data={})
+
+
+def message_update(text: str = ''):
+    message = SimpleNamespace(text=text, reply_text=AsyncMock())
+    return SimpleNamespace(callback_query=None, message=message, effective_user=SimpleNamespace(id=77))
+
+
+def callback_update():
+    query = SimpleNamespace(message=SimpleNamespace(edit_text=AsyncMock()), answer=AsyncMock())
+    return SimpleNamespace(callback_query=query, message=None, effective_user=SimpleNamespace(id=77))
+
+
+class TestCompile:
+    """Компиляция workflow в таблицу шагов"""
+
+    def test_rejects_broken_references(self):
+        with pytest.raises(ValueError):
+            compile_workflow(Workflow(name='w', entry_point='missing'))
+        with pytest.raises(ValueError):
+            compile_workflow(Workflow(name='w', entry_point='a', steps={
+                'a': Step(id='a', type=StepType.INPUT, title='', message='', next_step='nowhere'),
+            }))
+        with pytest.raises(ValueError):
+            compile_workflow(Workflow(name='w', entry_point='a', steps={
+                'a': Step(id='a', type=StepType.CONDITIONAL, title='', message=''),
+            }))
+
+    @pytest.mark.asyncio
+    async def test_static_keyboard_built_once(self):
+        manager = WorkflowManager()
+        compiled = manager.register_workflow(Workflow(name='w', entry_point='pick', steps={
+            'pick': Step(id='pick', type=StepType.CALLBACK, title='', message='Выбор', data_key='choice',
+                         next_step='done', keyboard=[[{'text': 'A', 'callback_data': 'workflow_callback_a'}]]),
+            'done': Step(id='done', type=StepType.INPUT, title='', message='Готово', data_key='text'),
+        }))
+        assert compiled.steps[0].next_index == 1
+
+        context = make_context()
+        for _ in range(2):
+            update = message_update()
+            assert await manager.start_workflow(update, context, 'w') == 'pick'
+            assert update.message.reply_text.call_args.kwargs['reply_markup'] is compiled.steps[0].markup
+
+        assert await manager.handle_callback(callback_update(), context, 'workflow_callback_a') == 'done'
+        assert context.user_data['workflow'].data == {'choice': 'a'}
+        assert await manager.handle_input(message_update(' текст '), context) is None
+        assert 'workflow' not in context.user_data
+
+    @pytest.mark.asyncio
+    async def test_persisted_step_survives_reordering(self):
+        def chain(*ids):
+            return Workflow(name='w', entry_point=ids[0], steps={
+                step_id: Step(id=step_id, type=StepType.INPUT, title='', message=step_id, data_key=step_id,
+                              next_step=ids[i + 1] if i + 1 < len(ids) else None)
+                for i, step_id in enumerate(ids)
+            })
+
+        context = make_context()
+        old = WorkflowManager()
+        old.register_workflow(chain('name', 'price'))
+        await old.start_workflow(message_update(), context, 'w')
+        restored = decode_state(encode_state(context.user_data))
+
+        # После деплоя перед 'name' появился новый шаг - пользователь продолжает с 'name'
+        new = WorkflowManager()
+        new.register_workflow(chain('intro', 'name', 'price'))
+        context = SimpleNamespace(user_data=restored)
+        assert await new.handle_input(message_update('Анна'), context) == 'price'
+        assert context.user_data['workflow'].data == {'name': 'Анна'}
+
+
+class TestWorkflows:
+    """Рабочие workflow из bot/workflows"""
+
+    @pytest.mark.asyncio
+    async def test_add_service_from_template(self, memory_db):
+        from bot.data.service_templates import get_category_templates
+        from bot.database.db import create_master_account, get_services_by_master, get_session
+        from bot.workflows import create_add_service_workflow
+
+        with get_session() as session:
+            master_id = create_master_account(session, 77, "Мастер").id
+
+        manager = WorkflowManager()
+        manager.register_workflow(create_add_service_workflow())
+        context = make_context()
+
+        update = callback_update()
+        assert await manager.start_workflow(update, context, 'add_service') == 'category'
+        markup = update.callback_query.message.edit_text.call_args.kwargs['reply_markup']
+        assert 'workflow_callback_nails' in [row[0].callback_data for row in markup.inline_keyboard]
+
+        assert await manager.handle_callback(callback_update(), context, 'workflow_callback_nails') == 'template'
+        assert await manager.handle_callback(callback_update(), context, 'workflow_callback_1') == 'price'
+        assert await manager.handle_input(message_update('1500'), context) == 'duration'
+        assert await manager.handle_input(message_update('0'), context) == 'duration'
+        assert await manager.handle_input(message_update('90'), context) == 'cooling'
+        assert await manager.handle_input(message_update('10'), context) is None
+
+        with get_session() as session:
+            services = get_services_by_master(session, master_id)
+            assert [(s.title, s.price, s.duration_mins, s.cooling_period_mins) for s in services] == [
+                (get_category_templates('nails')[1]['name'], 1500, 90, 10)
+            ]
+            assert services[0].category.category_key == 'nails'
+        assert context.user_data == {}
+
+    @pytest.mark.asyncio
+    async def test_onboarding_skips_completed_steps(self, memory_db):
+        from bot.database.db import create_master_account, create_service, get_session
+        from bot.workflows import create_onboarding_workflow
+
+        with get_session() as session:
+            master = create_master_account(session, 77, "Мастер")
+            create_service(session, master.id, "Стрижка", 1000, 60, 0)
+
+        manager = WorkflowManager()
+        manager.register_workflow(create_onboarding_workflow())
+        context = make_context()
+
+        assert await manager.start_workflow(message_update(), context, 'onboarding') == 'schedule'
+        assert context.user_data['workflow'].step == 'schedule'
+
+
+class TestWorkflowState:
+    """Состояние прохождения workflow"""
+
+    def test_roundtrip_and_legacy_eviction(self):
+        state = WorkflowState(workflow='add_service', step='price', data={'price': '1500'})
+        assert decode_state(encode_state({'workflow': state}))['workflow'] == state
+        assert not hasattr(state, '__dict__')
+
+        users = {1: {'workflow_name': 'add_service', 'workflow_step': 'price', 'workflow_data': {}, 'workflow': state}}
+        evicted, changed, _ = evict_idle_states(users, ttl=3600, now=state.touched_at)
+        assert evicted == {'legacy': 3} and changed == [1]
+        assert users[1] == {'workflow': state}